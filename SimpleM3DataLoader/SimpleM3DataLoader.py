@@ -1,8 +1,17 @@
+import json
+import warnings
 from dataclasses import dataclass
+from datetime import date, datetime, time as dt_time, timedelta, timezone
 from decimal import Decimal
 from enum import Enum
-from typing import Dict, List, Any, Optional, Tuple
-from sqlite3 import Connection, SQLITE_LIMIT_VARIABLE_NUMBER
+from itertools import repeat
+from typing import Callable, Dict, Iterable, Iterator, List, Any, Optional, Sequence, Tuple
+from sqlite3 import Connection, Cursor, SQLITE_LIMIT_VARIABLE_NUMBER, register_adapter
+
+from .instrumentation import log, log_error, stage
+
+# sqlite3 cannot bind Decimal values, the DECIMAL columns (NUMERIC affinity) convert the text back to a number
+register_adapter(Decimal, str)
 
 
 class TagType(Enum):
@@ -21,6 +30,355 @@ class TagType(Enum):
         raise ValueError(f"No TagType with value: {value}")
 
 
+# Temporal tag values are stored as integers so that they sort (and compare) correctly regardless of the
+# input format, and range filters become plain index range seeks:
+# - DATE: days since 1970-01-01
+# - TIME: microseconds since midnight
+# - TIMESTAMP: microseconds since 1970-01-01 00:00:00 (timezone aware values are converted to UTC)
+_EPOCH = datetime(1970, 1, 1)
+_EPOCH_ORDINAL = _EPOCH.toordinal()
+_MICROSECOND = timedelta(microseconds=1)
+
+
+_INT64_MIN = -(1 << 63)
+_INT64_MAX = (1 << 63) - 1
+# Ranges of the encoded temporal values (those of Python's date, time and datetime)
+_DATE_RANGE = (date.min.toordinal() - _EPOCH_ORDINAL, date.max.toordinal() - _EPOCH_ORDINAL)
+_TIME_RANGE = (0, 24 * 60 * 60 * 1_000_000 - 1)
+_TIMESTAMP_RANGE = ((datetime.min - _EPOCH) // _MICROSECOND, (datetime.max - _EPOCH) // _MICROSECOND)
+
+
+def _check_range(value: int, value_range: Tuple[int, int]) -> int:
+    if not value_range[0] <= value <= value_range[1]:
+        raise ValueError(f"{value} is out of range")
+    return value
+
+
+def _encode_date(value: Any) -> int:
+    if isinstance(value, int):
+        return _check_range(value, _DATE_RANGE)
+    if isinstance(value, datetime):
+        value = value.date()
+    elif isinstance(value, str):
+        value = date.fromisoformat(value.strip()[:10])
+    elif not isinstance(value, date):
+        raise TypeError(f"Expected an ISO 8601 date, got {type(value).__name__}")
+    return value.toordinal() - _EPOCH_ORDINAL
+
+
+def _encode_time(value: Any) -> int:
+    if isinstance(value, int):
+        return _check_range(value, _TIME_RANGE)
+    if isinstance(value, datetime):
+        value = value.time()
+    elif isinstance(value, str):
+        value = dt_time.fromisoformat(value.strip())
+    elif not isinstance(value, dt_time):
+        raise TypeError(f"Expected an ISO 8601 time, got {type(value).__name__}")
+    return ((value.hour * 60 + value.minute) * 60 + value.second) * 1_000_000 + value.microsecond
+
+
+def _encode_timestamp(value: Any) -> int:
+    if isinstance(value, int):
+        return _check_range(value, _TIMESTAMP_RANGE)
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.strip())
+    elif isinstance(value, date) and not isinstance(value, datetime):
+        value = datetime.combine(value, dt_time())
+    elif not isinstance(value, datetime):
+        raise TypeError(f"Expected an ISO 8601 timestamp, got {type(value).__name__}")
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return (value - _EPOCH) // _MICROSECOND
+
+
+def _encode_alphanumerical(value: Any) -> str:
+    if isinstance(value, str):
+        return value
+    # Numbers are stored as text by the TEXT column anyway
+    if isinstance(value, (int, float)):
+        return str(value)
+    raise TypeError(f"Expected a string, got {type(value).__name__}")
+
+
+def _encode_numerical_int(value: Any) -> int:
+    if isinstance(value, str):
+        value = int(value.strip())
+    elif isinstance(value, float) and value.is_integer():
+        value = int(value)
+    elif not isinstance(value, int):
+        raise TypeError(f"Expected an integer, got {type(value).__name__}")
+    if not _INT64_MIN <= value <= _INT64_MAX:
+        raise ValueError(f"{value} does not fit into a 64-bit integer")
+    return value
+
+
+def _encode_numerical_dec(value: Any) -> Any:
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        value = Decimal(str(value))
+    elif isinstance(value, str):
+        value = Decimal(value.strip())
+    elif not isinstance(value, Decimal):
+        raise TypeError(f"Expected a decimal number, got {type(value).__name__}")
+    if not value.is_finite():
+        raise ValueError(f"{value} is not a finite number")
+    return value
+
+
+def canonical_json(value: Any) -> str:
+    """
+    Canonical serialization of a JSON value (sorted keys, no whitespace), equal values serialize equally.
+    """
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False, allow_nan=False)
+
+
+def _encode_json(value: Any) -> str:
+    # Strings are JSON documents, other values (dict, list, numbers, ...) are serialized
+    return canonical_json(json.loads(value) if isinstance(value, str) else value)
+
+
+def tag_value_key(value: Any) -> Any:
+    """
+    Hashable form of a tag value given in a tagging: JSON objects and arrays (e.g. parsed from a taggings file)
+    are replaced by their canonical serialization, which encodes to the same stored value.
+    """
+    return canonical_json(value) if isinstance(value, (dict, list)) else value
+
+
+_ENCODERS: Dict[TagType, Callable[[Any], Any]] = {
+    TagType.ALPHANUMERICAL: _encode_alphanumerical,
+    TagType.TIMESTAMP: _encode_timestamp,
+    TagType.TIME: _encode_time,
+    TagType.DATE: _encode_date,
+    TagType.NUMERICAL_INT: _encode_numerical_int,
+    TagType.NUMERICAL_DEC: _encode_numerical_dec,
+    TagType.JSON: _encode_json,
+}
+
+
+def encode_tag_value(tagtype: TagType, value: Any) -> Any:
+    """
+    Convert a tag value to its stored representation.
+
+    Parameters:
+    - tagtype: TagType of the tagset.
+    - value: Tag value, temporal values as ISO 8601 strings, date/time/datetime objects or already encoded integers.
+             JSON values as JSON strings or as Python values, they are stored in a canonical serialization.
+
+    Returns:
+    - The value as stored in the typed tag table
+
+    Raises ValueError or TypeError if the value is not valid for the tag type.
+    """
+    if value is None or (isinstance(value, bool) and tagtype != TagType.JSON):
+        raise TypeError(f"Invalid {tagtype.name.lower()} tag value: {value!r}")
+    return _ENCODERS[tagtype](value)
+
+
+# (row, value, error) of a value that could not be converted to its stored representation
+InvalidValue = Tuple[int, Any, str]
+
+
+@dataclass
+class NormalizedValues():
+    """
+    A column of tag values in their stored representation, invalid rows are None and reported in invalid.
+    """
+    values: List[Any]
+    invalid: List[InvalidValue]
+
+    def valid(self) -> Iterator[Tuple[int, Any]]:
+        """
+        (row, stored value) of the valid rows.
+        """
+        if not self.invalid:
+            return enumerate(self.values)
+        return ((row, value) for row, value in enumerate(self.values) if value is not None)
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def _temporal_column_numpy(values: Sequence[Any], unit: str, prefix: str, min_length: int, value_range: Tuple[int, int]) -> List[int]:
+    """
+    Parse a column of ISO 8601 strings (or a datetime64 array) with NumPy and return the encoded integers.
+    Anything NumPy does not parse exactly like the per value encoders raises, e.g. timezone offsets
+    (NumPy warns instead of failing) or reduced precision values such as "2026".
+    """
+    numpy = _numpy()
+    if numpy is None:
+        raise ImportError("NumPy is not available")
+    if isinstance(values, numpy.ndarray) and values.dtype.kind == "M":
+        parsed = values.astype(f"datetime64[{unit}]")
+    else:
+        if not (isinstance(values, numpy.ndarray) and values.dtype.kind == "U") and not all(type(value) is str for value in values):
+            raise TypeError("Not a column of strings")
+        strings = numpy.char.strip(numpy.asarray(values, dtype=str))
+        if len(strings) and numpy.char.str_len(strings).min() < min_length:
+            raise ValueError("Reduced precision value")
+        if unit == "D":
+            strings = strings.astype("<U10")
+        elif prefix:
+            strings = numpy.char.add(prefix, strings)
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            try:
+                parsed = strings.astype(f"datetime64[{unit}]")
+            except Warning as e:
+                # The values are converted one by one (e.g. timezone offsets to UTC)
+                raise ValueError(f"Not parsed exactly by NumPy: {e}") from e
+    encoded = parsed.astype(numpy.int64)
+    if len(encoded) and (encoded.min() < value_range[0] or encoded.max() > value_range[1]):
+        raise ValueError("Value out of range (or NaT)")
+    return encoded.tolist()
+
+
+def _integer_column(values: Sequence[Any], value_range: Tuple[int, int]) -> List[int]:
+    """
+    A column that is already encoded as integers (a list of ints or an integer NumPy array), range checked.
+    """
+    if hasattr(values, "dtype"):
+        if values.dtype.kind not in "iu":
+            raise TypeError("Not an integer array")
+        values = values.tolist()
+    elif not all(type(value) is int for value in values):
+        raise TypeError("Not a column of integers")
+    if values and (min(values) < value_range[0] or max(values) > value_range[1]):
+        raise ValueError("Value out of range")
+    return list(values)
+
+
+def _date_column(values: Sequence[Any]) -> List[int]:
+    try:
+        return _integer_column(values, _DATE_RANGE)
+    except (TypeError, ValueError):
+        return _temporal_column_numpy(values, "D", "", 10, _DATE_RANGE)
+
+
+def _time_column(values: Sequence[Any]) -> List[int]:
+    try:
+        return _integer_column(values, _TIME_RANGE)
+    except (TypeError, ValueError):
+        # NumPy has no time of day type, times are parsed as timestamps on 1970-01-01
+        return _temporal_column_numpy(values, "us", "1970-01-01T", 2, _TIME_RANGE)
+
+
+def _timestamp_column(values: Sequence[Any]) -> List[int]:
+    try:
+        return _integer_column(values, _TIMESTAMP_RANGE)
+    except (TypeError, ValueError):
+        return _temporal_column_numpy(values, "us", "", 10, _TIMESTAMP_RANGE)
+
+
+def _alphanumerical_column(values: Sequence[Any]) -> List[str]:
+    if not all(type(value) is str for value in values):
+        raise TypeError("Not a column of strings")
+    return list(values)
+
+
+def _numerical_dec_column(values: Sequence[Any]) -> List[Any]:
+    if hasattr(values, "dtype") and values.dtype.kind == "f":
+        numpy = _numpy()
+        if not numpy.isfinite(values).all():
+            raise ValueError("Not a finite number")
+        return [Decimal(str(value)) for value in values.tolist()]
+    return _integer_column(values, (_INT64_MIN, _INT64_MAX))
+
+
+# Column encoders: convert a whole column at once or raise, the column is then encoded value by value
+_COLUMN_ENCODERS: Dict[TagType, Callable[[Sequence[Any]], List[Any]]] = {
+    TagType.ALPHANUMERICAL: _alphanumerical_column,
+    TagType.TIMESTAMP: _timestamp_column,
+    TagType.TIME: _time_column,
+    TagType.DATE: _date_column,
+    TagType.NUMERICAL_INT: lambda values: _integer_column(values, (_INT64_MIN, _INT64_MAX)),
+    TagType.NUMERICAL_DEC: _numerical_dec_column,
+}
+
+
+def normalize_tag_values(tagtype: TagType, values: Sequence[Any]) -> NormalizedValues:
+    """
+    Convert and validate a column of tag values (e.g. the values of one tagset in a batch).
+
+    The column is first converted as a whole: strings and already encoded integers are checked in one
+    pass, and ISO 8601 temporal strings and NumPy arrays are parsed by NumPy when it is installed. Only if
+    that fails (mixed or invalid values) every value is converted on its own (see encode_tag_value), so
+    that the invalid values are reported per row instead of failing the whole column. JSON values are
+    always converted one by one to their canonical serialization.
+
+    Parameters:
+    - tagtype: TagType of the tagset.
+    - values: Tag values, a list or a NumPy array.
+
+    Returns:
+    - NormalizedValues with the stored representation of each row (None for invalid rows) and the invalid rows
+    """
+    column_encoder = _COLUMN_ENCODERS.get(tagtype)
+    if column_encoder is not None:
+        try:
+            return NormalizedValues(column_encoder(values), [])
+        except (ImportError, TypeError, ValueError, OverflowError):
+            pass
+
+    if hasattr(values, "tolist"):
+        values = values.tolist()
+    encoded: List[Any] = []
+    invalid: List[InvalidValue] = []
+    for row, value in enumerate(values):
+        try:
+            encoded.append(encode_tag_value(tagtype, value))
+        except (TypeError, ValueError, ArithmeticError) as e:
+            encoded.append(None)
+            invalid.append((row, value, f"{type(e).__name__}: {e}"))
+    return NormalizedValues(encoded, invalid)
+
+
+def encode_tag_values(tagtype: TagType, values: Sequence[Any]) -> List[Any]:
+    """
+    Convert a list of tag values to their stored representation (see normalize_tag_values).
+    Raises ValueError if any value is invalid.
+    """
+    normalized = normalize_tag_values(tagtype, values)
+    if normalized.invalid:
+        row, value, error = normalized.invalid[0]
+        raise ValueError(f"Invalid {tagtype.name.lower()} tag value at row {row}: {value!r} ({error})")
+    return normalized.values
+
+
+def _format_invalid(invalid: List[Tuple[str, Any, str]], limit: int = 5) -> str:
+    """
+    Sample of invalid (tagset_name, value, error) tag values for log messages.
+    """
+    sample = "; ".join(f'"{tagset_name}" {value!r}: {error}' for tagset_name, value, error in invalid[:limit])
+    return sample + ("; ..." if len(invalid) > limit else "")
+
+
+def decode_tag_value(tagtype: TagType, value: Any) -> Any:
+    """
+    Convert a stored tag value back to a Python value (date, time and datetime for the temporal types).
+    Values that were not stored in the integer encoding (e.g. by older versions) are returned unchanged.
+    """
+    if not isinstance(value, int):
+        return value
+    if tagtype == TagType.DATE:
+        return date.fromordinal(value + _EPOCH_ORDINAL)
+    if tagtype == TagType.TIME:
+        seconds, microsecond = divmod(value, 1_000_000)
+        minutes, second = divmod(seconds, 60)
+        hour, minute = divmod(minutes, 60)
+        return dt_time(hour, minute, second, microsecond)
+    if tagtype == TagType.TIMESTAMP:
+        return _EPOCH + value * _MICROSECOND
+    return value
+
+
 @dataclass
 class Tags():
     tagset_name: str
@@ -71,6 +429,45 @@ class MediaObject():
         self.group = group
 
 
+# Callbacks notified with the (media_id, tag_id) rows written by add_media_taggings (e.g. in-memory indexes),
+# and with deleted=True with the rows deleted by sync_media_taggings and sync_medias
+TaggingsListener = Callable[..., None]
+_taggings_listeners: List[TaggingsListener] = []
+
+
+def register_taggings_listener(listener: TaggingsListener):
+    """
+    Register a callback that is called with the connection and the (media_id, tag_id) rows
+    after every committed batch of taggings. Rows that already existed may be included.
+    Committed batches of deleted taggings are passed with the keyword argument deleted=True.
+    """
+    if listener not in _taggings_listeners:
+        _taggings_listeners.append(listener)
+
+
+def unregister_taggings_listener(listener: TaggingsListener):
+    if listener in _taggings_listeners:
+        _taggings_listeners.remove(listener)
+
+
+def has_taggings_listeners() -> bool:
+    """
+    Whether any taggings listener is registered, so that callers can skip building the rows otherwise.
+    """
+    return bool(_taggings_listeners)
+
+
+def notify_taggings_listeners(connection: Connection, taggings: List[Tuple[int, int]], deleted: bool = False):
+    for listener in _taggings_listeners:
+        try:
+            if deleted:
+                listener(connection, taggings, deleted=True)
+            else:
+                listener(connection, taggings)
+        except Exception as e:
+            log_error("SDL.notify_taggings_listeners", f"Error in taggings listener {listener}", e)
+
+
 def _sqlite_max_variables(conn: Connection, fallback: int = 999) -> int:
     """
     Returns SQLite's variable limit when available (Python 3.11+), otherwise fallback.
@@ -81,38 +478,103 @@ def _sqlite_max_variables(conn: Connection, fallback: int = 999) -> int:
         return fallback
 
 
-def add_tagsets(connection: Connection, tagsets: List[Tagset], ignore_existing: bool = False):
+# Column type of the value column of each typed tag table (and of the temporary tables staging its values)
+_VALUE_COLUMN_TYPES = {
+    TagType.ALPHANUMERICAL: 'TEXT',
+    TagType.TIMESTAMP: 'TIMESTAMP',
+    TagType.TIME: 'TIME',
+    TagType.DATE: 'DATE',
+    TagType.NUMERICAL_INT: 'INTEGER',
+    TagType.NUMERICAL_DEC: 'DECIMAL(10,5)',
+    TagType.JSON: 'TEXT',
+}
+
+
+def _insert_missing_tags(cursor: Cursor, tagtype: TagType, staged_values: str, params: Iterable[Any] = ()) -> int:
+    """
+    Create the tags (rows in tags and in the typed table) of the staged (tagset_id, value) pairs that do not exist yet.
+
+    The new tags are collected in a temporary table where their ids are assigned explicitly, following the
+    current maximum tag id, then both tables are filled from it with INSERT ... SELECT. Should another writer
+    add tags in between, the insert fails on the primary key instead of assigning wrong ids.
+
+    Parameters:
+    - cursor: sqlite3.Cursor of the connection, the tags are added in its current transaction.
+    - tagtype: TagType of the staged values.
+    - staged_values: SELECT statement returning tagset_id, value columns, values in their stored representation.
+    - params: Parameters of the SELECT statement.
+
+    Returns:
+    - The number of tags created
+    """
+    table = f"{tagtype.name.lower()}_tags"
+    new_tags = f"tmp_new_{tagtype.name.lower()}_tags"
+    cursor.execute(
+        f"""
+        CREATE TEMP TABLE IF NOT EXISTS {new_tags} (
+            id INTEGER PRIMARY KEY,
+            tagset_id INTEGER NOT NULL,
+            value {_VALUE_COLUMN_TYPES[tagtype]} NOT NULL
+        )
+        """
+    )
+    cursor.execute(f"DELETE FROM {new_tags}")
+    max_id = cursor.execute("SELECT COALESCE(MAX(id), 0) FROM tags").fetchone()[0]
+    cursor.execute(
+        f"""
+        INSERT INTO {new_tags} (id, tagset_id, value)
+        SELECT ? + ROW_NUMBER() OVER (ORDER BY s.tagset_id, s.value), s.tagset_id, s.value
+        FROM (SELECT DISTINCT tagset_id, value FROM ({staged_values}) WHERE value IS NOT NULL) s
+        WHERE NOT EXISTS (
+            SELECT 1 FROM {table} t WHERE t.tagset_id = s.tagset_id AND t.value = s.value
+        )
+        """,
+        [max_id, *params]
+    )
+    created = cursor.execute(f"SELECT COUNT(*) FROM {new_tags}").fetchone()[0]
+    if created:
+        cursor.execute(
+            f"INSERT INTO tags (id, tagset_id, tagtype_id) SELECT id, tagset_id, ? FROM {new_tags}",
+            [tagtype.value]
+        )
+        cursor.execute(f"INSERT INTO {table} (id, value, tagset_id) SELECT id, value, tagset_id FROM {new_tags}")
+    return created
+
+
+def add_tagsets(connection: Connection, tagsets: Iterable[Tagset], ignore_existing: bool = False):
     """
     Add tagsets and their associated tags to the database.
     
     Parameters:
     - connection: sqlite3.Connection object to the database.
-    - tagsets: List of Tagset objects to be added.
+    - tagsets: Iterable of Tagset objects to be added (e.g. one batch of a streamed file).
     - ignore_existing: If True, existing tagsets will be ignored.
     """
     cursor = None
     try:
+        tagsets = list(tagsets)
         ignore_existing_clause = "OR IGNORE" if ignore_existing else ""
         cursor = connection.cursor()
         # cursor.execute("BEGIN TRANSACTION")
-        cursor.executemany(
-            f"""
-            INSERT {ignore_existing_clause} INTO tagsets (name, tagtype_id)
-            VALUES (?, ?)
-            """,
-            [(tagset.name, tagset.tagtype.value) for tagset in tagsets]
-        )
+        with stage("SDL.add_tagsets", rows=len(tagsets)):
+            cursor.executemany(
+                f"""
+                INSERT {ignore_existing_clause} INTO tagsets (name, tagtype_id)
+                VALUES (?, ?)
+                """,
+                [(tagset.name, tagset.tagtype.value) for tagset in tagsets]
+            )
 
         # Checkpoint: commit tagsets first to make ingestion resumable.
         # If a later step fails, rerun tag insertion; existing tagsets can be skipped via --ignore-existing.
         connection.commit()
         # cursor.execute("COMMIT")
-        for tagset in tagsets:
-            if len(tagset.tags.tags) > 0:
-                print(f'Adding tags for tagset: {tagset.name}...')
-                add_tags(connection, tagset.tags)
+        tags_batch = [tagset.tags for tagset in tagsets if len(tagset.tags.tags) > 0]
+        if tags_batch:
+            log("SDL.add_tagsets", f"Adding tags for {len(tags_batch)} tagset(s)...", "debug")
+            add_tags_batch(connection, tags_batch)
     except Exception as e:
-        print("(SDL.add_tagsets) Error adding tagsets: ", e)
+        log_error("SDL.add_tagsets", "Error adding tagsets", e)
         # if cursor:
             # cursor.execute("ROLLBACK")
         if connection.in_transaction:
@@ -130,45 +592,91 @@ def add_tags(connection: Connection, tags: Tags):
     - connection: sqlite3.Connection object to the database.
     - tags: Tags object containing the tagset name and list of tag values to be added
     """
+    add_tags_batch(connection, [tags])
+
+
+def add_tags_batch(connection: Connection, tags_batch: Iterable[Tags]):
+    """
+    Add the tags of many tagsets at once (e.g. one batch of a streamed tags file).
+
+    The values of all tagsets are staged per TagType in a temporary table, then the tags that do not exist
+    yet are created with a few set-based statements per TagType (see _insert_missing_tags). Values that
+    already exist, or that encode to the same stored value, are added once. All tags are committed together.
+    Invalid values (see normalize_tag_values) are skipped and reported, the other values are added.
+
+    Parameters:
+    - connection: sqlite3.Connection object to the database.
+    - tags_batch: Iterable of Tags objects, the tagsets must exist.
+    """
+    tags_batch = list(tags_batch)
     cursor = None
     try:
-        cursor = connection.cursor()
-        (tagset_id, tagtype_id) = cursor.execute(
-            "SELECT id, tagtype_id FROM tagsets WHERE name = ?", 
-            [tags.tagset_name]
-        ).fetchone()
+        with stage("SDL.add_tags", tagsets=len(tags_batch)) as tags_stage:
+            cursor = connection.cursor()
+            cursor.execute(
+                """
+                CREATE TEMP TABLE IF NOT EXISTS tmp_tagset_names (
+                    name TEXT PRIMARY KEY
+                ) WITHOUT ROWID
+                """
+            )
+            cursor.execute("DELETE FROM tmp_tagset_names")
+            cursor.executemany(
+                "INSERT OR IGNORE INTO tmp_tagset_names VALUES (?)",
+                ((tags.tagset_name,) for tags in tags_batch)
+            )
+            tagsets = {
+                name: (tagset_id, TagType(tagtype_id))
+                for name, tagset_id, tagtype_id in cursor.execute(
+                    """
+                    SELECT ts.name, ts.id, ts.tagtype_id
+                    FROM tagsets ts
+                    JOIN tmp_tagset_names n ON n.name = ts.name
+                    """
+                )
+            }
+            missing = sorted({tags.tagset_name for tags in tags_batch} - tagsets.keys())
+            if missing:
+                raise ValueError(f"Tagset(s) not found: {', '.join(missing[:10])}{', ...' if len(missing) > 10 else ''}")
 
-        existing = get_tag_id_map_for_tagset_values(connection, tags.tagset_name, tags.tags) or {}
-        existing_values = {v for (_, v) in existing.keys()}
-        new_values = [v for v in tags.tags if v not in existing_values]
+            # Stage the (tagset_id, value) pairs of every TagType, values in their stored representation
+            staged: Dict[TagType, int] = {}
+            invalid: List[Tuple[str, Any, str]] = []
+            for tags in tags_batch:
+                tagset_id, tagtype = tagsets[tags.tagset_name]
+                staged_table = f"tmp_{tagtype.name.lower()}_tag_values_by_tagset"
+                if tagtype not in staged:
+                    cursor.execute(
+                        f"""
+                        CREATE TEMP TABLE IF NOT EXISTS {staged_table} (
+                            tagset_id INTEGER NOT NULL,
+                            value {_VALUE_COLUMN_TYPES[tagtype]}
+                        )
+                        """
+                    )
+                    cursor.execute(f"DELETE FROM {staged_table}")
+                    staged[tagtype] = 0
+                normalized = normalize_tag_values(tagtype, tags.tags)
+                invalid.extend((tags.tagset_name, value, error) for _, value, error in normalized.invalid)
+                cursor.executemany(
+                    f"INSERT INTO {staged_table} (tagset_id, value) VALUES (?, ?)",
+                    zip(repeat(tagset_id), (value for _, value in normalized.valid()))
+                )
+                staged[tagtype] += len(tags.tags) - len(normalized.invalid)
+            if invalid:
+                log("SDL.add_tags", f"{len(invalid)} invalid tag value(s) skipped: {_format_invalid(invalid)}", "warning", invalid=len(invalid))
 
-        # Add to tags to the table and get the id of the last inserted tag
-        cursor.executemany(
-            """
-            INSERT INTO tags (tagset_id, tagtype_id)
-            VALUES (?, ?)
-            """,
-            [[tagset_id, tagtype_id] for _ in range(len(new_values))]
-        ) 
-        res = cursor.execute("SELECT last_insert_rowid()").fetchone()[0]
-
-        # The bulk insert via the transaction ensures that all inserted tag ids are in a sequence
-        tag_ids = list(range(res - len(new_values) + 1, res + 1))
-        print(f"Tagset: {tags.tagset_name}, tag_ids: ({tag_ids[0]}:{tag_ids[-1]})")
-        values = new_values
-        if TagType.get_tagtype_name_by_value(tagtype_id) == TagType.NUMERICAL_DEC.name:
-            values = [Decimal(val) for val in  new_values]
-        # Add tags to their appropriate tagtype table
-        cursor.executemany(
-            f"""
-            INSERT INTO {TagType.get_tagtype_name_by_value(tagtype_id).lower()}_tags (id, value, tagset_id) 
-            VALUES (?, ?, ?)
-            """,
-            [[tag_id, val, tagset_id] for tag_id, val in zip(tag_ids, values)]
-        )
-        connection.commit()
+            created = 0
+            for tagtype in staged:
+                created += _insert_missing_tags(
+                    cursor, tagtype, f"SELECT tagset_id, value FROM tmp_{tagtype.name.lower()}_tag_values_by_tagset"
+                )
+            connection.commit()
+            tags_stage.rows = created
+            tags_stage.fields["values"] = sum(staged.values())
+            tags_stage.fields["invalid"] = len(invalid)
     except Exception as e:
-        print(f"(SDL.add_tags) Error adding tags ({tags.tagset_name}): ", e)
+        log_error("SDL.add_tags", f"Error adding tags ({', '.join(tags.tagset_name for tags in tags_batch[:3])}{', ...' if len(tags_batch) > 3 else ''})", e)
         if connection.in_transaction:
             connection.rollback()
     finally:
@@ -178,87 +686,98 @@ def add_tags(connection: Connection, tags: Tags):
 
 def add_medias(
     connection: Connection,
-    media_objects: List[MediaObject],
-    ignore_existing: bool = False
+    media_objects: Iterable[MediaObject],
+    ignore_existing: bool = False,
+    no_groups: bool = False,
+    defer_missing_leaders: bool = False
 ):
     """
     Add media objects (video, image, etc.) to the database.
+
+    All media objects are inserted with one bulk insert, then the group of every member is resolved
+    with a single staged join (UPDATE ... FROM) against its leader, in the same transaction.
     
     Parameters:
     - connection: sqlite3.Connection object to the database.
-    - media_objects: List of MediaObject objects to be added. 
+    - media_objects: Iterable of MediaObject objects to be added (e.g. one batch of a streamed file).
                      Media objects can optionally belong to a group (e.g. video segments from the same video).
-    - ignore_existing: If True, existing media objects will be ignored.
+                     A group leader must be part of the batch or already exist in the database.
+    - ignore_existing: If True, existing media objects will be ignored (and keep their group).
+    - no_groups: If True, the group fields are ignored and no group resolution is done.
+    - defer_missing_leaders: If True, members of a group whose leader is not added yet (e.g. it comes in a later
+                             batch of the file) are added without a group and recorded in pending_media_groups,
+                             resolve_pending_groups groups them once the leader is added. Otherwise a missing
+                             leader is an error.
     """
     cursor = None
     try:
-        # Groups are essentially a leader-member relationship where objects without a group are potential leaders
-        ignore_existing_clause = "OR IGNORE" if ignore_existing else ""
-        group_medias: Dict[str, List[MediaObject]] = {}
-        leaders: Dict[str, MediaObject] = {}
-        for mo in media_objects:
-            if mo.group is not None and mo.group not in group_medias:
-                group_medias[mo.group] = [mo]
-            elif mo.group is not None:
-                group_medias[mo.group].append(mo)
-        
-        for mo in media_objects:
-            if mo.source in group_medias:
-                leaders[mo.source] = mo
-
-        for grp in group_medias.keys():
-            if grp not in leaders:
-                raise ValueError(f"Group leader media object not found for group: {grp}")
+        media_objects = list(media_objects)
+        with stage("SDL.add_medias", rows=len(media_objects)) as medias_stage:
+            ignore_existing_clause = "OR IGNORE" if ignore_existing else ""
+            cursor = connection.cursor()
+            # Medias inserted by this call get ids above the current maximum
+            max_id = cursor.execute("SELECT COALESCE(MAX(id), 0) FROM medias").fetchone()[0]
+            cursor.executemany(
+                f"""
+                INSERT {ignore_existing_clause} INTO medias (source, source_type, thumbnail_uri)
+                VALUES (?, ?, ?)
+                """,
+                [(mo.source, mo.source_type.value, mo.thumbnail) for mo in media_objects]
+            )
 
-        cursor = connection.cursor()
-        # First add all media objects without groups
-        added = set()
-        for grp_lead in leaders:
-            grp_mo = leaders[grp_lead]
-            group_id = None
-            try:
-                group_id = cursor.execute(
-                    f"""
-                    INSERT INTO medias (source, source_type, thumbnail_uri)
-                    VALUES (?, ?, ?)
-                    RETURNING id
-                    """,
-                    [grp_mo.source, grp_mo.source_type.value, grp_mo.thumbnail]
-                ).fetchone()[0]
-            except Exception as e:
-                print(f"(SDL.add_medias) Error adding group leader media object ({grp_mo.source}): ", e)
-                group_id = cursor.execute("SELECT id FROM medias WHERE source = ?", [grp_mo.source]).fetchone()[0]
-
-            added.add(grp_mo.source)
-
-            # Then add all media objects that belong to this group
-            if grp_mo.source in group_medias:
-                grp_members = []
-                for mo in group_medias[grp_mo.source]:
-                    # Avoid adding a leader again
-                    if mo.source not in added:
-                        grp_members.append([mo.source, mo.source_type.value, mo.thumbnail, group_id])
-                    else:
-                        # Update the group_id of leader media object
-                        cursor.execute(
-                            """
-                            UPDATE medias
-                            SET group_id = ?
-                            WHERE source = ?
-                            """,
-                            [group_id, mo.source]
-                        )
-                cursor.executemany(
-                    f"""
-                    INSERT {ignore_existing_clause} INTO medias (source, source_type, thumbnail_uri, group_id)
-                    VALUES (?, ?, ?, ?)
+            members = [] if no_groups else [(mo.source, mo.group) for mo in media_objects if mo.group is not None]
+            medias_stage.fields["members"] = len(members)
+            if members:
+                # Groups are a leader-member relationship, members reference their leader by source
+                cursor.execute(
+                    """
+                    CREATE TEMP TABLE IF NOT EXISTS tmp_media_groups (
+                        source TEXT PRIMARY KEY,
+                        group_source TEXT NOT NULL
+                    ) WITHOUT ROWID
+                    """
+                )
+                cursor.execute("DELETE FROM tmp_media_groups")
+                cursor.executemany("INSERT OR REPLACE INTO tmp_media_groups VALUES (?, ?)", members)
+
+                if defer_missing_leaders:
+                    medias_stage.fields["pending"] = cursor.execute(
+                        """
+                        INSERT OR REPLACE INTO pending_media_groups (media_id, group_source)
+                        SELECT m.id, g.group_source
+                        FROM tmp_media_groups g
+                        JOIN medias m ON m.source = g.source
+                        LEFT JOIN medias l ON l.source = g.group_source
+                        WHERE l.id IS NULL AND m.id > ?
+                        """,
+                        [max_id]
+                    ).rowcount
+                else:
+                    missing = cursor.execute(
+                        """
+                        SELECT DISTINCT g.group_source
+                        FROM tmp_media_groups g
+                        LEFT JOIN medias l ON l.source = g.group_source
+                        WHERE l.id IS NULL
+                        LIMIT 10
+                        """
+                    ).fetchall()
+                    if missing:
+                        raise ValueError(f"Group leader media object not found for group(s): {', '.join(src for (src,) in missing)}")
+
+                cursor.execute(
+                    """
+                    UPDATE medias
+                    SET group_id = l.id
+                    FROM tmp_media_groups g
+                    JOIN medias l ON l.source = g.group_source
+                    WHERE medias.source = g.source AND medias.id > ?
                     """,
-                    grp_members
+                    [max_id]
                 )
-                added.update([mo[0] for mo in grp_members])
             connection.commit()
     except Exception as e:
-        print("(SDL.add_medias): ", e)
+        log_error("SDL.add_medias", "Error adding media objects", e)
         if connection.in_transaction:
             connection.rollback()
     finally:
@@ -266,8 +785,44 @@ def add_medias(
             cursor.close()
 
 
+def resolve_pending_groups(connection: Connection) -> List[str]:
+    """
+    Group the members added before their group leader (see add_medias with defer_missing_leaders),
+    e.g. after the last batch of a streamed file.
+
+    Parameters:
+    - connection: sqlite3.Connection object to the database.
+
+    Returns:
+    - Sources of the group leaders that are still missing, their members stay pending
+    """
+    try:
+        with stage("SDL.resolve_pending_groups") as resolve_stage:
+            resolve_stage.rows = connection.execute(
+                """
+                UPDATE medias
+                SET group_id = leader.id
+                FROM pending_media_groups pending JOIN medias leader ON leader.source = pending.group_source
+                WHERE medias.id = pending.media_id
+                """
+            ).rowcount
+            connection.execute(
+                "DELETE FROM pending_media_groups WHERE group_source IN (SELECT source FROM medias)"
+            )
+            missing = [
+                source for (source,) in connection.execute(
+                    "SELECT DISTINCT group_source FROM pending_media_groups ORDER BY group_source"
+                )
+            ]
+            connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    return missing
+
+
 def get_tag_id_map_for_tagset_values(
-    connection: Connection, tagset_name: str, tag_values: List[Any]
+    connection: Connection, tagset_name: str, tag_values: List[Any], register_missing: bool = False
 ) -> dict[Tuple[str, Any], int]:
     """
     Get a mapping of (tagset_name, tag_value) to tag_id for a given tagset and list of tag values.
@@ -276,10 +831,13 @@ def get_tag_id_map_for_tagset_values(
     - connection: sqlite3.Connection object to the database.
     - tagset_name: Name of the tagset for which to retrieve tag ids.
     - tag_values: List of tag values for which to retrieve tag ids.
+    - register_missing: If True, tag values that are not found are added to the tagset (in the current
+                        transaction, which is left open), errors are raised instead of logged.
     
     Returns:
     - A dictionary mapping (tagset_name, tag_value) to tag_id for the specified tagset and tag values
     - If a tag value is not found for the given tagset, it will be skipped
+    - Invalid tag values (see normalize_tag_values) are reported and skipped
     """
     try:
         # Get tagset id and tagtype id for the given tagset name
@@ -293,37 +851,38 @@ def get_tag_id_map_for_tagset_values(
         ).fetchone()
 
         if res is None:
-            print(f'"{tagset_name}" tagset not found, skipping...')
+            log("SDL.get_tag_id_map_for_tagset_values", f'"{tagset_name}" tagset not found, skipping...', "warning")
             return {}
 
         tagset_id, tagtype_id = res
 
-        attr = 'TEXT'
         tagtype = TagType.get_tagtype_name_by_value(tagtype_id)
-        if  tagtype == TagType.DATE.name:
-            attr = 'DATE'
-        elif  tagtype == TagType.TIME.name:
-            attr = 'TIME'
-        elif  tagtype == TagType.TIMESTAMP.name:
-            attr = 'TIMESTAMP'
-        elif  tagtype == TagType.NUMERICAL_INT.name:
-            attr = 'INTEGER'
-        elif  tagtype == TagType.NUMERICAL_DEC.name:
-            print(f'Converting to Decimal for {tagset_name} ({tagset_id})')
-            tag_values = [Decimal(val) for val in tag_values]
-            attr = 'DECIMAL(10,5)'
+        attr = _VALUE_COLUMN_TYPES[TagType[tagtype]]
+
+        # Values are looked up in their stored representation (e.g. dates as integers), invalid values are skipped
+        normalized = normalize_tag_values(TagType[tagtype], tag_values)
+        if normalized.invalid:
+            invalid = [(tagset_name, value, error) for _, value, error in normalized.invalid]
+            log(
+                "SDL.get_tag_id_map_for_tagset_values",
+                f"{len(invalid)} invalid tag value(s) skipped: {_format_invalid(invalid)}",
+                "warning",
+                invalid=len(invalid)
+            )
 
         table = f"{tagtype.lower()}_tags" 
         tmp_table = f"tmp_{tagtype.lower()}_tag_values"
 
         cur = connection.cursor()
         try:
-            # Create a temporary table to hold the tag values for efficient querying
+            # Create a temporary table to hold the tag values for efficient querying.
+            # pos refers back to the given tag value, as different inputs can share one stored value.
             cur.execute(
                 f"""
                 CREATE TEMP TABLE IF NOT EXISTS {tmp_table} (
-                    value {attr} PRIMARY KEY
-                ) WITHOUT ROWID
+                    pos INTEGER PRIMARY KEY,
+                    value {attr}
+                )
                 """
             )
 
@@ -332,41 +891,158 @@ def get_tag_id_map_for_tagset_values(
 
             # Bulk insert tag values into the temporary table
             cur.executemany(
-                f"INSERT OR IGNORE INTO {tmp_table} VALUES (?)",
-                ((v,) for v in tag_values)
+                f"INSERT INTO {tmp_table} (pos, value) VALUES (?, ?)",
+                normalized.valid()
             )
 
+            if register_missing:
+                created = _insert_missing_tags(cur, TagType[tagtype], f"SELECT ? AS tagset_id, value FROM {tmp_table}", [tagset_id])
+                if created:
+                    log("SDL.get_tag_id_map_for_tagset_values", f'Registered {created} new tag(s) in "{tagset_name}" tagset', "debug", created=created)
+
             # Query to get tag ids for the given tagset and tag values by joining with the temporary table
             found_tags = cur.execute(
                 f"""
-                SELECT ttg.id, ttg.value
-                FROM {table} ttg 
-                JOIN {tmp_table} tv ON tv.value = ttg.value
-                WHERE ttg.tagset_id = ?
+                SELECT ttg.id, tv.pos
+                FROM {tmp_table} tv
+                JOIN {table} ttg ON ttg.value = tv.value AND ttg.tagset_id = ?
                 """,
                 [tagset_id]
             ).fetchall()
 
             if found_tags:
-                return {(tagset_name, value): tag_id for tag_id, value in found_tags}
+                return {(tagset_name, tag_values[pos]): tag_id for tag_id, pos in found_tags}
 
-            print(f'No tag(s) found for "{tagset_name}" tagset, skipping...')
+            log("SDL.get_tag_id_map_for_tagset_values", f'No tag(s) found for "{tagset_name}" tagset, skipping...', "debug")
             return {}
 
         finally:
             cur.close()
 
     except Exception as e:
-        print(f"(SDL.get_tag_id_map_for_tagset_values) {tagset_name} ({len(tag_values)}):", e)
+        log_error("SDL.get_tag_id_map_for_tagset_values", f"{tagset_name} ({len(tag_values)})", e)
+        if register_missing:
+            raise
 
 
-def add_media_taggings(connection: Connection, media_tag_mappings: List[dict]):
+def get_media_id_map_for_sources(connection: Connection, sources: Iterable[str]) -> Dict[str, int]:
+    """
+    Get a mapping of media source to media id for a list of media sources.
+
+    Parameters:
+    - connection: sqlite3.Connection object to the database.
+    - sources: Iterable of media sources for which to retrieve media ids.
+
+    Returns:
+    - A dictionary mapping media source to media id
+    - Sources without a media are left out of the mapping
+    """
+    cur = connection.cursor()
+    try:
+        # Stage the sources in a temporary table and resolve them with a single join
+        cur.execute(
+            """
+            CREATE TEMP TABLE IF NOT EXISTS tmp_media_sources (
+                source TEXT PRIMARY KEY
+            ) WITHOUT ROWID
+            """
+        )
+        cur.execute("DELETE FROM tmp_media_sources")
+        cur.executemany(
+            "INSERT OR IGNORE INTO tmp_media_sources VALUES (?)",
+            ((src,) for src in sources)
+        )
+        return dict(
+            cur.execute(
+                """
+                SELECT m.source, m.id
+                FROM medias m
+                JOIN tmp_media_sources ms ON ms.source = m.source
+                """
+            ).fetchall()
+        )
+    finally:
+        cur.close()
+
+
+def resolve_media_taggings(
+    connection: Connection, media_tag_mappings: List[dict], register_missing_tags: bool = False
+) -> List[Tuple[int, int]]:
+    """
+    Resolve media taggings to (media_id, tag_id) pairs that are ready to be inserted.
+    Media sources and tag values that are not found in the database are skipped.
+
+    Parameters:
+    - connection: sqlite3.Connection (read access is sufficient, unless register_missing_tags is set)
+    - media_tag_mappings: List of media tagging dictionaries (see add_media_taggings)
+    - register_missing_tags: If True, tag values that are not found are added to their tagset in the
+                             current transaction (see get_tag_id_map_for_tagset_values).
+
+    Returns:
+    - List of (media_id, tag_id) tuples
+    """
+    tagset_to_values = {}
+
+    # Step 1: Resolve media sources and group tagset names and values
+    with stage("SDL.resolve_media_taggings.media_sources", "debug", batch_size=len(media_tag_mappings)) as resolve_stage:
+        media_source_to_id = get_media_id_map_for_sources(
+            connection, (mapping['media_source'] for mapping in media_tag_mappings)
+        )
+        resolve_stage.rows = len(media_source_to_id)
+    unresolved = {
+        mapping['media_source'] for mapping in media_tag_mappings
+        if mapping['media_source'] not in media_source_to_id
+    }
+    if unresolved:
+        sample = ", ".join(sorted(unresolved)[:10])
+        log(
+            "SDL.resolve_media_taggings",
+            f"{len(unresolved)} media source(s) not found, skipping: {sample}{', ...' if len(unresolved) > 10 else ''}",
+            "warning",
+            unresolved=len(unresolved)
+        )
+
+    for mapping in media_tag_mappings:
+        for tagset_name, tag_values in mapping['tagsets'].items():
+            if tagset_name not in tagset_to_values:
+                tagset_to_values[tagset_name] = set()
+            tagset_to_values[tagset_name].update(map(tag_value_key, tag_values))
+
+    # Step 2: Get tag ids for each tagset and its values
+    with stage("SDL.resolve_media_taggings.tag_values", "debug", tagsets=len(tagset_to_values)) as resolve_stage:
+        tag_mapping = {}
+        for tagset_name, tag_values in tagset_to_values.items():
+            tag_ids = get_tag_id_map_for_tagset_values(connection, tagset_name, list(tag_values), register_missing_tags)
+            tag_mapping.update(tag_ids or {})
+        resolve_stage.rows = len(tag_mapping)
+
+    # Step 3: Create list of taggings
+    with stage("SDL.resolve_media_taggings.taggings", "debug") as resolve_stage:
+        taggings = []
+        for mapping in media_tag_mappings:
+            media_id = media_source_to_id.get(mapping['media_source'])
+            if media_id is None:
+                continue
+            for tagset_name, tag_values in mapping['tagsets'].items():
+                for tag_value in tag_values:
+                    tag_id = tag_mapping.get((tagset_name, tag_value_key(tag_value)))
+                    if tag_id:
+                        taggings.append((media_id, tag_id))
+        resolve_stage.rows = len(taggings)
+    return taggings
+
+
+def add_media_taggings(connection: Connection, media_tag_mappings: Iterable[dict], register_missing_tags: bool = False):
     """
     Add taggings between media and tags in bulk.
 
+    By default tag values must already exist in their tagset (tagsets and tags are loaded first). With
+    register_missing_tags, missing tag values are created in the same pass and committed together with
+    the taggings. Tagsets must exist in both cases.
+
     Parameters:
     - connection: sqlite3.Connection
-    - media_tag_mappings: List of dictionaries with the following structure:
+    - media_tag_mappings: Iterable (e.g. one batch of a streamed file) of dictionaries with the following structure:
         {
             'media_source': str,
             'tagsets': {
@@ -375,64 +1051,31 @@ def add_media_taggings(connection: Connection, media_tag_mappings: List[dict]):
                 ...
             }
         }
+    - register_missing_tags: If True, tag values that are not found are added to their tagset.
     """
     cursor = None
     try:
-        cursor = connection.cursor()
-        tagset_to_values = {}
-        media_source_to_id = {}
+        media_tag_mappings = list(media_tag_mappings)
+        with stage("SDL.add_media_taggings", batch_size=len(media_tag_mappings)) as taggings_stage:
+            # The mappings are traversed twice (Step 1 and Step 3)
+            taggings = resolve_media_taggings(connection, media_tag_mappings, register_missing_tags)
+            taggings_stage.rows = len(taggings)
 
-        # Step 1: Group tagset names and values
-        print("(SDL.add_media_taggings): Step 1)")
-        for mapping in media_tag_mappings:
-            media_source = mapping['media_source']
-            if media_source not in media_source_to_id:
-                media_id = cursor.execute(
+            cursor = connection.cursor()
+            with stage("SDL.add_media_taggings.insert", "debug", rows=len(taggings)):
+                cursor.executemany(
                     """
-                    SELECT id 
-                    FROM medias 
-                    WHERE source = ?
+                    INSERT OR IGNORE INTO taggings (media_id, tag_id)
+                    VALUES (?, ?)
                     """,
-                    [media_source]
-                ).fetchone()[0]
-                media_source_to_id[media_source] = media_id
-
-            for tagset_name, tag_values in mapping['tagsets'].items():
-                if tagset_name not in tagset_to_values:
-                    tagset_to_values[tagset_name] = set()
-                tagset_to_values[tagset_name].update(tag_values)
-
-        # Step 2: Get tag ids for each tagset and its values
-        # NOTE: Potential for concurrency here if needed
-        print("(SDL.add_media_taggings): Step 2)")
-        tag_mapping = {}
-        for tagset_name, tag_values in tagset_to_values.items():
-            tag_ids = get_tag_id_map_for_tagset_values(connection, tagset_name, list(tag_values))
-            tag_mapping.update(tag_ids)
-
-        # Step 3: Create list of taggings and bulk insert
-        print("(SDL.add_media_taggings): Step 3)")
-        taggings = []
-        for mapping in media_tag_mappings:
-            media_id = media_source_to_id[mapping['media_source']]
-            for tagset_name, tag_values in mapping['tagsets'].items():
-                for tag_value in tag_values:
-                    tag_id = tag_mapping.get((tagset_name, tag_value))
-                    if tag_id:
-                        taggings.append((media_id, tag_id))
-
-        cursor.executemany(
-            """
-            INSERT OR IGNORE INTO taggings (media_id, tag_id)
-            VALUES (?, ?)
-            """,
-            taggings
-        )
-        connection.commit()
+                    taggings
+                )
+                connection.commit()
+            notify_taggings_listeners(connection, taggings)
     except Exception as e:
-        print("(SDL.add_media_taggings): ", e)
+        log_error("SDL.add_media_taggings", "Error adding media taggings", e)
         if connection.in_transaction:
             connection.rollback()
     finally:
         if cursor:
-            cursor.close()
\ No newline at end of file
+            cursor.close()
@@ -1,4 +1,41 @@
 from .SimpleM3DataLoader import (
     Tagset, Tags, TagType, MediaObject, MediaSourceType,
-    add_tagsets, add_tags, add_medias, add_medias, add_media_taggings
-)
\ No newline at end of file
+    encode_tag_value, encode_tag_values, decode_tag_value, canonical_json, tag_value_key,
+    InvalidValue, NormalizedValues, normalize_tag_values,
+    add_tagsets, add_tags, add_tags_batch, add_medias, add_media_taggings, resolve_media_taggings, resolve_pending_groups,
+    get_tag_id_map_for_tagset_values, get_media_id_map_for_sources,
+    register_taggings_listener, unregister_taggings_listener, has_taggings_listeners
+)
+from .instrumentation import (
+    Event, Sink, PrintSink, LoggingSink, JsonLinesSink, StageTotals, print_sink,
+    add_sink, remove_sink, set_sinks, emit, log, log_error, stage, trace_statements
+)
+from .streaming import iter_json_records, iter_json_batches, iter_raw_json_batches
+from .bulk import (
+    BulkLoadConnection, bulk_load_session, drop_secondary_indexes, drop_maintenance_triggers, create_schema_objects
+)
+from .pipeline import add_media_taggings_parallel
+from .query import Filter, OPERATORS, get_tagset, encode_filter_value, json_path_expression, build_query, query
+from .bitmap import Bitmap, BitmapIndex
+from .facets import facet_counts, rebuild_tag_counts
+from .schema import upgrade_schema
+from .checkpoint import (
+    FailedRecord, IngestManifest, chunk_digest, load_checkpointed, add_media_taggings_parallel_checkpointed
+)
+from .arrays import add_taggings_from_arrays, add_taggings_from_csr
+from .snapshot import export_snapshot, Snapshot, StringColumn
+from .benchmark import generate_collection, representative_queries, run_benchmark
+from .result_cache import ResultCache, normalize_query
+from .service import ConnectionPool, QueryService, enable_wal, make_server, serve, sample_requests, load_test
+from .shards import (
+    ShardedDatabase, init_shards, replicate_tags, add_medias_sharded, add_media_taggings_sharded,
+    connect_federated, shard_count, shard_of, global_media_id, split_media_id
+)
+from .sync import sync_medias, sync_media_taggings
+from .search import enable_text_search, disable_text_search, rebuild_text_search, search_text
+from .json_paths import add_json_path_indexes, drop_json_path_indexes, get_json_path_indexes
+from .intervals import enable_interval_index, rebuild_interval_index, query_intervals, nearest_intervals
+from .media_cache import (
+    MediaRecord, enable_media_tag_cache, attach_media_tag_cache, detach_media_tag_cache,
+    rebuild_media_tag_cache, refresh_media_tag_cache, get_media_records
+)
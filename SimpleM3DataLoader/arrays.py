@@ -0,0 +1,150 @@
+from itertools import repeat
+from sqlite3 import Connection
+from typing import Any, List, Optional, Sequence
+
+from .SimpleM3DataLoader import (
+    get_media_id_map_for_sources, get_tag_id_map_for_tagset_values, has_taggings_listeners, notify_taggings_listeners,
+    tag_value_key
+)
+from .instrumentation import log, log_error, stage
+
+
+def _to_list(values: Sequence[Any]) -> List[Any]:
+    """
+    Plain Python values of a list, array.array or NumPy array (NumPy scalars cannot be bound by sqlite3).
+    """
+    if hasattr(values, "tolist"):
+        return values.tolist()
+    return list(values)
+
+
+def _resolve_media(connection: Connection, media: List[Any]) -> List[Optional[int]]:
+    if not media or not isinstance(media[0], str):
+        return media
+    source_to_id = get_media_id_map_for_sources(connection, set(media))
+    return [source_to_id.get(source) for source in media]
+
+
+def _resolve_tags(connection: Connection, tags: List[Any], tagset: Optional[str]) -> List[Optional[int]]:
+    if tagset is None:
+        return tags
+    keys = [tag_value_key(value) for value in tags]
+    value_to_id = {
+        value: tag_id
+        for (_, value), tag_id in (get_tag_id_map_for_tagset_values(connection, tagset, list(set(keys))) or {}).items()
+    }
+    return [value_to_id.get(key) for key in keys]
+
+
+def add_taggings_from_arrays(
+    connection: Connection,
+    media: Sequence[Any],
+    tags: Sequence[Any],
+    tagset: Optional[str] = None,
+    chunk_size: int = 1_000_000
+) -> int:
+    """
+    Add taggings given as two parallel arrays, without building per media dictionaries.
+
+    Each chunk is resolved on its distinct values only (one staged join for the media sources, one for
+    the tag values) and inserted with a single executemany over the two arrays.
+
+    Parameters:
+    - connection: sqlite3.Connection object to the database.
+    - media: Media ids (integers) or media sources (strings), one per tagging. Lists, array.array or NumPy arrays.
+    - tags: Tag ids, or tag values of the given tagset, one per tagging.
+    - tagset: Name of the tagset the tag values belong to, None if tags are tag ids.
+    - chunk_size: Number of taggings resolved and inserted per transaction.
+
+    Returns:
+    - The number of taggings inserted (rows with an unknown media source or tag value are skipped,
+      media and tag ids are not checked beyond the foreign keys)
+    """
+    if len(media) != len(tags):
+        raise ValueError(f"media and tags must have the same length ({len(media)} != {len(tags)})")
+
+    total = 0
+    for start in range(0, len(media), chunk_size):
+        cursor = None
+        try:
+            with stage("SDL.add_taggings_from_arrays", batch_size=min(chunk_size, len(media) - start)) as arrays_stage:
+                media_ids = _resolve_media(connection, _to_list(media[start:start + chunk_size]))
+                tag_ids = _resolve_tags(connection, _to_list(tags[start:start + chunk_size]), tagset)
+
+                if None in media_ids or None in tag_ids:
+                    rows = [(m, t) for m, t in zip(media_ids, tag_ids) if m is not None and t is not None]
+                    log(
+                        "SDL.add_taggings_from_arrays",
+                        f"{len(media_ids) - len(rows)} tagging(s) with an unknown media source or tag value, skipping",
+                        "warning",
+                        skipped=len(media_ids) - len(rows)
+                    )
+                    media_ids = [m for m, _ in rows]
+                    tag_ids = [t for _, t in rows]
+
+                cursor = connection.cursor()
+                cursor.executemany(
+                    """
+                    INSERT OR IGNORE INTO taggings (media_id, tag_id)
+                    VALUES (?, ?)
+                    """,
+                    zip(media_ids, tag_ids)
+                )
+                connection.commit()
+                arrays_stage.rows = len(media_ids)
+            total += len(media_ids)
+            if has_taggings_listeners():
+                notify_taggings_listeners(connection, list(zip(media_ids, tag_ids)))
+        except Exception as e:
+            log_error("SDL.add_taggings_from_arrays", "Error adding taggings", e)
+            if connection.in_transaction:
+                connection.rollback()
+        finally:
+            if cursor:
+                cursor.close()
+    return total
+
+
+def add_taggings_from_csr(
+    connection: Connection,
+    indptr: Sequence[int],
+    indices: Sequence[Any],
+    media: Optional[Sequence[Any]] = None,
+    tagset: Optional[str] = None,
+    chunk_size: int = 1_000_000
+) -> int:
+    """
+    Add taggings given as a CSR matrix: the tags of row i are indices[indptr[i]:indptr[i + 1]].
+
+    Parameters:
+    - connection: sqlite3.Connection object to the database.
+    - indptr: Row offsets (number of rows + 1), e.g. scipy.sparse.csr_matrix.indptr or a Snapshot's taggings.
+    - indices: Tag ids, or tag values of the given tagset.
+    - media: Media id or source of each row, None if the row number is the media id (as in a Snapshot).
+    - tagset: Name of the tagset the tag values belong to, None if indices are tag ids.
+    - chunk_size: Approximate number of taggings resolved and inserted per transaction.
+
+    Returns:
+    - The number of taggings inserted (see add_taggings_from_arrays)
+    """
+    indptr = _to_list(indptr)
+    rows = len(indptr) - 1
+    if media is not None and len(media) != rows:
+        raise ValueError(f"media must have one entry per row ({len(media)} != {rows})")
+    row_media = range(rows) if media is None else _to_list(media)
+
+    total = 0
+    row = 0
+    while row < rows:
+        # Rows are expanded to one media entry per tagging, chunk by chunk
+        end = row + 1
+        while end < rows and indptr[end + 1] - indptr[row] <= chunk_size:
+            end += 1
+        chunk_media: List[Any] = []
+        for i in range(row, end):
+            chunk_media.extend(repeat(row_media[i], indptr[i + 1] - indptr[i]))
+        total += add_taggings_from_arrays(
+            connection, chunk_media, indices[indptr[row]:indptr[end]], tagset, max(len(chunk_media), 1)
+        )
+        row = end
+    return total
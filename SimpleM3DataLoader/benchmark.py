@@ -0,0 +1,325 @@
+import json
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from .SimpleM3DataLoader import (
+    MediaObject, MediaSourceType, Tags, Tagset, TagType,
+    add_media_taggings, add_medias, add_tags_batch, add_tagsets
+)
+from .facets import facet_counts
+from .instrumentation import log, stage
+from .pipeline import add_media_taggings_parallel
+from .query import query
+from .streaming import iter_json_batches, iter_raw_json_batches
+
+
+# Files of a generated collection, all JSON Lines so that they can be streamed by the loaders
+COLLECTION_FILE = "collection.json"
+TAGSETS_FILE = "tagsets.jsonl"
+TAGS_FILE = "tags.jsonl"
+MEDIAS_FILE = "medias.jsonl"
+TAGGINGS_FILE = "taggings.jsonl"
+# Number of tags records (tagsets) added per call
+TAGS_BATCH_SIZE = 1000
+
+_WORDS = [
+    "car", "tree", "person", "dog", "cat", "bicycle", "boat", "mountain", "beach", "city",
+    "road", "sky", "building", "bird", "horse", "train", "flower", "snow", "river", "bridge"
+]
+
+
+def _tag_value(tagtype: TagType, i: int) -> Any:
+    """
+    The i-th value of a synthetic tagset, unique per tagset.
+    """
+    if tagtype == TagType.ALPHANUMERICAL:
+        return f"{_WORDS[i % len(_WORDS)]} {i}"
+    if tagtype == TagType.NUMERICAL_INT:
+        return i * 10
+    if tagtype == TagType.NUMERICAL_DEC:
+        return f"{i / 4:.2f}"
+    if tagtype == TagType.DATE:
+        return (date(2000, 1, 1) + timedelta(days=i)).isoformat()
+    if tagtype == TagType.TIME:
+        microseconds = (i * 1_000_003) % 86_400_000_000
+        return (datetime(2000, 1, 1) + timedelta(microseconds=microseconds)).time().isoformat()
+    if tagtype == TagType.TIMESTAMP:
+        return (datetime(2020, 1, 1) + timedelta(seconds=i * 37)).isoformat()
+    return json.dumps({"id": i, "label": _WORDS[i % len(_WORDS)]})
+
+
+def _write_jsonl(path: Path, records) -> int:
+    count = 0
+    with open(path, "w") as f:
+        for record in records:
+            f.write(json.dumps(record))
+            f.write("\n")
+            count += 1
+    return count
+
+
+def generate_collection(
+    out_dir: Path,
+    medias: int = 100_000,
+    group_size: int = 100,
+    tagsets: int = 70,
+    tags_per_tagset: int = 1000,
+    taggings_per_media: int = 10,
+    seed: int = 0
+) -> dict:
+    """
+    Generate a synthetic M3 collection as JSON Lines files (see COLLECTION_FILE for the description).
+
+    The medias are videos, each followed by group_size keyframe images grouped under it. The tagsets cycle
+    through all tag types, and both the tagsets of a media and the tags within a tagset follow a skewed
+    (Zipf-like) distribution, so that a few tags are very frequent and most are rare.
+
+    Parameters:
+    - out_dir: Directory the files are written to.
+    - medias: Number of medias.
+    - group_size: Number of keyframes per video.
+    - tagsets: Number of tagsets.
+    - tags_per_tagset: Number of tags per tagset.
+    - taggings_per_media: Average number of taggings per media.
+    - seed: Random seed, the same parameters and seed generate the same collection.
+
+    Returns:
+    - The collection description, also written to COLLECTION_FILE
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(seed)
+
+    tagtypes = list(TagType)
+    tagset_list = [
+        {"name": f"{tagtypes[i % len(tagtypes)].name.title()} {i // len(tagtypes)}", "tagtype": tagtypes[i % len(tagtypes)].name.lower()}
+        for i in range(tagsets)
+    ]
+
+    _write_jsonl(out_dir / TAGSETS_FILE, ({**ts, "tags": []} for ts in tagset_list))
+    _write_jsonl(
+        out_dir / TAGS_FILE,
+        (
+            {"tagset_name": ts["name"], "tags": [_tag_value(TagType[ts["tagtype"].upper()], i) for i in range(tags_per_tagset)]}
+            for ts in tagset_list
+        )
+    )
+
+    def media_sources():
+        i = 0
+        while i < medias:
+            video = f"video_{i}.mp4"
+            yield {"source": video, "source_type": "video", "thumbnail": f"video_{i}.jpg", "group": None}
+            i += 1
+            for k in range(min(group_size, medias - i)):
+                yield {"source": f"video_{i - 1}_keyframe_{k}.jpg", "source_type": "image", "thumbnail": None, "group": video}
+                i += 1
+
+    _write_jsonl(out_dir / MEDIAS_FILE, media_sources())
+
+    # Cumulative Zipf weights over the tagsets
+    cum_weights = []
+    total = 0.0
+    for rank in range(tagsets):
+        total += 1 / (rank + 1)
+        cum_weights.append(total)
+
+    def media_taggings():
+        for media in media_sources():
+            count = rng.randint(1, 2 * taggings_per_media - 1) if taggings_per_media > 1 else taggings_per_media
+            tagset_values: Dict[int, set] = {}
+            for tagset_index in rng.choices(range(tagsets), cum_weights=cum_weights, k=count):
+                tagset_values.setdefault(tagset_index, set()).add(int(tags_per_tagset * rng.random() ** 3))
+            yield {
+                "media_source": media["source"],
+                "tagsets": {
+                    tagset_list[tagset_index]["name"]: [
+                        _tag_value(TagType[tagset_list[tagset_index]["tagtype"].upper()], i) for i in sorted(values)
+                    ]
+                    for tagset_index, values in tagset_values.items()
+                }
+            }
+
+    taggings = 0
+    with open(out_dir / TAGGINGS_FILE, "w") as f:
+        for record in media_taggings():
+            taggings += sum(len(values) for values in record["tagsets"].values())
+            f.write(json.dumps(record))
+            f.write("\n")
+
+    collection = {
+        "parameters": {
+            "medias": medias,
+            "group_size": group_size,
+            "tagsets": tagsets,
+            "tags_per_tagset": tags_per_tagset,
+            "taggings_per_media": taggings_per_media,
+            "seed": seed
+        },
+        "taggings": taggings,
+        "tagsets": tagset_list
+    }
+    with open(out_dir / COLLECTION_FILE, "w") as f:
+        json.dump(collection, f, indent=2)
+    return collection
+
+
+def _time_query(name: str, run: Callable[[], int], repeat: int) -> dict:
+    timings = []
+    results = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = run()
+        timings.append(time.perf_counter() - start)
+    log("SDL.benchmark", f"query {name}: {results} results, median {statistics.median(timings) * 1000:.2f}ms")
+    return {"name": name, "results": results, "min_seconds": min(timings), "median_seconds": statistics.median(timings)}
+
+
+def _first_tagset(collection: dict, tagtype: TagType) -> Optional[str]:
+    for tagset in collection["tagsets"]:
+        if tagset["tagtype"] == tagtype.name.lower():
+            return tagset["name"]
+    return None
+
+
+def representative_queries(collection: dict) -> Dict[str, Callable[[sqlite3.Connection], int]]:
+    """
+    Queries over a generated collection: a frequent equality filter, a date range, their conjunction,
+    an 'in' list, and facet counts over the whole collection and over a query result.
+    Each query returns its number of results.
+    """
+    tags_per_tagset = collection["parameters"]["tags_per_tagset"]
+    text = _first_tagset(collection, TagType.ALPHANUMERICAL)
+    day = _first_tagset(collection, TagType.DATE)
+    number = _first_tagset(collection, TagType.NUMERICAL_INT)
+    queries: Dict[str, Callable[[sqlite3.Connection], int]] = {}
+
+    if text:
+        equality = (text, "=", _tag_value(TagType.ALPHANUMERICAL, 0))
+        queries["equality"] = lambda c: sum(1 for _ in query(c, [equality]))
+        queries["facets_of_equality"] = lambda c: sum(
+            len(counts) for counts in facet_counts(c, query(c, [equality])).values()
+        )
+    if day:
+        date_range = (day, "between", (_tag_value(TagType.DATE, 0), _tag_value(TagType.DATE, tags_per_tagset // 10)))
+        queries["date_range"] = lambda c: sum(1 for _ in query(c, [date_range]))
+        if text:
+            queries["equality_and_date_range"] = lambda c: sum(1 for _ in query(c, [equality, date_range]))
+    if number:
+        in_list = (number, "in", [_tag_value(TagType.NUMERICAL_INT, i) for i in range(0, tags_per_tagset, max(tags_per_tagset // 20, 1))])
+        queries["in_list"] = lambda c: sum(1 for _ in query(c, [in_list], source_type=MediaSourceType.IMAGE))
+    queries["facets_global"] = lambda c: sum(len(counts) for counts in facet_counts(c).values())
+    return queries
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True, cwd=Path(__file__).parent
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def run_benchmark(
+    data_dir: Path,
+    db_file: Path,
+    ddl_file: Path,
+    results_file: Optional[Path] = None,
+    batch_size: int = 10_000,
+    workers: int = 1,
+    repeat: int = 5
+) -> dict:
+    """
+    Load a generated collection (see generate_collection) into a new database and time every ingestion stage
+    (add_tagsets, add_tags, add_medias, add_media_taggings) and the representative queries.
+
+    Parameters:
+    - data_dir: Directory of the generated collection.
+    - db_file: Path of the database to create, an existing file is replaced.
+    - ddl_file: Path to the DDL script.
+    - results_file: Optional path the results are written to as JSON.
+    - batch_size: Number of records parsed and inserted per batch.
+    - workers: Number of worker processes for the media taggings (see add_media_taggings_parallel).
+    - repeat: Number of runs per query.
+
+    Returns:
+    - The results: environment, collection parameters, per stage rows/seconds/rows_per_sec and per query
+      result count and min/median seconds
+    """
+    data_dir, db_file = Path(data_dir), Path(db_file)
+    with open(data_dir / COLLECTION_FILE) as f:
+        collection = json.load(f)
+
+    for suffix in ("", "-wal", "-shm"):
+        Path(f"{db_file}{suffix}").unlink(missing_ok=True)
+
+    stages = {}
+    with sqlite3.connect(db_file, autocommit=False) as connection:
+        connection.execute("PRAGMA foreign_keys = ON")
+        with open(ddl_file) as f:
+            connection.executescript(f.read())
+        connection.commit()
+
+        with stage("SDL.benchmark.add_tagsets") as timed, open(data_dir / TAGSETS_FILE) as f:
+            for batch in iter_json_batches(f, batch_size):
+                add_tagsets(connection, [
+                    Tagset(ts["name"], TagType[ts["tagtype"].upper()], Tags(ts["name"], ts["tags"])) for ts in batch
+                ])
+                timed.rows += len(batch)
+        stages["add_tagsets"] = timed.as_dict()
+
+        with stage("SDL.benchmark.add_tags") as timed, open(data_dir / TAGS_FILE) as f:
+            for batch in iter_json_batches(f, TAGS_BATCH_SIZE):
+                add_tags_batch(connection, [Tags(tg["tagset_name"], tg["tags"]) for tg in batch])
+                timed.rows += sum(len(tg["tags"]) for tg in batch)
+        stages["add_tags"] = timed.as_dict()
+
+        with stage("SDL.benchmark.add_medias") as timed, open(data_dir / MEDIAS_FILE) as f:
+            for batch in iter_json_batches(f, batch_size):
+                add_medias(connection, [
+                    MediaObject(mo["source"], MediaSourceType[mo["source_type"].upper()], mo.get("thumbnail"), mo.get("group"))
+                    for mo in batch
+                ])
+                timed.rows += len(batch)
+        stages["add_medias"] = timed.as_dict()
+
+        with stage("SDL.benchmark.add_media_taggings", workers=workers) as timed, open(data_dir / TAGGINGS_FILE) as f:
+            if workers > 1:
+                add_media_taggings_parallel(db_file, iter_raw_json_batches(f, batch_size), workers)
+            else:
+                for batch in iter_json_batches(f, batch_size):
+                    add_media_taggings(connection, batch)
+            timed.rows = connection.execute("SELECT COUNT(*) FROM taggings").fetchone()[0]
+        stages["add_media_taggings"] = timed.as_dict()
+
+        queries = [
+            _time_query(name, lambda: run(connection), repeat)
+            for name, run in representative_queries(collection).items()
+        ]
+
+    results = {
+        "environment": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform()
+        },
+        "collection": collection["parameters"],
+        "settings": {"batch_size": batch_size, "workers": workers, "repeat": repeat},
+        "database_bytes": db_file.stat().st_size,
+        "stages": stages,
+        "queries": queries
+    }
+    if results_file is not None:
+        with open(results_file, "w") as f:
+            json.dump(results, f, indent=2)
+    return results
@@ -0,0 +1,474 @@
+import json
+import os
+import re
+import struct
+from array import array
+from itertools import groupby
+from pathlib import Path
+from sqlite3 import Connection
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from .SimpleM3DataLoader import register_taggings_listener, unregister_taggings_listener
+from .query import _filter_condition, encode_filter_value, get_tagset
+
+
+# Roaring-style containers: the media ids are split by their high 16 bits, the low 16 bits of a chunk are
+# stored as a sorted array('H') while sparse, or as a 65536 bit Python int once dense.
+_CHUNK_BITS = 1 << 16
+_CHUNK_BYTES = _CHUNK_BITS // 8
+_ARRAY_MAX = 4096
+
+_Container = Union[array, int]
+
+
+def _to_int(container: _Container) -> int:
+    if isinstance(container, int):
+        return container
+    bits = bytearray(_CHUNK_BYTES)
+    for low in container:
+        bits[low >> 3] |= 1 << (low & 7)
+    return int.from_bytes(bits, "little")
+
+
+def _compact_lows(bits: int) -> List[int]:
+    # Positions of the set bits, found on the (reversed) binary string representation
+    return [match.start() for match in re.finditer("1", bin(bits)[:1:-1])]
+
+
+def _compact(bits: int) -> Optional[_Container]:
+    """
+    Store a dense container as an array when it became sparse, None if it is empty.
+    """
+    count = bits.bit_count()
+    if count == 0:
+        return None
+    if count > _ARRAY_MAX:
+        return bits
+    return array("H", _compact_lows(bits))
+
+
+def _container_len(container: _Container) -> int:
+    return container.bit_count() if isinstance(container, int) else len(container)
+
+
+def _container_and(a: _Container, b: _Container) -> Optional[_Container]:
+    if isinstance(a, array) and isinstance(b, array):
+        res = array("H", sorted(set(a).intersection(b)))
+        return res if res else None
+    if isinstance(a, array) or isinstance(b, array):
+        sparse, dense = (a, b) if isinstance(a, array) else (b, a)
+        bits = dense.to_bytes(_CHUNK_BYTES, "little")
+        res = array("H", [low for low in sparse if bits[low >> 3] >> (low & 7) & 1])
+        return res if res else None
+    return _compact(a & b)
+
+
+def _container_or(a: _Container, b: _Container) -> _Container:
+    if isinstance(a, array) and isinstance(b, array) and len(a) + len(b) <= _ARRAY_MAX:
+        return array("H", sorted(set(a).union(b)))
+    return _compact(_to_int(a) | _to_int(b))
+
+
+def _container_andnot(a: _Container, b: _Container) -> Optional[_Container]:
+    if isinstance(a, array):
+        if isinstance(b, array):
+            res = array("H", sorted(set(a).difference(b)))
+        else:
+            bits = b.to_bytes(_CHUNK_BYTES, "little")
+            res = array("H", [low for low in a if not bits[low >> 3] >> (low & 7) & 1])
+        return res if res else None
+    return _compact(a & ~_to_int(b))
+
+
+class Bitmap:
+    """
+    Compressed set of media ids (roaring-style) supporting &, |, - (and not), len, in and iteration.
+    """
+    __slots__ = ("containers",)
+
+    def __init__(self, containers: Optional[Dict[int, _Container]] = None):
+        self.containers: Dict[int, _Container] = containers or {}
+
+    @classmethod
+    def from_ids(cls, ids: Iterable[int]) -> "Bitmap":
+        """
+        Build a bitmap from media ids (in any order, duplicates are allowed).
+        """
+        containers: Dict[int, _Container] = {}
+        for high, lows in groupby(sorted(set(ids)), key=lambda media_id: media_id >> 16):
+            lows = array("H", [media_id & 0xFFFF for media_id in lows])
+            containers[high] = lows if len(lows) <= _ARRAY_MAX else _to_int(lows)
+        return cls(containers)
+
+    def add_many(self, ids: Iterable[int]):
+        """
+        Add media ids to the bitmap in place.
+        """
+        for high, container in Bitmap.from_ids(ids).containers.items():
+            current = self.containers.get(high)
+            self.containers[high] = container if current is None else _container_or(current, container)
+
+    def remove_many(self, ids: Iterable[int]):
+        """
+        Remove media ids from the bitmap in place.
+        """
+        for high, container in Bitmap.from_ids(ids).containers.items():
+            current = self.containers.get(high)
+            if current is None:
+                continue
+            res = _container_andnot(current, container)
+            if res is None:
+                del self.containers[high]
+            else:
+                self.containers[high] = res
+
+    def __and__(self, other: "Bitmap") -> "Bitmap":
+        containers = {}
+        for high in self.containers.keys() & other.containers.keys():
+            res = _container_and(self.containers[high], other.containers[high])
+            if res is not None:
+                containers[high] = res
+        return Bitmap(containers)
+
+    def __or__(self, other: "Bitmap") -> "Bitmap":
+        containers = dict(self.containers)
+        for high, container in other.containers.items():
+            current = containers.get(high)
+            containers[high] = container if current is None else _container_or(current, container)
+        return Bitmap(containers)
+
+    def __sub__(self, other: "Bitmap") -> "Bitmap":
+        containers = {}
+        for high, container in self.containers.items():
+            if high in other.containers:
+                container = _container_andnot(container, other.containers[high])
+            if container is not None:
+                containers[high] = container
+        return Bitmap(containers)
+
+    def __len__(self) -> int:
+        return sum(_container_len(container) for container in self.containers.values())
+
+    def __contains__(self, media_id: int) -> bool:
+        container = self.containers.get(media_id >> 16)
+        if container is None:
+            return False
+        low = media_id & 0xFFFF
+        if isinstance(container, int):
+            return bool(container >> low & 1)
+        return low in container
+
+    def __iter__(self) -> Iterator[int]:
+        for high in sorted(self.containers):
+            container = self.containers[high]
+            lows = container if isinstance(container, array) else _compact_lows(container)
+            base = high << 16
+            for low in lows:
+                yield base | low
+
+    def to_bytes(self) -> bytes:
+        parts = [struct.pack("<I", len(self.containers))]
+        for high in sorted(self.containers):
+            container = self.containers[high]
+            if isinstance(container, int):
+                parts.append(struct.pack("<IBI", high, 1, _CHUNK_BYTES))
+                parts.append(container.to_bytes(_CHUNK_BYTES, "little"))
+            else:
+                parts.append(struct.pack("<IBI", high, 0, len(container)))
+                parts.append(container.tobytes())
+        return b"".join(parts)
+
+    @classmethod
+    def from_buffer(cls, buf: bytes, offset: int = 0) -> Tuple["Bitmap", int]:
+        """
+        Deserialize a bitmap written by to_bytes.
+
+        Returns:
+        - (Bitmap, offset after the bitmap)
+        """
+        (count,) = struct.unpack_from("<I", buf, offset)
+        offset += 4
+        containers: Dict[int, _Container] = {}
+        for _ in range(count):
+            high, kind, length = struct.unpack_from("<IBI", buf, offset)
+            offset += 9
+            if kind == 1:
+                containers[high] = int.from_bytes(buf[offset:offset + length], "little")
+                offset += length
+            else:
+                lows = array("H")
+                lows.frombytes(buf[offset:offset + 2 * length])
+                containers[high] = lows
+                offset += 2 * length
+        return cls(containers), offset
+
+
+# Boolean tag expression evaluated by BitmapIndex.evaluate:
+# - (tagset_name, operator, value): medias tagged with a matching tag (operators as in query)
+# - ("and", expr, ...), ("or", expr, ...), ("not", expr)
+Expression = Tuple[Any, ...]
+
+_MAGIC = b"SM3BMP01"
+
+
+class BitmapIndex:
+    """
+    In-memory index of the taggings table: one compressed bitmap of media ids per tag.
+
+    Boolean tag expressions (and/or/not over tag filters, including ranges over the typed tag values)
+    are answered in memory, only the (small) typed tag tables are consulted to resolve filters to tag ids.
+    The index can be saved to and loaded from disk, and is kept up to date through refresh() (changes
+    since the last refresh, including deletions) or attach() (taggings inserted by this process).
+    """
+
+    def __init__(self):
+        self.tag_bitmaps: Dict[int, Bitmap] = {}
+        self.medias = Bitmap()
+        # Highest taggings rowid and media id covered by the index, and the (media_id, tag_id) of that row
+        self.taggings_rowid = 0
+        self.media_id = 0
+        self.last_tagging: Optional[Tuple[int, int]] = None
+        self._db_file: Optional[str] = None
+
+    @classmethod
+    def build(cls, connection: Connection) -> "BitmapIndex":
+        """
+        Build the index from the taggings table.
+
+        Parameters:
+        - connection: sqlite3.Connection object to the database.
+        """
+        index = cls()
+        index._db_file = _main_db_file(connection)
+        index.refresh(connection)
+        return index
+
+    def refresh(self, connection: Connection) -> int:
+        """
+        Apply the changes since the last build/refresh.
+
+        New medias and taggings rows are detected by their rowid. Deletions (e.g. by sync) are detected
+        by comparing the number of medias, and the number of taggings of every tag with tag_counts: the
+        medias or the tags that differ are reloaded. If the last taggings row seen was deleted, later rows
+        may have reused rowids that were already seen, all tags are reloaded.
+
+        Returns:
+        - The number of taggings added
+        """
+        media_ids = [
+            media_id for (media_id,) in connection.execute(
+                "SELECT id FROM medias WHERE id > ?", [self.media_id]
+            )
+        ]
+        if media_ids:
+            self.medias.add_many(media_ids)
+        media_count, self.media_id = connection.execute("SELECT COUNT(*), COALESCE(MAX(id), 0) FROM medias").fetchone()
+        if media_count != len(self.medias):
+            self.medias = Bitmap.from_ids(media_id for (media_id,) in connection.execute("SELECT id FROM medias"))
+
+        if self.taggings_rowid:
+            last = connection.execute(
+                "SELECT media_id, tag_id FROM taggings WHERE rowid = ?", [self.taggings_rowid]
+            ).fetchone()
+            if last is None or tuple(last) != self.last_tagging:
+                self.tag_bitmaps = {}
+                self.taggings_rowid = 0
+
+        new_tag_ids: Dict[int, array] = {}
+        count = 0
+        for rowid, media_id, tag_id in connection.execute(
+            "SELECT rowid, media_id, tag_id FROM taggings WHERE rowid > ? ORDER BY rowid", [self.taggings_rowid]
+        ):
+            ids = new_tag_ids.get(tag_id)
+            if ids is None:
+                ids = new_tag_ids[tag_id] = array("I")
+            ids.append(media_id)
+            count += 1
+            self.taggings_rowid = rowid
+            self.last_tagging = (media_id, tag_id)
+
+        for tag_id, ids in new_tag_ids.items():
+            bitmap = self.tag_bitmaps.get(tag_id)
+            if bitmap is None:
+                self.tag_bitmaps[tag_id] = Bitmap.from_ids(ids)
+            else:
+                bitmap.add_many(ids)
+
+        counts = dict(connection.execute("SELECT tag_id, count FROM tag_counts WHERE count > 0"))
+        stale = [
+            tag_id for tag_id in self.tag_bitmaps.keys() | counts.keys()
+            if counts.get(tag_id, 0) != len(self.tag_bitmaps.get(tag_id, ()))
+        ]
+        if stale:
+            self._reload_tags(connection, stale)
+        return count
+
+    def _reload_tags(self, connection: Connection, tag_ids: List[int]):
+        """
+        Rebuild the bitmaps of tags from the taggings table.
+        """
+        reloaded: Dict[int, List[int]] = {tag_id: [] for tag_id in tag_ids}
+        for tag_id, media_id in connection.execute(
+            "SELECT tg.tag_id, tg.media_id FROM json_each(?) j CROSS JOIN taggings tg ON tg.tag_id = j.value",
+            [json.dumps(tag_ids)]
+        ):
+            reloaded[tag_id].append(media_id)
+        for tag_id, ids in reloaded.items():
+            if ids:
+                self.tag_bitmaps[tag_id] = Bitmap.from_ids(ids)
+            else:
+                self.tag_bitmaps.pop(tag_id, None)
+
+    def add_taggings(self, taggings: Iterable[Tuple[int, int]]):
+        """
+        Add (media_id, tag_id) rows to the index.
+        """
+        new_tag_ids: Dict[int, List[int]] = {}
+        for media_id, tag_id in taggings:
+            new_tag_ids.setdefault(tag_id, []).append(media_id)
+        for tag_id, ids in new_tag_ids.items():
+            self.tag_bitmaps.setdefault(tag_id, Bitmap()).add_many(ids)
+        self.medias.add_many(media_id for ids in new_tag_ids.values() for media_id in ids)
+
+    def remove_taggings(self, taggings: Iterable[Tuple[int, int]]):
+        """
+        Remove (media_id, tag_id) rows from the index.
+        """
+        removed: Dict[int, List[int]] = {}
+        for media_id, tag_id in taggings:
+            removed.setdefault(tag_id, []).append(media_id)
+        for tag_id, ids in removed.items():
+            bitmap = self.tag_bitmaps.get(tag_id)
+            if bitmap is not None:
+                bitmap.remove_many(ids)
+
+    def _on_taggings(self, connection: Connection, taggings: List[Tuple[int, int]], deleted: bool = False):
+        # The batches of a bulk load may still be rolled back, refresh() picks them up once committed
+        if getattr(connection, "defer_commits", False):
+            return
+        if _main_db_file(connection) == self._db_file:
+            if deleted:
+                self.remove_taggings(taggings)
+            else:
+                self.add_taggings(taggings)
+
+    def attach(self):
+        """
+        Update the index with the taggings inserted by add_media_taggings and deleted by the syncs (in this
+        process) from now on. Taggings of bulk loads (see bulk_load_session) and other deletions are applied
+        by refresh().
+        """
+        register_taggings_listener(self._on_taggings)
+
+    def detach(self):
+        unregister_taggings_listener(self._on_taggings)
+
+    def tags(self, tag_ids: Iterable[int]) -> Bitmap:
+        """
+        Union of the bitmaps of the given tags.
+        """
+        res = Bitmap()
+        for tag_id in tag_ids:
+            bitmap = self.tag_bitmaps.get(tag_id)
+            if bitmap is not None:
+                res = res | bitmap
+        return res
+
+    def filter(self, connection: Connection, tagset_name: str, operator: str, value: Any) -> Bitmap:
+        """
+        Medias tagged with a tag of the tagset whose value matches (operators as in query).
+        """
+        tagset_id, tagtype = get_tagset(connection, tagset_name)
+        condition, params = _filter_condition("t", operator, encode_filter_value(tagtype, operator, value))
+        tag_ids = [
+            tag_id for (tag_id,) in connection.execute(
+                f"SELECT t.id FROM {tagtype.name.lower()}_tags t WHERE t.tagset_id = ? AND {condition}",
+                [tagset_id, *params]
+            )
+        ]
+        return self.tags(tag_ids)
+
+    def evaluate(self, connection: Connection, expression: Expression) -> Bitmap:
+        """
+        Evaluate a boolean tag expression.
+
+        Parameters:
+        - connection: sqlite3.Connection used to resolve filters to tag ids.
+        - expression: e.g. ("and", ("Objects", "=", "car"), ("not", ("Objects", "=", "person")),
+                                   ("or", ("Day", "=", 1), ("Start (ms)", "between", (0, 60000))))
+
+        Returns:
+        - Bitmap of the matching media ids
+        """
+        op = expression[0].lower() if isinstance(expression[0], str) else None
+        if op == "and" and len(expression) > 1:
+            operands = [self.evaluate(connection, expr) for expr in expression[1:]]
+            # Intersect the smallest bitmaps first
+            operands.sort(key=len)
+            res = operands[0]
+            for bitmap in operands[1:]:
+                res = res & bitmap
+            return res
+        if op == "or" and len(expression) > 1:
+            res = Bitmap()
+            for expr in expression[1:]:
+                res = res | self.evaluate(connection, expr)
+            return res
+        if op == "not" and len(expression) == 2:
+            return self.medias - self.evaluate(connection, expression[1])
+        if len(expression) == 3:
+            return self.filter(connection, *expression)
+        raise ValueError(f"Invalid expression: {expression}")
+
+    def save(self, path: Path):
+        """
+        Write the index to a file (written to a temporary file first, then renamed).
+        """
+        path = Path(path)
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(_MAGIC)
+            db_file = (self._db_file or "").encode()
+            f.write(struct.pack("<QQII", self.taggings_rowid, self.media_id, len(db_file), len(self.tag_bitmaps)))
+            f.write(struct.pack("<qq", *(self.last_tagging or (-1, -1))))
+            f.write(db_file)
+            f.write(self.medias.to_bytes())
+            for tag_id, bitmap in self.tag_bitmaps.items():
+                f.write(struct.pack("<Q", tag_id))
+                f.write(bitmap.to_bytes())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: Path, connection: Optional[Connection] = None) -> "BitmapIndex":
+        """
+        Read an index written by save. If a connection is given, the index is refreshed with the
+        taggings inserted since it was saved.
+        """
+        with open(path, "rb") as f:
+            buf = f.read()
+        if buf[:len(_MAGIC)] != _MAGIC:
+            raise ValueError(f"Not a bitmap index file: {path}")
+        offset = len(_MAGIC)
+        index = cls()
+        index.taggings_rowid, index.media_id, db_file_len, tag_count = struct.unpack_from("<QQII", buf, offset)
+        offset += struct.calcsize("<QQII")
+        last_tagging = struct.unpack_from("<qq", buf, offset)
+        offset += struct.calcsize("<qq")
+        index.last_tagging = last_tagging if last_tagging != (-1, -1) else None
+        index._db_file = buf[offset:offset + db_file_len].decode() or None
+        offset += db_file_len
+        index.medias, offset = Bitmap.from_buffer(buf, offset)
+        for _ in range(tag_count):
+            (tag_id,) = struct.unpack_from("<Q", buf, offset)
+            index.tag_bitmaps[tag_id], offset = Bitmap.from_buffer(buf, offset + 8)
+        if connection is not None:
+            index._db_file = _main_db_file(connection)
+            index.refresh(connection)
+        return index
+
+
+def _main_db_file(connection: Connection) -> str:
+    for _, name, file in connection.execute("PRAGMA database_list"):
+        if name == "main":
+            return file
+    return ""
@@ -0,0 +1,187 @@
+from contextlib import contextmanager
+from sqlite3 import Connection
+from typing import Dict, Iterator, List, Tuple
+
+from .facets import rebuild_tag_counts
+from .instrumentation import log, stage
+from .intervals import has_interval_index, rebuild_interval_index
+from .media_cache import has_media_tag_cache, rebuild_media_tag_cache
+from .search import has_text_search, rebuild_text_search
+
+
+# PRAGMAs changed for the duration of a bulk load and restored afterwards
+_RESTORED_PRAGMAS = ("journal_mode", "synchronous", "cache_size", "mmap_size", "temp_store")
+
+
+class BulkLoadConnection(Connection):
+    """
+    sqlite3.Connection that defers commit() calls while a bulk load is running.
+
+    The loader functions commit after every step, during a bulk load these commits are skipped
+    so that the whole load runs as a single transaction. Any rollback marks the load as failed.
+
+    Usage: sqlite3.connect(db_file, autocommit=False, factory=BulkLoadConnection)
+    """
+    defer_commits: bool = False
+    failed: bool = False
+
+    def commit(self):
+        if not self.defer_commits:
+            super().commit()
+
+    def rollback(self):
+        if self.defer_commits:
+            self.failed = True
+        super().rollback()
+
+    def raise_if_failed(self, step: str):
+        """
+        Abort the bulk load as soon as a loader function rolled back its changes.
+        """
+        if self.failed:
+            raise RuntimeError(f"Bulk load failed while adding {step}, all changes have been rolled back")
+
+
+def _set_pragmas(connection: Connection, pragmas: Dict[str, object]):
+    # The journal mode and safety level cannot be changed from within a transaction
+    connection.commit()
+    autocommit = connection.autocommit
+    connection.autocommit = True
+    try:
+        for pragma, value in pragmas.items():
+            connection.execute(f"PRAGMA {pragma} = {value}")
+    finally:
+        connection.autocommit = autocommit
+
+
+def drop_secondary_indexes(connection: Connection) -> List[Tuple[str, str]]:
+    """
+    Drop the secondary indexes (idx_*) defined in ddl.sql.
+
+    Parameters:
+    - connection: sqlite3.Connection object to the database.
+
+    Returns:
+    - List of (index_name, create_statement) for the dropped indexes, to be passed to create_schema_objects
+    """
+    indexes = connection.execute(
+        r"""
+        SELECT name, sql
+        FROM sqlite_master
+        WHERE type = 'index' AND sql IS NOT NULL AND name LIKE 'idx\_%' ESCAPE '\'
+        """
+    ).fetchall()
+    for name, _ in indexes:
+        connection.execute(f"DROP INDEX IF EXISTS {name}")
+    return indexes
+
+
+def drop_maintenance_triggers(connection: Connection) -> List[Tuple[str, str]]:
+    """
+    Drop the triggers (trg_*) maintaining summary tables such as tag_counts.
+    The summaries have to be rebuilt afterwards (see bulk_load_session).
+
+    Parameters:
+    - connection: sqlite3.Connection object to the database.
+
+    Returns:
+    - List of (trigger_name, create_statement) for the dropped triggers, to be passed to create_schema_objects
+    """
+    triggers = connection.execute(
+        r"""
+        SELECT name, sql
+        FROM sqlite_master
+        WHERE type = 'trigger' AND name LIKE 'trg\_%' ESCAPE '\'
+        """
+    ).fetchall()
+    for name, _ in triggers:
+        connection.execute(f"DROP TRIGGER IF EXISTS {name}")
+    return triggers
+
+
+def create_schema_objects(connection: Connection, objects: List[Tuple[str, str]]):
+    """
+    (Re)create the given indexes or triggers, objects that already exist are skipped.
+
+    Parameters:
+    - connection: sqlite3.Connection object to the database.
+    - objects: List of (name, create_statement) as returned by drop_secondary_indexes or drop_maintenance_triggers
+    """
+    existing = {name for (name,) in connection.execute("SELECT name FROM sqlite_master")}
+    for name, sql in objects:
+        if name not in existing:
+            log("SDL.create_schema_objects", f"Creating {name}...")
+            with stage("SDL.create_schema_objects", "debug", name=name):
+                connection.execute(sql)
+
+
+@contextmanager
+def bulk_load_session(
+    connection: BulkLoadConnection,
+    cache_size_mib: int = 1024,
+    mmap_size_mib: int = 4096
+) -> Iterator[BulkLoadConnection]:
+    """
+    Context manager that prepares a database for a fast bulk load.
+
+    While loading:
+    - The secondary indexes are dropped and rebuilt once the data is inserted
+    - The summary maintenance triggers are dropped, the summaries (tag_counts),
+      the text search indexes, the interval index and the media tag cache are rebuilt once
+    - WAL journal, synchronous = OFF, a large page cache and memory mapped I/O are used
+    - All commits of the loader functions are deferred, the load is a single transaction
+
+    On success the transaction is committed, on failure (an exception or a rollback by one of the
+    loader functions) everything is rolled back. In both cases the indexes and the previous
+    PRAGMA settings are restored.
+
+    Parameters:
+    - connection: BulkLoadConnection opened with autocommit=False.
+    - cache_size_mib: Page cache size used during the load (MiB).
+    - mmap_size_mib: Memory mapped I/O size used during the load (MiB).
+    """
+    saved: Dict[str, object] = {
+        pragma: connection.execute(f"PRAGMA {pragma}").fetchone()[0] for pragma in _RESTORED_PRAGMAS
+    }
+    _set_pragmas(connection, {
+        "journal_mode": "WAL",
+        "synchronous": "OFF",
+        "cache_size": -cache_size_mib * 1024,
+        "mmap_size": mmap_size_mib * 1024 * 1024,
+        "temp_store": "MEMORY",
+    })
+
+    indexes = drop_secondary_indexes(connection)
+    triggers = drop_maintenance_triggers(connection)
+    connection.defer_commits = True
+    connection.failed = False
+    try:
+        yield connection
+        connection.raise_if_failed("data")
+        create_schema_objects(connection, indexes)
+        if triggers:
+            with stage("SDL.rebuild_tag_counts"):
+                rebuild_tag_counts(connection)
+            if has_text_search(connection):
+                with stage("SDL.rebuild_text_search"):
+                    rebuild_text_search(connection)
+            if has_interval_index(connection):
+                rebuild_interval_index(connection)
+            if has_media_tag_cache(connection):
+                rebuild_media_tag_cache(connection)
+            create_schema_objects(connection, triggers)
+        connection.defer_commits = False
+        with stage("SDL.bulk_load_session.commit"):
+            connection.commit()
+    except BaseException:
+        connection.defer_commits = False
+        if connection.in_transaction:
+            connection.rollback()
+        # The rollback restores the dropped indexes and triggers, this only covers a partial rebuild
+        create_schema_objects(connection, indexes + triggers)
+        connection.commit()
+        raise
+    finally:
+        connection.defer_commits = False
+        connection.execute("PRAGMA optimize")
+        _set_pragmas(connection, saved)
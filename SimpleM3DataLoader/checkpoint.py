@@ -0,0 +1,281 @@
+import hashlib
+import json
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from .bulk import BulkLoadConnection
+from .instrumentation import Event, add_sink, log, remove_sink, stage
+from .pipeline import add_media_taggings_parallel
+from .streaming import iter_raw_json_batches
+
+
+# (record_offset, record, error)
+FailedRecord = Tuple[int, Any, str]
+
+
+def chunk_digest(batch: List[Union[str, Any]]) -> str:
+    """
+    SHA-256 of a chunk: raw JSON Lines are hashed as read, decoded records (JSON arrays) as canonical JSON.
+    """
+    digest = hashlib.sha256()
+    for record in batch:
+        if isinstance(record, str):
+            digest.update(record.rstrip("\r\n").encode())
+        else:
+            digest.update(json.dumps(record, sort_keys=True, separators=(",", ":")).encode())
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+class IngestManifest():
+    """
+    Completed chunks of one input file, recorded in the ingest_chunks table (see ddl.sql).
+
+    A chunk is identified by the offset of its first record in the input, it is only skipped on a rerun
+    if its number of records and content hash are unchanged. Completed chunks are matched by their record
+    range, so a rerun with another batch size still skips them. The records of a chunk that could not be
+    added are stored in ingest_failures.
+    """
+
+    def __init__(self, connection: sqlite3.Connection, kind: str, input_file: Path, restart: bool = False):
+        """
+        Parameters:
+        - connection: sqlite3.Connection object to the database.
+        - kind: Kind of records (tagsets, tags, medias, taggings).
+        - input_file: Path to the input file, identified by its absolute path.
+        - restart: If True, the manifest of the input is cleared and every chunk is loaded again.
+        """
+        if connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'ingest_chunks'").fetchone() is None:
+            raise RuntimeError(
+                "The database has no ingest manifest (created from an earlier ddl.sql), upgrade it with upgradedb"
+            )
+        self.kind = kind
+        self.input = str(Path(input_file).resolve())
+        if restart:
+            connection.execute("DELETE FROM ingest_chunks WHERE kind = ? AND input = ?", [self.kind, self.input])
+            connection.execute("DELETE FROM ingest_failures WHERE kind = ? AND input = ?", [self.kind, self.input])
+            connection.commit()
+        self.done: Dict[int, Tuple[int, str]] = {
+            offset: (records, digest)
+            for offset, records, digest in connection.execute(
+                "SELECT record_offset, records, hash FROM ingest_chunks WHERE kind = ? AND input = ?",
+                [self.kind, self.input]
+            )
+        }
+        self.skipped_records = 0
+
+    def pending(self, batches: Iterable[List[Any]]) -> Iterator[Tuple[int, str, List[Any]]]:
+        """
+        Yield (record_offset, digest, batch) for the chunks that are not completed yet.
+
+        The records are regrouped: the records of a completed chunk are collected over its recorded range
+        and skipped if their hash is unchanged, the other records are chunked with the size of the input
+        batches, and a new chunk ends where a completed one starts (chunks never overlap).
+        """
+        batch_size = 1
+        chunk: List[Any] = []
+        chunk_offset = 0
+        completed: Optional[Tuple[int, str]] = None
+
+        def records() -> Iterator[Any]:
+            nonlocal batch_size
+            for batch in batches:
+                batch_size = max(batch_size, len(batch))
+                yield from batch
+
+        def flush() -> Iterator[Tuple[int, str, List[Any]]]:
+            nonlocal chunk
+            digest = chunk_digest(chunk)
+            if completed == (len(chunk), digest):
+                self.skipped_records += len(chunk)
+            else:
+                if completed is not None:
+                    log("SDL.IngestManifest", f"Chunk at record {chunk_offset} of {self.input} changed, loading it again", "warning")
+                yield chunk_offset, digest, chunk
+            chunk = []
+
+        offset = 0
+        for record in records():
+            if chunk and completed is None and offset in self.done:
+                yield from flush()
+            if not chunk:
+                chunk_offset = offset
+                completed = self.done.get(offset)
+            chunk.append(record)
+            offset += 1
+            if len(chunk) >= (completed[0] if completed is not None else batch_size):
+                yield from flush()
+        if chunk:
+            yield from flush()
+        if self.skipped_records:
+            log("SDL.IngestManifest", f"Skipped {self.skipped_records} records of {self.input} loaded by an earlier run")
+
+    def mark_done(
+        self,
+        connection: sqlite3.Connection,
+        offset: int,
+        records: int,
+        digest: str,
+        failures: Optional[List[FailedRecord]] = None
+    ):
+        """
+        Record a completed chunk and its failed records, in the current transaction of the connection.
+        """
+        connection.execute(
+            "DELETE FROM ingest_failures WHERE kind = ? AND input = ? AND record_offset >= ? AND record_offset < ?",
+            [self.kind, self.input, offset, offset + records]
+        )
+        connection.executemany(
+            """
+            INSERT INTO ingest_failures (kind, input, record_offset, record, error)
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            [
+                (self.kind, self.input, record_offset, json.dumps(record, default=str), error)
+                for record_offset, record, error in failures or []
+            ]
+        )
+        connection.execute(
+            """
+            INSERT OR REPLACE INTO ingest_chunks (kind, input, record_offset, records, hash, failed_records, completed_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            [self.kind, self.input, offset, records, digest, len(failures or []), datetime.now().isoformat(timespec="seconds")]
+        )
+        self.done[offset] = (records, digest)
+
+
+def _decode(batch: List[Union[str, Any]]) -> List[Any]:
+    return [json.loads(record) if isinstance(record, str) else record for record in batch]
+
+
+def _try_load(
+    connection: BulkLoadConnection,
+    load: Callable[[List[Any]], None],
+    records: List[Any],
+    errors: List[str]
+) -> bool:
+    """
+    Run the load function with deferred commits, returns False if it rolled back (the changes are undone).
+    """
+    errors.clear()
+    connection.defer_commits = True
+    connection.failed = False
+    try:
+        load(records)
+    except Exception as e:
+        errors.append(f"{type(e).__name__}: {e}")
+        connection.rollback()
+    finally:
+        connection.defer_commits = False
+    return not connection.failed
+
+
+def _isolate_failures(
+    connection: BulkLoadConnection,
+    load: Callable[[List[Any]], None],
+    records: List[Any],
+    offset: int,
+    errors: List[str]
+) -> List[FailedRecord]:
+    """
+    Load the records of a failed chunk by halves, committing the parts that succeed, down to the single failed records.
+    """
+    if len(records) == 1:
+        return [(offset, records[0], "; ".join(errors) or "unknown error")]
+    failures = []
+    middle = len(records) // 2
+    for start, part in ((0, records[:middle]), (middle, records[middle:])):
+        if _try_load(connection, load, part, errors):
+            connection.commit()
+        else:
+            failures.extend(_isolate_failures(connection, load, part, offset + start, errors))
+    return failures
+
+
+def load_checkpointed(
+    connection: BulkLoadConnection,
+    kind: str,
+    input_file: Path,
+    batches: Iterable[List[Union[str, Any]]],
+    load: Callable[[List[Any]], None],
+    restart: bool = False
+) -> Tuple[int, int]:
+    """
+    Load an input file chunk by chunk, committing every chunk together with its entry in the manifest,
+    so that a rerun skips the completed chunks (see IngestManifest).
+
+    If the load function rolls back a chunk, the chunk is split to find the failing records, the other
+    records are added and the failed ones are stored with their error in ingest_failures.
+
+    Parameters:
+    - connection: BulkLoadConnection opened with autocommit=False (used to defer the commits of the load function).
+    - kind: Kind of records (tagsets, tags, medias, taggings).
+    - input_file: Path to the input file.
+    - batches: Chunks of the input file, raw JSON Lines or decoded records (see iter_raw_json_batches).
+    - load: Function adding a list of decoded records, e.g. lambda batch: add_media_taggings(connection, batch).
+    - restart: If True, all chunks are loaded again.
+
+    Returns:
+    - (records_loaded, records_failed), not counting the skipped chunks
+    """
+    manifest = IngestManifest(connection, kind, input_file, restart)
+    errors: List[str] = []
+
+    def capture_errors(event: Event):
+        if event["event"] == "error" and event["level"] == "error":
+            errors.append(f"{event['message']}: {event['error']}")
+
+    loaded = failed = 0
+    add_sink(capture_errors)
+    try:
+        for offset, digest, batch in manifest.pending(batches):
+            records = _decode(batch)
+            with stage("SDL.load_checkpointed", "debug", kind=kind, offset=offset, batch_size=len(records)) as chunk_stage:
+                failures: List[FailedRecord] = []
+                if not _try_load(connection, load, records, errors):
+                    failures = _isolate_failures(connection, load, records, offset, errors)
+                manifest.mark_done(connection, offset, len(records), digest, failures)
+                connection.commit()
+                chunk_stage.rows = len(records) - len(failures)
+            loaded += len(records) - len(failures)
+            failed += len(failures)
+    finally:
+        remove_sink(capture_errors)
+        connection.defer_commits = False
+    if failed:
+        log("SDL.load_checkpointed", f"{failed} {kind} record(s) of {manifest.input} could not be added, see ingest_failures", "warning")
+    return loaded, failed
+
+
+def add_media_taggings_parallel_checkpointed(
+    db_file: Path,
+    taggings_file: Path,
+    batch_size: int,
+    workers: Optional[int] = None,
+    restart: bool = False
+) -> int:
+    """
+    add_media_taggings_parallel with the chunks of the input recorded in the manifest (see load_checkpointed).
+    Every chunk is recorded in the transaction that commits its taggings. Failing chunks abort the load.
+
+    Returns:
+    - The number of taggings handed to the writer
+    """
+    with sqlite3.connect(db_file, autocommit=False) as connection:
+        manifest = IngestManifest(connection, "taggings", taggings_file, restart)
+    chunks: List[Tuple[int, int, str]] = []
+
+    def pending_batches(f) -> Iterator[List[Union[str, Any]]]:
+        for offset, digest, batch in manifest.pending(iter_raw_json_batches(f, batch_size)):
+            chunks.append((offset, len(batch), digest))
+            yield batch
+
+    def on_batch_written(connection: sqlite3.Connection, index: int):
+        offset, records, digest = chunks[index]
+        manifest.mark_done(connection, offset, records, digest)
+
+    with open(taggings_file, "r") as f:
+        return add_media_taggings_parallel(db_file, pending_batches(f), workers, on_batch_written=on_batch_written)
@@ -0,0 +1,176 @@
+import heapq
+from sqlite3 import Connection
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .SimpleM3DataLoader import TagType, decode_tag_value
+from .query import get_tagset
+
+
+def rebuild_tag_counts(connection: Connection):
+    """
+    Recompute the tag_counts summary table from the taggings table.
+    Used after loads that bypass the maintenance triggers (see bulk_load_session).
+
+    Parameters:
+    - connection: sqlite3.Connection object to the database.
+    """
+    connection.execute("DELETE FROM tag_counts")
+    connection.execute(
+        """
+        INSERT INTO tag_counts (tag_id, tagset_id, count)
+        SELECT tg.tag_id, t.tagset_id, tg.count
+        FROM (SELECT tag_id, COUNT(*) AS count FROM taggings GROUP BY tag_id) tg
+        JOIN tags t ON t.id = tg.tag_id
+        """
+    )
+
+
+def _tagset_ids(connection: Connection, tagset_names: Optional[List[str]]) -> Dict[int, str]:
+    if tagset_names is None:
+        return {tagset_id: name for tagset_id, name in connection.execute("SELECT id, name FROM tagsets")}
+    return {get_tagset(connection, name)[0]: name for name in tagset_names}
+
+
+def _tag_values(connection: Connection, tag_ids: List[int]) -> Dict[int, Any]:
+    """
+    Values of the given tags, looked up in their typed tag tables (decoded, see decode_tag_value).
+    """
+    values: Dict[int, Any] = {}
+    by_type: Dict[int, List[int]] = {}
+    for i in range(0, len(tag_ids), 500):
+        chunk = tag_ids[i:i + 500]
+        for tag_id, tagtype_id in connection.execute(
+            f"SELECT id, tagtype_id FROM tags WHERE id IN ({', '.join('?' for _ in chunk)})", chunk
+        ):
+            by_type.setdefault(tagtype_id, []).append(tag_id)
+
+    for tagtype_id, ids in by_type.items():
+        tagtype = TagType(tagtype_id)
+        table = f"{tagtype.name.lower()}_tags"
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            for tag_id, value in connection.execute(
+                f"SELECT id, value FROM {table} WHERE id IN ({', '.join('?' for _ in chunk)})", chunk
+            ):
+                values[tag_id] = decode_tag_value(tagtype, value)
+    return values
+
+
+def _stage_media_ids(connection: Connection, media_ids: Iterable[int]) -> int:
+    """
+    Stage media ids in a temp table. In legacy transaction mode (the sqlite3 default) the DML starts a
+    transaction, facet_counts ends it again if the connection was not in a transaction before.
+    """
+    cur = connection.cursor()
+    try:
+        cur.execute(
+            """
+            CREATE TEMP TABLE IF NOT EXISTS tmp_facet_medias (
+                id INTEGER PRIMARY KEY
+            )
+            """
+        )
+        cur.execute("DELETE FROM tmp_facet_medias")
+        cur.executemany("INSERT OR IGNORE INTO tmp_facet_medias VALUES (?)", ((media_id,) for media_id in media_ids))
+        return cur.execute("SELECT COUNT(*) FROM tmp_facet_medias").fetchone()[0]
+    finally:
+        cur.close()
+
+
+def facet_counts(
+    connection: Connection,
+    media_ids: Optional[Iterable[int]] = None,
+    tagsets: Optional[List[str]] = None,
+    top_n: int = 10
+) -> Dict[str, List[Tuple[Any, int]]]:
+    """
+    Count the tags of each tagset over a set of medias (facets).
+
+    Without media ids the global counts are read from the tag_counts summary table. For a media id set the
+    counting starts from the smaller side of the intersection: the taggings of the given medias (media side),
+    or the taggings of the tags of the requested tagsets probed against the medias (tag side). Their sizes
+    are estimated from tag_counts.
+
+    Parameters:
+    - connection: sqlite3.Connection object to the database.
+    - media_ids: Optional media ids (e.g. a query result or a Bitmap), None for the whole collection.
+    - tagsets: Optional names of the tagsets to count, None for all tagsets.
+    - top_n: Number of most frequent tags returned per tagset.
+
+    Returns:
+    - Dictionary mapping tagset name to a list of (tag_value, count), most frequent first.
+      Tagsets without any matching tag are left out.
+    """
+    tagset_names = _tagset_ids(connection, tagsets)
+    if not tagset_names:
+        return {}
+    tagset_filter = ", ".join(str(tagset_id) for tagset_id in tagset_names)
+
+    if media_ids is None:
+        rows = []
+        for tagset_id in tagset_names:
+            rows.extend(
+                (tagset_id, tag_id, count) for tag_id, count in connection.execute(
+                    """
+                    SELECT tag_id, count
+                    FROM tag_counts
+                    WHERE tagset_id = ? AND count > 0
+                    ORDER BY count DESC
+                    LIMIT ?
+                    """,
+                    [tagset_id, top_n]
+                )
+            )
+    else:
+        # A transaction started by the staging is rolled back afterwards (only the temp table was written),
+        # so that legacy mode connections do not keep a read snapshot (and the WAL) after the call
+        owns_transaction = not connection.in_transaction
+        media_count = _stage_media_ids(connection, media_ids)
+        try:
+            total_taggings, tagset_taggings = connection.execute(
+                f"""
+                SELECT COALESCE(SUM(count), 0), COALESCE(SUM(CASE WHEN tagset_id IN ({tagset_filter}) THEN count END), 0)
+                FROM tag_counts
+                """
+            ).fetchone()
+            max_media_id = connection.execute("SELECT COALESCE(MAX(id), 0) FROM medias").fetchone()[0]
+            media_side_cost = media_count * total_taggings / max(max_media_id, 1)
+
+            # CROSS JOIN fixes the join order to the chosen side, on the tag side the unary + makes SQLite
+            # probe the staged medias per tagging instead of looking up every staged media per tag
+            if media_side_cost <= tagset_taggings:
+                sql = f"""
+                    SELECT t.tagset_id, tg.tag_id, COUNT(*)
+                    FROM tmp_facet_medias fm
+                    CROSS JOIN taggings tg ON tg.media_id = fm.id
+                    CROSS JOIN tags t ON t.id = tg.tag_id
+                    WHERE t.tagset_id IN ({tagset_filter})
+                    GROUP BY tg.tag_id
+                    """
+            else:
+                sql = f"""
+                    SELECT tc.tagset_id, tc.tag_id, COUNT(*)
+                    FROM tag_counts tc
+                    CROSS JOIN taggings tg ON tg.tag_id = tc.tag_id
+                    WHERE tc.tagset_id IN ({tagset_filter}) AND tc.count > 0
+                    AND +tg.media_id IN tmp_facet_medias
+                    GROUP BY tc.tag_id
+                    """
+            top: Dict[int, List[Tuple[int, int]]] = {}
+            for tagset_id, tag_id, count in connection.execute(sql):
+                top.setdefault(tagset_id, []).append((tag_id, count))
+            rows = []
+            for tagset_id, counts in top.items():
+                rows.extend(
+                    (tagset_id, tag_id, count)
+                    for tag_id, count in heapq.nlargest(top_n, counts, key=lambda tag_count: tag_count[1])
+                )
+        finally:
+            if owns_transaction and connection.in_transaction:
+                connection.rollback()
+
+    values = _tag_values(connection, [tag_id for _, tag_id, _ in rows])
+    facets: Dict[str, List[Tuple[Any, int]]] = {}
+    for tagset_id, tag_id, count in rows:
+        facets.setdefault(tagset_names[tagset_id], []).append((values.get(tag_id), count))
+    return facets
@@ -0,0 +1,229 @@
+import json
+import logging
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from sqlite3 import Connection
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+
+# An event is a flat dictionary with at least "event", "source", "level" and "time" keys:
+# - message:   "message"
+# - error:     "message", "error"
+# - stage:     "seconds", "rows", "rows_per_sec" and the stage fields (e.g. batch_size)
+# - statement: "sql", "seconds" (see trace_statements)
+Event = Dict[str, Any]
+Sink = Callable[[Event], None]
+
+LEVELS = {"debug": logging.DEBUG, "info": logging.INFO, "warning": logging.WARNING, "error": logging.ERROR}
+
+
+def format_event(event: Event) -> str:
+    """
+    One line description of an event, e.g. "(SDL.add_media_taggings): 10000 rows in 0.52s (19230 rows/sec)".
+    """
+    source = event["source"]
+    kind = event["event"]
+    fields = {k: v for k, v in event.items() if k not in ("event", "source", "level", "time", "message", "error", "seconds", "rows", "rows_per_sec", "sql")}
+    details = "".join(f", {k}={v}" for k, v in fields.items())
+    if kind == "stage":
+        return f"({source}): {event['rows']} rows in {event['seconds']:.2f}s ({event['rows_per_sec']:.0f} rows/sec{details})"
+    if kind == "error":
+        return f"({source}) {event['message']}: {event['error']}"
+    if kind == "statement":
+        sql = " ".join(event["sql"].split())
+        return f"({source}): {event['seconds'] * 1000:.1f}ms {sql[:200]}{'...' if len(sql) > 200 else ''}"
+    return f"({source}): {event['message']}{details}"
+
+
+class PrintSink():
+    """
+    Print events of at least min_level to stdout (the default sink).
+    """
+
+    def __init__(self, min_level: str = "info"):
+        self.min_level = min_level
+
+    def __call__(self, event: Event):
+        if LEVELS[event["level"]] >= LEVELS[self.min_level]:
+            print(format_event(event))
+
+
+class LoggingSink():
+    """
+    Forward events to a logging.Logger (default: "SimpleM3DataLoader"), the event is attached as record.sdl_event.
+    """
+
+    def __init__(self, logger: Optional[logging.Logger] = None):
+        self.logger = logger or logging.getLogger("SimpleM3DataLoader")
+
+    def __call__(self, event: Event):
+        self.logger.log(LEVELS[event["level"]], format_event(event), extra={"sdl_event": event})
+
+
+class JsonLinesSink():
+    """
+    Append every event as one JSON object per line to a file.
+    """
+
+    def __init__(self, path: Path):
+        self.file = open(path, "a")
+
+    def __call__(self, event: Event):
+        self.file.write(json.dumps(event, default=str))
+        self.file.write("\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class StageTotals():
+    """
+    Accumulate the stage events per source: number of calls, rows and seconds.
+    """
+
+    def __init__(self):
+        self.totals: Dict[str, Dict[str, float]] = {}
+
+    def __call__(self, event: Event):
+        if event["event"] != "stage":
+            return
+        totals = self.totals.setdefault(event["source"], {"calls": 0, "rows": 0, "seconds": 0.0})
+        totals["calls"] += 1
+        totals["rows"] += event["rows"]
+        totals["seconds"] += event["seconds"]
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """
+        Totals per stage with their rows/sec, by decreasing time spent.
+        """
+        return {
+            source: {**totals, "rows_per_sec": totals["rows"] / max(totals["seconds"], 1e-9)}
+            for source, totals in sorted(self.totals.items(), key=lambda item: -item[1]["seconds"])
+        }
+
+
+print_sink = PrintSink()
+_sinks: List[Sink] = [print_sink]
+
+
+def add_sink(sink: Sink):
+    if sink not in _sinks:
+        _sinks.append(sink)
+
+
+def remove_sink(sink: Sink):
+    if sink in _sinks:
+        _sinks.remove(sink)
+
+
+def set_sinks(sinks: List[Sink]) -> List[Sink]:
+    """
+    Replace all sinks (e.g. [] to silence the loader), returns the previous sinks.
+    """
+    previous = list(_sinks)
+    _sinks[:] = sinks
+    return previous
+
+
+def emit(event: str, source: str, level: str = "info", **fields):
+    if not _sinks:
+        return
+    record = {"event": event, "source": source, "level": level, "time": time.time(), **fields}
+    for sink in list(_sinks):
+        try:
+            sink(record)
+        except Exception as e:
+            print(f"(SDL.emit) Error in event sink {sink}: ", e)
+
+
+def log(source: str, message: str, level: str = "info", **fields):
+    emit("message", source, level, message=message, **fields)
+
+
+def log_error(source: str, message: str, error: BaseException, level: str = "error"):
+    emit("error", source, level, message=message, error=str(error) or repr(error), error_type=type(error).__name__)
+
+
+class Stage():
+    """
+    A timed stage, see stage. rows and fields can be updated while the stage runs.
+    """
+
+    def __init__(self, source: str, level: str, rows: int, fields: Dict[str, Any]):
+        self.source = source
+        self.level = level
+        self.rows = rows
+        self.fields = fields
+        self.start = time.perf_counter()
+        self.seconds = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"rows": self.rows, "seconds": self.seconds, "rows_per_sec": self.rows / max(self.seconds, 1e-9), **self.fields}
+
+
+@contextmanager
+def stage(source: str, level: str = "info", rows: int = 0, **fields) -> Iterator[Stage]:
+    """
+    Time a stage and emit it as a "stage" event when it ends (also when it fails, with failed=True).
+
+    Parameters:
+    - source: Name of the stage, e.g. "SDL.add_media_taggings".
+    - level: Event level, sub-stages use "debug".
+    - rows: Number of rows processed, can also be set on the yielded Stage.
+    - fields: Additional event fields, e.g. batch_size.
+    """
+    current = Stage(source, level, rows, fields)
+    try:
+        yield current
+    except BaseException:
+        current.fields["failed"] = True
+        raise
+    finally:
+        current.seconds = time.perf_counter() - current.start
+        emit("stage", source, level, **current.as_dict())
+
+
+@contextmanager
+def trace_statements(
+    connection: Connection,
+    slow_ms: float = 100.0,
+    progress_steps: int = 10_000,
+    source: str = "SDL.trace_statements"
+):
+    """
+    Emit a "statement" event (level warning) for every SQL statement of the connection that runs for at least slow_ms.
+
+    The statements are seen through the connection's trace callback and their run time is measured with
+    the progress handler, which is invoked every progress_steps virtual machine instructions. The run time
+    is therefore the time from the start of a statement to its last progress callback (time spent waiting
+    for I/O at commit is not included). Replaces any trace callback and progress handler of the connection
+    while active.
+    """
+    current = {"sql": None, "start": 0.0, "last": 0.0}
+
+    def finish():
+        if current["sql"] is not None:
+            seconds = current["last"] - current["start"]
+            if seconds * 1000 >= slow_ms:
+                emit("statement", source, "warning", sql=current["sql"], seconds=seconds)
+        current["sql"] = None
+
+    def on_statement(sql: str):
+        finish()
+        now = time.perf_counter()
+        current.update(sql=sql, start=now, last=now)
+
+    def on_progress() -> int:
+        current["last"] = time.perf_counter()
+        return 0
+
+    connection.set_trace_callback(on_statement)
+    connection.set_progress_handler(on_progress, progress_steps)
+    try:
+        yield
+    finally:
+        finish()
+        connection.set_trace_callback(None)
+        connection.set_progress_handler(None, 0)
@@ -0,0 +1,244 @@
+from sqlite3 import Connection
+from typing import List, Optional, Tuple
+
+from .SimpleM3DataLoader import TagType
+from .instrumentation import stage
+from .query import get_tagset
+
+
+# The interval of a media (e.g. a keyframe or a transcript segment), taken from its designated start and end
+# tags (e.g. "Start (ms)" and "End (ms)"), in an R*Tree over (group, start, end) per media. The group is the
+# group_id of the media (its video), 0 for medias without a group. rtree_i32 stores 32-bit integers, intervals
+# outside that range (about 24 days in milliseconds) and with start > end are not indexed.
+# The triggers keep the index up to date as taggings are added or removed and medias are regrouped,
+# bulk_load_session drops them and rebuilds the index instead.
+# The triggers delete and reinsert rather than INSERT OR REPLACE, the conflict clause of a trigger statement is
+# overridden by the one of the outer statement (INSERT OR IGNORE INTO taggings) and would ignore the new interval.
+_INTERVAL_INDEX_DDL = """
+CREATE TABLE IF NOT EXISTS interval_tagsets (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    start_tagset_id INTEGER NOT NULL REFERENCES tagsets(id),
+    end_tagset_id INTEGER NOT NULL REFERENCES tagsets(id)
+);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS media_intervals USING rtree_i32(
+    media_id,
+    min_group_id, max_group_id,
+    start_value, end_value
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_taggings_insert_media_intervals AFTER INSERT ON taggings
+WHEN (SELECT tagset_id FROM tags WHERE id = NEW.tag_id) IN (
+    SELECT start_tagset_id FROM interval_tagsets UNION ALL SELECT end_tagset_id FROM interval_tagsets
+)
+BEGIN
+    DELETE FROM media_intervals WHERE media_id = NEW.media_id;
+    INSERT INTO media_intervals (media_id, min_group_id, max_group_id, start_value, end_value)
+    {new_interval};
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_taggings_delete_media_intervals AFTER DELETE ON taggings
+WHEN (SELECT tagset_id FROM tags WHERE id = OLD.tag_id) IN (
+    SELECT start_tagset_id FROM interval_tagsets UNION ALL SELECT end_tagset_id FROM interval_tagsets
+)
+BEGIN
+    DELETE FROM media_intervals WHERE media_id = OLD.media_id;
+    INSERT INTO media_intervals (media_id, min_group_id, max_group_id, start_value, end_value)
+    {old_interval};
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_medias_update_group_media_intervals AFTER UPDATE OF group_id ON medias
+BEGIN
+    UPDATE media_intervals
+    SET min_group_id = COALESCE(NEW.group_id, 0), max_group_id = COALESCE(NEW.group_id, 0)
+    WHERE media_id = NEW.id;
+END;
+"""
+
+# The interval of one media, the earliest start and the latest end. CROSS JOIN reads the taggings of the media
+# first, instead of every tag of the start and end tagsets.
+_MEDIA_INTERVAL_SELECT = """
+    SELECT media_id, group_id, group_id, start_value, end_value
+    FROM (
+        SELECT m.id AS media_id, COALESCE(m.group_id, 0) AS group_id,
+            (
+                SELECT MIN(s.value) FROM taggings tg CROSS JOIN numerical_int_tags s ON s.id = tg.tag_id
+                WHERE tg.media_id = m.id AND s.tagset_id = it.start_tagset_id
+            ) AS start_value,
+            (
+                SELECT MAX(e.value) FROM taggings tg CROSS JOIN numerical_int_tags e ON e.id = tg.tag_id
+                WHERE tg.media_id = m.id AND e.tagset_id = it.end_tagset_id
+            ) AS end_value
+        FROM medias m, interval_tagsets it
+        WHERE m.id = {media_id} AND it.id = 1
+    )
+    WHERE start_value <= end_value AND start_value >= -2147483648 AND end_value <= 2147483647"""
+
+# The intervals of all medias with both a start and an end tag
+_INTERVAL_SELECT = """
+    SELECT ts.media_id, COALESCE(m.group_id, 0), COALESCE(m.group_id, 0), MIN(s.value), MAX(e.value)
+    FROM interval_tagsets it
+    JOIN numerical_int_tags s ON s.tagset_id = it.start_tagset_id
+    JOIN taggings ts ON ts.tag_id = s.id
+    JOIN taggings te ON te.media_id = ts.media_id
+    JOIN numerical_int_tags e ON e.id = te.tag_id AND e.tagset_id = it.end_tagset_id
+    JOIN medias m ON m.id = ts.media_id
+    WHERE it.id = 1"""
+
+_INTERVAL_HAVING = """HAVING MIN(s.value) <= MAX(e.value)
+        AND MIN(s.value) >= -2147483648 AND MAX(e.value) <= 2147483647"""
+
+RELATIONS = ("overlaps", "within", "contains")
+
+# Largest distance searched by nearest_intervals (the range of rtree_i32)
+_MAX_DISTANCE = 1 << 32
+
+
+def has_interval_index(connection: Connection) -> bool:
+    return connection.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'interval_tagsets'"
+    ).fetchone() is not None
+
+
+def _numerical_int_tagset_id(connection: Connection, tagset_name: str) -> int:
+    tagset_id, tagtype = get_tagset(connection, tagset_name)
+    if tagtype != TagType.NUMERICAL_INT:
+        raise ValueError(f'Interval tagsets must be numerical_int tagsets, "{tagset_name}" is {tagtype.name.lower()}')
+    return tagset_id
+
+
+def enable_interval_index(connection: Connection, start_tagset: str, end_tagset: str):
+    """
+    Index the intervals of the medias (e.g. keyframes, transcript segments) given by a start and an end tagset
+    for overlap, containment and nearest interval queries (see query_intervals and nearest_intervals).
+    The index is built from the existing taggings and kept up to date as taggings are added.
+
+    Parameters:
+    - connection: sqlite3.Connection object to the database.
+    - start_tagset: Name of the numerical_int tagset holding the interval starts (e.g. "Start (ms)").
+    - end_tagset: Name of the numerical_int tagset holding the interval ends (e.g. "End (ms)").
+    """
+    start_tagset_id = _numerical_int_tagset_id(connection, start_tagset)
+    end_tagset_id = _numerical_int_tagset_id(connection, end_tagset)
+    connection.executescript(
+        _INTERVAL_INDEX_DDL.format(
+            new_interval=_MEDIA_INTERVAL_SELECT.format(media_id="NEW.media_id"),
+            old_interval=_MEDIA_INTERVAL_SELECT.format(media_id="OLD.media_id")
+        )
+    )
+    try:
+        connection.execute(
+            "INSERT OR REPLACE INTO interval_tagsets (id, start_tagset_id, end_tagset_id) VALUES (1, ?, ?)",
+            [start_tagset_id, end_tagset_id]
+        )
+        rebuild_interval_index(connection)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+
+
+def rebuild_interval_index(connection: Connection):
+    """
+    Rebuild the interval index from the taggings of the start and end tagsets.
+    Used after loads that bypass the maintenance triggers (see bulk_load_session).
+
+    Parameters:
+    - connection: sqlite3.Connection object to the database.
+    """
+    with stage("SDL.rebuild_interval_index") as rebuild_stage:
+        connection.execute("DELETE FROM media_intervals")
+        rebuild_stage.rows = connection.execute(
+            f"""
+            INSERT INTO media_intervals (media_id, min_group_id, max_group_id, start_value, end_value)
+            {_INTERVAL_SELECT}
+            GROUP BY ts.media_id
+            {_INTERVAL_HAVING}
+            """
+        ).rowcount
+
+
+def query_intervals(
+    connection: Connection,
+    start: int,
+    end: int,
+    group_id: Optional[int] = None,
+    relation: str = "overlaps"
+) -> List[Tuple[int, int, int]]:
+    """
+    Find the medias whose interval relates to [start, end], e.g. the segments of a video overlapping 60-75 s.
+
+    Parameters:
+    - connection: sqlite3.Connection object to the database.
+    - start: Start of the searched interval (inclusive, in the unit of the interval tagsets).
+    - end: End of the searched interval (inclusive).
+    - group_id: Optional group (the media id of the video) the medias belong to, all groups by default.
+    - relation: overlaps (the intervals share at least one point), within (the media interval lies inside
+                [start, end]) or contains (the media interval covers [start, end]).
+
+    Returns:
+    - List of (media_id, start, end), ordered by start
+    """
+    if relation not in RELATIONS:
+        raise ValueError(f"Invalid relation: {relation} (supported: {', '.join(RELATIONS)})")
+    if start > end:
+        raise ValueError(f"Invalid interval: start {start} is after end {end}")
+
+    if relation == "overlaps":
+        conditions, params = ["start_value <= ?", "end_value >= ?"], [end, start]
+    elif relation == "within":
+        conditions, params = ["start_value >= ?", "end_value <= ?"], [start, end]
+    else:
+        conditions, params = ["start_value <= ?", "end_value >= ?"], [start, end]
+    if group_id is not None:
+        conditions += ["min_group_id >= ?", "max_group_id <= ?"]
+        params += [group_id, group_id]
+
+    with stage("SDL.query_intervals", "debug", relation=relation) as query_stage:
+        results = connection.execute(
+            f"""
+            SELECT media_id, start_value, end_value
+            FROM media_intervals
+            WHERE {' AND '.join(conditions)}
+            ORDER BY start_value, media_id
+            """,
+            params
+        ).fetchall()
+        query_stage.rows = len(results)
+    return results
+
+
+def nearest_intervals(
+    connection: Connection,
+    position: int,
+    group_id: Optional[int] = None,
+    k: int = 1
+) -> List[Tuple[int, int, int, int]]:
+    """
+    Find the k medias whose interval is nearest to a position, e.g. the keyframe of a video closest to 61.5 s.
+
+    The R*Tree is searched with a window around the position that grows until it holds k intervals,
+    every interval within the window is at most its half-width away so the k nearest are among them.
+
+    Parameters:
+    - connection: sqlite3.Connection object to the database.
+    - position: The position (in the unit of the interval tagsets).
+    - group_id: Optional group (the media id of the video) the medias belong to, all groups by default.
+    - k: Number of medias returned.
+
+    Returns:
+    - List of (media_id, start, end, distance), nearest first (distance 0 for intervals containing the position)
+    """
+    width = 1
+    while True:
+        candidates = query_intervals(connection, position - width, position + width, group_id)
+        if len(candidates) >= k or width >= _MAX_DISTANCE:
+            break
+        width *= 8
+
+    results = [
+        (media_id, start, end, max(start - position, position - end, 0))
+        for media_id, start, end in candidates
+    ]
+    results.sort(key=lambda result: (result[3], result[1], result[0]))
+    return results[:k]
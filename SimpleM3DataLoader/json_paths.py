@@ -0,0 +1,125 @@
+from sqlite3 import Connection
+from typing import Dict, List, Optional
+
+from .SimpleM3DataLoader import TagType
+from .instrumentation import stage
+from .query import get_tagset, json_path_expression
+
+
+# The JSON paths declared per JSON tagset. Each path has a partial expression index on json_tags
+# (idx_json_path_<id>, restricted to the tagset), SQLite extracts the path when tags are inserted and
+# JSON path filters (see query) seek the index instead of calling json_extract on every tag of the tagset.
+_JSON_PATHS_DDL = """
+CREATE TABLE IF NOT EXISTS json_path_indexes (
+    id INTEGER PRIMARY KEY,
+    tagset_id INTEGER NOT NULL REFERENCES tagsets(id),
+    path TEXT NOT NULL,
+    UNIQUE (tagset_id, path)
+);
+"""
+
+
+def _json_tagset_id(connection: Connection, tagset_name: str) -> int:
+    tagset_id, tagtype = get_tagset(connection, tagset_name)
+    if tagtype != TagType.JSON:
+        raise ValueError(f'JSON path indexes require a JSON tagset, "{tagset_name}" is {tagtype.name.lower()}')
+    return tagset_id
+
+
+def _has_json_path_indexes(connection: Connection) -> bool:
+    return connection.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'json_path_indexes'"
+    ).fetchone() is not None
+
+
+def add_json_path_indexes(connection: Connection, tagset_name: str, paths: List[str]):
+    """
+    Declare JSON paths of a JSON tagset that are filtered on (e.g. "$.class", "$.confidence") and index them.
+    The values at the paths are extracted into an expression index per path, existing tags are indexed now
+    and tags added later as they are inserted.
+
+    Parameters:
+    - connection: sqlite3.Connection object to the database.
+    - tagset_name: Name of the JSON tagset.
+    - paths: JSON paths (SQLite JSON path syntax), paths that are already declared are skipped.
+    """
+    tagset_id = _json_tagset_id(connection, tagset_name)
+    for path in paths:
+        # Validates the path syntax, json_extract raises on a malformed path
+        connection.execute("SELECT json_extract('{}', ?)", [path])
+        json_path_expression("value", path)
+
+    connection.execute(_JSON_PATHS_DDL)
+    try:
+        for path in paths:
+            row = connection.execute(
+                "INSERT INTO json_path_indexes (tagset_id, path) VALUES (?, ?) ON CONFLICT DO NOTHING RETURNING id",
+                [tagset_id, path]
+            ).fetchone()
+            if row is None:
+                continue
+            with stage("SDL.add_json_path_index", tagset=tagset_name, path=path) as index_stage:
+                index_stage.rows = connection.execute(
+                    "SELECT COUNT(*) FROM json_tags WHERE tagset_id = ?", [tagset_id]
+                ).fetchone()[0]
+                connection.execute(
+                    f"""
+                    CREATE INDEX IF NOT EXISTS idx_json_path_{row[0]}
+                    ON json_tags ({json_path_expression("value", path)})
+                    WHERE tagset_id = {int(tagset_id)}
+                    """
+                )
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+
+
+def drop_json_path_indexes(connection: Connection, tagset_name: str, paths: Optional[List[str]] = None):
+    """
+    Drop the indexes of declared JSON paths (see add_json_path_indexes), filters on them scan the tags of the tagset.
+
+    Parameters:
+    - connection: sqlite3.Connection object to the database.
+    - tagset_name: Name of the JSON tagset.
+    - paths: Paths to drop, all paths of the tagset by default.
+    """
+    if not _has_json_path_indexes(connection):
+        return
+    tagset_id = _json_tagset_id(connection, tagset_name)
+    rows = connection.execute("SELECT id, path FROM json_path_indexes WHERE tagset_id = ?", [tagset_id]).fetchall()
+    try:
+        for path_id, path in rows:
+            if paths is not None and path not in paths:
+                continue
+            connection.execute(f"DROP INDEX IF EXISTS idx_json_path_{path_id}")
+            connection.execute("DELETE FROM json_path_indexes WHERE id = ?", [path_id])
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+
+
+def get_json_path_indexes(connection: Connection) -> Dict[str, List[str]]:
+    """
+    Get the declared JSON paths.
+
+    Parameters:
+    - connection: sqlite3.Connection object to the database.
+
+    Returns:
+    - Dictionary of tagset name -> list of declared paths
+    """
+    if not _has_json_path_indexes(connection):
+        return {}
+    paths: Dict[str, List[str]] = {}
+    for tagset_name, path in connection.execute(
+        """
+        SELECT ts.name, p.path
+        FROM json_path_indexes p
+        JOIN tagsets ts ON ts.id = p.tagset_id
+        ORDER BY ts.name, p.id
+        """
+    ):
+        paths.setdefault(tagset_name, []).append(path)
+    return paths
@@ -0,0 +1,219 @@
+import json
+from dataclasses import dataclass
+from itertools import batched
+from sqlite3 import Connection
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .SimpleM3DataLoader import (
+    MediaSourceType, TagType, decode_tag_value, register_taggings_listener, unregister_taggings_listener
+)
+from .instrumentation import stage
+
+
+# All tags of a media in one row: a JSON object of tagset id -> stored values (see get_media_records).
+# The triggers invalidate (delete) the row of a media in the transaction changing its taggings, the taggings
+# listener below writes it again after each committed batch of add_media_taggings. Medias without a row
+# (invalidated by other writers, or without taggings) are materialized from the tag tables when they are read.
+_MEDIA_TAG_CACHE_DDL = """
+CREATE TABLE IF NOT EXISTS media_tag_cache (
+    media_id INTEGER PRIMARY KEY REFERENCES medias(id),
+    tags TEXT NOT NULL
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_taggings_insert_media_tag_cache AFTER INSERT ON taggings
+BEGIN
+    DELETE FROM media_tag_cache WHERE media_id = NEW.media_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_taggings_delete_media_tag_cache AFTER DELETE ON taggings
+BEGIN
+    DELETE FROM media_tag_cache WHERE media_id = OLD.media_id;
+END;
+"""
+
+# The value of a tag, looked up in the typed tag table of its tag type only
+_TAG_VALUE = "CASE t.tagtype_id\n" + "\n".join(
+    f"        WHEN {tagtype.value} THEN (SELECT value FROM {tagtype.name.lower()}_tags WHERE id = t.id)"
+    for tagtype in TagType
+) + "\n    END"
+
+# Number of medias materialized per statement by rebuild_media_tag_cache
+REBUILD_BATCH_SIZE = 10_000
+
+
+@dataclass
+class MediaRecord():
+    """
+    A media with all its tags, tags maps tagset names to their decoded values (see decode_tag_value).
+    """
+    id: int
+    source: str
+    source_type: MediaSourceType
+    thumbnail: Optional[str]
+    group_id: Optional[int]
+    tags: Dict[str, List[Any]]
+
+
+def has_media_tag_cache(connection: Connection) -> bool:
+    return connection.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'media_tag_cache'"
+    ).fetchone() is not None
+
+
+def _materialize(connection: Connection, media_ids: List[int]) -> Dict[int, Dict[str, List[Any]]]:
+    """
+    Read the stored tag values of medias from the tag tables, grouped by tagset id.
+    """
+    tags: Dict[int, Dict[str, List[Any]]] = {}
+    cursor = connection.execute(
+        f"""
+        SELECT tg.media_id, t.tagset_id, {_TAG_VALUE}
+        FROM json_each(?) j
+        CROSS JOIN taggings tg ON tg.media_id = j.value
+        JOIN tags t ON t.id = tg.tag_id
+        ORDER BY tg.media_id, t.tagset_id, t.id
+        """,
+        [json.dumps(media_ids)]
+    )
+    for media_id, tagset_id, value in cursor:
+        tags.setdefault(media_id, {}).setdefault(str(tagset_id), []).append(value)
+    return tags
+
+
+def refresh_media_tag_cache(connection: Connection, media_ids: Iterable[int]):
+    """
+    Write the cached tags of medias (in the current transaction, the caller commits).
+
+    Parameters:
+    - connection: sqlite3.Connection object to the database.
+    - media_ids: Ids of the medias to refresh.
+    """
+    media_ids = list(dict.fromkeys(media_ids))
+    tags = _materialize(connection, media_ids)
+    connection.executemany(
+        "INSERT OR REPLACE INTO media_tag_cache (media_id, tags) VALUES (?, ?)",
+        ((media_id, json.dumps(media_tags, separators=(",", ":"))) for media_id, media_tags in tags.items())
+    )
+    connection.execute(
+        "DELETE FROM media_tag_cache WHERE media_id IN (SELECT value FROM json_each(?))",
+        [json.dumps([media_id for media_id in media_ids if media_id not in tags])]
+    )
+
+
+def rebuild_media_tag_cache(connection: Connection):
+    """
+    Rebuild the cached tags of all medias (in the current transaction, the caller commits).
+    Used after loads that bypass the maintenance triggers (see bulk_load_session).
+
+    Parameters:
+    - connection: sqlite3.Connection object to the database.
+    """
+    with stage("SDL.rebuild_media_tag_cache") as rebuild_stage:
+        connection.execute("DELETE FROM media_tag_cache")
+        media_ids = [media_id for (media_id,) in connection.execute("SELECT DISTINCT media_id FROM taggings")]
+        for batch in batched(media_ids, REBUILD_BATCH_SIZE):
+            refresh_media_tag_cache(connection, batch)
+        rebuild_stage.rows = len(media_ids)
+
+
+def enable_media_tag_cache(connection: Connection):
+    """
+    Create the per-media tag cache read by get_media_records and fill it with the tags of all medias.
+    The cache is kept up to date by add_media_taggings (and the other taggings loaders) of this process,
+    see attach_media_tag_cache.
+
+    Parameters:
+    - connection: sqlite3.Connection object to the database.
+    """
+    connection.executescript(_MEDIA_TAG_CACHE_DDL)
+    try:
+        rebuild_media_tag_cache(connection)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    attach_media_tag_cache()
+
+
+def attach_media_tag_cache():
+    """
+    Refresh the cached tags of the medias of every committed batch of taggings written by add_media_taggings
+    (and the other taggings loaders) in this process from now on. Databases without the cache are skipped.
+    Called by enable_media_tag_cache, processes that load into a database whose cache was enabled earlier
+    attach it themselves. Without it the medias of new taggings are read from the tag tables (see
+    get_media_records) until the next rebuild.
+    """
+    register_taggings_listener(_on_taggings)
+
+
+def detach_media_tag_cache():
+    unregister_taggings_listener(_on_taggings)
+
+
+def _on_taggings(connection: Connection, taggings: List[Tuple[int, int]], deleted: bool = False):
+    # The medias of deleted taggings are refreshed the same way, their cached tags are read again.
+    # Within bulk_load_session the cache is rebuilt once the load is done
+    if getattr(connection, "defer_commits", False):
+        return
+    if not has_media_tag_cache(connection):
+        # Ends the read transaction the check starts on autocommit=False connections (nothing else is pending,
+        # listeners are called after the batch is committed), it would otherwise block other writers
+        connection.commit()
+        return
+    try:
+        with stage("SDL.refresh_media_tag_cache", "debug", rows=len(taggings)):
+            refresh_media_tag_cache(connection, (media_id for media_id, _ in taggings))
+            connection.commit()
+    except Exception:
+        # The taggings are committed, the invalidated rows are read from the tag tables until the next refresh
+        connection.rollback()
+        raise
+
+
+def get_media_records(connection: Connection, media_ids: Iterable[int]) -> List[MediaRecord]:
+    """
+    Get medias with all their tags, e.g. the detail view of a page of query results.
+
+    The medias and their cached tags are read in one statement, medias without a cached row are read from
+    the tag tables (the cache is optional, see enable_media_tag_cache).
+
+    Parameters:
+    - connection: sqlite3.Connection object to the database.
+    - media_ids: Ids of the medias.
+
+    Returns:
+    - List of MediaRecord in the order of media_ids, ids that are not found are skipped
+    """
+    media_ids = list(media_ids)
+    cached = "c.tags" if has_media_tag_cache(connection) else "NULL"
+    cache_join = "LEFT JOIN media_tag_cache c ON c.media_id = m.id" if cached == "c.tags" else ""
+    with stage("SDL.get_media_records", "debug") as records_stage:
+        rows = connection.execute(
+            f"""
+            SELECT m.id, m.source, m.source_type, m.thumbnail_uri, m.group_id, {cached}
+            FROM json_each(?) j
+            CROSS JOIN medias m ON m.id = j.value
+            {cache_join}
+            ORDER BY j.key
+            """,
+            [json.dumps(media_ids)]
+        ).fetchall()
+        records_stage.rows = len(rows)
+
+        missing = [row[0] for row in rows if row[5] is None]
+        materialized = _materialize(connection, missing) if missing else {}
+        records_stage.fields["materialized"] = len(missing)
+
+    tagsets = {
+        str(tagset_id): (name, TagType(tagtype_id))
+        for tagset_id, name, tagtype_id in connection.execute("SELECT id, name, tagtype_id FROM tagsets")
+    }
+    records = []
+    for media_id, source, source_type, thumbnail, group_id, cached_tags in rows:
+        media_tags = json.loads(cached_tags) if cached_tags is not None else materialized.get(media_id, {})
+        tags = {}
+        for tagset_id, values in media_tags.items():
+            name, tagtype = tagsets[tagset_id]
+            tags[name] = [decode_tag_value(tagtype, value) for value in values]
+        records.append(MediaRecord(media_id, source, MediaSourceType(source_type), thumbnail, group_id, tags))
+    return records
@@ -0,0 +1,142 @@
+import json
+import os
+import sqlite3
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Deque, Iterable, List, Optional, Tuple, Union
+
+from .SimpleM3DataLoader import notify_taggings_listeners, resolve_media_taggings
+from .bulk import _set_pragmas
+from .instrumentation import log, log_error, stage
+
+
+# Read-only connection of a worker process, opened by _init_worker. In autocommit mode, so that the
+# staging statements of resolve_media_taggings do not leave a read transaction open for the whole load
+# (which would keep the WAL from being checkpointed while the writer appends to it).
+_worker_connection: Optional[sqlite3.Connection] = None
+
+
+def _init_worker(db_uri: str):
+    global _worker_connection
+    _worker_connection = sqlite3.connect(db_uri, uri=True, autocommit=True)
+
+
+def _prepare_taggings_batch(batch: List[Union[str, Any]]) -> List[Tuple[int, int]]:
+    """
+    Worker: decode (raw JSON Lines) and resolve a batch of media taggings to (media_id, tag_id) rows.
+    """
+    records = [json.loads(record) if isinstance(record, str) else record for record in batch]
+    return resolve_media_taggings(_worker_connection, records)
+
+
+def add_media_taggings_parallel(
+    db_file: Path,
+    batches: Iterable[List[Union[str, Any]]],
+    workers: Optional[int] = None,
+    max_pending: Optional[int] = None,
+    commit_rows: int = 1_000_000,
+    on_batch_written: Optional[Callable[[sqlite3.Connection, int], None]] = None
+) -> int:
+    """
+    Add media taggings with a pool of worker processes feeding a single SQLite writer.
+
+    The workers decode and normalize the batches and resolve media sources and tag values through
+    their own read-only connections. The writer (the calling process) only inserts the resulting
+    (media_id, tag_id) rows and commits every commit_rows rows. The database is switched to WAL for
+    the duration of the load so that the readers never block the writer.
+
+    Parameters:
+    - db_file: Path to the sqlite3 database file.
+    - batches: Iterable of batches, each a list of media tagging dictionaries (see add_media_taggings)
+               or raw JSON Lines strings (see iter_raw_json_batches).
+    - workers: Number of worker processes (default: number of CPUs).
+    - max_pending: Maximum number of batches in flight, bounds the memory use (default: 2 * workers).
+    - commit_rows: Number of inserted rows per transaction.
+    - on_batch_written: Optional callback with the writer connection and the index of a batch, called
+                        in the transaction that commits the batch (e.g. to record a checkpoint).
+
+    Returns:
+    - The number of taggings handed to the writer
+
+    If a batch fails the uncommitted rows are rolled back and the error is raised, the rows committed
+    before (every commit_rows rows) are kept.
+    """
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or 2 * workers
+    db_uri = f"{Path(db_file).resolve().as_uri()}?mode=ro"
+
+    connection = sqlite3.connect(db_file, autocommit=False)
+    connection.execute("PRAGMA foreign_keys = ON")
+    journal_mode = connection.execute("PRAGMA journal_mode").fetchone()[0]
+    _set_pragmas(connection, {"journal_mode": "WAL"})
+
+    total_rows = 0
+    uncommitted: List[Tuple[int, List[Tuple[int, int]]]] = []
+    uncommitted_rows = 0
+    pending: Deque[Tuple[int, Future]] = deque()
+
+    def commit():
+        nonlocal uncommitted, uncommitted_rows
+        if on_batch_written is not None:
+            for index, _ in uncommitted:
+                on_batch_written(connection, index)
+        connection.commit()
+        for _, rows in uncommitted:
+            notify_taggings_listeners(connection, rows)
+        uncommitted = []
+        uncommitted_rows = 0
+
+    def write(index: int, future: Future):
+        nonlocal total_rows, uncommitted_rows
+        # Time the writer spends waiting for the workers versus inserting
+        with stage("SDL.add_media_taggings_parallel.wait", "debug") as wait_stage:
+            rows = future.result()
+            wait_stage.rows = len(rows)
+        with stage("SDL.add_media_taggings_parallel.insert", "debug", rows=len(rows)):
+            connection.executemany(
+                """
+                INSERT OR IGNORE INTO taggings (media_id, tag_id)
+                VALUES (?, ?)
+                """,
+                rows
+            )
+        total_rows += len(rows)
+        parallel_stage.rows = total_rows
+        uncommitted.append((index, rows))
+        uncommitted_rows += len(rows)
+        if uncommitted_rows >= commit_rows:
+            commit()
+            elapsed = time.perf_counter() - parallel_stage.start
+            log(
+                "SDL.add_media_taggings_parallel", f"{total_rows} taggings",
+                rows=total_rows, rows_per_sec=round(total_rows / max(elapsed, 1e-9))
+            )
+
+    try:
+        with stage("SDL.add_media_taggings_parallel", workers=workers) as parallel_stage:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(db_uri,)) as pool:
+                try:
+                    for index, batch in enumerate(batches):
+                        # Backpressure: wait for the oldest batch before reading further
+                        if len(pending) >= max_pending:
+                            write(*pending.popleft())
+                        pending.append((index, pool.submit(_prepare_taggings_batch, batch)))
+                    while pending:
+                        write(*pending.popleft())
+                except BaseException:
+                    for _, future in pending:
+                        future.cancel()
+                    raise
+            commit()
+    except Exception as e:
+        # The batches committed so far stay, the error is raised so the load is not reported as complete
+        log_error("SDL.add_media_taggings_parallel", "Error adding media taggings", e)
+        if connection.in_transaction:
+            connection.rollback()
+        raise
+    finally:
+        _set_pragmas(connection, {"journal_mode": journal_mode})
+        connection.close()
+    return total_rows
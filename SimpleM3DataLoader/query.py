@@ -0,0 +1,281 @@
+from sqlite3 import Connection
+from typing import Any, Iterator, List, Optional, Tuple, Union
+
+from .SimpleM3DataLoader import MediaSourceType, TagType, canonical_json, encode_tag_value
+
+
+# (tagset_name, operator, value), or (tagset_name, json_path, operator, value) for a field of the tags of a JSON tagset
+# For "in" the value is a list of values and for "between" a (low, high) pair
+Filter = Union[Tuple[str, str, Any], Tuple[str, str, str, Any]]
+
+COMPARISON_OPERATORS = ("=", "!=", "<", "<=", ">", ">=")
+OPERATORS = (*COMPARISON_OPERATORS, "in", "between")
+
+# Number of taggings counted at most per filter to estimate its selectivity
+SELECTIVITY_SAMPLE_LIMIT = 10_000
+
+
+def get_tagset(connection: Connection, tagset_name: str) -> Tuple[int, TagType]:
+    """
+    Get the id and tag type of a tagset.
+
+    Parameters:
+    - connection: sqlite3.Connection object to the database.
+    - tagset_name: Name of the tagset.
+
+    Returns:
+    - (tagset_id, TagType)
+    """
+    res = connection.execute(
+        "SELECT id, tagtype_id FROM tagsets WHERE name = ?", [tagset_name]
+    ).fetchone()
+    if res is None:
+        raise ValueError(f'Tagset not found: "{tagset_name}"')
+    return res[0], TagType(res[1])
+
+
+def _filter_condition(alias: str, operator: str, value: Any, expression: Optional[str] = None) -> Tuple[str, List[Any]]:
+    """
+    SQL condition on the typed tag value of a filter (or on the given expression) and its parameters.
+    """
+    column = expression or f"{alias}.value"
+    operator = operator.lower()
+    if operator in COMPARISON_OPERATORS:
+        return f"{column} {operator} ?", [value]
+    if operator == "in":
+        values = list(value)
+        if len(values) == 0:
+            raise ValueError("Operator 'in' requires at least one value")
+        return f"{column} IN ({', '.join('?' for _ in values)})", values
+    if operator == "between":
+        low, high = value
+        return f"{column} BETWEEN ? AND ?", [low, high]
+    raise ValueError(f"Invalid operator: {operator} (supported: {', '.join(OPERATORS)})")
+
+
+def json_path_expression(column: str, path: str) -> str:
+    """
+    SQL expression extracting a JSON path (e.g. "$.class", "$.box[2]") from a JSON tag value column.
+    The path is inlined as a literal, so that the expression matches the path indexes (see add_json_path_indexes).
+    """
+    if not path.startswith("$"):
+        raise ValueError(f'Invalid JSON path: "{path}" (paths start with "$", e.g. "$.class")')
+    quoted = path.replace("'", "''")
+    return f"json_extract({column}, '{quoted}')"
+
+
+def _encode_json_path_value(value: Any) -> Any:
+    # json_extract returns JSON booleans as 1/0 and objects and arrays as (compact) JSON text
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (dict, list)):
+        return canonical_json(value)
+    return value
+
+
+def encode_filter_value(tagtype: TagType, operator: str, value: Any) -> Any:
+    """
+    Convert the value(s) of a filter to the stored representation of the tag type (see encode_tag_value).
+    """
+    operator = operator.lower()
+    if operator == "in":
+        return [encode_tag_value(tagtype, v) for v in value]
+    if operator == "between":
+        low, high = value
+        return (encode_tag_value(tagtype, low), encode_tag_value(tagtype, high))
+    return encode_tag_value(tagtype, value)
+
+
+def encode_json_path_filter_value(operator: str, value: Any) -> Any:
+    """
+    Convert the value(s) of a JSON path filter to the SQL values returned by json_extract.
+    """
+    operator = operator.lower()
+    if operator == "in":
+        return [_encode_json_path_value(v) for v in value]
+    if operator == "between":
+        low, high = value
+        return (_encode_json_path_value(low), _encode_json_path_value(high))
+    return _encode_json_path_value(value)
+
+
+def _json_path_index(connection: Connection, tagset_id: int, path: str) -> Optional[str]:
+    """
+    Name of the index of a declared JSON path (see add_json_path_indexes), None if the path is not indexed.
+    """
+    has_paths = connection.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'json_path_indexes'"
+    ).fetchone()
+    if has_paths is None:
+        return None
+    res = connection.execute(
+        "SELECT id FROM json_path_indexes WHERE tagset_id = ? AND path = ?", [tagset_id, path]
+    ).fetchone()
+    return None if res is None else f"idx_json_path_{res[0]}"
+
+
+# (typed_table, tagset_id, operator, encoded_value, json_path, json_path_index)
+_Term = Tuple[str, int, str, Any, Optional[str], Optional[str]]
+
+
+def _filter_terms(connection: Connection, filters: List[Filter]) -> List[_Term]:
+    """
+    Route each filter to the typed tag table of its tagset.
+    """
+    terms = []
+    for f in filters:
+        if len(f) == 4:
+            tagset_name, path, operator, value = f
+            tagset_id, tagtype = get_tagset(connection, tagset_name)
+            if tagtype != TagType.JSON:
+                raise ValueError(f'JSON path filters require a JSON tagset, "{tagset_name}" is {tagtype.name.lower()}')
+            index = _json_path_index(connection, tagset_id, path)
+            terms.append(("json_tags", tagset_id, operator, encode_json_path_filter_value(operator, value), path, index))
+            continue
+        tagset_name, operator, value = f
+        tagset_id, tagtype = get_tagset(connection, tagset_name)
+        terms.append((f"{tagtype.name.lower()}_tags", tagset_id, operator, encode_filter_value(tagtype, operator, value), None, None))
+    return terms
+
+
+def _term_source(term: _Term, alias: str) -> str:
+    """
+    The tag table of a filter driving a query. A JSON path filter seeks the index of its path when there is one,
+    SQLite does not pick partial expression indexes reliably by itself.
+    """
+    table, _, operator, _, _, index = term
+    if index is not None and operator != "!=":
+        return f"{table} {alias} INDEXED BY {index}"
+    return f"{table} {alias}"
+
+
+def _term_condition(term: _Term, alias: str) -> Tuple[str, List[Any]]:
+    _, tagset_id, operator, value, path, _ = term
+    if path is None:
+        condition, params = _filter_condition(alias, operator, value)
+        return f"{alias}.tagset_id = ? AND {condition}", [tagset_id, *params]
+    # The path indexes are partial indexes on one tagset, SQLite only uses them when the tagset id is a literal
+    condition, params = _filter_condition(alias, operator, value, json_path_expression(f"{alias}.value", path))
+    return f"{alias}.tagset_id = {int(tagset_id)} AND {condition}", params
+
+
+def _estimate_cardinality(connection: Connection, term: _Term) -> int:
+    """
+    Estimate the number of taggings matching a filter by counting them up to SELECTIVITY_SAMPLE_LIMIT.
+    """
+    condition, params = _term_condition(term, "t")
+    return connection.execute(
+        f"""
+        SELECT COUNT(*) FROM (
+            SELECT 1
+            FROM {_term_source(term, "t")}
+            CROSS JOIN taggings tg ON tg.tag_id = t.id
+            WHERE {condition}
+            LIMIT ?
+        )
+        """,
+        [*params, SELECTIVITY_SAMPLE_LIMIT]
+    ).fetchone()[0]
+
+
+def build_query(
+    connection: Connection,
+    filters: List[Filter],
+    source_type: Optional[Union[MediaSourceType, str]] = None
+) -> Tuple[str, List[Any]]:
+    """
+    Build the SQL query for a conjunction of tag filters.
+
+    The most selective filter drives the query (a range seek on the (tagset_id, value) index, or on the path
+    index of a JSON path filter, joined with taggings), every other filter is checked per candidate media with an EXISTS on the taggings primary key,
+    in order of increasing estimated cardinality.
+
+    Parameters:
+    - connection: sqlite3.Connection object to the database.
+    - filters: List of (tagset_name, operator, value) filters, see query.
+    - source_type: Optional media source type the results are restricted to.
+
+    Returns:
+    - (sql, parameters)
+    """
+    if isinstance(source_type, str):
+        source_type = MediaSourceType[source_type.upper()]
+
+    terms = _filter_terms(connection, filters)
+    if len(terms) > 1:
+        terms.sort(key=lambda term: _estimate_cardinality(connection, term))
+
+    if not terms:
+        sql = "SELECT m.id FROM medias m"
+        params: List[Any] = []
+        if source_type is not None:
+            sql += " WHERE m.source_type = ?"
+            params.append(source_type.value)
+        return sql, params
+
+    condition, params = _term_condition(terms[0], "t")
+    # A JSON path filter seeks its path index, CROSS JOIN keeps the planner from scanning taggings instead
+    join = "JOIN" if terms[0][4] is None else "CROSS JOIN"
+    sql = f"""
+        SELECT DISTINCT tg.media_id
+        FROM {_term_source(terms[0], "t")}
+        {join} taggings tg ON tg.tag_id = t.id
+        """
+    if source_type is not None:
+        sql += "JOIN medias m ON m.id = tg.media_id AND m.source_type = ?\n"
+        params.insert(0, source_type.value)
+    sql += f"WHERE {condition}\n"
+
+    for i, term in enumerate(terms[1:], start=1):
+        condition, term_params = _term_condition(term, f"t{i}")
+        # Equality filters match few tags, which are probed directly on the taggings primary key.
+        # For the other operators and JSON paths (a value may be shared by many tags) the tags of the
+        # candidate media are scanned instead (CROSS JOIN fixes the join order), as the filter may match
+        # any number of tags.
+        join = "JOIN" if term[2].lower() in ("=", "in") and term[4] is None else "CROSS JOIN"
+        sql += f"""
+        AND EXISTS (
+            SELECT 1
+            FROM taggings tg{i}
+            {join} {term[0]} t{i} ON t{i}.id = tg{i}.tag_id
+            WHERE tg{i}.media_id = tg.media_id AND {condition}
+        )
+        """
+        params.extend(term_params)
+    return sql, params
+
+
+def query(
+    connection: Connection,
+    filters: List[Filter],
+    source_type: Optional[Union[MediaSourceType, str]] = None,
+    batch_size: int = 1000
+) -> Iterator[int]:
+    """
+    Query the ids of the medias matching all given tag filters.
+
+    Parameters:
+    - connection: sqlite3.Connection object to the database.
+    - filters: List of (tagset_name, operator, value) filters, all of which have to match.
+               Operators: =, !=, <, <=, >, >=, in (list of values), between ((low, high) pair)
+               e.g. [("Objects", "=", "car"), ("Upload Date", "<", "2026-01-01")]
+               Date, time and timestamp values are given as ISO 8601 strings or date/time/datetime objects.
+               Fields of JSON tags are filtered with (tagset_name, json_path, operator, value),
+               e.g. ("Boxes", "$.confidence", ">=", 0.8), see add_json_path_indexes.
+    - source_type: Optional media source type (MediaSourceType or its name) the results are restricted to.
+    - batch_size: Number of rows fetched from SQLite at a time.
+
+    Returns:
+    - Iterator over the matching media ids, the rows are fetched lazily
+    """
+    sql, params = build_query(connection, filters, source_type)
+    cursor = connection.execute(sql, params)
+    try:
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for (media_id,) in rows:
+                yield media_id
+    finally:
+        cursor.close()
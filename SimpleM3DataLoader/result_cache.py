@@ -0,0 +1,194 @@
+import json
+import sqlite3
+import sys
+import threading
+from collections import OrderedDict
+from itertools import islice
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, TypeVar, Union
+
+from .SimpleM3DataLoader import MediaSourceType
+from .facets import facet_counts
+from .instrumentation import log
+from .query import Filter, query
+
+
+T = TypeVar("T")
+
+_INT_SIZE = sys.getsizeof(2**40)
+
+
+def _estimate_size(value: Any) -> int:
+    """
+    Approximate memory used by a cached result (media id lists and facet counts).
+    """
+    size = sys.getsizeof(value)
+    if isinstance(value, (list, tuple)):
+        if value and isinstance(value[0], int):
+            return size + len(value) * _INT_SIZE
+        return size + sum(_estimate_size(item) for item in value)
+    if isinstance(value, dict):
+        return size + sum(_estimate_size(k) + _estimate_size(v) for k, v in value.items())
+    return size
+
+
+def _filter_key(f: Filter) -> str:
+    *target, operator, value = f
+    operator = operator.lower()
+    if operator == "in":
+        # The order of the values does not change the result
+        value = sorted(value, key=lambda v: json.dumps(v, default=str, sort_keys=True))
+    return json.dumps([*target, operator, value], default=str, sort_keys=True)
+
+
+def normalize_query(filters: Iterable[Filter], source_type: Optional[Union[MediaSourceType, str]] = None) -> str:
+    """
+    Cache key of a query: the filters in a canonical order and serialization (a conjunction does not depend on
+    the order of its filters), operators in lower case and the source type by name.
+    """
+    if isinstance(source_type, MediaSourceType):
+        source_type = source_type.name
+    return json.dumps([sorted(_filter_key(f) for f in filters), source_type.upper() if source_type else None])
+
+
+class ResultCache():
+    """
+    In-process LRU cache of query and facet results of one database, bounded by a number of entries and
+    an estimate of the memory used by the results.
+
+    The cache holds its own connection to the database file and reads PRAGMA data_version before every
+    lookup and before storing a result. data_version changes whenever another connection (of any process)
+    commits, the whole cache is then dropped. A result that was computed while a commit happened is not
+    stored, so cached results are never older than the last commit seen by the cache.
+    """
+
+    def __init__(self, db_file: Path, max_entries: int = 1024, max_bytes: int = 256 * 1024 * 1024):
+        """
+        Parameters:
+        - db_file: Path to the sqlite3 database file the cached queries run on.
+        - max_entries: Maximum number of cached results.
+        - max_bytes: Maximum (estimated) memory used by the cached results, larger results are not cached.
+        """
+        self.db_file = Path(db_file)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[str, ...], Tuple[Any, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._watcher = sqlite3.connect(
+            f"{self.db_file.resolve().as_uri()}?mode=ro", uri=True, autocommit=True, check_same_thread=False
+        )
+        self._data_version = self._watcher.execute("PRAGMA data_version").fetchone()[0]
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _validate(self):
+        # Called with the lock held
+        data_version = self._watcher.execute("PRAGMA data_version").fetchone()[0]
+        if data_version != self._data_version:
+            self._data_version = data_version
+            self._generation += 1
+            if self._entries:
+                self.invalidations += 1
+                log("SDL.ResultCache", f"Database changed, dropping {len(self._entries)} cached results", "debug")
+            self._entries.clear()
+            self._bytes = 0
+
+    def _store(self, key: Tuple[str, ...], value: Any):
+        # Called with the lock held
+        size = _estimate_size(value)
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (value, size)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            self.evictions += 1
+
+    def get_or_compute(self, key: Tuple[str, ...], compute: Callable[[], T]) -> T:
+        """
+        Return the cached result of key, or compute and cache it. Cached results are shared, they must
+        not be modified.
+        """
+        with self._lock:
+            self._validate()
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            generation = self._generation
+
+        value = compute()
+
+        with self._lock:
+            self._validate()
+            if self._generation == generation and key not in self._entries:
+                self._store(key, value)
+        return value
+
+    def query(
+        self,
+        connection: sqlite3.Connection,
+        filters: List[Filter],
+        source_type: Optional[Union[MediaSourceType, str]] = None,
+        limit: Optional[int] = None
+    ) -> Tuple[int, ...]:
+        """
+        Cached query (see query), the matching media ids (at most limit) as a tuple.
+        """
+        key = ("query", normalize_query(filters, source_type), str(limit))
+        return self.get_or_compute(key, lambda: tuple(islice(query(connection, filters, source_type), limit)))
+
+    def facet_counts(
+        self,
+        connection: sqlite3.Connection,
+        filters: List[Filter],
+        source_type: Optional[Union[MediaSourceType, str]] = None,
+        tagsets: Optional[List[str]] = None,
+        top_n: int = 10
+    ) -> Dict[str, List[Tuple[Any, int]]]:
+        """
+        Cached facet counts (see facet_counts) of the medias matching the filters, of all medias without filters.
+        The media ids of the filters are cached as a query (without limit).
+        """
+        key = ("facets", normalize_query(filters, source_type), json.dumps(tagsets), str(top_n))
+
+        def compute() -> Dict[str, List[Tuple[Any, int]]]:
+            media_ids = self.query(connection, filters, source_type) if filters else None
+            return facet_counts(connection, media_ids, tagsets, top_n)
+
+        return self.get_or_compute(key, compute)
+
+    def clear(self):
+        """
+        Drop all cached results.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        """
+        Hits, misses, hit rate, evicted results, invalidations (database changes that dropped the cache),
+        the number of cached results and their estimated size.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+    def close(self):
+        self._watcher.close()
@@ -0,0 +1,115 @@
+import re
+import sqlite3
+from sqlite3 import Connection
+from typing import Dict, List, Tuple
+
+from .SimpleM3DataLoader import TagType, encode_tag_value
+from .facets import rebuild_tag_counts
+from .instrumentation import log, stage
+from .media_cache import has_media_tag_cache, rebuild_media_tag_cache
+
+
+def _normalize_sql(sql: str) -> str:
+    return re.sub(r"\s+", " ", sql).strip()
+
+
+def _schema_objects(connection: Connection) -> Dict[str, Tuple[str, str]]:
+    """
+    The tables, indexes and triggers of a database by name, as (type, create_statement), in creation order.
+    """
+    return {
+        name: (object_type, sql)
+        for object_type, name, sql in connection.execute(
+            """
+            SELECT type, name, sql
+            FROM sqlite_master
+            WHERE type IN ('table', 'index', 'trigger') AND sql IS NOT NULL AND name NOT LIKE 'sqlite\\_%' ESCAPE '\\'
+            ORDER BY rowid
+            """
+        )
+    }
+
+
+def _encode_temporal_values(connection: Connection) -> List[str]:
+    """
+    Encode the date, time and timestamp values stored as text by earlier versions to their integer form
+    (see encode_tag_value). Values that cannot be parsed, or that encode to a value the tagset already has
+    (e.g. the same timestamp with another UTC offset), are left as they are and logged.
+
+    Returns:
+    - Names of the tables with encoded values
+    """
+    encoded_tables = []
+    for tagtype in (TagType.DATE, TagType.TIME, TagType.TIMESTAMP):
+        table = f"{tagtype.name.lower()}_tags"
+        rows = connection.execute(f"SELECT id, value FROM {table} WHERE typeof(value) = 'text'").fetchall()
+        encoded = 0
+        for tag_id, value in rows:
+            try:
+                connection.execute(f"UPDATE {table} SET value = ? WHERE id = ?", [encode_tag_value(tagtype, value), tag_id])
+                encoded += 1
+            except (ValueError, sqlite3.IntegrityError) as e:
+                log("SDL.upgrade_schema", f"{table} value {value!r} (tag {tag_id}) is not encoded: {e}", "warning")
+        if encoded:
+            log("SDL.upgrade_schema", f"Encoded {encoded} {table} value(s)")
+            encoded_tables.append(table)
+    return encoded_tables
+
+
+def upgrade_schema(connection: Connection, ddl_script: str) -> List[str]:
+    """
+    Bring a database created from an earlier version of ddl.sql up to date: the tables, indexes and triggers
+    of the DDL script missing in the database are created, and the indexes and triggers whose definition
+    changed are recreated. The tag_counts summary is rebuilt when its table or triggers are created.
+    Tables whose definition changed are not altered, a warning is logged for each of them.
+    Objects the DDL script does not define (e.g. the text search or interval indexes) are left as they are.
+    Date, time and timestamp values stored as text by earlier versions are encoded as integers.
+
+    Running it on an up to date database does nothing.
+
+    Parameters:
+    - connection: sqlite3.Connection object to the database.
+    - ddl_script: The DDL script the database is upgraded to (the content of ddl.sql).
+
+    Returns:
+    - Names of the created or recreated objects, and of the tables whose values were encoded
+    """
+    reference = sqlite3.connect(":memory:")
+    try:
+        reference.executescript(ddl_script)
+        expected = _schema_objects(reference)
+    finally:
+        reference.close()
+
+    with stage("SDL.upgrade_schema") as upgrade_stage:
+        existing = _schema_objects(connection)
+        upgraded = []
+        try:
+            for name, (object_type, sql) in expected.items():
+                if name in existing:
+                    if _normalize_sql(existing[name][1]) == _normalize_sql(sql):
+                        continue
+                    if object_type == "table":
+                        log("SDL.upgrade_schema", f"Table {name} differs from its definition in the DDL script, it is not altered", "warning")
+                        continue
+                    log("SDL.upgrade_schema", f"Recreating {object_type} {name}...")
+                    connection.execute(f"DROP {object_type.upper()} {name}")
+                else:
+                    log("SDL.upgrade_schema", f"Creating {object_type} {name}...")
+                connection.execute(sql)
+                upgraded.append(name)
+
+            encoded_tables = _encode_temporal_values(connection)
+            if encoded_tables and has_media_tag_cache(connection):
+                rebuild_media_tag_cache(connection)
+            upgraded += encoded_tables
+
+            # The counts of the existing taggings, or of those added while a trigger was missing
+            if any("tag_counts" in name for name in upgraded):
+                rebuild_tag_counts(connection)
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        upgrade_stage.rows = len(upgraded)
+    return upgraded
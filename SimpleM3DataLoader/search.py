@@ -0,0 +1,228 @@
+from sqlite3 import Connection
+from typing import Any, List, Optional, Tuple, Union
+
+from .SimpleM3DataLoader import MediaSourceType, TagType
+from .instrumentation import log, stage
+from .query import get_tagset
+
+
+# Full-text indexes over the values of selected alphanumerical tagsets (e.g. captions, transcripts, titles):
+# - alphanumerical_tags_fts: words (unicode61 tokenizer, diacritics removed, prefix indexes)
+# - alphanumerical_tags_trigram: trigrams, for case-insensitive substring search
+# Both are external content tables on alphanumerical_tags, only the rows of the tagsets listed in
+# text_search_tagsets are indexed. The triggers keep them up to date as tags are added (add_tags,
+# register_missing_tags), bulk_load_session drops them and rebuilds the indexes instead.
+_TEXT_SEARCH_DDL = """
+CREATE TABLE IF NOT EXISTS text_search_tagsets (
+    tagset_id INTEGER PRIMARY KEY REFERENCES tagsets(id)
+);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS alphanumerical_tags_fts USING fts5(
+    value, tagset_id UNINDEXED,
+    content = 'alphanumerical_tags', content_rowid = 'id',
+    tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS alphanumerical_tags_trigram USING fts5(
+    value, tagset_id UNINDEXED,
+    content = 'alphanumerical_tags', content_rowid = 'id',
+    tokenize = 'trigram'
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_alphanumerical_tags_insert_text_search AFTER INSERT ON alphanumerical_tags
+WHEN NEW.tagset_id IN (SELECT tagset_id FROM text_search_tagsets)
+BEGIN
+    INSERT INTO alphanumerical_tags_fts (rowid, value, tagset_id) VALUES (NEW.id, NEW.value, NEW.tagset_id);
+    INSERT INTO alphanumerical_tags_trigram (rowid, value, tagset_id) VALUES (NEW.id, NEW.value, NEW.tagset_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_alphanumerical_tags_delete_text_search AFTER DELETE ON alphanumerical_tags
+WHEN OLD.tagset_id IN (SELECT tagset_id FROM text_search_tagsets)
+BEGIN
+    INSERT INTO alphanumerical_tags_fts (alphanumerical_tags_fts, rowid, value, tagset_id) VALUES ('delete', OLD.id, OLD.value, OLD.tagset_id);
+    INSERT INTO alphanumerical_tags_trigram (alphanumerical_tags_trigram, rowid, value, tagset_id) VALUES ('delete', OLD.id, OLD.value, OLD.tagset_id);
+END;
+"""
+
+_TEXT_SEARCH_TABLES = ("alphanumerical_tags_fts", "alphanumerical_tags_trigram")
+
+# Trigrams need at least 3 characters, shorter substrings are searched with LIKE (a scan of the indexed tagsets)
+_MIN_TRIGRAM_LENGTH = 3
+
+
+def has_text_search(connection: Connection) -> bool:
+    return connection.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'text_search_tagsets'"
+    ).fetchone() is not None
+
+
+def _alphanumerical_tagset_id(connection: Connection, tagset_name: str) -> int:
+    tagset_id, tagtype = get_tagset(connection, tagset_name)
+    if tagtype != TagType.ALPHANUMERICAL:
+        raise ValueError(f'Text search requires an alphanumerical tagset, "{tagset_name}" is {tagtype.name.lower()}')
+    return tagset_id
+
+
+def _index_tagsets(connection: Connection, tagset_ids: List[int]) -> int:
+    rows = 0
+    for table in _TEXT_SEARCH_TABLES:
+        rows = connection.execute(
+            f"""
+            INSERT INTO {table} (rowid, value, tagset_id)
+            SELECT id, value, tagset_id FROM alphanumerical_tags
+            WHERE tagset_id IN ({', '.join('?' for _ in tagset_ids)})
+            """,
+            tagset_ids
+        ).rowcount
+    return rows
+
+
+def enable_text_search(connection: Connection, tagset_names: List[str]):
+    """
+    Index the values of alphanumerical tagsets for full-text and substring search (see search_text).
+    The index tables and triggers are created on first use, the existing values of the tagsets are indexed
+    and the values added later are indexed as they are inserted.
+
+    Parameters:
+    - connection: sqlite3.Connection object to the database.
+    - tagset_names: Names of alphanumerical tagsets, tagsets that are already indexed are skipped.
+    """
+    tagset_ids = [_alphanumerical_tagset_id(connection, name) for name in tagset_names]
+    with stage("SDL.enable_text_search", tagsets=len(tagset_ids)) as enable_stage:
+        connection.executescript(_TEXT_SEARCH_DDL)
+        indexed = {tagset_id for (tagset_id,) in connection.execute("SELECT tagset_id FROM text_search_tagsets")}
+        new_ids = [tagset_id for tagset_id in dict.fromkeys(tagset_ids) if tagset_id not in indexed]
+        if new_ids:
+            connection.executemany("INSERT INTO text_search_tagsets (tagset_id) VALUES (?)", ((tagset_id,) for tagset_id in new_ids))
+            enable_stage.rows = _index_tagsets(connection, new_ids)
+        connection.commit()
+
+
+def disable_text_search(connection: Connection, tagset_names: List[str]):
+    """
+    Remove tagsets from the text search index (see enable_text_search).
+
+    Parameters:
+    - connection: sqlite3.Connection object to the database.
+    - tagset_names: Names of indexed tagsets.
+    """
+    if not has_text_search(connection):
+        return
+    tagset_ids = [_alphanumerical_tagset_id(connection, name) for name in tagset_names]
+    params = ", ".join("?" for _ in tagset_ids)
+    for table in _TEXT_SEARCH_TABLES:
+        connection.execute(
+            f"""
+            INSERT INTO {table} ({table}, rowid, value, tagset_id)
+            SELECT 'delete', t.id, t.value, t.tagset_id
+            FROM alphanumerical_tags t
+            JOIN text_search_tagsets ts ON ts.tagset_id = t.tagset_id
+            WHERE t.tagset_id IN ({params})
+            """,
+            tagset_ids
+        )
+    connection.execute(f"DELETE FROM text_search_tagsets WHERE tagset_id IN ({params})", tagset_ids)
+    connection.commit()
+
+
+def rebuild_text_search(connection: Connection):
+    """
+    Rebuild the text search indexes from the values of the indexed tagsets.
+    Used after loads that bypass the maintenance triggers (see bulk_load_session).
+
+    Parameters:
+    - connection: sqlite3.Connection object to the database.
+    """
+    for table in _TEXT_SEARCH_TABLES:
+        connection.execute(f"INSERT INTO {table} ({table}) VALUES ('delete-all')")
+    tagset_ids = [tagset_id for (tagset_id,) in connection.execute("SELECT tagset_id FROM text_search_tagsets")]
+    if tagset_ids:
+        _index_tagsets(connection, tagset_ids)
+
+
+def _quote(term: str) -> str:
+    # FTS5 string: the term is matched literally (as a phrase of its tokens)
+    return '"' + term.replace('"', '""') + '"'
+
+
+def search_text(
+    connection: Connection,
+    text: str,
+    tagsets: Optional[List[str]] = None,
+    substring: bool = False,
+    source_type: Optional[Union[MediaSourceType, str]] = None,
+    limit: Optional[int] = 100
+) -> List[Tuple[int, float]]:
+    """
+    Search the values of the indexed alphanumerical tagsets and return the tagged medias, best match first.
+
+    The matching tags are found in the full-text index and joined with taggings, a media is ranked by its
+    best matching tag (BM25, lower is better).
+
+    Parameters:
+    - connection: sqlite3.Connection object to the database.
+    - text: Words that all have to appear in a tag value (e.g. "BMX race"), or with substring a string
+            contained in the value (case-insensitive, e.g. "BMX" also matches "BMXing").
+    - tagsets: Optional names of the indexed tagsets searched, all indexed tagsets by default.
+    - substring: If True, search for the text as a substring (trigram index) instead of words.
+    - source_type: Optional media source type (MediaSourceType or its name) the results are restricted to.
+    - limit: Maximum number of medias returned, None for all.
+
+    Returns:
+    - List of (media_id, score), best match (lowest score) first
+    """
+    if not has_text_search(connection):
+        raise ValueError("No tagset is indexed for text search, see enable_text_search")
+    if isinstance(source_type, str):
+        source_type = MediaSourceType[source_type.upper()]
+
+    params: List[Any] = []
+    if substring and len(text) < _MIN_TRIGRAM_LENGTH:
+        # A scan of the content table, restricted to the indexed tagsets
+        table = "alphanumerical_tags"
+        escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        match = f"{table}.value LIKE ? ESCAPE '\\' AND {table}.tagset_id IN (SELECT tagset_id FROM text_search_tagsets)"
+        params.append(f"%{escaped}%")
+        score = "0.0"
+    else:
+        table = "alphanumerical_tags_trigram" if substring else "alphanumerical_tags_fts"
+        terms = [text] if substring else text.split()
+        if not terms:
+            return []
+        match = f"{table} MATCH ?"
+        params.append(" ".join(_quote(term) for term in terms))
+        score = "rank"  # bm25
+
+    if tagsets is not None:
+        tagset_ids = [_alphanumerical_tagset_id(connection, name) for name in tagsets]
+        indexed = {tagset_id for (tagset_id,) in connection.execute("SELECT tagset_id FROM text_search_tagsets")}
+        not_indexed = [name for name, tagset_id in zip(tagsets, tagset_ids) if tagset_id not in indexed]
+        if not_indexed:
+            raise ValueError(f"Tagset(s) not indexed for text search: {', '.join(not_indexed)}")
+        match += f" AND {table}.tagset_id IN ({', '.join('?' for _ in tagset_ids)})"
+        params.extend(tagset_ids)
+
+    sql = f"""
+        WITH matches AS MATERIALIZED (
+            SELECT {table}.rowid AS tag_id, {score} AS score
+            FROM {table}
+            WHERE {match}
+        )
+        SELECT tg.media_id, MIN(mt.score) AS score
+        FROM matches mt
+        JOIN taggings tg ON tg.tag_id = mt.tag_id
+        """
+    if source_type is not None:
+        sql += "JOIN medias m ON m.id = tg.media_id AND m.source_type = ?\n"
+        params.append(source_type.value)
+    sql += "GROUP BY tg.media_id\nORDER BY score, tg.media_id\n"
+    if limit is not None:
+        sql += "LIMIT ?"
+        params.append(limit)
+
+    with stage("SDL.search_text", "debug", substring=substring) as search_stage:
+        results = connection.execute(sql, params).fetchall()
+        search_stage.rows = len(results)
+    if substring and len(text) < _MIN_TRIGRAM_LENGTH:
+        log("SDL.search_text", f'Substring "{text}" is shorter than {_MIN_TRIGRAM_LENGTH} characters, all indexed values were scanned', "debug")
+    return results
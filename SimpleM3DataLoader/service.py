@@ -0,0 +1,423 @@
+import http.client
+import json
+import random
+import socket
+import socketserver
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import islice
+from pathlib import Path
+from queue import Queue
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+from .facets import _tag_values, facet_counts
+from .instrumentation import log, log_error, stage
+from .query import Filter, query
+from .result_cache import ResultCache
+
+
+# (path, JSON body) of a request to the query service
+ServiceRequest = Tuple[str, Dict[str, Any]]
+
+
+def enable_wal(db_file: Path):
+    """
+    Switch the database to WAL (persistent), so that readers and a writer do not block each other.
+    """
+    with sqlite3.connect(db_file, autocommit=True) as connection:
+        journal_mode = connection.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+    if journal_mode.lower() != "wal":
+        raise RuntimeError(f"Could not switch {db_file} to WAL (journal_mode = {journal_mode})")
+
+
+class ConnectionPool():
+    """
+    A fixed pool of read-only connections to a WAL database, shared by threads.
+
+    Connections are opened with mode=ro and in autocommit mode, so that every statement reads the latest
+    committed snapshot and no read transaction is held between requests (which would keep the WAL from
+    being checkpointed). Each connection keeps its own cache of prepared statements (cached_statements),
+    queries of the same shape are therefore only prepared once per connection.
+    """
+
+    def __init__(self, db_file: Path, size: int = 4, statement_cache_size: int = 256, busy_timeout_ms: int = 5000):
+        """
+        Parameters:
+        - db_file: Path to the sqlite3 database file, it has to be in WAL mode (see enable_wal).
+        - size: Number of connections, i.e. the number of queries run concurrently.
+        - statement_cache_size: Number of prepared statements cached per connection.
+        - busy_timeout_ms: How long a connection waits for a lock (e.g. while the WAL is being reset).
+        """
+        self.db_file = Path(db_file)
+        self.size = size
+        self._idle: Queue[sqlite3.Connection] = Queue()
+        self._connections: List[sqlite3.Connection] = []
+        uri = f"{self.db_file.resolve().as_uri()}?mode=ro"
+        for _ in range(size):
+            connection = sqlite3.connect(
+                uri,
+                uri=True,
+                autocommit=True,
+                check_same_thread=False,
+                cached_statements=statement_cache_size
+            )
+            connection.execute(f"PRAGMA busy_timeout = {int(busy_timeout_ms)}")
+            self._connections.append(connection)
+            self._idle.put(connection)
+        journal_mode = self._connections[0].execute("PRAGMA journal_mode").fetchone()[0]
+        if journal_mode.lower() != "wal":
+            log("SDL.ConnectionPool", f"{self.db_file} is not in WAL mode ({journal_mode}), writers will block the readers", "warning")
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """
+        Borrow a connection, waiting until one is idle.
+        """
+        connection = self._idle.get()
+        try:
+            yield connection
+        finally:
+            self._idle.put(connection)
+
+    @property
+    def idle(self) -> int:
+        return self._idle.qsize()
+
+    def close(self):
+        for connection in self._connections:
+            connection.close()
+
+
+def _json_default(value: Any) -> Any:
+    # Decoded temporal values (date, time, datetime) and decimals
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _filters(body: Dict[str, Any]) -> List[Filter]:
+    filters: List[Filter] = []
+    for f in body.get("filters", []):
+        *target, operator, value = f
+        filters.append((*target, operator, tuple(value) if operator.lower() == "between" else value))
+    return filters
+
+
+class QueryService():
+    """
+    The request handlers of the query service, each runs on a pooled connection:
+    - POST /query  {"filters": [[tagset, operator, value] or [tagset, json_path, operator, value], ...], "source_type": "IMAGE", "limit": 1000}
+                   -> {"media_ids": [...], "count": n}
+    - POST /facets {"filters": [...], "tagsets": [...], "top_n": 10} (facets of the query result, or of all medias without filters)
+                   -> {"facets": {tagset: [[value, count], ...]}}
+    - GET  /stats  -> requests served per path, errors, pool size, idle connections and result cache metrics
+
+    With a ResultCache, repeated queries and facet counts are answered from memory until the database changes.
+    """
+
+    def __init__(self, pool: ConnectionPool, max_limit: int = 100_000, cache: Optional[ResultCache] = None):
+        self.pool = pool
+        self.max_limit = max_limit
+        self.cache = cache
+        self.requests: Dict[str, int] = {}
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def handle(self, method: str, path: str, body: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        """
+        Handle one request, returns (HTTP status, JSON response).
+        """
+        handler = {
+            ("POST", "/query"): self.query,
+            ("POST", "/facets"): self.facets,
+            ("GET", "/stats"): self.stats,
+        }.get((method, path))
+        if handler is None:
+            return 404, {"error": f"Unknown endpoint: {method} {path}"}
+        with self._lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+        try:
+            return 200, handler(body)
+        except (ValueError, KeyError, TypeError) as e:
+            self._count_error()
+            return 400, {"error": f"{type(e).__name__}: {e}"}
+        except Exception as e:
+            self._count_error()
+            log_error("SDL.QueryService", f"Error handling {method} {path}", e)
+            return 500, {"error": f"{type(e).__name__}: {e}"}
+
+    def _count_error(self):
+        with self._lock:
+            self.errors += 1
+
+    def query(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        limit = min(int(body.get("limit", self.max_limit)), self.max_limit)
+        with self.pool.connection() as connection, stage("SDL.QueryService.query", "debug") as query_stage:
+            if self.cache is not None:
+                media_ids = list(self.cache.query(connection, _filters(body), body.get("source_type"), limit))
+            else:
+                media_ids = list(islice(query(connection, _filters(body), body.get("source_type")), limit))
+            query_stage.rows = len(media_ids)
+        return {"media_ids": media_ids, "count": len(media_ids)}
+
+    def facets(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        filters = _filters(body)
+        tagsets, top_n = body.get("tagsets"), int(body.get("top_n", 10))
+        with self.pool.connection() as connection, stage("SDL.QueryService.facets", "debug") as facets_stage:
+            if self.cache is not None:
+                counts = self.cache.facet_counts(connection, filters, body.get("source_type"), tagsets, top_n)
+            else:
+                media_ids = query(connection, filters, body.get("source_type")) if filters else None
+                counts = facet_counts(connection, media_ids, tagsets, top_n)
+            facets_stage.rows = sum(len(tags) for tags in counts.values())
+        return {"facets": counts}
+
+    def stats(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            stats: Dict[str, Any] = {
+                "requests": dict(self.requests),
+                "errors": self.errors,
+                "pool_size": self.pool.size,
+                "idle_connections": self.pool.idle,
+            }
+        if self.cache is not None:
+            stats["cache"] = self.cache.stats()
+        return stats
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    # Keep-alive connections, clients send many requests over one connection
+    protocol_version = "HTTP/1.1"
+    service: QueryService
+
+    def _respond(self, status: int, response: Dict[str, Any]):
+        payload = json.dumps(response, default=_json_default).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _handle(self, method: str):
+        body: Dict[str, Any] = {}
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            try:
+                body = json.loads(self.rfile.read(length))
+            except json.JSONDecodeError as e:
+                self._respond(400, {"error": f"Invalid JSON: {e}"})
+                return
+        self._respond(*self.service.handle(method, self.path.split("?", 1)[0], body))
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def address_string(self) -> str:
+        # Unix socket clients have no address
+        return str(self.client_address[0]) if self.client_address else "unix"
+
+    def log_message(self, format: str, *args: Any):
+        log("SDL.QueryService", format % args, "debug")
+
+
+class _ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(
+    service: QueryService,
+    host: str = "127.0.0.1",
+    port: int = 8080,
+    unix_socket: Optional[Path] = None
+) -> socketserver.BaseServer:
+    """
+    Create the HTTP server of the query service, on a TCP port or on a Unix socket (one thread per client
+    connection, the number of concurrent queries is bounded by the connection pool).
+    """
+    handler = type("RequestHandler", (_RequestHandler,), {"service": service})
+    if unix_socket is not None:
+        unix_socket = Path(unix_socket)
+        if unix_socket.is_socket():
+            unix_socket.unlink()
+        return _ThreadingUnixHTTPServer(str(unix_socket), handler)
+    # The headers and the body are written separately, without TCP_NODELAY every response waits for a delayed ACK
+    handler.disable_nagle_algorithm = True
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def serve(
+    db_file: Path,
+    host: str = "127.0.0.1",
+    port: int = 8080,
+    unix_socket: Optional[Path] = None,
+    pool_size: int = 4,
+    statement_cache_size: int = 256,
+    cache_entries: int = 1024,
+    cache_bytes: int = 256 * 1024 * 1024
+):
+    """
+    Run the read-only query service until interrupted. The database is switched to WAL first, so that
+    ingestion (e.g. add-media-taggings-from-json) can write while queries are served.
+    Results are cached (see ResultCache) unless cache_entries or cache_bytes is 0.
+    """
+    enable_wal(db_file)
+    pool = ConnectionPool(db_file, pool_size, statement_cache_size)
+    cache = ResultCache(db_file, cache_entries, cache_bytes) if cache_entries > 0 and cache_bytes > 0 else None
+    server = make_server(QueryService(pool, cache=cache), host, port, unix_socket)
+    address = unix_socket if unix_socket is not None else f"http://{host}:{server.server_address[1]}"
+    log("SDL.serve", f"Serving {db_file} on {address} with {pool_size} connections")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        pool.close()
+        if cache is not None:
+            cache.close()
+        if unix_socket is not None and Path(unix_socket).is_socket():
+            Path(unix_socket).unlink()
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, unix_socket: Path, timeout: float = 60.0):
+        super().__init__("localhost", timeout=timeout)
+        self.unix_socket = str(unix_socket)
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.unix_socket)
+
+
+def _client(url: Optional[str], unix_socket: Optional[Path]) -> http.client.HTTPConnection:
+    if unix_socket is not None:
+        return _UnixHTTPConnection(unix_socket)
+    host, _, port = (url or "http://127.0.0.1:8080").split("://", 1)[-1].rstrip("/").partition(":")
+    return http.client.HTTPConnection(host, int(port or 80), timeout=60.0)
+
+
+def sample_requests(connection: sqlite3.Connection, count: int = 100, seed: int = 0) -> List[ServiceRequest]:
+    """
+    A request mix for load tests: equality queries on frequent tags (from tag_counts), every tenth
+    request asks for the facets of the query result instead.
+    """
+    rows = connection.execute(
+        """
+        SELECT ts.name, tc.tag_id
+        FROM tag_counts tc
+        JOIN tagsets ts ON ts.id = tc.tagset_id
+        WHERE tc.count > 0
+        ORDER BY tc.count DESC
+        LIMIT ?
+        """,
+        [count]
+    ).fetchall()
+    if not rows:
+        raise ValueError("No taggings to build load test requests from")
+    values = _tag_values(connection, [tag_id for _, tag_id in rows])
+    filters = [[[tagset_name, "=", values[tag_id]]] for tagset_name, tag_id in rows if tag_id in values]
+    rng = random.Random(seed)
+    requests: List[ServiceRequest] = []
+    for i in range(count):
+        f = rng.choice(filters)
+        if i % 10 == 9:
+            requests.append(("/facets", {"filters": f, "top_n": 10}))
+        else:
+            requests.append(("/query", {"filters": f, "limit": 1000}))
+    return requests
+
+
+def _percentile(sorted_values: List[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))]
+
+
+def load_test(
+    requests: List[ServiceRequest],
+    url: Optional[str] = None,
+    unix_socket: Optional[Path] = None,
+    clients: int = 8,
+    total_requests: int = 1000
+) -> Dict[str, Union[int, float]]:
+    """
+    Send requests to a running query service from concurrent clients (threads, one keep-alive
+    connection each) and measure the latencies.
+
+    Parameters:
+    - requests: Requests sent in turns by the clients (see sample_requests).
+    - url: Base URL of the service (e.g. http://127.0.0.1:8080), or
+    - unix_socket: Path to the Unix socket of the service.
+    - clients: Number of concurrent clients.
+    - total_requests: Number of requests sent in total.
+
+    Returns:
+    - Dictionary with the number of requests and errors, the throughput and the p50/p90/p99/max latencies in ms
+    """
+    latencies: List[float] = []
+    errors = 0
+    lock = threading.Lock()
+    counter = iter(range(total_requests))
+
+    def next_request() -> Optional[int]:
+        with lock:
+            return next(counter, None)
+
+    def run_client():
+        nonlocal errors
+        connection = _client(url, unix_socket)
+        own: List[float] = []
+        failed = 0
+        try:
+            while (i := next_request()) is not None:
+                path, body = requests[i % len(requests)]
+                payload = json.dumps(body, default=_json_default)
+                start = time.perf_counter()
+                try:
+                    connection.request("POST", path, payload, {"Content-Type": "application/json"})
+                    response = connection.getresponse()
+                    response.read()
+                    if response.status != 200:
+                        failed += 1
+                except (OSError, http.client.HTTPException):
+                    failed += 1
+                    connection.close()
+                own.append(time.perf_counter() - start)
+        finally:
+            connection.close()
+            with lock:
+                latencies.extend(own)
+                errors += failed
+
+    threads = [threading.Thread(target=run_client) for _ in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "clients": clients,
+        "seconds": seconds,
+        "requests_per_sec": len(latencies) / max(seconds, 1e-9),
+        "p50_ms": _percentile(latencies, 50) * 1000,
+        "p90_ms": _percentile(latencies, 90) * 1000,
+        "p99_ms": _percentile(latencies, 99) * 1000,
+        "max_ms": (latencies[-1] if latencies else 0.0) * 1000,
+    }
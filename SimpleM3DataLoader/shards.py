@@ -0,0 +1,529 @@
+import heapq
+import json
+import os
+import sqlite3
+import sys
+import zlib
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from .SimpleM3DataLoader import MediaObject, MediaSourceType, add_media_taggings, add_medias, resolve_pending_groups
+from .bulk import _set_pragmas
+from .facets import facet_counts
+from .instrumentation import log, stage
+from .query import Filter, query
+
+
+# A sharded database is a directory with the manifest, the catalog and the shard files:
+# - catalog.db: tagsets and tags (the master copy, replicated to every shard) and the shard of every media
+# - shard_000.db, ...: medias and taggings of the media groups routed to the shard, and a copy of the tags
+MANIFEST_FILE = "shards.json"
+CATALOG_FILE = "catalog.db"
+
+# Tables replicated from the catalog to the shards, in foreign key order
+REPLICATED_TABLES = (
+    "tagsets", "tags",
+    "alphanumerical_tags", "timestamp_tags", "time_tags", "date_tags",
+    "numerical_int_tags", "numerical_dec_tags", "json_tags",
+)
+
+
+def shard_file(directory: Path, shard: int) -> Path:
+    return Path(directory) / f"shard_{shard:03d}.db"
+
+
+def shard_count(directory: Path) -> int:
+    """
+    Number of shards of a sharded database (see init_shards).
+    """
+    manifest = Path(directory) / MANIFEST_FILE
+    if not manifest.exists():
+        raise FileNotFoundError(f"Not a sharded database (no {MANIFEST_FILE}): {directory}")
+    with open(manifest, "r") as f:
+        return int(json.load(f)["shards"])
+
+
+def shard_of(group_key: str, shards: int) -> int:
+    """
+    Shard of a media group, the group key is the source of the group leader (or of the media without a group).
+    """
+    return zlib.crc32(group_key.encode()) % shards
+
+
+# Media ids are assigned by each shard, outside of a shard a media is identified by a global id that
+# interleaves the shards: global_id = media_id * shards + shard
+def global_media_id(shard: int, media_id: int, shards: int) -> int:
+    return media_id * shards + shard
+
+
+def split_media_id(global_id: int, shards: int) -> Tuple[int, int]:
+    """
+    (shard, media_id) of a global media id (see global_media_id).
+    """
+    media_id, shard = divmod(global_id, shards)
+    return shard, media_id
+
+
+def init_shards(directory: Path, ddl_file: Path, shards: int):
+    """
+    Create a sharded database: the catalog and the shard files, each initialized with the DDL.
+
+    Parameters:
+    - directory: Directory of the sharded database, created if needed (must not contain one yet).
+    - ddl_file: Path to the DDL file (ddl.sql).
+    - shards: Number of shard files the medias and taggings are partitioned across.
+    """
+    if shards < 1:
+        raise ValueError("At least one shard is required")
+    directory = Path(directory)
+    if (directory / MANIFEST_FILE).exists():
+        raise FileExistsError(f"Sharded database already exists: {directory}")
+    directory.mkdir(parents=True, exist_ok=True)
+    with open(ddl_file, "r") as f:
+        ddl_script = f.read()
+
+    for db_file in [directory / CATALOG_FILE, *(shard_file(directory, shard) for shard in range(shards))]:
+        with sqlite3.connect(db_file) as connection:
+            connection.execute("PRAGMA foreign_keys = ON")
+            connection.executescript(ddl_script)
+            # Shards are written by their own process while the others read, see add_medias_sharded
+            connection.execute("PRAGMA journal_mode = WAL")
+        connection.close()
+
+    with sqlite3.connect(directory / CATALOG_FILE) as connection:
+        connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS media_routes (
+                source TEXT PRIMARY KEY,
+                shard INTEGER NOT NULL
+            ) WITHOUT ROWID
+            """
+        )
+    connection.close()
+
+    with open(directory / MANIFEST_FILE, "w") as f:
+        json.dump({"shards": shards}, f)
+    log("SDL.init_shards", f"Created {shards} shard(s) in {directory}")
+
+
+def replicate_tags(directory: Path):
+    """
+    Copy the tagsets and tags of the catalog to every shard (ATTACH and INSERT ... SELECT).
+    Tags keep their ids, so that tag ids (e.g. of facet counts) are the same in all shards.
+    Tags that already exist in a shard are left unchanged, the catalog only grows.
+
+    Parameters:
+    - directory: Directory of the sharded database.
+    """
+    directory = Path(directory)
+    shards = shard_count(directory)
+    catalog_uri = f"{(directory / CATALOG_FILE).resolve().as_uri()}?mode=ro"
+    with stage("SDL.replicate_tags", shards=shards) as replicate_stage:
+        for shard in range(shards):
+            connection = sqlite3.connect(shard_file(directory, shard), autocommit=False)
+            try:
+                connection.execute("ATTACH DATABASE ? AS catalog", [catalog_uri])
+                for table in REPLICATED_TABLES:
+                    replicate_stage.rows += connection.execute(
+                        f"INSERT OR IGNORE INTO main.{table} SELECT * FROM catalog.{table}"
+                    ).rowcount
+                connection.commit()
+                connection.execute("DETACH DATABASE catalog")
+            finally:
+                connection.close()
+
+
+def _route_sources(catalog: sqlite3.Connection, sources: Iterable[str]) -> Dict[str, int]:
+    """
+    Shard of each media source, sources that were not routed by add_medias_sharded are left out.
+    """
+    cur = catalog.cursor()
+    try:
+        cur.execute(
+            """
+            CREATE TEMP TABLE IF NOT EXISTS tmp_media_sources (
+                source TEXT PRIMARY KEY
+            ) WITHOUT ROWID
+            """
+        )
+        cur.execute("DELETE FROM tmp_media_sources")
+        cur.executemany("INSERT OR IGNORE INTO tmp_media_sources VALUES (?)", ((src,) for src in sources))
+        return dict(
+            cur.execute(
+                """
+                SELECT r.source, r.shard
+                FROM media_routes r
+                JOIN tmp_media_sources ms ON ms.source = r.source
+                """
+            ).fetchall()
+        )
+    finally:
+        cur.close()
+
+
+# Writer connections of a worker process, one per shard file
+_shard_connections: Dict[str, sqlite3.Connection] = {}
+
+
+def _shard_connection(db_file: str) -> sqlite3.Connection:
+    connection = _shard_connections.get(db_file)
+    if connection is None:
+        connection = sqlite3.connect(db_file, autocommit=False)
+        connection.execute("PRAGMA foreign_keys = ON")
+        _set_pragmas(connection, {"synchronous": "NORMAL"})
+        _shard_connections[db_file] = connection
+    return connection
+
+
+def _load_shard_batch(db_file: str, kind: str, records: List[Any], options: Dict[str, Any]) -> Tuple[int, List[str]]:
+    """
+    Worker: add a batch of medias or media taggings to one shard.
+
+    Returns:
+    - The number of rows inserted (0 if the loader function rolled the batch back)
+    - For medias, the sources of the batch that are in the shard after the load (none if it was rolled back)
+    """
+    connection = _shard_connection(db_file)
+    # Rows get rowids above the current maximum, the shard has a single writer
+    table = "medias" if kind == "medias" else "taggings"
+    max_rowid_sql = f"SELECT COALESCE(MAX(rowid), 0) FROM {table}"
+    max_rowid = connection.execute(max_rowid_sql).fetchone()[0]
+    loaded: List[str] = []
+    if kind == "medias":
+        add_medias(connection, records, **options)
+        loaded = [
+            source for (source,) in connection.execute(
+                "SELECT source FROM medias WHERE source IN (SELECT value FROM json_each(?))",
+                [json.dumps([mo.source for mo in records])]
+            )
+        ]
+    else:
+        add_media_taggings(connection, records)
+    inserted = connection.execute(max_rowid_sql).fetchone()[0] - max_rowid
+    connection.rollback()  # ends the read transaction of the count
+    return inserted, loaded
+
+
+def _load_sharded(
+    directory: Path,
+    kind: str,
+    source: str,
+    batches: Iterable[List[Any]],
+    route: Callable[[sqlite3.Connection, List[Any]], List[Tuple[int, Any]]],
+    options: Dict[str, Any],
+    workers: Optional[int],
+    batch_size: int
+) -> int:
+    """
+    Route the records of every batch to their shard and load each shard in a worker process.
+
+    The records are collected per shard until batch_size records are available. A shard has at most one
+    batch in flight, so its batches are written in input order by a single writer at a time, while the
+    shards are written in parallel. The medias of a batch are routed in the catalog (media_routes) once
+    the shard has them, medias of a batch that was rolled back are not routed.
+    """
+    directory = Path(directory)
+    shards = shard_count(directory)
+    workers = workers or min(shards, os.cpu_count() or 1)
+    db_files = [str(shard_file(directory, shard)) for shard in range(shards)]
+    buffers: List[List[Any]] = [[] for _ in range(shards)]
+    pending: Dict[int, Future] = {}
+    inserted = 0
+
+    catalog = sqlite3.connect(directory / CATALOG_FILE, autocommit=False)
+    try:
+        with stage(source, shards=shards, workers=workers) as sharded_stage:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+
+                def wait(shard: int):
+                    nonlocal inserted
+                    future = pending.pop(shard, None)
+                    if future is not None:
+                        batch_inserted, loaded = future.result()
+                        if loaded:
+                            catalog.executemany(
+                                "INSERT OR REPLACE INTO media_routes (source, shard) VALUES (?, ?)",
+                                ((source, shard) for source in loaded)
+                            )
+                            catalog.commit()
+                        inserted += batch_inserted
+                        sharded_stage.rows = inserted
+
+                def submit(shard: int):
+                    wait(shard)
+                    pending[shard] = pool.submit(_load_shard_batch, db_files[shard], kind, buffers[shard], options)
+                    buffers[shard] = []
+
+                try:
+                    for batch in batches:
+                        for shard, record in route(catalog, batch):
+                            buffers[shard].append(record)
+                        catalog.commit()
+                        for shard in range(shards):
+                            if len(buffers[shard]) >= batch_size:
+                                submit(shard)
+                    for shard in range(shards):
+                        if buffers[shard]:
+                            submit(shard)
+                    for shard in list(pending):
+                        wait(shard)
+                except BaseException:
+                    # Batches that are written anyway (already running) are still routed
+                    for shard, future in list(pending.items()):
+                        if future.cancel():
+                            pending.pop(shard)
+                    for shard in list(pending):
+                        try:
+                            wait(shard)
+                        except Exception:
+                            pending.pop(shard, None)
+                    raise
+    finally:
+        catalog.close()
+    return inserted
+
+
+def add_medias_sharded(
+    directory: Path,
+    batches: Iterable[List[MediaObject]],
+    workers: Optional[int] = None,
+    batch_size: int = 10_000,
+    ignore_existing: bool = False
+) -> int:
+    """
+    Add media objects to a sharded database, the shards are loaded in parallel worker processes.
+
+    Every media group (a leader and its members, e.g. a video and its keyframes) is routed to one shard by
+    the source of its leader, and the shard of every media is recorded in the catalog (media_routes).
+    Medias can come in any order: members written to their shard before their leader are grouped once all
+    batches are written (see resolve_pending_groups), leaders that are still missing are reported.
+
+    Parameters:
+    - directory: Directory of the sharded database (see init_shards).
+    - batches: Iterable of batches of MediaObject objects (e.g. a streamed file).
+    - workers: Number of worker processes (default: number of shards, at most the number of CPUs).
+    - batch_size: Number of media objects added per shard and batch.
+    - ignore_existing: If True, existing media objects will be ignored.
+
+    Returns:
+    - The number of medias inserted into the shards
+    """
+    shards = shard_count(directory)
+
+    def route(catalog: sqlite3.Connection, batch: List[MediaObject]) -> List[Tuple[int, MediaObject]]:
+        # The routes are recorded once the shard batch is written (see _load_sharded)
+        return [(shard_of(mo.group or mo.source, shards), mo) for mo in batch]
+
+    options = {"ignore_existing": ignore_existing, "defer_missing_leaders": True}
+    inserted = _load_sharded(directory, "medias", "SDL.add_medias_sharded", batches, route, options, workers, batch_size)
+
+    missing: List[str] = []
+    for shard in range(shards):
+        connection = sqlite3.connect(shard_file(directory, shard), autocommit=False)
+        try:
+            connection.execute("PRAGMA foreign_keys = ON")
+            missing.extend(resolve_pending_groups(connection))
+        finally:
+            connection.close()
+    if missing:
+        log(
+            "SDL.add_medias_sharded",
+            f"Group leader media objects not found, their members are grouped once they are added: {', '.join(missing)}",
+            "warning",
+            missing=len(missing)
+        )
+    return inserted
+
+
+def add_media_taggings_sharded(
+    directory: Path,
+    batches: Iterable[List[dict]],
+    workers: Optional[int] = None,
+    batch_size: int = 10_000
+) -> int:
+    """
+    Add media taggings to a sharded database, the shards are loaded in parallel worker processes.
+
+    The taggings of a media are routed to the shard of the media (see add_medias_sharded), taggings of
+    unknown media sources are skipped. The tags must have been added to the catalog and replicated to
+    the shards (see replicate_tags), missing tags cannot be registered in sharded loads.
+
+    Parameters:
+    - directory: Directory of the sharded database (see init_shards).
+    - batches: Iterable of batches of media tagging dictionaries (see add_media_taggings).
+    - workers: Number of worker processes (default: number of shards, at most the number of CPUs).
+    - batch_size: Number of media tagging dictionaries added per shard and batch.
+
+    Returns:
+    - The number of taggings inserted into the shards
+    """
+    def route(catalog: sqlite3.Connection, batch: List[dict]) -> List[Tuple[int, dict]]:
+        routes = _route_sources(catalog, (mapping['media_source'] for mapping in batch))
+        unrouted = len(batch) - sum(1 for mapping in batch if mapping['media_source'] in routes)
+        if unrouted:
+            log("SDL.add_media_taggings_sharded", f"{unrouted} media source(s) not found, skipping", "warning", unresolved=unrouted)
+        return [
+            (routes[mapping['media_source']], mapping) for mapping in batch if mapping['media_source'] in routes
+        ]
+
+    return _load_sharded(directory, "taggings", "SDL.add_media_taggings_sharded", batches, route, {}, workers, batch_size)
+
+
+class ShardedDatabase():
+    """
+    Read-only queries over a sharded database, fanned out to the shards in parallel threads.
+
+    Every shard has its own connection (sqlite3 releases the GIL while a statement runs), in autocommit
+    mode like the connections of ConnectionPool, so that every query reads the latest commit of the shard
+    and no read transaction is held between queries. The results are merged: media ids are returned as global ids (see global_media_id) and facet counts are summed
+    across the shards.
+    """
+
+    def __init__(self, directory: Path, threads: Optional[int] = None):
+        """
+        Parameters:
+        - directory: Directory of the sharded database.
+        - threads: Number of shards queried at the same time (default: number of shards).
+        """
+        self.directory = Path(directory)
+        self.shards = shard_count(self.directory)
+        self.connections = [
+            sqlite3.connect(
+                f"{shard_file(self.directory, shard).resolve().as_uri()}?mode=ro",
+                uri=True,
+                autocommit=True,
+                check_same_thread=False
+            )
+            for shard in range(self.shards)
+        ]
+        self._executor = ThreadPoolExecutor(max_workers=threads or self.shards)
+
+    def __enter__(self) -> "ShardedDatabase":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown()
+        for connection in self.connections:
+            connection.close()
+
+    def _map(self, fn: Callable[[int, sqlite3.Connection], Any], shards: Optional[Iterable[int]] = None) -> List[Any]:
+        shards = range(self.shards) if shards is None else list(shards)
+        return list(self._executor.map(lambda shard: fn(shard, self.connections[shard]), shards))
+
+    def query(
+        self,
+        filters: List[Filter],
+        source_type: Optional[Union[MediaSourceType, str]] = None
+    ) -> List[int]:
+        """
+        Global ids of the medias matching all given tag filters (see query), grouped by shard.
+        """
+        with stage("SDL.ShardedDatabase.query", "debug", shards=self.shards) as query_stage:
+            results = self._map(
+                lambda shard, connection: [
+                    global_media_id(shard, media_id, self.shards)
+                    for media_id in query(connection, filters, source_type)
+                ]
+            )
+            media_ids = [media_id for shard_media_ids in results for media_id in shard_media_ids]
+            query_stage.rows = len(media_ids)
+        return media_ids
+
+    def facet_counts(
+        self,
+        media_ids: Optional[Iterable[int]] = None,
+        tagsets: Optional[List[str]] = None,
+        top_n: int = 10
+    ) -> Dict[str, List[Tuple[Any, int]]]:
+        """
+        Facet counts (see facet_counts) over all shards, for the whole collection or for global media ids.
+        The counts of every tag are summed across the shards before the top_n tags are selected.
+        """
+        by_shard: Optional[Dict[int, List[int]]] = None
+        if media_ids is not None:
+            by_shard = {}
+            for media_id in media_ids:
+                shard, local_id = split_media_id(media_id, self.shards)
+                by_shard.setdefault(shard, []).append(local_id)
+
+        # Every shard counts all its tags, a tag may be frequent overall without being in the top of a shard
+        results = self._map(
+            lambda shard, connection: facet_counts(
+                connection, None if by_shard is None else by_shard[shard], tagsets, sys.maxsize
+            ),
+            None if by_shard is None else by_shard.keys()
+        )
+        totals: Dict[str, Dict[Any, int]] = {}
+        for counts in results:
+            for tagset_name, tag_counts in counts.items():
+                tagset_totals = totals.setdefault(tagset_name, {})
+                for value, count in tag_counts:
+                    tagset_totals[value] = tagset_totals.get(value, 0) + count
+        return {
+            tagset_name: heapq.nlargest(top_n, tagset_totals.items(), key=lambda value_count: value_count[1])
+            for tagset_name, tagset_totals in totals.items()
+        }
+
+
+def connect_federated(directory: Path) -> sqlite3.Connection:
+    """
+    Open a read-only connection to the catalog with every shard attached (as shard_000, ...) and temporary
+    views medias, taggings and tag_counts combining the shards, with global media ids (see global_media_id).
+
+    The views shadow the (empty) tables of the catalog, so that plain SQL and the single database APIs
+    (query, facet_counts, ...) run across all shards on one connection. Queries run on one thread, use
+    ShardedDatabase to query the shards in parallel. The number of shards is limited by SQLite's maximum
+    number of attached databases (10 by default).
+
+    Parameters:
+    - directory: Directory of the sharded database.
+
+    Returns:
+    - sqlite3.Connection
+    """
+    directory = Path(directory)
+    shards = shard_count(directory)
+    connection = sqlite3.connect(f"{(directory / CATALOG_FILE).resolve().as_uri()}?mode=ro", uri=True, autocommit=True)
+    try:
+        max_attached = connection.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+        if shards > max_attached:
+            raise ValueError(f"{shards} shards exceed SQLite's limit of {max_attached} attached databases, use ShardedDatabase")
+        for shard in range(shards):
+            connection.execute(
+                f"ATTACH DATABASE ? AS shard_{shard:03d}",
+                [f"{shard_file(directory, shard).resolve().as_uri()}?mode=ro"]
+            )
+
+        def union(select: str) -> str:
+            return "\nUNION ALL\n".join(select.format(shard=shard, schema=f"shard_{shard:03d}") for shard in range(shards))
+
+        connection.execute(
+            "CREATE TEMP VIEW medias AS\n" + union(
+                f"""
+                SELECT id * {shards} + {{shard}} AS id, source, source_type, thumbnail_uri,
+                       group_id * {shards} + {{shard}} AS group_id
+                FROM {{schema}}.medias
+                """
+            )
+        )
+        connection.execute(
+            "CREATE TEMP VIEW taggings AS\n" + union(
+                f"SELECT media_id * {shards} + {{shard}} AS media_id, tag_id FROM {{schema}}.taggings"
+            )
+        )
+        connection.execute(
+            f"""
+            CREATE TEMP VIEW tag_counts AS
+            SELECT tag_id, tagset_id, SUM(count) AS count
+            FROM ({union("SELECT tag_id, tagset_id, count FROM {schema}.tag_counts")})
+            GROUP BY tag_id
+            """
+        )
+    except Exception:
+        connection.close()
+        raise
+    return connection
@@ -0,0 +1,375 @@
+import json
+import mmap
+import os
+import sys
+from array import array
+from datetime import datetime
+from pathlib import Path
+from sqlite3 import Connection
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .SimpleM3DataLoader import TagType
+from .instrumentation import stage
+
+
+SNAPSHOT_FORMAT = "SM3SNAP1"
+MANIFEST_FILE = "manifest.json"
+
+# Column type -> array typecode, all columns are stored little endian
+_TYPECODES = {"int64": "q", "float64": "d", "uint8": "B"}
+
+# Rows fetched from SQLite and written at a time
+_CHUNK_ROWS = 65_536
+
+# Exported tables: (table, [(column, type)]), NULL integers are exported as -1
+_TABLES: List[Tuple[str, List[Tuple[str, str]]]] = [
+    ("medias", [("id", "int64"), ("source", "string"), ("source_type", "int64"), ("thumbnail_uri", "string"), ("group_id", "int64")]),
+    ("tagsets", [("id", "int64"), ("name", "string"), ("tagtype_id", "int64")]),
+    ("tags", [("id", "int64"), ("tagset_id", "int64"), ("tagtype_id", "int64")]),
+]
+
+# Type of the value column of each typed tag table (temporal values are stored encoded, see encode_tag_value)
+_VALUE_TYPES = {
+    TagType.ALPHANUMERICAL: "string",
+    TagType.TIMESTAMP: "int64",
+    TagType.TIME: "int64",
+    TagType.DATE: "int64",
+    TagType.NUMERICAL_INT: "int64",
+    TagType.NUMERICAL_DEC: "float64",
+    TagType.JSON: "string",
+}
+
+
+def _column_file(out_dir: Path, table: str, column: str, part: Optional[str] = None) -> Path:
+    return out_dir / (f"{table}.{column}.{part}.bin" if part else f"{table}.{column}.bin")
+
+
+class _ArrayWriter():
+    """
+    Append-only writer of a fixed width column.
+    """
+
+    def __init__(self, path: Path, column_type: str):
+        self.file = open(path, "wb")
+        self.typecode = _TYPECODES[column_type]
+        self.buffer = array(self.typecode)
+        self.length = 0
+
+    def append(self, value):
+        self.buffer.append(value)
+        if len(self.buffer) >= _CHUNK_ROWS:
+            self.flush()
+
+    def extend(self, values):
+        self.buffer.extend(values)
+        if len(self.buffer) >= _CHUNK_ROWS:
+            self.flush()
+
+    def flush(self):
+        if sys.byteorder != "little":
+            self.buffer.byteswap()
+        self.buffer.tofile(self.file)
+        self.length += len(self.buffer)
+        self.buffer = array(self.typecode)
+
+    def close(self) -> int:
+        self.flush()
+        self.file.close()
+        return self.length
+
+
+class _StringWriter():
+    """
+    Append-only writer of a string column: UTF-8 data, int64 offsets (length + 1) and, if any value
+    is NULL, a uint8 validity column.
+    """
+
+    def __init__(self, out_dir: Path, table: str, column: str):
+        self.out_dir, self.table, self.column = out_dir, table, column
+        self.data = open(_column_file(out_dir, table, column, "data"), "wb")
+        self.offsets = _ArrayWriter(_column_file(out_dir, table, column, "offsets"), "int64")
+        self.offsets.append(0)
+        self.valid = array("B")
+        self.has_nulls = False
+        self.position = 0
+
+    def append(self, value: Optional[str]):
+        if value is None:
+            self.has_nulls = True
+            self.valid.append(0)
+        else:
+            encoded = str(value).encode()
+            self.data.write(encoded)
+            self.position += len(encoded)
+            self.valid.append(1)
+        self.offsets.append(self.position)
+
+    def close(self) -> int:
+        self.data.close()
+        length = self.offsets.close() - 1
+        if self.has_nulls:
+            with open(_column_file(self.out_dir, self.table, self.column, "valid"), "wb") as f:
+                self.valid.tofile(f)
+        return length
+
+
+def _export_table(connection: Connection, out_dir: Path, table: str, columns: List[Tuple[str, str]]) -> dict:
+    writers = [
+        _StringWriter(out_dir, table, column) if column_type == "string"
+        else _ArrayWriter(_column_file(out_dir, table, column), column_type)
+        for column, column_type in columns
+    ]
+    cursor = connection.execute(f"SELECT {', '.join(column for column, _ in columns)} FROM {table} ORDER BY id")
+    rows = 0
+    while True:
+        chunk = cursor.fetchmany(_CHUNK_ROWS)
+        if not chunk:
+            break
+        for (column, column_type), writer, values in zip(columns, writers, zip(*chunk)):
+            if column_type == "string":
+                for value in values:
+                    writer.append(value)
+            elif column_type == "float64":
+                writer.extend(float(value) for value in values)
+            else:
+                writer.extend(-1 if value is None else value for value in values)
+        rows += len(chunk)
+    for writer in writers:
+        writer.close()
+    return {
+        "rows": rows,
+        "columns": {
+            column: {"type": column_type, "nullable": isinstance(writer, _StringWriter) and writer.has_nulls}
+            for (column, column_type), writer in zip(columns, writers)
+        }
+    }
+
+
+def _export_taggings(connection: Connection, out_dir: Path) -> dict:
+    """
+    Taggings in CSR layout: indptr[media_id]:indptr[media_id + 1] is the range of the media's tag ids in indices.
+    """
+    max_media_id = connection.execute("SELECT COALESCE(MAX(id), 0) FROM medias").fetchone()[0]
+    counts = array("q", bytes(8 * (max_media_id + 1)))
+    for media_id, count in connection.execute("SELECT media_id, COUNT(*) FROM taggings GROUP BY media_id"):
+        counts[media_id] = count
+
+    indptr = _ArrayWriter(_column_file(out_dir, "taggings", "indptr"), "int64")
+    position = 0
+    indptr.append(0)
+    for count in counts:
+        position += count
+        indptr.append(position)
+    indptr.close()
+
+    indices = _ArrayWriter(_column_file(out_dir, "taggings", "indices"), "int64")
+    cursor = connection.execute("SELECT tag_id FROM taggings ORDER BY media_id, tag_id")
+    while True:
+        chunk = cursor.fetchmany(_CHUNK_ROWS)
+        if not chunk:
+            break
+        indices.extend(tag_id for (tag_id,) in chunk)
+    rows = indices.close()
+    return {
+        "rows": rows,
+        "max_media_id": max_media_id,
+        "columns": {"indptr": {"type": "int64", "nullable": False}, "indices": {"type": "int64", "nullable": False}}
+    }
+
+
+def export_snapshot(connection: Connection, out_dir: Path) -> dict:
+    """
+    Export the database to a columnar snapshot directory (see Snapshot).
+
+    Every column is a raw little endian file (int64, float64, or UTF-8 data with int64 offsets for strings),
+    the taggings are stored in CSR layout indexed by media id. The tables are read in one read transaction,
+    so the snapshot is consistent. The manifest is written last, a directory without manifest is incomplete.
+
+    Parameters:
+    - connection: sqlite3.Connection object to the database.
+    - out_dir: Directory the snapshot is written to, existing snapshot files are replaced.
+
+    Returns:
+    - The manifest
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    (out_dir / MANIFEST_FILE).unlink(missing_ok=True)
+
+    started = not connection.in_transaction
+    if started:
+        connection.execute("BEGIN")
+    try:
+        tables = {}
+        for table, columns in _TABLES:
+            with stage("SDL.export_snapshot", "debug", table=table) as export_stage:
+                tables[table] = _export_table(connection, out_dir, table, columns)
+                export_stage.rows = tables[table]["rows"]
+        for tagtype, value_type in _VALUE_TYPES.items():
+            table = f"{tagtype.name.lower()}_tags"
+            with stage("SDL.export_snapshot", "debug", table=table) as export_stage:
+                tables[table] = _export_table(
+                    connection, out_dir, table, [("id", "int64"), ("tagset_id", "int64"), ("value", value_type)]
+                )
+                tables[table]["tagtype"] = tagtype.name.lower()
+                export_stage.rows = tables[table]["rows"]
+        with stage("SDL.export_snapshot", "debug", table="taggings") as export_stage:
+            tables["taggings"] = _export_taggings(connection, out_dir)
+            export_stage.rows = tables["taggings"]["rows"]
+    finally:
+        if started:
+            connection.rollback()
+
+    manifest = {
+        "format": SNAPSHOT_FORMAT,
+        "byteorder": "little",
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "tables": tables
+    }
+    tmp_path = out_dir / (MANIFEST_FILE + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, out_dir / MANIFEST_FILE)
+    return manifest
+
+
+class StringColumn():
+    """
+    Read-only view of a string column of a snapshot, values are decoded on access.
+    """
+
+    def __init__(self, offsets: memoryview, data: memoryview, valid: Optional[memoryview]):
+        self.offsets = offsets
+        self.data = data
+        self.valid = valid
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> Optional[str]:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        if self.valid is not None and not self.valid[i]:
+            return None
+        return str(self.data[self.offsets[i]:self.offsets[i + 1]], "utf-8")
+
+    def __iter__(self) -> Iterator[Optional[str]]:
+        for i in range(len(self)):
+            yield self[i]
+
+
+class Snapshot():
+    """
+    Memory mapped reader of a snapshot written by export_snapshot.
+
+    Columns are returned as zero-copy memoryviews (int64 'q', float64 'd') over read-only memory maps, so
+    processes reading the same snapshot share one copy in the page cache. numpy() wraps a column as a
+    read-only NumPy array without copying, if NumPy is installed.
+
+    Usage:
+        with Snapshot("snapshot/") as snapshot:
+            indptr, indices = snapshot.taggings()
+            tag_ids = snapshot.media_tags(42)
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        manifest_path = self.path / MANIFEST_FILE
+        if not manifest_path.exists():
+            raise FileNotFoundError(f"Snapshot manifest not found (incomplete snapshot?): {manifest_path}")
+        with open(manifest_path) as f:
+            self.manifest = json.load(f)
+        if self.manifest.get("format") != SNAPSHOT_FORMAT:
+            raise ValueError(f"Not a snapshot: {self.path}")
+        if sys.byteorder != "little":
+            raise ValueError("Snapshots can only be memory mapped on little endian machines")
+        self._maps: Dict[Path, Any] = {}
+
+    def __enter__(self) -> "Snapshot":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """
+        Close the memory maps, views returned before must not be used anymore.
+        """
+        for mapped in self._maps.values():
+            if isinstance(mapped, mmap.mmap):
+                try:
+                    mapped.close()
+                except BufferError:
+                    # Views are still referenced, the map is closed once they are released
+                    pass
+        self._maps = {}
+
+    @property
+    def tables(self) -> Dict[str, dict]:
+        return self.manifest["tables"]
+
+    def _map(self, path: Path) -> memoryview:
+        if path not in self._maps:
+            with open(path, "rb") as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    self._maps[path] = b""
+                else:
+                    self._maps[path] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return memoryview(self._maps[path])
+
+    def _column_info(self, table: str, column: str) -> dict:
+        try:
+            return self.tables[table]["columns"][column]
+        except KeyError:
+            raise KeyError(f"Column not found in snapshot: {table}.{column}") from None
+
+    def column(self, table: str, column: str) -> memoryview:
+        """
+        Zero-copy view of an int64 or float64 column.
+        """
+        column_type = self._column_info(table, column)["type"]
+        if column_type == "string":
+            raise TypeError(f"{table}.{column} is a string column, use strings()")
+        return self._map(_column_file(self.path, table, column)).cast(_TYPECODES[column_type])
+
+    def strings(self, table: str, column: str) -> StringColumn:
+        """
+        View of a string column (NULL values are returned as None).
+        """
+        info = self._column_info(table, column)
+        if info["type"] != "string":
+            raise TypeError(f"{table}.{column} is not a string column, use column()")
+        valid = self._map(_column_file(self.path, table, column, "valid")) if info["nullable"] else None
+        return StringColumn(
+            self._map(_column_file(self.path, table, column, "offsets")).cast("q"),
+            self._map(_column_file(self.path, table, column, "data")),
+            valid
+        )
+
+    def numpy(self, table: str, column: str):
+        """
+        Zero-copy read-only NumPy array of an int64 or float64 column (requires NumPy).
+        """
+        try:
+            import numpy
+        except ImportError:
+            raise ImportError("Snapshot.numpy requires NumPy (pip install numpy), use column() otherwise") from None
+        view = self.column(table, column)
+        return numpy.frombuffer(view, dtype="<i8" if view.format == "q" else "<f8")
+
+    def taggings(self) -> Tuple[memoryview, memoryview]:
+        """
+        The taggings in CSR layout: (indptr, indices), indexed by media id.
+        """
+        return self.column("taggings", "indptr"), self.column("taggings", "indices")
+
+    def media_tags(self, media_id: int) -> memoryview:
+        """
+        Tag ids of a media (sorted), an empty view for unknown media ids.
+        """
+        indptr, indices = self.taggings()
+        if not 0 <= media_id < len(indptr) - 1:
+            return indices[0:0]
+        return indices[indptr[media_id]:indptr[media_id + 1]]
@@ -0,0 +1,168 @@
+import json
+from itertools import batched
+from typing import Any, Iterator, List, TextIO, Union
+
+
+_WHITESPACE = " \t\n\r"
+
+# A decoding error this close to the end of the buffer may be a token cut off by the buffer end (e.g. a
+# literal "fals" or an escape "\ud83d\ude0"), errors further from the end are syntax errors
+_MAX_TOKEN_LENGTH = 16
+
+
+def _iter_json_lines(f: TextIO, buffered: str, max_record_size: int) -> Iterator[str]:
+    """
+    The non-blank lines of a JSON Lines file, from the current position. buffered is the text already read from f.
+    """
+    *lines, line = buffered.split("\n")
+    yield from (line for line in lines if line and not line.isspace())
+    while True:
+        if len(line) > max_record_size:
+            raise ValueError(f"Record larger than {max_record_size} characters")
+        more = f.readline(max_record_size + 1 - len(line))
+        line += more
+        if not more or more.endswith("\n"):
+            if line and not line.isspace():
+                yield line
+            if not more:
+                return
+            line = ""
+
+
+def iter_json_records(f: TextIO, chunk_size: int = 1 << 20, max_record_size: int = 1 << 28) -> Iterator[Any]:
+    """
+    Incrementally parse the records of a JSON file without loading it as a whole.
+
+    Parameters:
+    - f: Text file object opened for reading.
+    - chunk_size: Number of characters read from the file per refill of the buffer (a record larger than
+                  the buffer grows it geometrically, so it is decoded a logarithmic number of times).
+    - max_record_size: Maximum number of characters of a record, larger (or unterminated) records raise
+                       a ValueError instead of buffering the rest of the file.
+
+    Supported formats:
+    - A JSON array of values, e.g. [{...}, {...}]
+    - JSON Lines, i.e. exactly one JSON value per line (blank lines are skipped)
+
+    Only the current buffer (at least one record) is held in memory, so the peak memory
+    depends on the size of the largest record and not on the size of the file.
+    """
+    decoder = json.JSONDecoder()
+    buf = ""
+    pos = 0
+    eof = False
+
+    def refill() -> bool:
+        nonlocal buf, pos, eof
+        if eof:
+            return False
+        # At least the size of the pending (partial) record, which is decoded again from its start
+        chunk = f.read(max(chunk_size, len(buf) - pos))
+        if not chunk:
+            eof = True
+            return False
+        # Drop the consumed prefix so the buffer does not keep growing
+        buf = buf[pos:] + chunk
+        pos = 0
+        return True
+
+    def skip_whitespace() -> bool:
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in _WHITESPACE:
+                pos += 1
+            if pos < len(buf):
+                return True
+            if not refill():
+                return False
+
+    if not skip_whitespace():
+        return
+
+    # A leading '[' means a JSON array, anything else is treated as JSON Lines
+    if buf[pos] != "[":
+        for number, line in enumerate(_iter_json_lines(f, buf[pos:], max_record_size), 1):
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Invalid JSON Lines record {number}: {e}") from e
+        return
+    pos += 1
+
+    expect_separator = False
+    while True:
+        if not skip_whitespace():
+            raise ValueError("Unexpected end of file, JSON array is not closed")
+
+        if buf[pos] == "]":
+            pos += 1
+            if skip_whitespace():
+                raise ValueError(f"Unexpected data after the end of the JSON array: {buf[pos:pos + 20]!r}")
+            return
+        if expect_separator:
+            if buf[pos] != ",":
+                raise ValueError(f"Expected ',' or ']' in JSON array, found {buf[pos]!r}")
+            pos += 1
+            expect_separator = False
+            if not skip_whitespace():
+                raise ValueError("Unexpected end of file, JSON array is not closed")
+
+        try:
+            record, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError as e:
+            # A record cut off at the end of the buffer fails at its end, or as an unterminated string
+            truncated = e.pos + _MAX_TOKEN_LENGTH >= len(buf) or e.msg.startswith("Unterminated string")
+            if not truncated:
+                raise
+            if len(buf) - pos > max_record_size:
+                raise ValueError(f"Record larger than {max_record_size} characters (or not terminated)") from e
+            if refill():
+                continue
+            raise
+
+        # A value ending exactly at the end of the buffer may be a truncated number
+        if end == len(buf) and refill():
+            continue
+
+        pos = end
+        expect_separator = True
+        yield record
+
+
+def iter_json_batches(f: TextIO, batch_size: int) -> Iterator[List[Any]]:
+    """
+    Incrementally parse the records of a JSON array or JSON Lines file in fixed-size batches.
+
+    Parameters:
+    - f: Text file object opened for reading.
+    - batch_size: Maximum number of records per batch.
+    """
+    for batch in batched(iter_json_records(f), batch_size):
+        yield list(batch)
+
+
+def iter_raw_json_batches(f: TextIO, batch_size: int, max_record_size: int = 1 << 28) -> Iterator[List[Union[str, Any]]]:
+    """
+    Split a JSON array or JSON Lines file into fixed-size batches with as little parsing as possible.
+
+    Parameters:
+    - f: Text file object opened for reading (seekable).
+    - batch_size: Maximum number of records per batch.
+    - max_record_size: Maximum number of characters of a record (see iter_json_records).
+
+    For JSON Lines the batches contain the raw (undecoded) lines, so the decoding can be done by
+    worker processes. The lines are split as iter_json_records splits them, one value per line.
+    JSON arrays cannot be split without parsing, their batches contain decoded records.
+    """
+    start = f.tell()
+    first = f.read(1)
+    while first and first in _WHITESPACE:
+        first = f.read(1)
+    f.seek(start)
+
+    if first == "[":
+        yield from iter_json_batches(f, batch_size)
+        return
+
+    for batch in batched(_iter_json_lines(f, "", max_record_size), batch_size):
+        yield list(batch)
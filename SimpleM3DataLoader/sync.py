@@ -0,0 +1,340 @@
+from sqlite3 import Connection
+from typing import Dict, Iterable, List, Optional
+
+from .SimpleM3DataLoader import (
+    MediaObject, get_media_id_map_for_sources, notify_taggings_listeners, resolve_media_taggings
+)
+from .instrumentation import log, stage
+
+
+def _apply_in_batches(
+    connection: Connection,
+    table: str,
+    statements: List[str],
+    batch_size: int,
+    deleted_taggings: Optional[str] = None
+) -> int:
+    """
+    Run statements over the rows of a staged change table, batch_size rows (a rowid range bound to
+    ?1 and ?2) per transaction.
+
+    If deleted_taggings is given, it selects the (media_id, tag_id) rows the statements of a batch delete,
+    the taggings listeners are notified of them once the batch is committed.
+
+    Returns:
+    - The number of staged rows
+    """
+    rows = connection.execute(f"SELECT COALESCE(MAX(rowid), 0) FROM {table}").fetchone()[0]
+    for start in range(1, rows + 1, batch_size):
+        deleted = connection.execute(deleted_taggings, [start, start + batch_size - 1]).fetchall() if deleted_taggings else []
+        for sql in statements:
+            connection.execute(sql, [start, start + batch_size - 1])
+        connection.commit()
+        if deleted:
+            notify_taggings_listeners(connection, deleted, deleted=True)
+    return rows
+
+
+def _count(connection: Connection, table: str) -> int:
+    return connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+def sync_medias(
+    connection: Connection,
+    batches: Iterable[List[MediaObject]],
+    partial: bool = False,
+    batch_size: int = 10_000,
+    dry_run: bool = False
+) -> Dict[str, int]:
+    """
+    Make the medias table match a new version of a collection, writing only the differences.
+
+    The new media objects are staged in a temporary table and compared with the medias by source:
+    - new sources are inserted
+    - medias whose source type or thumbnail changed are updated
+    - medias whose group leader changed are reassigned to the new group
+    - medias that are not in the new version are deleted with their taggings (unless partial)
+    Each kind of change is staged and then applied in transactions of batch_size rows, an interrupted
+    sync can simply be run again.
+
+    Parameters:
+    - connection: sqlite3.Connection object to the database.
+    - batches: Iterable of batches of MediaObject objects, the complete new version of the medias.
+    - partial: If True, the batches only hold changed and new medias, no media is deleted.
+    - batch_size: Number of changed rows applied per transaction.
+    - dry_run: If True, only count the changes.
+
+    Returns:
+    - Dictionary with the number of inserted, updated, regrouped and deleted medias
+    """
+    cur = connection.cursor()
+    try:
+        with stage("SDL.sync_medias.stage", "debug") as stage_stage:
+            cur.execute(
+                """
+                CREATE TEMP TABLE IF NOT EXISTS tmp_sync_medias (
+                    source TEXT PRIMARY KEY,
+                    source_type INTEGER NOT NULL,
+                    thumbnail_uri TEXT,
+                    group_source TEXT
+                ) WITHOUT ROWID
+                """
+            )
+            cur.execute("DELETE FROM tmp_sync_medias")
+            for batch in batches:
+                cur.executemany(
+                    "INSERT OR REPLACE INTO tmp_sync_medias VALUES (?, ?, ?, ?)",
+                    [(mo.source, mo.source_type.value, mo.thumbnail, mo.group) for mo in batch]
+                )
+            stage_stage.rows = _count(connection, "tmp_sync_medias")
+
+        # Group leaders have to be part of the new version (or, for partial syncs, exist already)
+        missing = cur.execute(
+            f"""
+            SELECT DISTINCT g.group_source
+            FROM tmp_sync_medias g
+            WHERE g.group_source IS NOT NULL
+            AND g.group_source NOT IN (SELECT source FROM tmp_sync_medias)
+            {"AND g.group_source NOT IN (SELECT source FROM medias)" if partial else ""}
+            LIMIT 10
+            """
+        ).fetchall()
+        if missing:
+            raise ValueError(f"Group leader media object not found for group(s): {', '.join(src for (src,) in missing)}")
+
+        with stage("SDL.sync_medias.diff", "debug"):
+            for table in ("tmp_sync_media_inserts", "tmp_sync_media_updates", "tmp_sync_media_deletes", "tmp_sync_media_groups"):
+                cur.execute(f"DROP TABLE IF EXISTS temp.{table}")
+            cur.execute(
+                """
+                CREATE TEMP TABLE tmp_sync_media_inserts AS
+                SELECT s.source, s.source_type, s.thumbnail_uri
+                FROM tmp_sync_medias s
+                WHERE NOT EXISTS (SELECT 1 FROM medias m WHERE m.source = s.source)
+                """
+            )
+            cur.execute(
+                """
+                CREATE TEMP TABLE tmp_sync_media_updates AS
+                SELECT m.id, s.source_type, s.thumbnail_uri
+                FROM tmp_sync_medias s
+                JOIN medias m ON m.source = s.source
+                WHERE m.source_type != s.source_type OR m.thumbnail_uri IS NOT s.thumbnail_uri
+                """
+            )
+            cur.execute(
+                f"""
+                CREATE TEMP TABLE tmp_sync_media_deletes AS
+                SELECT m.id
+                FROM medias m
+                WHERE {"0" if partial else "NOT EXISTS (SELECT 1 FROM tmp_sync_medias s WHERE s.source = m.source)"}
+                """
+            )
+
+        changes = {
+            "inserted": _count(connection, "tmp_sync_media_inserts"),
+            "updated": _count(connection, "tmp_sync_media_updates"),
+            "deleted": _count(connection, "tmp_sync_media_deletes"),
+        }
+        if dry_run:
+            # The new medias do not have ids yet, count the changed group leaders by source
+            changes["regrouped"] = cur.execute(
+                """
+                SELECT COUNT(*)
+                FROM tmp_sync_medias s
+                LEFT JOIN medias m ON m.source = s.source
+                LEFT JOIN medias l ON l.id = m.group_id
+                WHERE l.source IS NOT s.group_source
+                """
+            ).fetchone()[0]
+            connection.rollback()
+            return changes
+
+        with stage("SDL.sync_medias.apply") as apply_stage:
+            connection.commit()
+            _apply_in_batches(connection, "tmp_sync_media_inserts", [
+                """
+                INSERT INTO medias (source, source_type, thumbnail_uri)
+                SELECT source, source_type, thumbnail_uri FROM tmp_sync_media_inserts WHERE rowid BETWEEN ?1 AND ?2
+                """
+            ], batch_size)
+            _apply_in_batches(connection, "tmp_sync_media_updates", [
+                """
+                UPDATE medias
+                SET source_type = u.source_type, thumbnail_uri = u.thumbnail_uri
+                FROM tmp_sync_media_updates u
+                WHERE medias.id = u.id AND u.rowid BETWEEN ?1 AND ?2
+                """
+            ], batch_size)
+
+            # Group reassignments are computed after the inserts, new leaders have ids now
+            cur.execute(
+                """
+                CREATE TEMP TABLE tmp_sync_media_groups AS
+                SELECT m.id, l.id AS group_id
+                FROM tmp_sync_medias s
+                JOIN medias m ON m.source = s.source
+                LEFT JOIN medias l ON l.source = s.group_source
+                WHERE m.group_id IS NOT l.id
+                """
+            )
+            changes["regrouped"] = _apply_in_batches(connection, "tmp_sync_media_groups", [
+                """
+                UPDATE medias
+                SET group_id = g.group_id
+                FROM tmp_sync_media_groups g
+                WHERE medias.id = g.id AND g.rowid BETWEEN ?1 AND ?2
+                """
+            ], batch_size)
+            # The new version decides the groups of its medias, their pending groups (see add_medias) are dropped
+            cur.execute(
+                "DELETE FROM pending_media_groups WHERE media_id IN (SELECT m.id FROM tmp_sync_medias s JOIN medias m ON m.source = s.source)"
+            )
+            connection.commit()
+
+            # Taggings and group references to the deleted medias go first (foreign keys)
+            _apply_in_batches(connection, "tmp_sync_media_deletes", [
+                "DELETE FROM taggings WHERE media_id IN (SELECT id FROM tmp_sync_media_deletes WHERE rowid BETWEEN ?1 AND ?2)",
+                "DELETE FROM pending_media_groups WHERE media_id IN (SELECT id FROM tmp_sync_media_deletes WHERE rowid BETWEEN ?1 AND ?2)",
+                "UPDATE medias SET group_id = NULL WHERE group_id IN (SELECT id FROM tmp_sync_media_deletes WHERE rowid BETWEEN ?1 AND ?2)",
+                "DELETE FROM medias WHERE id IN (SELECT id FROM tmp_sync_media_deletes WHERE rowid BETWEEN ?1 AND ?2)",
+            ], batch_size, deleted_taggings="""
+                SELECT t.media_id, t.tag_id
+                FROM tmp_sync_media_deletes d
+                CROSS JOIN taggings t ON t.media_id = d.id
+                WHERE d.rowid BETWEEN ?1 AND ?2
+            """)
+            apply_stage.rows = sum(changes.values())
+            apply_stage.fields.update(changes)
+        return changes
+    except Exception:
+        if connection.in_transaction:
+            connection.rollback()
+        raise
+    finally:
+        cur.close()
+
+
+def sync_media_taggings(
+    connection: Connection,
+    batches: Iterable[List[dict]],
+    partial: bool = False,
+    batch_size: int = 10_000,
+    register_missing_tags: bool = True,
+    dry_run: bool = False
+) -> Dict[str, int]:
+    """
+    Make the taggings table match a new version of the media taggings, writing only the differences.
+
+    The new taggings are resolved (media source, (tagset, value)) to (media_id, tag_id) rows and staged
+    in a temporary table. Rows that do not exist yet are inserted and the existing rows that are not in
+    the new version (stale taggings) are deleted, in transactions of batch_size rows. Tags are never
+    deleted, tag values that are no longer used keep their tag.
+
+    Parameters:
+    - connection: sqlite3.Connection object to the database.
+    - batches: Iterable of batches of media tagging dictionaries (see add_media_taggings), the complete
+               new version of the taggings.
+    - partial: If True, only the taggings of the medias in the batches are synced, the taggings of the
+               other medias are kept.
+    - batch_size: Number of changed rows applied per transaction.
+    - register_missing_tags: If True, new tag values are added to their tagset (the tagsets must exist),
+                             otherwise taggings of unknown tag values are skipped.
+    - dry_run: If True, only count the changes. No tag is added, so taggings of new tag values are not
+               counted, and taggings of medias a sync_medias would delete are counted as deleted.
+
+    Returns:
+    - Dictionary with the number of inserted and deleted taggings
+
+    The taggings listeners are notified of the inserted rows and of the deleted rows (deleted=True), an
+    attached BitmapIndex stays up to date. Other in-memory indexes have to be refreshed after a sync that
+    deleted taggings.
+    """
+    cur = connection.cursor()
+    try:
+        with stage("SDL.sync_media_taggings.stage", "debug") as stage_stage:
+            cur.execute(
+                """
+                CREATE TEMP TABLE IF NOT EXISTS tmp_sync_taggings (
+                    media_id INTEGER NOT NULL,
+                    tag_id INTEGER NOT NULL,
+                    PRIMARY KEY (media_id, tag_id)
+                ) WITHOUT ROWID
+                """
+            )
+            cur.execute("CREATE TEMP TABLE IF NOT EXISTS tmp_sync_tagged_medias (id INTEGER PRIMARY KEY)")
+            cur.execute("DELETE FROM tmp_sync_taggings")
+            cur.execute("DELETE FROM tmp_sync_tagged_medias")
+            for batch in batches:
+                cur.executemany(
+                    "INSERT OR IGNORE INTO tmp_sync_taggings VALUES (?, ?)",
+                    resolve_media_taggings(connection, batch, register_missing_tags and not dry_run)
+                )
+                if partial:
+                    media_ids = get_media_id_map_for_sources(connection, (mapping['media_source'] for mapping in batch))
+                    cur.executemany("INSERT OR IGNORE INTO tmp_sync_tagged_medias VALUES (?)", ((media_id,) for media_id in media_ids.values()))
+            stage_stage.rows = _count(connection, "tmp_sync_taggings")
+
+        with stage("SDL.sync_media_taggings.diff", "debug"):
+            for table in ("tmp_sync_tagging_inserts", "tmp_sync_tagging_deletes"):
+                cur.execute(f"DROP TABLE IF EXISTS temp.{table}")
+            cur.execute(
+                """
+                CREATE TEMP TABLE tmp_sync_tagging_inserts AS
+                SELECT s.media_id, s.tag_id
+                FROM tmp_sync_taggings s
+                WHERE NOT EXISTS (SELECT 1 FROM taggings t WHERE t.media_id = s.media_id AND t.tag_id = s.tag_id)
+                """
+            )
+            # Partial syncs only scan the taggings of the listed medias
+            cur.execute(
+                f"""
+                CREATE TEMP TABLE tmp_sync_tagging_deletes AS
+                SELECT t.media_id, t.tag_id
+                FROM {"tmp_sync_tagged_medias p CROSS JOIN taggings t ON t.media_id = p.id" if partial else "taggings t"}
+                WHERE NOT EXISTS (SELECT 1 FROM tmp_sync_taggings s WHERE s.media_id = t.media_id AND s.tag_id = t.tag_id)
+                """
+            )
+
+        changes = {
+            "inserted": _count(connection, "tmp_sync_tagging_inserts"),
+            "deleted": _count(connection, "tmp_sync_tagging_deletes"),
+        }
+        if dry_run:
+            connection.rollback()
+            return changes
+
+        with stage("SDL.sync_media_taggings.apply", rows=sum(changes.values()), **changes):
+            # Commits the tags registered while resolving
+            connection.commit()
+            _apply_in_batches(connection, "tmp_sync_tagging_deletes", [
+                """
+                DELETE FROM taggings
+                WHERE (media_id, tag_id) IN (
+                    SELECT media_id, tag_id FROM tmp_sync_tagging_deletes WHERE rowid BETWEEN ?1 AND ?2
+                )
+                """
+            ], batch_size, deleted_taggings="SELECT media_id, tag_id FROM tmp_sync_tagging_deletes WHERE rowid BETWEEN ?1 AND ?2")
+            rows = changes["inserted"]
+            for start in range(1, rows + 1, batch_size):
+                inserted = cur.execute(
+                    "SELECT media_id, tag_id FROM tmp_sync_tagging_inserts WHERE rowid BETWEEN ? AND ?",
+                    [start, start + batch_size - 1]
+                ).fetchall()
+                cur.executemany("INSERT OR IGNORE INTO taggings (media_id, tag_id) VALUES (?, ?)", inserted)
+                connection.commit()
+                notify_taggings_listeners(connection, inserted)
+        if changes["deleted"]:
+            log(
+                "SDL.sync_media_taggings",
+                f"{changes['deleted']} stale tagging(s) deleted, in-memory indexes that are not attached "
+                "(BitmapIndex.attach) have to be refreshed",
+                "warning"
+            )
+        return changes
+    except Exception:
+        if connection.in_transaction:
+            connection.rollback()
+        raise
+    finally:
+        cur.close()
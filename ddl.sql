@@ -8,8 +8,20 @@ DROP INDEX IF EXISTS idx_json_tagset_id_value;
 
 DROP INDEX IF EXISTS idx_taggings_media_id;
 DROP INDEX IF EXISTS idx_taggings_tag_id;
-
-
+DROP INDEX IF EXISTS idx_tag_counts_tagset_id_count;
+
+
+DROP TABLE IF EXISTS alphanumerical_tags_fts;
+DROP TABLE IF EXISTS alphanumerical_tags_trigram;
+DROP TABLE IF EXISTS text_search_tagsets;
+DROP TABLE IF EXISTS json_path_indexes;
+DROP TABLE IF EXISTS media_intervals;
+DROP TABLE IF EXISTS interval_tagsets;
+DROP TABLE IF EXISTS media_tag_cache;
+DROP TABLE IF EXISTS ingest_failures;
+DROP TABLE IF EXISTS ingest_chunks;
+DROP TABLE IF EXISTS pending_media_groups;
+DROP TABLE IF EXISTS tag_counts;
 DROP TABLE IF EXISTS taggings;
 DROP TABLE IF EXISTS numerical_int_tags;
 DROP TABLE IF EXISTS numerical_dec_tags;
@@ -92,6 +104,7 @@ CREATE TABLE alphanumerical_tags (
 );
 
 ------------------------------------------------------------------------- Timestamp Tags
+-- Stored as INTEGER microseconds since 1970-01-01 00:00:00 UTC (see encode_tag_value)
 CREATE TABLE timestamp_tags (
     id INTEGER PRIMARY KEY REFERENCES tags(id),
     value TIMESTAMP without time zone NOT NULL,
@@ -100,6 +113,7 @@ CREATE TABLE timestamp_tags (
 );
 
 ------------------------------------------------------------------------- Time Tags
+-- Stored as INTEGER microseconds since midnight (see encode_tag_value)
 CREATE TABLE time_tags (
     id INTEGER PRIMARY KEY REFERENCES tags(id),
     value TIME without time zone NOT NULL,
@@ -108,6 +122,7 @@ CREATE TABLE time_tags (
 );
 
 ------------------------------------------------------------------------- Date Tags
+-- Stored as INTEGER days since 1970-01-01 (see encode_tag_value)
 CREATE TABLE date_tags (
     id INTEGER PRIMARY KEY REFERENCES tags(id),
     value DATE NOT NULL,
@@ -146,11 +161,64 @@ CREATE TABLE taggings (
     PRIMARY KEY (media_id, tag_id)
 );
 
+------------------------------------------------------------------------- Pending Groups
+-- Members added before their group leader (e.g. the leader comes later in a streamed file),
+-- they are grouped once the leader is added (see resolve_pending_groups)
+CREATE TABLE pending_media_groups (
+    media_id INTEGER PRIMARY KEY REFERENCES medias(id),
+    group_source TEXT NOT NULL
+);
+
+------------------------------------------------------------------------- Tag Counts
+-- Number of taggings per tag, maintained by the triggers below (used for facet counts)
+CREATE TABLE tag_counts (
+    tag_id INTEGER PRIMARY KEY REFERENCES tags(id),
+    tagset_id INTEGER NOT NULL REFERENCES tagsets(id),
+    count INTEGER NOT NULL
+);
+
+CREATE TRIGGER trg_taggings_insert_tag_counts AFTER INSERT ON taggings
+BEGIN
+    INSERT INTO tag_counts (tag_id, tagset_id, count)
+    SELECT NEW.tag_id, t.tagset_id, 1 FROM tags t WHERE t.id = NEW.tag_id
+    ON CONFLICT (tag_id) DO UPDATE SET count = count + 1;
+END;
+
+CREATE TRIGGER trg_taggings_delete_tag_counts AFTER DELETE ON taggings
+BEGIN
+    UPDATE tag_counts SET count = count - 1 WHERE tag_id = OLD.tag_id;
+END;
+
+------------------------------------------------------------------------- Ingestion Manifest
+-- Chunks of the input files loaded by the add-*-from-json commands, a rerun skips the completed chunks
+-- (identified by the offset of their first record, the number of records and a SHA-256 of their content)
+CREATE TABLE ingest_chunks (
+    kind TEXT NOT NULL, -- tagsets, tags, medias or taggings
+    input TEXT NOT NULL, -- absolute path of the input file
+    record_offset INTEGER NOT NULL,
+    records INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    failed_records INTEGER NOT NULL DEFAULT 0,
+    completed_at TEXT NOT NULL,
+    PRIMARY KEY (kind, input, record_offset)
+);
+
+-- Records of completed chunks that could not be added, with the error
+CREATE TABLE ingest_failures (
+    kind TEXT NOT NULL,
+    input TEXT NOT NULL,
+    record_offset INTEGER NOT NULL,
+    record TEXT NOT NULL,
+    error TEXT NOT NULL,
+    PRIMARY KEY (kind, input, record_offset)
+);
+
 ------------------------------------------------------------------------- INDEXES
 -- NOTE: If bulk insertion takes too long: 
 -- 1. DROP the indexes 
 -- 2. Insert data 
 -- 3. Create the indexes again
+-- The bulk-load command in main.py does this automatically (and rebuilds tag_counts instead of using the triggers).
 
 CREATE INDEX idx_alphanumerical_tagset_id_value ON alphanumerical_tags(tagset_id, value);
 CREATE INDEX idx_timestamp_tagset_id_value ON timestamp_tags(tagset_id, value);
@@ -161,7 +229,9 @@ CREATE INDEX idx_numerical_dec_tagset_id_value ON numerical_dec_tags(tagset_id,
 CREATE INDEX idx_json_tagset_id_value ON json_tags(tagset_id, value);
 
 CREATE INDEX idx_taggings_media_id ON taggings(media_id);
-CREATE INDEX idx_taggings_tag_id ON taggings(tag_id);
+CREATE INDEX idx_taggings_tag_id ON taggings(tag_id, media_id); -- covers media_id for tag -> media lookups
 
 CREATE INDEX idx_medias_group_id ON medias(group_id);
 
+CREATE INDEX idx_tag_counts_tagset_id_count ON tag_counts(tagset_id, count);
+
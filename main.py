@@ -1,14 +1,87 @@
 import click
 import json
 import sqlite3
-from typing import List
+from typing import List, Optional, Tuple
 from pathlib import Path
 
 import SimpleM3DataLoader as sdl
 
+DEFAULT_BATCH_SIZE = 10_000
+# Tags records hold all the values of a tagset, they are added in smaller batches
+TAGS_BATCH_SIZE = 1000
+
+
+def _tagset_from_json(ts: dict) -> sdl.Tagset:
+    if ts['tagtype'].upper() not in sdl.TagType.__members__:
+        raise ValueError(f"Invalid tag type: ({ts['name'], ts['tagtype']})")
+    return sdl.Tagset(
+        ts['name'], 
+        sdl.TagType[ts['tagtype'].upper()],
+        sdl.Tags(ts['name'], list(dict.fromkeys(ts['tags'])))
+    )
+
+
+def _tags_from_json(tg: dict) -> sdl.Tags:
+    return sdl.Tags(
+        tg['tagset_name'], 
+        list(dict.fromkeys(tg['tags']))
+    )
+
+
+def _media_from_json(mo: dict) -> sdl.MediaObject:
+    return sdl.MediaObject(
+        mo['source'], 
+        sdl.MediaSourceType[mo['source_type'].upper()],
+        mo.get('thumbnail', None),
+        mo.get('group', None)
+    )
+
+
+def _resolve_pending_groups(connection: sqlite3.Connection):
+    missing = sdl.resolve_pending_groups(connection)
+    if missing:
+        print(f"Group leader media objects not found, their members are grouped once they are added: {', '.join(missing)}")
+
+
+def _report_checkpointed(loaded: int, failed: int):
+    print(f"{loaded} records added" + (f", {failed} failed (see ingest-status --failures)" if failed else ""))
+
+
 @click.group()
-def cli():
-    pass
+@click.option("--events", "events_file", type=Path, default=None, help="Append all loader events (stages, messages, errors) as JSON Lines to this file.")
+@click.option("--verbose", is_flag=True, help="Also print the debug events (sub-stages of every batch).")
+@click.option("--profile", is_flag=True, help="Print the total time, rows and rows/sec per stage at the end.")
+@click.option("--trace-slow-ms", type=float, default=None, help="Report SQL statements running at least this many milliseconds.")
+@click.pass_context
+def cli(ctx: click.Context, events_file: Optional[Path] = None, verbose: bool = False, profile: bool = False, trace_slow_ms: Optional[float] = None):
+    if verbose:
+        sdl.print_sink.min_level = "debug"
+    if events_file is not None:
+        events_sink = sdl.JsonLinesSink(events_file)
+        sdl.add_sink(events_sink)
+        ctx.call_on_close(events_sink.close)
+    if profile:
+        totals = sdl.StageTotals()
+        sdl.add_sink(totals)
+
+        def print_profile():
+            print("Stage totals:")
+            for source, stage_totals in totals.summary().items():
+                print(f"  {source}: {stage_totals['calls']} calls, {stage_totals['rows']} rows in {stage_totals['seconds']:.2f}s ({stage_totals['rows_per_sec']:.0f} rows/sec)")
+        ctx.call_on_close(print_profile)
+    ctx.obj = {"trace_slow_ms": trace_slow_ms}
+
+
+def _connect(db_file: Path, **kwargs) -> sqlite3.Connection:
+    """
+    Open a connection to the database, tracing slow statements if requested with --trace-slow-ms.
+    """
+    connection = sqlite3.connect(db_file, **kwargs)
+    ctx = click.get_current_context(silent=True)
+    trace_slow_ms = ctx.obj.get("trace_slow_ms") if ctx and ctx.obj else None
+    if trace_slow_ms is not None:
+        ctx.with_resource(sdl.trace_statements(connection, trace_slow_ms))
+    return connection
 
 @cli.command()
 @click.argument("dbname", type=str)
@@ -25,17 +98,48 @@ def initdb(dbname: str, ddl_file: Path):
             connection.executescript(ddl_script)
 
 
+@cli.command()
+@click.argument("db_file", type=Path)
+@click.argument("ddl_file", type=Path)
+def upgradedb(db_file: Path, ddl_file: Path):
+    """
+    Upgrade a database created from an earlier version of the DDL file (see upgrade_schema).
+
+    Parameters:
+    - db_file: Path to the sqlite3 database file.
+    - ddl_file: Path to the DDL file the database is upgraded to.
+
+    Example:
+    upgradedb example.db ddl.sql
+    """
+    if not db_file.exists():
+        raise FileNotFoundError(f"Database file not found: {db_file}")
+    if not ddl_file.exists():
+        raise FileNotFoundError(f"DDL file not found: {ddl_file}")
+
+    try:
+        with _connect(db_file, autocommit=False) as connection:
+            upgraded = sdl.upgrade_schema(connection, ddl_file.read_text())
+        print(f"Upgraded {len(upgraded)} schema object(s): {', '.join(upgraded)}" if upgraded else "The database is up to date")
+    except Exception as e:
+        print("Error upgrading the database:", e)
+
+
 @cli.command()
 @click.argument("db_file", type=Path)
 @click.argument("tagsets_f", type=Path)
 @click.option("--ignore-existing", is_flag=True, help="Ignore existing tagsets.")
-def add_tagsets_from_json(db_file: Path, tagsets_f: Path, ignore_existing: bool = False):
+@click.option("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, show_default=True, help="Number of records parsed and inserted per batch.")
+@click.option("--restart", is_flag=True, help="Load all records again instead of skipping the chunks completed by an earlier run.")
+def add_tagsets_from_json(db_file: Path, tagsets_f: Path, ignore_existing: bool = False, batch_size: int = DEFAULT_BATCH_SIZE, restart: bool = False):
     """
     Add tagsets from a JSON file.
     
     Parameters:
     - db_file: Path to the sqlite3 database file.
-    - tagsets_f: Path to the JSON file containing tagsets.
+    - tagsets_f: Path to the JSON (array or JSON Lines) file containing tagsets.
+    - batch_size: Number of tagsets parsed and inserted per batch (one checkpointed chunk).
+    - restart: Load all records again instead of skipping the chunks completed by an earlier run.
 
     NOTE: We recommend not using numerical_dec with SQLite3, in the future support will come for Postgres to better utilize Decimals 
 
@@ -51,21 +155,16 @@ def add_tagsets_from_json(db_file: Path, tagsets_f: Path, ignore_existing: bool
         raise FileNotFoundError(f"Tagsets file not found: {tagsets_f}")
 
     try:
-        with open(tagsets_f, 'r') as f:
-            tagsets_data : List[sdl.Tagset] = []
-            for ts in json.load(f):
-                if ts['tagtype'].upper() not in sdl.TagType.__members__:
-                    raise ValueError(f"Invalid tag type: ({ts['name'], ts['tagtype']})")
-                tagsets_data.append(
-                    sdl.Tagset(
-                        ts['name'], 
-                        sdl.TagType[ts['tagtype'].upper()],
-                        sdl.Tags(ts['name'], list(dict.fromkeys(ts['tags'])))
-                    )
-                )
-            with sqlite3.connect(db_file, autocommit=False) as connection:
-                connection.execute("PRAGMA foreign_keys = ON")
+        with open(tagsets_f, 'r') as f, _connect(db_file, autocommit=False, factory=sdl.BulkLoadConnection) as connection:
+            connection.execute("PRAGMA foreign_keys = ON")
+
+            def load(batch: List[dict]):
+                tagsets_data : List[sdl.Tagset] = [_tagset_from_json(ts) for ts in batch]
                 sdl.add_tagsets(connection, tagsets_data, ignore_existing)
+
+            _report_checkpointed(*sdl.load_checkpointed(
+                connection, "tagsets", tagsets_f, sdl.iter_raw_json_batches(f, batch_size), load, restart
+            ))
     except Exception as e:
         print("Error loading tagsets from JSON:", e)
 
@@ -73,13 +172,19 @@ def add_tagsets_from_json(db_file: Path, tagsets_f: Path, ignore_existing: bool
 @cli.command()
 @click.argument("db_file", type=Path)
 @click.argument("tags_file", type=Path)
-def add_tags_from_json(db_file: Path, tags_file: Path):
+@click.option("--batch-size", type=int, default=TAGS_BATCH_SIZE, show_default=True, help="Number of records (tagsets) added per batch and checkpointed chunk.")
+@click.option("--restart", is_flag=True, help="Load all records again instead of skipping the chunks completed by an earlier run.")
+def add_tags_from_json(db_file: Path, tags_file: Path, batch_size: int = TAGS_BATCH_SIZE, restart: bool = False):
     """
     Add tags from a JSON file.
     
     Parameters:
     - db_file: Path to the sqlite3 database file.
-    - tags_file: Path to the JSON file containing tags.
+    - tags_file: Path to the JSON (array or JSON Lines) file containing tags.
+    - batch_size: Number of records (tagsets) added per batch and checkpointed chunk.
+    - restart: Load all records again instead of skipping the chunks completed by an earlier run.
+
+    The file is parsed incrementally, each record is added as soon as its chunk is read.
 
     Example JSON format:
     [
@@ -93,19 +198,15 @@ def add_tags_from_json(db_file: Path, tags_file: Path):
         raise FileNotFoundError(f"Tags file not found: {tags_file}")
 
     try:
-        with open(tags_file, 'r') as f:
-            tags_data : List[sdl.Tags] = []
-            for tg in json.load(f):
-                tags_data.append(
-                    sdl.Tags(
-                        tg['tagset_name'], 
-                        list(dict.fromkeys(tg['tags']))
-                    )
-                )
-            with sqlite3.connect(db_file, autocommit=False) as connection:
-                connection.execute("PRAGMA foreign_keys = ON")
-                for tags in tags_data:
-                    sdl.add_tags(connection, tags)
+        with open(tags_file, 'r') as f, _connect(db_file, autocommit=False, factory=sdl.BulkLoadConnection) as connection:
+            connection.execute("PRAGMA foreign_keys = ON")
+
+            def load(batch: List[dict]):
+                sdl.add_tags_batch(connection, [_tags_from_json(tg) for tg in batch])
+
+            _report_checkpointed(*sdl.load_checkpointed(
+                connection, "tags", tags_file, sdl.iter_raw_json_batches(f, batch_size), load, restart
+            ))
     except Exception as e:
         print("Error loading tags from JSON:", e)
 
@@ -115,15 +216,26 @@ def add_tags_from_json(db_file: Path, tags_file: Path):
 @click.argument("medias_file", type=Path)
 @click.option("--ignore-existing", is_flag=True, help="Ignore existing media groups.")
 @click.option("--no-groups", is_flag=True, help="There are no media groups.")
-def add_medias_from_json(db_file: Path, medias_file: Path, ignore_existing: bool = False, no_groups: bool = False):
+@click.option("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, show_default=True, help="Number of records parsed and inserted per batch.")
+@click.option("--restart", is_flag=True, help="Load all records again instead of skipping the chunks completed by an earlier run.")
+def add_medias_from_json(
+    db_file: Path, 
+    medias_file: Path, 
+    ignore_existing: bool = False, 
+    no_groups: bool = False, 
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    restart: bool = False
+):
     """
     Add media objects from a JSON file.
     
     Parameters:
     - db_file: Path to the sqlite3 database file.
-    - medias_file: Path to the JSON file containing media objects.
+    - medias_file: Path to the JSON (array or JSON Lines) file containing media objects.
     - ignore_existing: Whether to ignore existing media entries.
-    - no_groups: Whether there are no media groups.
+    - no_groups: Whether there are no media groups (the group fields are ignored, skipping the group resolution).
+    - batch_size: Number of media objects parsed and inserted per batch (one checkpointed chunk).
+    - restart: Load all records again instead of skipping the chunks completed by an earlier run.
 
     Example JSON format:
     [
@@ -135,7 +247,8 @@ def add_medias_from_json(db_file: Path, medias_file: Path, ignore_existing: bool
         },
     ]
 
-    Note that the thumbnail and group fields are optional
+    Note that the thumbnail and group fields are optional.
+    Members whose group leader comes later in the file are grouped once the leader is added.
     """
     if not db_file.exists():
         raise FileNotFoundError(f"Database file not found: {db_file}")
@@ -144,20 +257,16 @@ def add_medias_from_json(db_file: Path, medias_file: Path, ignore_existing: bool
         raise FileNotFoundError(f"Medias file not found: {medias_file}")
 
     try:
-        with open(medias_file, 'r') as f:
-            medias_data : List[sdl.MediaObject] = []
-            for mo in json.load(f):
-                medias_data.append(
-                    sdl.MediaObject(
-                        mo['source'], 
-                        sdl.MediaSourceType[mo['source_type'].upper()],
-                        mo.get('thumbnail', None),
-                        mo.get('group', None)
-                    )
-                )
-            with sqlite3.connect(db_file, autocommit=False) as connection:
-                connection.execute("PRAGMA foreign_keys = ON")
-                sdl.add_medias(connection, medias_data, ignore_existing)
+        with open(medias_file, 'r') as f, _connect(db_file, autocommit=False, factory=sdl.BulkLoadConnection) as connection:
+            connection.execute("PRAGMA foreign_keys = ON")
+
+            def load(batch: List[dict]):
+                sdl.add_medias(connection, [_media_from_json(mo) for mo in batch], ignore_existing, no_groups, defer_missing_leaders=True)
+
+            _report_checkpointed(*sdl.load_checkpointed(
+                connection, "medias", medias_file, sdl.iter_raw_json_batches(f, batch_size), load, restart
+            ))
+            _resolve_pending_groups(connection)
     except Exception as e:
         print("Error loading media objects from JSON:", e)
 
@@ -165,13 +274,30 @@ def add_medias_from_json(db_file: Path, medias_file: Path, ignore_existing: bool
 @cli.command()
 @click.argument("db_file", type=Path)
 @click.argument("taggings_file", type=Path)
-def add_media_taggings_from_json(db_file: Path, taggings_file: Path):
+@click.option("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, show_default=True, help="Number of records parsed and inserted per batch.")
+@click.option("--workers", type=int, default=1, show_default=True, help="Number of worker processes parsing and resolving batches.")
+@click.option("--restart", is_flag=True, help="Load all records again instead of skipping the chunks completed by an earlier run.")
+@click.option("--register-missing-tags", is_flag=True, help="Add tag values that do not exist yet to their tagset instead of skipping them.")
+def add_media_taggings_from_json(
+    db_file: Path,
+    taggings_file: Path,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    workers: int = 1,
+    restart: bool = False,
+    register_missing_tags: bool = False
+):
     """
     Add media taggings from a JSON file.
 
     Parameters:
     - db_file: Path to the sqlite3 database file.
-    - taggings_file: Path to the JSON file containing media taggings.    
+    - taggings_file: Path to the JSON (array or JSON Lines) file containing media taggings.    
+    - batch_size: Number of media taggings parsed and inserted per batch.
+    - workers: Number of worker processes, with more than one worker the batches are decoded and resolved
+               in parallel and a single writer inserts them (JSON Lines input is decoded by the workers).
+    - restart: Load all records again instead of skipping the chunks completed by an earlier run.
+    - register_missing_tags: Add tag values that do not exist yet to their tagset (the tagsets must exist).
+                             Tags are created by the writer, so the batches are not resolved by workers.
 
     Example JSON format:
     [
@@ -191,14 +317,824 @@ def add_media_taggings_from_json(db_file: Path, taggings_file: Path):
         raise FileNotFoundError(f"Taggings file not found: {taggings_file}")
     
     try:
-        with open(taggings_file, 'r') as f:
-            taggings_data = json.load(f)
-            with sqlite3.connect(db_file, autocommit=False) as connection:
-                connection.execute("PRAGMA foreign_keys = ON")
-                sdl.add_media_taggings(connection, taggings_data)
+        if workers > 1 and register_missing_tags:
+            print("Missing tags are registered by a single writer, ignoring --workers")
+        elif workers > 1:
+            sdl.add_media_taggings_parallel_checkpointed(db_file, taggings_file, batch_size, workers, restart)
+            return
+
+        sdl.attach_media_tag_cache()
+        with open(taggings_file, 'r') as f, _connect(db_file, autocommit=False, factory=sdl.BulkLoadConnection) as connection:
+            connection.execute("PRAGMA foreign_keys = ON")
+            _report_checkpointed(*sdl.load_checkpointed(
+                connection, "taggings", taggings_file, sdl.iter_raw_json_batches(f, batch_size),
+                lambda batch: sdl.add_media_taggings(connection, batch, register_missing_tags), restart
+            ))
     except Exception as e:
         print("Error loading media taggings from JSON:", e) 
 
 
+@cli.command()
+@click.argument("db_file", type=Path)
+@click.option("--failures", is_flag=True, help="Also print the records that could not be added.")
+def ingest_status(db_file: Path, failures: bool = False):
+    """
+    Print the chunks loaded per input file by the add-*-from-json commands, and optionally the failed records.
+
+    Parameters:
+    - db_file: Path to the sqlite3 database file.
+    - failures: Also print the records that could not be added.
+    """
+    if not db_file.exists():
+        raise FileNotFoundError(f"Database file not found: {db_file}")
+
+    try:
+        with _connect(db_file) as connection:
+            for kind, input_file, chunks, records, failed, completed_at in connection.execute(
+                """
+                SELECT kind, input, COUNT(*), SUM(records), SUM(failed_records), MAX(completed_at)
+                FROM ingest_chunks
+                GROUP BY kind, input
+                ORDER BY MIN(completed_at)
+                """
+            ):
+                print(f"{kind} {input_file}: {chunks} chunks, {records} records, {failed} failed (last chunk {completed_at})")
+            if failures:
+                for kind, input_file, record_offset, record, error in connection.execute(
+                    "SELECT kind, input, record_offset, record, error FROM ingest_failures ORDER BY kind, input, record_offset"
+                ):
+                    print(f"{kind} {input_file} record {record_offset}: {error}\n  {record}")
+    except Exception as e:
+        print("Error reading ingestion status:", e)
+
+@cli.command()
+@click.argument("db_file", type=Path)
+@click.argument("tagsets_file", type=Path)
+@click.argument("tags_file", type=Path)
+@click.argument("medias_file", type=Path)
+@click.argument("taggings_file", type=Path)
+@click.option("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, show_default=True, help="Number of records parsed and inserted per batch.")
+@click.option("--cache-size-mib", type=int, default=1024, show_default=True, help="SQLite page cache size used during the load.")
+@click.option("--mmap-size-mib", type=int, default=4096, show_default=True, help="SQLite memory mapped I/O size used during the load.")
+def bulk_load(
+    db_file: Path, 
+    tagsets_file: Path, 
+    tags_file: Path, 
+    medias_file: Path, 
+    taggings_file: Path, 
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    cache_size_mib: int = 1024,
+    mmap_size_mib: int = 4096
+):
+    """
+    Load tagsets, tags, medias and media taggings in one pass.
+
+    Parameters:
+    - db_file: Path to the sqlite3 database file (initialized with initdb).
+    - tagsets_file: Path to the JSON file containing tagsets.
+    - tags_file: Path to the JSON file containing tags.
+    - medias_file: Path to the JSON file containing media objects.
+    - taggings_file: Path to the JSON file containing media taggings.
+    - batch_size: Number of records parsed and inserted per batch.
+    - cache_size_mib: SQLite page cache size used during the load.
+    - mmap_size_mib: SQLite memory mapped I/O size used during the load.
+
+    The load runs as a single transaction with the secondary indexes dropped and WAL, synchronous = OFF,
+    and a large cache/mmap configured. The indexes and the previous settings are restored afterwards.
+    If any step fails the whole load is rolled back.
+    """
+    if not db_file.exists():
+        raise FileNotFoundError(f"Database file not found: {db_file}")
+
+    for input_file in [tagsets_file, tags_file, medias_file, taggings_file]:
+        if not input_file.exists():
+            raise FileNotFoundError(f"Input file not found: {input_file}")
+
+    try:
+        with _connect(db_file, autocommit=False, factory=sdl.BulkLoadConnection) as connection:
+            connection.execute("PRAGMA foreign_keys = ON")
+            with sdl.bulk_load_session(connection, cache_size_mib, mmap_size_mib):
+                print("Adding tagsets...")
+                with open(tagsets_file, 'r') as f:
+                    for batch in sdl.iter_json_batches(f, batch_size):
+                        sdl.add_tagsets(connection, [_tagset_from_json(ts) for ts in batch])
+                        connection.raise_if_failed("tagsets")
+
+                print("Adding tags...")
+                with open(tags_file, 'r') as f:
+                    for batch in sdl.iter_json_batches(f, TAGS_BATCH_SIZE):
+                        sdl.add_tags_batch(connection, [_tags_from_json(tg) for tg in batch])
+                        connection.raise_if_failed("tags")
+
+                print("Adding medias...")
+                with open(medias_file, 'r') as f:
+                    for batch in sdl.iter_json_batches(f, batch_size):
+                        sdl.add_medias(connection, (_media_from_json(mo) for mo in batch), defer_missing_leaders=True)
+                        connection.raise_if_failed("medias")
+                    _resolve_pending_groups(connection)
+
+                print("Adding media taggings...")
+                with open(taggings_file, 'r') as f:
+                    for batch in sdl.iter_json_batches(f, batch_size):
+                        sdl.add_media_taggings(connection, batch)
+                        connection.raise_if_failed("media taggings")
+    except Exception as e:
+        print("Error bulk loading from JSON:", e)
+
+
+@cli.command()
+@click.argument("shards_dir", type=Path)
+@click.argument("ddl_file", type=Path)
+@click.option("--shards", type=int, default=4, show_default=True, help="Number of shard files the medias and taggings are partitioned across.")
+def init_shards(shards_dir: Path, ddl_file: Path, shards: int = 4):
+    """
+    Initialize a sharded database: a directory with a catalog (tagsets, tags) and the shard files (medias, taggings).
+
+    Parameters:
+    - shards_dir: Directory of the sharded database.
+    - ddl_file: Path to the DDL file the catalog and the shards are initialized with.
+    - shards: Number of shard files.
+    """
+    if not ddl_file.exists():
+        raise FileNotFoundError(f"DDL file not found: {ddl_file}")
+
+    try:
+        sdl.init_shards(shards_dir, ddl_file, shards)
+    except Exception as e:
+        print("Error initializing shards:", e)
+
+
+@cli.command()
+@click.argument("shards_dir", type=Path)
+@click.argument("tagsets_file", type=Path)
+@click.argument("tags_file", type=Path)
+@click.argument("medias_file", type=Path)
+@click.argument("taggings_file", type=Path)
+@click.option("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, show_default=True, help="Number of records parsed and inserted per batch.")
+@click.option("--workers", type=int, default=None, help="Number of worker processes writing the shards (default: number of shards, at most the number of CPUs).")
+def load_shards(
+    shards_dir: Path,
+    tagsets_file: Path,
+    tags_file: Path,
+    medias_file: Path,
+    taggings_file: Path,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    workers: Optional[int] = None
+):
+    """
+    Load tagsets, tags, medias and media taggings into a sharded database.
+
+    Parameters:
+    - shards_dir: Directory of the sharded database (initialized with init-shards).
+    - tagsets_file: Path to the JSON file containing tagsets.
+    - tags_file: Path to the JSON file containing tags.
+    - medias_file: Path to the JSON file containing media objects.
+    - taggings_file: Path to the JSON file containing media taggings.
+    - batch_size: Number of records parsed and inserted per batch.
+    - workers: Number of worker processes writing the shards.
+
+    Tagsets and tags are added to the catalog and replicated to every shard. Medias are partitioned by
+    media group (a video and its keyframes are in the same shard), the taggings follow their media, and
+    the shards are written in parallel.
+    """
+    sdl.shard_count(shards_dir)  # raises if shards_dir is not a sharded database
+
+    for input_file in [tagsets_file, tags_file, medias_file, taggings_file]:
+        if not input_file.exists():
+            raise FileNotFoundError(f"Input file not found: {input_file}")
+
+    try:
+        print("Adding tagsets and tags to the catalog...")
+        with _connect(shards_dir / sdl.shards.CATALOG_FILE, autocommit=False) as connection:
+            connection.execute("PRAGMA foreign_keys = ON")
+            with open(tagsets_file, 'r') as f:
+                for batch in sdl.iter_json_batches(f, batch_size):
+                    sdl.add_tagsets(connection, [_tagset_from_json(ts) for ts in batch])
+            with open(tags_file, 'r') as f:
+                for batch in sdl.iter_json_batches(f, TAGS_BATCH_SIZE):
+                    sdl.add_tags_batch(connection, [_tags_from_json(tg) for tg in batch])
+        connection.close()
+        sdl.replicate_tags(shards_dir)
+
+        print("Adding medias...")
+        with open(medias_file, 'r') as f:
+            sdl.add_medias_sharded(
+                shards_dir,
+                ([_media_from_json(mo) for mo in batch] for batch in sdl.iter_json_batches(f, batch_size)),
+                workers,
+                batch_size
+            )
+
+        print("Adding media taggings...")
+        with open(taggings_file, 'r') as f:
+            sdl.add_media_taggings_sharded(shards_dir, sdl.iter_json_batches(f, batch_size), workers, batch_size)
+    except Exception as e:
+        print("Error loading shards from JSON:", e)
+
+
+@cli.command()
+@click.argument("db_file", type=Path)
+@click.argument("medias_file", type=Path)
+@click.argument("taggings_file", type=Path)
+@click.option("--partial", is_flag=True, help="The files only hold new and changed medias (and all taggings of those), nothing else is deleted.")
+@click.option("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, show_default=True, help="Number of records parsed per batch and changed rows applied per transaction.")
+@click.option("--dry-run", is_flag=True, help="Only print the changes.")
+def sync(
+    db_file: Path,
+    medias_file: Path,
+    taggings_file: Path,
+    partial: bool = False,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    dry_run: bool = False
+):
+    """
+    Update the database to a new version of the medias and media taggings, applying only the differences.
+
+    Parameters:
+    - db_file: Path to the sqlite3 database file.
+    - medias_file: Path to the JSON file containing the media objects of the new version.
+    - taggings_file: Path to the JSON file containing the media taggings of the new version.
+    - partial: The files only hold new and changed medias (and all taggings of those), nothing else is deleted.
+    - batch_size: Number of records parsed per batch and changed rows applied per transaction.
+    - dry_run: Only print the changes.
+
+    Medias are compared by source: new medias are added, changed ones updated or moved to their new group,
+    and medias missing from the new version are deleted with their taggings. Taggings are compared by
+    (media source, tagset, value): new ones are added (new tag values are added to their tagset) and
+    stale ones deleted. An interrupted sync can be run again.
+    """
+    if not db_file.exists():
+        raise FileNotFoundError(f"Database file not found: {db_file}")
+
+    for input_file in [medias_file, taggings_file]:
+        if not input_file.exists():
+            raise FileNotFoundError(f"Input file not found: {input_file}")
+
+    try:
+        sdl.attach_media_tag_cache()
+        with _connect(db_file, autocommit=False) as connection:
+            connection.execute("PRAGMA foreign_keys = ON")
+            with open(medias_file, 'r') as f:
+                changes = sdl.sync_medias(
+                    connection,
+                    ([_media_from_json(mo) for mo in batch] for batch in sdl.iter_json_batches(f, batch_size)),
+                    partial,
+                    batch_size,
+                    dry_run
+                )
+            if dry_run:
+                print("Dry run, nothing is changed")
+            print(f"Medias: {changes['inserted']} added, {changes['updated']} updated, {changes['regrouped']} regrouped, {changes['deleted']} deleted")
+            with open(taggings_file, 'r') as f:
+                changes = sdl.sync_media_taggings(
+                    connection, sdl.iter_json_batches(f, batch_size), partial, batch_size, dry_run=dry_run
+                )
+            print(f"Taggings: {changes['inserted']} added, {changes['deleted']} deleted")
+    except Exception as e:
+        print("Error syncing:", e)
+
+
+def _parse_filters(filters: List[Tuple[str, str, str]]) -> List[sdl.Filter]:
+    parsed_filters : List[sdl.Filter] = []
+    for tagset_name, operator, value in filters:
+        if operator.lower() in ("in", "between"):
+            parsed_filters.append((tagset_name, operator, value.split(",")))
+        else:
+            parsed_filters.append((tagset_name, operator, value))
+    return parsed_filters
+
+
+def _parse_json_value(value: str):
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+def _parse_json_filters(filters: List[Tuple[str, str, str, str]]) -> List[sdl.Filter]:
+    parsed_filters : List[sdl.Filter] = []
+    for tagset_name, path, operator, value in filters:
+        if operator.lower() in ("in", "between"):
+            parsed_filters.append((tagset_name, path, operator, [_parse_json_value(v) for v in value.split(",")]))
+        else:
+            parsed_filters.append((tagset_name, path, operator, _parse_json_value(value)))
+    return parsed_filters
+
+
+@cli.command()
+@click.argument("db_file", type=Path)
+@click.option(
+    "--filter", "filters", type=(str, str, str), multiple=True, 
+    help="Tag filter TAGSET OPERATOR VALUE, e.g. --filter Objects = car. Values of 'in' and 'between' are comma separated."
+)
+@click.option(
+    "--json-filter", "json_filters", type=(str, str, str, str), multiple=True,
+    help="Filter on a field of JSON tags TAGSET PATH OPERATOR VALUE, e.g. --json-filter Boxes '$.confidence' '>=' 0.8. Values are parsed as JSON when possible."
+)
+@click.option("--source-type", type=click.Choice(list(sdl.MediaSourceType.__members__), case_sensitive=False), default=None, help="Only return medias of this source type.")
+@click.option("--limit", type=int, default=None, help="Maximum number of media ids to print.")
+def query(
+    db_file: Path,
+    filters: List[Tuple[str, str, str]],
+    json_filters: List[Tuple[str, str, str, str]],
+    source_type: Optional[str] = None,
+    limit: Optional[int] = None
+):
+    """
+    Print the ids of the medias matching all given tag filters.
+
+    Parameters:
+    - db_file: Path to the sqlite3 database file.
+    - filters: Tag filters (tagset name, operator, value), all of which have to match.
+    - json_filters: Filters on fields of JSON tags (tagset name, JSON path, operator, value), see add-json-path-index.
+    - source_type: Only return medias of this source type.
+    - limit: Maximum number of media ids to print.
+
+    Example:
+    query example.db --filter Objects = car --filter "Start (ms)" between 0,60000 --source-type image
+
+    For a sharded database (a directory, see init-shards) the shards are queried in parallel and the
+    global media ids are printed.
+    """
+    if not db_file.exists():
+        raise FileNotFoundError(f"Database file not found: {db_file}")
+
+    try:
+        if db_file.is_dir():
+            with sdl.ShardedDatabase(db_file) as db:
+                for media_id in db.query(_parse_filters(filters) + _parse_json_filters(json_filters), source_type)[:limit]:
+                    print(media_id)
+            return
+
+        with _connect(db_file) as connection:
+            for i, media_id in enumerate(sdl.query(connection, _parse_filters(filters) + _parse_json_filters(json_filters), source_type)):
+                if limit is not None and i >= limit:
+                    break
+                print(media_id)
+    except Exception as e:
+        print("Error querying medias:", e)
+
+
+@cli.command()
+@click.argument("db_file", type=Path)
+@click.option("--filter", "filters", type=(str, str, str), multiple=True, help="Tag filter TAGSET OPERATOR VALUE selecting the medias (see query).")
+@click.option("--tagset", "tagsets", type=str, multiple=True, help="Tagset to count, all tagsets by default.")
+@click.option("--source-type", type=click.Choice(list(sdl.MediaSourceType.__members__), case_sensitive=False), default=None, help="Only count medias of this source type.")
+@click.option("--top-n", type=int, default=10, show_default=True, help="Number of most frequent tags per tagset.")
+def facets(db_file: Path, filters: List[Tuple[str, str, str]], tagsets: List[str], source_type: Optional[str] = None, top_n: int = 10):
+    """
+    Print the most frequent tags per tagset, over all medias or the medias matching the filters.
+
+    Parameters:
+    - db_file: Path to the sqlite3 database file.
+    - filters: Tag filters (tagset name, operator, value) selecting the medias.
+    - tagsets: Tagsets to count, all tagsets by default.
+    - source_type: Only count medias of this source type.
+    - top_n: Number of most frequent tags per tagset.
+
+    For a sharded database (a directory, see init-shards) the counts are summed across the shards.
+    """
+    if not db_file.exists():
+        raise FileNotFoundError(f"Database file not found: {db_file}")
+
+    try:
+        if db_file.is_dir():
+            with sdl.ShardedDatabase(db_file) as db:
+                media_ids = db.query(_parse_filters(filters), source_type) if filters or source_type else None
+                counts = db.facet_counts(media_ids, list(tagsets) or None, top_n)
+        else:
+            with _connect(db_file) as connection:
+                media_ids = sdl.query(connection, _parse_filters(filters), source_type) if filters or source_type else None
+                counts = sdl.facet_counts(connection, media_ids, list(tagsets) or None, top_n)
+        for tagset_name, tag_counts in counts.items():
+            print(f"{tagset_name}:")
+            for value, count in tag_counts:
+                print(f"  {value}: {count}")
+    except Exception as e:
+        print("Error counting facets:", e)
+
+
+@cli.command()
+@click.argument("db_file", type=Path)
+@click.argument("tagsets", type=str, nargs=-1, required=True)
+@click.option("--disable", is_flag=True, default=False, help="Remove the tagsets from the text search index instead.")
+def enable_text_search(db_file: Path, tagsets: List[str], disable: bool = False):
+    """
+    Index the values of alphanumerical tagsets for full-text and substring search (see search).
+
+    Parameters:
+    - db_file: Path to the sqlite3 database file.
+    - tagsets: Names of the alphanumerical tagsets to index.
+    - disable: Remove the tagsets from the text search index instead.
+
+    Example:
+    enable-text-search example.db Caption Transcript
+    """
+    if not db_file.exists():
+        raise FileNotFoundError(f"Database file not found: {db_file}")
+
+    try:
+        with _connect(db_file) as connection:
+            if disable:
+                sdl.disable_text_search(connection, list(tagsets))
+            else:
+                sdl.enable_text_search(connection, list(tagsets))
+    except Exception as e:
+        print("Error updating the text search index:", e)
+
+
+@cli.command()
+@click.argument("db_file", type=Path)
+@click.argument("text", type=str)
+@click.option("--tagset", "tagsets", type=str, multiple=True, help="Indexed tagset to search, all indexed tagsets by default.")
+@click.option("--substring", is_flag=True, default=False, help="Search for the text as a substring instead of words.")
+@click.option("--source-type", type=click.Choice(list(sdl.MediaSourceType.__members__), case_sensitive=False), default=None, help="Only return medias of this source type.")
+@click.option("--limit", type=int, default=100, show_default=True, help="Maximum number of medias to print.")
+def search(db_file: Path, text: str, tagsets: List[str], substring: bool = False, source_type: Optional[str] = None, limit: int = 100):
+    """
+    Print the ids and scores of the medias tagged with values matching the text, best match first.
+
+    Parameters:
+    - db_file: Path to the sqlite3 database file.
+    - text: Words that all have to appear in a tag value, or with --substring a string contained in it.
+    - tagsets: Indexed tagsets to search (see enable-text-search), all indexed tagsets by default.
+    - substring: Search for the text as a substring instead of words.
+    - source_type: Only return medias of this source type.
+    - limit: Maximum number of medias to print.
+
+    Example:
+    search example.db "bmx race" --tagset Caption
+    """
+    if not db_file.exists():
+        raise FileNotFoundError(f"Database file not found: {db_file}")
+
+    try:
+        with _connect(db_file) as connection:
+            results = sdl.search_text(connection, text, list(tagsets) or None, substring, source_type, limit)
+            for media_id, score in results:
+                print(f"{media_id}\t{score:.4f}")
+    except Exception as e:
+        print("Error searching tags:", e)
+
+
+@cli.command()
+@click.argument("db_file", type=Path)
+@click.argument("tagset", type=str)
+@click.argument("paths", type=str, nargs=-1)
+@click.option("--drop", is_flag=True, default=False, help="Drop the indexes of the paths (all paths of the tagset without PATHS) instead.")
+def add_json_path_index(db_file: Path, tagset: str, paths: List[str], drop: bool = False):
+    """
+    Index JSON paths of a JSON tagset for JSON path filters (see query --json-filter), or list the indexed paths.
+
+    Parameters:
+    - db_file: Path to the sqlite3 database file.
+    - tagset: Name of the JSON tagset.
+    - paths: JSON paths to index, e.g. '$.class' '$.confidence'. Without paths the indexed paths are printed.
+    - drop: Drop the indexes of the paths instead.
+
+    Example:
+    add-json-path-index example.db Boxes '$.class' '$.confidence'
+    """
+    if not db_file.exists():
+        raise FileNotFoundError(f"Database file not found: {db_file}")
+
+    try:
+        with _connect(db_file) as connection:
+            if drop:
+                sdl.drop_json_path_indexes(connection, tagset, list(paths) or None)
+            elif paths:
+                sdl.add_json_path_indexes(connection, tagset, list(paths))
+            else:
+                for path in sdl.get_json_path_indexes(connection).get(tagset, []):
+                    print(path)
+    except Exception as e:
+        print("Error updating the JSON path indexes:", e)
+
+
+@cli.command()
+@click.argument("db_file", type=Path)
+@click.argument("start_tagset", type=str)
+@click.argument("end_tagset", type=str)
+def enable_interval_index(db_file: Path, start_tagset: str, end_tagset: str):
+    """
+    Index the intervals of the medias given by a start and an end tagset (see intervals).
+
+    Parameters:
+    - db_file: Path to the sqlite3 database file.
+    - start_tagset: Name of the numerical_int tagset holding the interval starts.
+    - end_tagset: Name of the numerical_int tagset holding the interval ends.
+
+    Example:
+    enable-interval-index example.db "Start (ms)" "End (ms)"
+    """
+    if not db_file.exists():
+        raise FileNotFoundError(f"Database file not found: {db_file}")
+
+    try:
+        with _connect(db_file) as connection:
+            sdl.enable_interval_index(connection, start_tagset, end_tagset)
+    except Exception as e:
+        print("Error building the interval index:", e)
+
+
+@cli.command()
+@click.argument("db_file", type=Path)
+@click.argument("start", type=int)
+@click.argument("end", type=int, required=False)
+@click.option("--group", type=str, default=None, help="Source of the group leader (e.g. the video) the medias belong to.")
+@click.option("--relation", type=click.Choice(["overlaps", "within", "contains"]), default="overlaps", show_default=True, help="Relation of the media intervals to [START, END].")
+@click.option("--nearest", type=int, default=None, help="Print the NEAREST medias whose interval is closest to START instead.")
+def intervals(db_file: Path, start: int, end: Optional[int] = None, group: Optional[str] = None, relation: str = "overlaps", nearest: Optional[int] = None):
+    """
+    Print the medias whose interval relates to [START, END] (END defaults to START), or the ones nearest to START.
+
+    Parameters:
+    - db_file: Path to the sqlite3 database file.
+    - start: Start of the interval, or the position with --nearest.
+    - end: End of the interval, defaults to start.
+    - group: Source of the group leader (e.g. the video) the medias belong to, all groups by default.
+    - relation: overlaps, within or contains.
+    - nearest: Number of nearest medias to print instead.
+
+    Example:
+    intervals example.db 60000 75000 --group s3://videos/traffic.mp4
+    intervals example.db 61500 --group s3://videos/traffic.mp4 --nearest 1
+    """
+    if not db_file.exists():
+        raise FileNotFoundError(f"Database file not found: {db_file}")
+
+    try:
+        with _connect(db_file) as connection:
+            group_id = None
+            if group is not None:
+                res = connection.execute("SELECT id FROM medias WHERE source = ?", [group]).fetchone()
+                if res is None:
+                    raise ValueError(f"Group leader media object not found: {group}")
+                group_id = res[0]
+            if nearest is not None:
+                for media_id, interval_start, interval_end, distance in sdl.nearest_intervals(connection, start, group_id, nearest):
+                    print(f"{media_id}\t{interval_start}\t{interval_end}\t{distance}")
+            else:
+                for media_id, interval_start, interval_end in sdl.query_intervals(connection, start, start if end is None else end, group_id, relation):
+                    print(f"{media_id}\t{interval_start}\t{interval_end}")
+    except Exception as e:
+        print("Error querying intervals:", e)
+
+
+@cli.command()
+@click.argument("db_file", type=Path)
+def enable_media_cache(db_file: Path):
+    """
+    Create and fill the per-media tag cache read by show.
+
+    Parameters:
+    - db_file: Path to the sqlite3 database file.
+    """
+    if not db_file.exists():
+        raise FileNotFoundError(f"Database file not found: {db_file}")
+
+    try:
+        with _connect(db_file) as connection:
+            sdl.enable_media_tag_cache(connection)
+    except Exception as e:
+        print("Error building the media tag cache:", e)
+
+
+@cli.command()
+@click.argument("db_file", type=Path)
+@click.argument("media_ids", type=int, nargs=-1, required=True)
+def show(db_file: Path, media_ids: List[int]):
+    """
+    Print the medias with all their tags, one JSON object per line.
+
+    Parameters:
+    - db_file: Path to the sqlite3 database file.
+    - media_ids: Ids of the medias.
+
+    Example:
+    show example.db 12 13 14
+    """
+    if not db_file.exists():
+        raise FileNotFoundError(f"Database file not found: {db_file}")
+
+    try:
+        with _connect(db_file) as connection:
+            for record in sdl.get_media_records(connection, media_ids):
+                print(json.dumps({
+                    "id": record.id,
+                    "source": record.source,
+                    "source_type": record.source_type.name,
+                    "thumbnail": record.thumbnail,
+                    "group_id": record.group_id,
+                    "tags": record.tags,
+                }, default=str, ensure_ascii=False))
+    except Exception as e:
+        print("Error reading medias:", e)
+
+
+@cli.command()
+@click.argument("db_file", type=Path)
+@click.argument("index_file", type=Path)
+def build_bitmap_index(db_file: Path, index_file: Path):
+    """
+    Build the in-memory bitmap index of the taggings and save it to a file.
+
+    Parameters:
+    - db_file: Path to the sqlite3 database file.
+    - index_file: Path of the index file, if it exists it is loaded and only refreshed with the new taggings.
+    """
+    if not db_file.exists():
+        raise FileNotFoundError(f"Database file not found: {db_file}")
+
+    try:
+        with _connect(db_file) as connection:
+            if index_file.exists():
+                index = sdl.BitmapIndex.load(index_file, connection)
+            else:
+                index = sdl.BitmapIndex.build(connection)
+            index.save(index_file)
+            print(f"Bitmap index with {len(index.tag_bitmaps)} tags and {len(index.medias)} medias saved to {index_file}")
+    except Exception as e:
+        print("Error building bitmap index:", e)
+
+
+@cli.command()
+@click.argument("db_file", type=Path)
+@click.argument("out_dir", type=Path)
+def export(db_file: Path, out_dir: Path):
+    """
+    Export the database to a columnar snapshot (memory mappable column files, taggings in CSR layout).
+
+    Parameters:
+    - db_file: Path to the sqlite3 database file.
+    - out_dir: Directory the snapshot is written to.
+    """
+    if not db_file.exists():
+        raise FileNotFoundError(f"Database file not found: {db_file}")
+
+    try:
+        with _connect(db_file) as connection:
+            manifest = sdl.export_snapshot(connection, out_dir)
+            print(f"Snapshot with {manifest['tables']['medias']['rows']} medias and {manifest['tables']['taggings']['rows']} taggings written to {out_dir}")
+    except Exception as e:
+        print("Error exporting snapshot:", e)
+
+@cli.command()
+@click.argument("out_dir", type=Path)
+@click.option("--medias", type=int, default=100_000, show_default=True, help="Number of medias.")
+@click.option("--group-size", type=int, default=100, show_default=True, help="Number of keyframes per video.")
+@click.option("--tagsets", type=int, default=70, show_default=True, help="Number of tagsets, cycling through all tag types.")
+@click.option("--tags-per-tagset", type=int, default=1000, show_default=True, help="Number of tags per tagset.")
+@click.option("--taggings-per-media", type=int, default=10, show_default=True, help="Average number of taggings per media.")
+@click.option("--seed", type=int, default=0, show_default=True, help="Random seed.")
+def generate_benchmark_data(
+    out_dir: Path,
+    medias: int = 100_000,
+    group_size: int = 100,
+    tagsets: int = 70,
+    tags_per_tagset: int = 1000,
+    taggings_per_media: int = 10,
+    seed: int = 0
+):
+    """
+    Generate a synthetic collection (JSON Lines tagsets, tags, medias and taggings files) for benchmarking.
+
+    Parameters:
+    - out_dir: Directory the files are written to.
+    - medias: Number of medias, videos each followed by group_size keyframes.
+    - group_size: Number of keyframes per video.
+    - tagsets: Number of tagsets.
+    - tags_per_tagset: Number of tags per tagset.
+    - taggings_per_media: Average number of taggings per media.
+    - seed: Random seed.
+    """
+    collection = sdl.generate_collection(out_dir, medias, group_size, tagsets, tags_per_tagset, taggings_per_media, seed)
+    print(f"Generated {medias} medias, {tagsets * tags_per_tagset} tags and {collection['taggings']} taggings in {out_dir}")
+
+
+@cli.command()
+@click.argument("data_dir", type=Path)
+@click.argument("db_file", type=Path)
+@click.argument("ddl_file", type=Path)
+@click.option("--results", "results_file", type=Path, default=None, help="JSON file the results are written to.")
+@click.option("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, show_default=True, help="Number of records parsed and inserted per batch.")
+@click.option("--workers", type=int, default=1, show_default=True, help="Number of worker processes for the media taggings.")
+@click.option("--repeat", type=int, default=5, show_default=True, help="Number of runs per query.")
+def benchmark(
+    data_dir: Path,
+    db_file: Path,
+    ddl_file: Path,
+    results_file: Optional[Path] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    workers: int = 1,
+    repeat: int = 5
+):
+    """
+    Load a generated collection into a new database, timing each ingestion stage and the representative queries.
+
+    Parameters:
+    - data_dir: Directory of the collection (see generate-benchmark-data).
+    - db_file: Path of the database to create, an existing file is replaced.
+    - ddl_file: Path to the DDL script.
+    - results_file: JSON file the results are written to.
+    - batch_size: Number of records parsed and inserted per batch.
+    - workers: Number of worker processes for the media taggings.
+    - repeat: Number of runs per query.
+    """
+    if not (data_dir / sdl.benchmark.COLLECTION_FILE).exists():
+        raise FileNotFoundError(f"Collection not found: {data_dir}")
+
+    if not ddl_file.exists():
+        raise FileNotFoundError(f"DDL file not found: {ddl_file}")
+
+    try:
+        sdl.run_benchmark(data_dir, db_file, ddl_file, results_file, batch_size, workers, repeat)
+    except Exception as e:
+        print("Error running benchmark:", e)
+
+
+@cli.command()
+@click.argument("db_file", type=Path)
+@click.option("--host", type=str, default="127.0.0.1", show_default=True, help="Host to listen on.")
+@click.option("--port", type=int, default=8080, show_default=True, help="TCP port to listen on.")
+@click.option("--socket", "unix_socket", type=Path, default=None, help="Listen on this Unix socket instead of a TCP port.")
+@click.option("--pool-size", type=int, default=4, show_default=True, help="Number of read-only connections (concurrent queries).")
+@click.option("--statement-cache", type=int, default=256, show_default=True, help="Number of prepared statements cached per connection.")
+@click.option("--cache-entries", type=int, default=1024, show_default=True, help="Number of cached query and facet results, 0 disables the cache.")
+@click.option("--cache-mib", type=int, default=256, show_default=True, help="Memory used by the cached results (MiB), 0 disables the cache.")
+def serve(
+    db_file: Path,
+    host: str = "127.0.0.1",
+    port: int = 8080,
+    unix_socket: Optional[Path] = None,
+    pool_size: int = 4,
+    statement_cache: int = 256,
+    cache_entries: int = 1024,
+    cache_mib: int = 256
+):
+    """
+    Serve read-only queries (POST /query, POST /facets, GET /stats) over HTTP.
+
+    Parameters:
+    - db_file: Path to the sqlite3 database file, it is switched to WAL so that loads can run while serving.
+    - host: Host to listen on.
+    - port: TCP port to listen on.
+    - unix_socket: Listen on this Unix socket instead of a TCP port.
+    - pool_size: Number of read-only connections (concurrent queries).
+    - statement_cache: Number of prepared statements cached per connection.
+    - cache_entries: Number of cached query and facet results, 0 disables the cache.
+    - cache_mib: Memory used by the cached results (MiB), 0 disables the cache.
+    """
+    if not db_file.exists():
+        raise FileNotFoundError(f"Database file not found: {db_file}")
+
+    try:
+        sdl.serve(db_file, host, port, unix_socket, pool_size, statement_cache, cache_entries, cache_mib * 1024 * 1024)
+    except Exception as e:
+        print("Error serving queries:", e)
+
+
+@cli.command()
+@click.argument("db_file", type=Path)
+@click.option("--url", type=str, default="http://127.0.0.1:8080", show_default=True, help="Base URL of the running query service.")
+@click.option("--socket", "unix_socket", type=Path, default=None, help="Unix socket of the running query service (instead of --url).")
+@click.option("--clients", type=int, default=8, show_default=True, help="Number of concurrent clients.")
+@click.option("--requests", "total_requests", type=int, default=2000, show_default=True, help="Number of requests sent in total.")
+@click.option("--seed", type=int, default=0, show_default=True, help="Random seed of the request mix.")
+def load_test(
+    db_file: Path,
+    url: str = "http://127.0.0.1:8080",
+    unix_socket: Optional[Path] = None,
+    clients: int = 8,
+    total_requests: int = 2000,
+    seed: int = 0
+):
+    """
+    Send concurrent requests to a running query service and print the latency percentiles.
+
+    Parameters:
+    - db_file: Path to the database served, the request mix (queries on frequent tags and facets) is sampled from it.
+    - url: Base URL of the running query service.
+    - unix_socket: Unix socket of the running query service (instead of url).
+    - clients: Number of concurrent clients.
+    - total_requests: Number of requests sent in total.
+    - seed: Random seed of the request mix.
+    """
+    if not db_file.exists():
+        raise FileNotFoundError(f"Database file not found: {db_file}")
+
+    try:
+        with _connect(db_file) as connection:
+            requests = sdl.sample_requests(connection, seed=seed)
+        result = sdl.load_test(requests, url, unix_socket, clients, total_requests)
+        print(
+            f"{result['requests']} requests ({result['errors']} errors) from {clients} clients in {result['seconds']:.2f}s "
+            f"({result['requests_per_sec']:.0f} requests/sec)"
+        )
+        print(f"p50 {result['p50_ms']:.2f}ms, p90 {result['p90_ms']:.2f}ms, p99 {result['p99_ms']:.2f}ms, max {result['max_ms']:.2f}ms")
+    except Exception as e:
+        print("Error running load test:", e)
+
+
 if __name__ == "__main__":
     cli()
\ No newline at end of file
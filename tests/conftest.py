@@ -0,0 +1,81 @@
+import sqlite3
+from pathlib import Path
+from typing import Dict, List
+
+import pytest
+
+import SimpleM3DataLoader as sdl
+
+
+DDL_FILE = Path(__file__).resolve().parent.parent / "ddl.sql"
+
+
+def init_db(db_file: Path) -> Path:
+    """
+    Create a database from ddl.sql (as the initdb command does).
+    """
+    with sqlite3.connect(db_file) as connection:
+        connection.executescript(DDL_FILE.read_text())
+    connection.close()
+    return db_file
+
+
+def small_collection(videos: int = 3, keyframes: int = 4) -> Dict[str, list]:
+    """
+    Videos with keyframes (group members), objects, a caption, a frame interval and a capture date.
+    """
+    tagsets = [
+        sdl.Tagset("Objects", sdl.TagType.ALPHANUMERICAL, sdl.Tags("Objects", ["car", "dog", "tree", "person"])),
+        sdl.Tagset("Caption", sdl.TagType.ALPHANUMERICAL, sdl.Tags("Caption", [])),
+        sdl.Tagset("Start (ms)", sdl.TagType.NUMERICAL_INT, sdl.Tags("Start (ms)", [])),
+        sdl.Tagset("End (ms)", sdl.TagType.NUMERICAL_INT, sdl.Tags("End (ms)", [])),
+        sdl.Tagset("Date", sdl.TagType.DATE, sdl.Tags("Date", [])),
+    ]
+    objects = ["car", "dog", "tree", "person"]
+    medias: List[sdl.MediaObject] = []
+    taggings: List[dict] = []
+    for v in range(videos):
+        video = f"video_{v}.mp4"
+        medias.append(sdl.MediaObject(video, sdl.MediaSourceType.VIDEO))
+        for k in range(keyframes):
+            source = f"video_{v}_frame_{k}.jpg"
+            medias.append(sdl.MediaObject(source, sdl.MediaSourceType.IMAGE, group=video))
+            taggings.append({
+                "media_source": source,
+                "tagsets": {
+                    "Objects": sorted({objects[(v + k) % 4], objects[(v * k) % 4]}),
+                    "Caption": [f"A {objects[(v + k) % 4]} in video {v}"],
+                    "Start (ms)": [k * 1000],
+                    "End (ms)": [k * 1000 + 999],
+                    "Date": [f"2026-01-{v + 1:02d}"],
+                },
+            })
+    return {"tagsets": tagsets, "medias": medias, "taggings": taggings}
+
+
+@pytest.fixture
+def db_file(tmp_path: Path) -> Path:
+    return init_db(tmp_path / "test.db")
+
+
+@pytest.fixture
+def connection(db_file: Path):
+    connection = sqlite3.connect(db_file, autocommit=False)
+    yield connection
+    connection.close()
+
+
+@pytest.fixture
+def collection() -> Dict[str, list]:
+    return small_collection()
+
+
+@pytest.fixture
+def loaded(connection: sqlite3.Connection, collection: Dict[str, list]) -> sqlite3.Connection:
+    """
+    A connection to a database holding the small collection, with register_missing_tags for the open tagsets.
+    """
+    sdl.add_tagsets(connection, collection["tagsets"])
+    sdl.add_medias(connection, collection["medias"])
+    sdl.add_media_taggings(connection, collection["taggings"], register_missing_tags=True)
+    return connection
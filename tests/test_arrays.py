@@ -0,0 +1,91 @@
+import sqlite3
+from array import array
+
+import pytest
+
+import SimpleM3DataLoader as sdl
+
+from conftest import init_db
+
+
+def _taggings(connection: sqlite3.Connection) -> set:
+    return set(connection.execute("SELECT media_id, tag_id FROM taggings"))
+
+
+@pytest.fixture
+def catalog(connection, collection):
+    sdl.add_tagsets(connection, collection["tagsets"])
+    sdl.add_medias(connection, collection["medias"])
+    return connection
+
+
+def test_arrays_of_sources_and_values(catalog):
+    sources = ["video_0_frame_0.jpg", "video_0_frame_1.jpg", "missing.jpg", "video_1_frame_0.jpg", "video_0_frame_0.jpg"]
+    values = ["car", "dog", "car", "unicorn", "tree"]
+    assert sdl.add_taggings_from_arrays(catalog, sources, values, tagset="Objects", chunk_size=2) == 3
+
+    ids = sdl.get_media_id_map_for_sources(catalog, sources)
+    tag_ids = {value: tag_id for (_, value), tag_id in sdl.get_tag_id_map_for_tagset_values(catalog, "Objects", ["car", "dog", "tree"]).items()}
+    assert _taggings(catalog) == {
+        (ids["video_0_frame_0.jpg"], tag_ids["car"]),
+        (ids["video_0_frame_1.jpg"], tag_ids["dog"]),
+        (ids["video_0_frame_0.jpg"], tag_ids["tree"]),
+    }
+
+
+def test_listeners_are_notified(catalog):
+    notified = []
+
+    def listener(connection, taggings):
+        notified.extend(taggings)
+
+    assert not sdl.has_taggings_listeners()
+    sdl.register_taggings_listener(listener)
+    try:
+        assert sdl.has_taggings_listeners()
+        sdl.add_taggings_from_arrays(catalog, ["video_0_frame_0.jpg", "video_0_frame_1.jpg"], ["car", "dog"], tagset="Objects")
+    finally:
+        sdl.unregister_taggings_listener(listener)
+    assert set(notified) == _taggings(catalog)
+    assert not sdl.has_taggings_listeners()
+
+
+def test_arrays_of_ids(catalog):
+    numpy = pytest.importorskip("numpy")
+    tag_ids = [tag_id for (tag_id,) in catalog.execute("SELECT id FROM tags")]
+    media = numpy.array([1, 2, 3, 3], dtype=numpy.int64)
+    tags = array("q", [tag_ids[0], tag_ids[1], tag_ids[0], tag_ids[0]])
+    assert sdl.add_taggings_from_arrays(catalog, media, tags) == 4
+    assert _taggings(catalog) == {(1, tag_ids[0]), (2, tag_ids[1]), (3, tag_ids[0])}
+    with pytest.raises(ValueError):
+        sdl.add_taggings_from_arrays(catalog, [1, 2], [tag_ids[0]])
+
+
+def test_csr_roundtrip_through_snapshot(tmp_path, loaded):
+    sdl.export_snapshot(loaded, tmp_path / "snapshot")
+    copy = sqlite3.connect(init_db(tmp_path / "copy.db"), autocommit=False)
+    try:
+        # Same catalog (and ids) in a new database, the taggings come from the snapshot
+        loaded.execute("ATTACH DATABASE ? AS copy", [str(tmp_path / "copy.db")])
+        for table in ("tagsets", "tags", "alphanumerical_tags", "numerical_int_tags", "date_tags", "medias"):
+            loaded.execute(f"INSERT INTO copy.{table} SELECT * FROM main.{table}")
+        loaded.commit()
+        loaded.execute("DETACH DATABASE copy")
+
+        with sdl.Snapshot(tmp_path / "snapshot") as snapshot:
+            indptr, indices = snapshot.taggings()
+            inserted = sdl.add_taggings_from_csr(copy, indptr, indices, chunk_size=7)
+            del indptr, indices
+        assert inserted == len(_taggings(loaded))
+        assert _taggings(copy) == _taggings(loaded)
+    finally:
+        copy.close()
+
+
+def test_csr_rows_by_source_and_value(catalog):
+    sources = ["video_0_frame_0.jpg", "video_0_frame_1.jpg", "video_1_frame_0.jpg"]
+    added = sdl.add_taggings_from_csr(catalog, [0, 2, 2, 3], ["car", "dog", "tree"], media=sources, tagset="Objects")
+    assert added == 3
+    assert len(set(sdl.query(catalog, [("Objects", "=", "tree")]))) == 1
+    with pytest.raises(ValueError):
+        sdl.add_taggings_from_csr(catalog, [0, 1], ["car"], media=sources, tagset="Objects")
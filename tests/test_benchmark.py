@@ -0,0 +1,46 @@
+import json
+import sqlite3
+
+import SimpleM3DataLoader as sdl
+from SimpleM3DataLoader.benchmark import COLLECTION_FILE, MEDIAS_FILE, TAGGINGS_FILE, TAGS_FILE, TAGSETS_FILE
+
+from conftest import DDL_FILE
+
+
+_PARAMETERS = {"medias": 250, "group_size": 9, "tagsets": 14, "tags_per_tagset": 40, "taggings_per_media": 4}
+
+
+def test_generate_is_deterministic(tmp_path):
+    first = sdl.generate_collection(tmp_path / "a", seed=3, **_PARAMETERS)
+    second = sdl.generate_collection(tmp_path / "b", seed=3, **_PARAMETERS)
+    other = sdl.generate_collection(tmp_path / "c", seed=4, **_PARAMETERS)
+    assert first == second
+    for name in (COLLECTION_FILE, TAGSETS_FILE, TAGS_FILE, MEDIAS_FILE, TAGGINGS_FILE):
+        assert (tmp_path / "a" / name).read_bytes() == (tmp_path / "b" / name).read_bytes()
+    assert (tmp_path / "a" / TAGGINGS_FILE).read_bytes() != (tmp_path / "c" / TAGGINGS_FILE).read_bytes()
+
+    # Every tag type is generated, videos are followed by their keyframes
+    assert {ts["tagtype"] for ts in first["tagsets"]} == {tagtype.name.lower() for tagtype in sdl.TagType}
+    medias = [json.loads(line) for line in (tmp_path / "a" / MEDIAS_FILE).read_text().splitlines()]
+    assert len(medias) == _PARAMETERS["medias"]
+    assert sum(media["group"] is None for media in medias) == -(-_PARAMETERS["medias"] // (_PARAMETERS["group_size"] + 1))
+
+
+def test_run_benchmark_loads_everything(tmp_path):
+    collection = sdl.generate_collection(tmp_path / "data", **_PARAMETERS)
+    results = sdl.run_benchmark(tmp_path / "data", tmp_path / "bench.db", DDL_FILE, tmp_path / "results.json", batch_size=64, repeat=1)
+    assert json.loads((tmp_path / "results.json").read_text()) == results
+
+    stages = results["stages"]
+    assert stages["add_tagsets"]["rows"] == _PARAMETERS["tagsets"]
+    assert stages["add_medias"]["rows"] == _PARAMETERS["medias"]
+    assert stages["add_media_taggings"]["rows"] == collection["taggings"]
+    assert results["queries"] and all(q["results"] >= 0 for q in results["queries"])
+
+    connection = sqlite3.connect(tmp_path / "bench.db")
+    try:
+        # All generated values are valid for their tag type
+        assert connection.execute("SELECT COUNT(*) FROM tags").fetchone()[0] == _PARAMETERS["tagsets"] * _PARAMETERS["tags_per_tagset"]
+        assert connection.execute("SELECT COUNT(*) FROM taggings").fetchone()[0] == collection["taggings"]
+    finally:
+        connection.close()
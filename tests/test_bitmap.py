@@ -0,0 +1,104 @@
+import random
+import sqlite3
+
+import pytest
+
+import SimpleM3DataLoader as sdl
+from SimpleM3DataLoader import Bitmap, BitmapIndex
+
+
+def _ids(connection: sqlite3.Connection, filters) -> set:
+    return set(sdl.query(connection, filters))
+
+
+def test_bitmap_set_operations():
+    rng = random.Random(0)
+    # Sparse and dense containers, in several chunks
+    a = set(rng.sample(range(200_000), 20_000)) | set(range(70_000, 80_000))
+    b = set(rng.sample(range(200_000), 3_000))
+    ba, bb = Bitmap.from_ids(a), Bitmap.from_ids(b)
+    assert set(ba & bb) == a & b
+    assert set(ba | bb) == a | b
+    assert set(ba - bb) == a - b
+    assert set(bb - ba) == b - a
+    assert len(ba) == len(a) and list(ba) == sorted(a)
+    assert 70_001 in ba and 200_001 not in ba
+
+    restored, offset = Bitmap.from_buffer(ba.to_bytes())
+    assert set(restored) == a and offset == len(ba.to_bytes())
+
+    ba.remove_many(b)
+    ba.add_many([5, 6])
+    assert set(ba) == (a - b) | {5, 6}
+
+
+def test_evaluate_matches_query(loaded):
+    index = BitmapIndex.build(loaded)
+    car = _ids(loaded, [("Objects", "=", "car")])
+    dog = _ids(loaded, [("Objects", "=", "dog")])
+    early = _ids(loaded, [("Start (ms)", "<", 2000)])
+    assert set(index.evaluate(loaded, ("Objects", "=", "car"))) == car
+    assert set(index.evaluate(loaded, ("and", ("Objects", "=", "car"), ("Start (ms)", "<", 2000)))) == car & early
+    assert set(index.evaluate(loaded, ("or", ("Objects", "=", "car"), ("Objects", "=", "dog")))) == car | dog
+    all_medias = {media_id for (media_id,) in loaded.execute("SELECT id FROM medias")}
+    assert set(index.evaluate(loaded, ("not", ("Objects", "=", "car")))) == all_medias - car
+    with pytest.raises(ValueError):
+        index.evaluate(loaded, ("xor", ("Objects", "=", "car")))
+
+
+def test_save_and_load(tmp_path, loaded):
+    index = BitmapIndex.build(loaded)
+    index.save(tmp_path / "index.bin")
+    restored = BitmapIndex.load(tmp_path / "index.bin", loaded)
+    assert restored.tag_bitmaps.keys() == index.tag_bitmaps.keys()
+    assert all(set(restored.tag_bitmaps[tag_id]) == set(bitmap) for tag_id, bitmap in index.tag_bitmaps.items())
+
+    # Changes made after the index was saved are applied when it is loaded
+    loaded.execute("DELETE FROM taggings WHERE rowid = (SELECT MAX(rowid) FROM taggings)")
+    loaded.commit()
+    restored = BitmapIndex.load(tmp_path / "index.bin", loaded)
+    assert sum(len(bitmap) for bitmap in restored.tag_bitmaps.values()) == loaded.execute("SELECT COUNT(*) FROM taggings").fetchone()[0]
+
+
+def _car(connection: sqlite3.Connection) -> int:
+    return connection.execute("SELECT id FROM alphanumerical_tags WHERE value = 'car'").fetchone()[0]
+
+
+def test_refresh_picks_up_deletions_and_reused_rowids(loaded):
+    index = BitmapIndex.build(loaded)
+    car = _car(loaded)
+    media_id, last_tag = loaded.execute("SELECT media_id, tag_id FROM taggings ORDER BY rowid DESC LIMIT 1").fetchone()
+    loaded.execute("DELETE FROM taggings WHERE tag_id = ? AND media_id = (SELECT MIN(media_id) FROM taggings WHERE tag_id = ?)", [car, car])
+    # The last row is deleted and its rowid reused by the next insert
+    loaded.execute("DELETE FROM taggings WHERE media_id = ? AND tag_id = ?", [media_id, last_tag])
+    untagged = loaded.execute("SELECT id FROM medias WHERE id NOT IN (SELECT media_id FROM taggings WHERE tag_id = ?) LIMIT 1", [car]).fetchone()[0]
+    loaded.execute("INSERT INTO taggings (media_id, tag_id) VALUES (?, ?)", [untagged, car])
+    loaded.commit()
+
+    index.refresh(loaded)
+    for tag_id, expected in loaded.execute("SELECT tag_id, COUNT(*) FROM taggings GROUP BY tag_id"):
+        assert len(index.tag_bitmaps[tag_id]) == expected
+    assert set(index.tags([car])) == {m for (m,) in loaded.execute("SELECT media_id FROM taggings WHERE tag_id = ?", [car])}
+
+
+def test_attached_index_skips_deferred_batches(db_file, loaded, collection):
+    index = BitmapIndex.build(loaded)
+    index.attach()
+    try:
+        loaded.execute("DELETE FROM taggings")
+        loaded.commit()
+        index.refresh(loaded)
+        assert not index.tag_bitmaps
+
+        sdl.add_media_taggings(loaded, collection["taggings"][:2])
+        assert len(index.tags(index.tag_bitmaps)) > 0
+
+        bulk = sqlite3.connect(db_file, autocommit=False, factory=sdl.BulkLoadConnection)
+        bulk.defer_commits = True
+        before = {tag_id: len(bitmap) for tag_id, bitmap in index.tag_bitmaps.items()}
+        sdl.add_media_taggings(bulk, collection["taggings"][2:])
+        bulk.rollback()
+        bulk.close()
+        assert {tag_id: len(bitmap) for tag_id, bitmap in index.tag_bitmaps.items()} == before
+    finally:
+        index.detach()
@@ -0,0 +1,91 @@
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+import SimpleM3DataLoader as sdl
+from SimpleM3DataLoader import BulkLoadConnection
+
+from conftest import init_db
+
+
+def _schema(connection: sqlite3.Connection) -> set:
+    return set(connection.execute("SELECT type, name, sql FROM sqlite_master WHERE type IN ('index', 'trigger')"))
+
+
+def _rows(connection: sqlite3.Connection) -> dict:
+    return {
+        table: sorted(connection.execute(f"SELECT * FROM {table}"))
+        for table in ("medias", "tags", "alphanumerical_tags", "numerical_int_tags", "date_tags", "taggings", "tag_counts")
+    }
+
+
+def _load(connection: sqlite3.Connection, collection: dict):
+    sdl.add_tagsets(connection, collection["tagsets"])
+    sdl.add_medias(connection, collection["medias"])
+    sdl.add_media_taggings(connection, collection["taggings"], register_missing_tags=True)
+
+
+@pytest.fixture
+def bulk_connection(db_file: Path):
+    connection = sqlite3.connect(db_file, autocommit=False, factory=BulkLoadConnection)
+    yield connection
+    connection.close()
+
+
+def test_bulk_load_equals_regular_load(tmp_path: Path, bulk_connection, collection):
+    schema = _schema(bulk_connection)
+    journal_mode = bulk_connection.execute("PRAGMA journal_mode").fetchone()[0]
+    with sdl.bulk_load_session(bulk_connection) as connection:
+        _load(connection, collection)
+        # Loaded without the secondary indexes and maintenance triggers
+        assert not {name for _, name, _ in _schema(connection) if name.startswith(("idx_", "trg_"))}
+
+    assert _schema(bulk_connection) == schema
+    assert bulk_connection.execute("PRAGMA journal_mode").fetchone()[0] == journal_mode
+
+    regular = sqlite3.connect(init_db(tmp_path / "regular.db"), autocommit=False)
+    try:
+        _load(regular, collection)
+        assert _rows(bulk_connection) == _rows(regular)
+    finally:
+        regular.close()
+
+
+def test_failed_step_rolls_back_everything(bulk_connection, collection):
+    schema = _schema(bulk_connection)
+    orphan = sdl.MediaObject("orphan.jpg", sdl.MediaSourceType.IMAGE, group="missing.mp4")
+    with pytest.raises(RuntimeError):
+        with sdl.bulk_load_session(bulk_connection) as connection:
+            sdl.add_tagsets(connection, collection["tagsets"])
+            sdl.add_medias(connection, [*collection["medias"], orphan])
+            connection.raise_if_failed("medias")
+
+    assert bulk_connection.execute("SELECT COUNT(*) FROM tagsets").fetchone()[0] == 0
+    assert bulk_connection.execute("SELECT COUNT(*) FROM medias").fetchone()[0] == 0
+    assert _schema(bulk_connection) == schema
+
+
+def test_pending_groups_resolve_within_the_load(bulk_connection):
+    video = sdl.MediaObject("video.mp4", sdl.MediaSourceType.VIDEO)
+    frame = sdl.MediaObject("frame.jpg", sdl.MediaSourceType.IMAGE, group="video.mp4")
+    with sdl.bulk_load_session(bulk_connection) as connection:
+        sdl.add_medias(connection, [frame], defer_missing_leaders=True)
+        sdl.add_medias(connection, [video], defer_missing_leaders=True)
+        assert sdl.resolve_pending_groups(connection) == []
+        assert connection.in_transaction
+
+    assert bulk_connection.execute(
+        "SELECT leader.source FROM medias m JOIN medias leader ON leader.id = m.group_id WHERE m.source = 'frame.jpg'"
+    ).fetchone() == ("video.mp4",)
+
+
+def test_exception_rolls_back_everything(bulk_connection, collection):
+    schema = _schema(bulk_connection)
+    with pytest.raises(KeyError):
+        with sdl.bulk_load_session(bulk_connection) as connection:
+            _load(connection, collection)
+            raise KeyError("stop")
+
+    assert bulk_connection.execute("SELECT COUNT(*) FROM taggings").fetchone()[0] == 0
+    assert _schema(bulk_connection) == schema
@@ -0,0 +1,112 @@
+import json
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+import SimpleM3DataLoader as sdl
+
+
+def _write_medias(path: Path, count: int, bad: tuple = ()) -> Path:
+    with open(path, "w") as f:
+        for i in range(count):
+            group = "missing_video.mp4" if i in bad else None
+            f.write(json.dumps({"source": f"{i}.jpg", "source_type": "image", "group": group}) + "\n")
+    return path
+
+
+def _load_medias(db_file: Path, medias_file: Path, batch_size: int, restart: bool = False):
+    connection = sqlite3.connect(db_file, autocommit=False, factory=sdl.BulkLoadConnection)
+    try:
+        def load(batch):
+            sdl.add_medias(connection, [
+                sdl.MediaObject(mo["source"], sdl.MediaSourceType[mo["source_type"].upper()], group=mo["group"])
+                for mo in batch
+            ])
+
+        with open(medias_file) as f:
+            return sdl.load_checkpointed(connection, "medias", medias_file, sdl.iter_raw_json_batches(f, batch_size), load, restart)
+    finally:
+        connection.close()
+
+
+def _count(db_file: Path, table: str) -> int:
+    with sqlite3.connect(db_file) as connection:
+        count = connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    connection.close()
+    return count
+
+
+def test_failed_records_are_isolated(tmp_path, db_file):
+    medias_file = _write_medias(tmp_path / "medias.jsonl", 25, bad=(3, 17))
+    assert _load_medias(db_file, medias_file, 10) == (23, 2)
+    assert _count(db_file, "medias") == 23
+    with sqlite3.connect(db_file) as connection:
+        failed = [offset for (offset,) in connection.execute("SELECT record_offset FROM ingest_failures ORDER BY 1")]
+    connection.close()
+    assert failed == [3, 17]
+
+
+@pytest.mark.parametrize("batch_size", [10, 7, 25, 100])
+def test_rerun_skips_completed_chunks_with_any_batch_size(tmp_path, db_file, batch_size):
+    medias_file = _write_medias(tmp_path / "medias.jsonl", 25)
+    assert _load_medias(db_file, medias_file, 10) == (25, 0)
+    assert _load_medias(db_file, medias_file, batch_size) == (0, 0)
+    assert _count(db_file, "ingest_failures") == 0
+    assert _count(db_file, "medias") == 25
+
+
+def test_rerun_loads_appended_records_only(tmp_path, db_file):
+    medias_file = _write_medias(tmp_path / "medias.jsonl", 25)
+    _load_medias(db_file, medias_file, 10)
+    _write_medias(medias_file, 40)
+    assert _load_medias(db_file, medias_file, 7) == (15, 0)
+    assert _count(db_file, "medias") == 40
+    assert _count(db_file, "ingest_failures") == 0
+
+
+def test_restart_loads_everything_again(tmp_path, db_file):
+    medias_file = _write_medias(tmp_path / "medias.jsonl", 5)
+    _load_medias(db_file, medias_file, 10)
+    # Existing medias fail again (no --ignore-existing), every record is reported
+    assert _load_medias(db_file, medias_file, 10, restart=True) == (0, 5)
+
+
+def test_members_are_grouped_once_their_leader_is_loaded(tmp_path, db_file):
+    medias_file = tmp_path / "medias.jsonl"
+    frames = [json.dumps({"source": f"frame_{i}.jpg", "source_type": "image", "group": "video.mp4"}) for i in range(3)]
+    video = json.dumps({"source": "video.mp4", "source_type": "video"})
+    connection = sqlite3.connect(db_file, autocommit=False, factory=sdl.BulkLoadConnection)
+    try:
+        def load_and_resolve():
+            def load(batch):
+                sdl.add_medias(connection, [
+                    sdl.MediaObject(mo["source"], sdl.MediaSourceType[mo["source_type"].upper()], group=mo.get("group"))
+                    for mo in batch
+                ], defer_missing_leaders=True)
+
+            with open(medias_file) as f:
+                loaded = sdl.load_checkpointed(connection, "medias", medias_file, sdl.iter_raw_json_batches(f, 2), load)
+            return loaded, sdl.resolve_pending_groups(connection)
+
+        # The leader is missing from the first run and appended to the file before the rerun
+        medias_file.write_text("\n".join(frames) + "\n")
+        assert load_and_resolve() == ((3, 0), ["video.mp4"])
+        medias_file.write_text("\n".join(frames + [video]) + "\n")
+        assert load_and_resolve() == ((1, 0), [])
+        grouped = connection.execute(
+            "SELECT COUNT(*) FROM medias m JOIN medias leader ON leader.id = m.group_id WHERE leader.source = 'video.mp4'"
+        ).fetchone()[0]
+        assert grouped == 3
+    finally:
+        connection.close()
+
+
+def test_parallel_taggings_are_checkpointed(tmp_path, db_file, loaded, collection):
+    loaded.execute("DELETE FROM taggings")
+    loaded.commit()
+    taggings_file = tmp_path / "taggings.jsonl"
+    taggings_file.write_text("\n".join(json.dumps(mapping) for mapping in collection["taggings"]))
+
+    assert sdl.add_media_taggings_parallel_checkpointed(db_file, taggings_file, 4, workers=2) > 0
+    assert sdl.add_media_taggings_parallel_checkpointed(db_file, taggings_file, 3, workers=2) == 0
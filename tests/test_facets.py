@@ -0,0 +1,66 @@
+import sqlite3
+from collections import Counter
+
+import pytest
+
+import SimpleM3DataLoader as sdl
+
+
+def _brute_force(connection: sqlite3.Connection, tagset: str, media_ids=None) -> Counter:
+    rows = connection.execute(
+        """
+        SELECT tg.media_id, a.value
+        FROM taggings tg
+        JOIN alphanumerical_tags a ON a.id = tg.tag_id
+        JOIN tagsets ts ON ts.id = a.tagset_id
+        WHERE ts.name = ?
+        """,
+        [tagset]
+    ).fetchall()
+    return Counter(value for media_id, value in rows if media_ids is None or media_id in media_ids)
+
+
+def test_global_counts(loaded):
+    facets = sdl.facet_counts(loaded, tagsets=["Objects"], top_n=10)
+    assert Counter(dict(facets["Objects"])) == _brute_force(loaded, "Objects")
+    counts = [count for _, count in facets["Objects"]]
+    assert counts == sorted(counts, reverse=True)
+
+
+@pytest.mark.parametrize("size", [1, 5, 100])
+def test_counts_over_media_ids(loaded, size):
+    media_ids = list(sdl.query(loaded, [("Objects", "=", "car")]))[:size]
+    facets = sdl.facet_counts(loaded, media_ids, ["Objects", "Caption"], top_n=100)
+    assert Counter(dict(facets["Objects"])) == _brute_force(loaded, "Objects", set(media_ids))
+
+
+def test_top_n(loaded):
+    facets = sdl.facet_counts(loaded, None, ["Objects"], top_n=2)
+    assert len(facets["Objects"]) == 2
+
+
+def test_tag_counts_follow_taggings(loaded):
+    before = Counter(dict(sdl.facet_counts(loaded, None, ["Objects"])["Objects"]))
+    media_id = loaded.execute("SELECT id FROM medias WHERE source = 'video_0_frame_0.jpg'").fetchone()[0]
+    loaded.execute(
+        "DELETE FROM taggings WHERE media_id = ? AND tag_id IN (SELECT id FROM alphanumerical_tags WHERE value = 'car')",
+        [media_id]
+    )
+    loaded.commit()
+    after = Counter(dict(sdl.facet_counts(loaded, None, ["Objects"])["Objects"]))
+    assert before - after == Counter({"car": 1})
+
+    sdl.rebuild_tag_counts(loaded)
+    loaded.commit()
+    assert Counter(dict(sdl.facet_counts(loaded, None, ["Objects"])["Objects"])) == after
+
+
+def test_legacy_connection_is_not_left_in_a_transaction(db_file, loaded):
+    loaded.close()
+    reader = sqlite3.connect(db_file)
+    try:
+        media_ids = [media_id for (media_id,) in reader.execute("SELECT id FROM medias")]
+        sdl.facet_counts(reader, media_ids, ["Objects"])
+        assert not reader.in_transaction
+    finally:
+        reader.close()
@@ -0,0 +1,89 @@
+import json
+import logging
+
+import pytest
+
+import SimpleM3DataLoader as sdl
+
+
+@pytest.fixture
+def events():
+    collected = []
+    previous = sdl.set_sinks([collected.append])
+    yield collected
+    sdl.set_sinks(previous)
+
+
+def test_stage_events(events):
+    with sdl.stage("test.stage", batch_size=10) as timed:
+        timed.rows = 5
+    with pytest.raises(KeyError):
+        with sdl.stage("test.failing", "debug"):
+            raise KeyError("x")
+
+    done, failed = events
+    assert done["event"] == "stage" and done["source"] == "test.stage" and done["level"] == "info"
+    assert done["rows"] == 5 and done["batch_size"] == 10 and done["seconds"] >= 0 and "failed" not in done
+    assert failed["source"] == "test.failing" and failed["level"] == "debug" and failed["failed"] is True
+
+
+def test_loaders_emit_stages(events, connection, collection):
+    sdl.add_tagsets(connection, collection["tagsets"])
+    sdl.add_medias(connection, collection["medias"])
+    medias = [event for event in events if event["event"] == "stage" and event["source"] == "SDL.add_medias"]
+    assert len(medias) == 1 and medias[0]["rows"] == len(collection["medias"])
+
+    sdl.add_medias(connection, [sdl.MediaObject("orphan.jpg", sdl.MediaSourceType.IMAGE, group="missing.mp4")])
+    errors = [event for event in events if event["event"] == "error"]
+    assert errors[-1]["source"] == "SDL.add_medias" and errors[-1]["error_type"] == "ValueError"
+
+
+def test_sinks(tmp_path, events, caplog, capsys):
+    totals = sdl.StageTotals()
+    json_sink = sdl.JsonLinesSink(tmp_path / "events.jsonl")
+    for sink in (totals, json_sink, sdl.LoggingSink(), sdl.PrintSink("warning")):
+        sdl.add_sink(sink)
+    try:
+        with caplog.at_level(logging.DEBUG, logger="SimpleM3DataLoader"):
+            for rows in (3, 4):
+                with sdl.stage("test.stage", rows=rows):
+                    pass
+            sdl.log("test.log", "careful", "warning")
+    finally:
+        json_sink.close()
+
+    assert totals.summary()["test.stage"]["calls"] == 2 and totals.summary()["test.stage"]["rows"] == 7
+    lines = [json.loads(line) for line in (tmp_path / "events.jsonl").read_text().splitlines()]
+    assert [line["source"] for line in lines] == ["test.stage", "test.stage", "test.log"]
+    assert [record.sdl_event["source"] for record in caplog.records] == ["test.stage", "test.stage", "test.log"]
+    # Only the warning reaches the PrintSink
+    assert capsys.readouterr().out == "(test.log): careful\n"
+
+
+def test_failing_sink_does_not_stop_others(events, capsys):
+    def failing(event):
+        raise RuntimeError("broken sink")
+
+    sdl.set_sinks([failing, events.append])
+    sdl.log("test.log", "still delivered")
+    assert events[-1]["message"] == "still delivered"
+    assert "broken sink" in capsys.readouterr().out
+
+
+def test_no_sinks_emit_nothing(events):
+    sdl.set_sinks([])
+    sdl.log("test.log", "dropped")
+    assert events == []
+
+
+def test_trace_statements(events, loaded):
+    with sdl.trace_statements(loaded, slow_ms=0, progress_steps=1):
+        list(sdl.query(loaded, [("Objects", "=", "car")]))
+    statements = [event for event in events if event["event"] == "statement"]
+    assert statements and all(event["level"] == "warning" for event in statements)
+    assert any("taggings" in event["sql"] for event in statements)
+
+    # The handlers are removed afterwards
+    events.clear()
+    list(sdl.query(loaded, [("Objects", "=", "car")]))
+    assert not [event for event in events if event["event"] == "statement"]
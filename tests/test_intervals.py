@@ -0,0 +1,136 @@
+import sqlite3
+
+import pytest
+
+import SimpleM3DataLoader as sdl
+from SimpleM3DataLoader import BulkLoadConnection
+
+
+def _intervals(connection: sqlite3.Connection) -> dict:
+    """
+    The interval and group of every media read from the taggings: the earliest start and the latest end.
+    """
+    intervals = {}
+    for media_id, group_id, start, end in connection.execute(
+        """
+        SELECT m.id, COALESCE(m.group_id, 0),
+            (SELECT MIN(t.value) FROM taggings tg JOIN numerical_int_tags t ON t.id = tg.tag_id JOIN tagsets ts ON ts.id = t.tagset_id
+             WHERE tg.media_id = m.id AND ts.name = 'Start (ms)'),
+            (SELECT MAX(t.value) FROM taggings tg JOIN numerical_int_tags t ON t.id = tg.tag_id JOIN tagsets ts ON ts.id = t.tagset_id
+             WHERE tg.media_id = m.id AND ts.name = 'End (ms)')
+        FROM medias m
+        """
+    ):
+        if start is not None and end is not None and start <= end and -2**31 <= start and end < 2**31:
+            intervals[media_id] = (group_id, start, end)
+    return intervals
+
+
+def _check_index(connection: sqlite3.Connection):
+    indexed = {
+        media_id: (min_group_id, start, end)
+        for media_id, min_group_id, max_group_id, start, end in connection.execute("SELECT * FROM media_intervals")
+    }
+    assert indexed == _intervals(connection)
+
+
+def _expected(connection, start, end, group_id=None, relation="overlaps") -> list:
+    matches = {
+        "overlaps": lambda s, e: s <= end and e >= start,
+        "within": lambda s, e: s >= start and e <= end,
+        "contains": lambda s, e: s <= start and e >= end,
+    }[relation]
+    return sorted(
+        ((media_id, s, e) for media_id, (group, s, e) in _intervals(connection).items()
+         if matches(s, e) and group_id in (None, group)),
+        key=lambda result: (result[1], result[0])
+    )
+
+
+@pytest.fixture
+def indexed(loaded):
+    sdl.enable_interval_index(loaded, "Start (ms)", "End (ms)")
+    return loaded
+
+
+def _video_id(connection, v: int) -> int:
+    return sdl.get_media_id_map_for_sources(connection, [f"video_{v}.mp4"])[f"video_{v}.mp4"]
+
+
+@pytest.mark.parametrize("relation", sdl.intervals.RELATIONS)
+@pytest.mark.parametrize("start, end", [(0, 0), (999, 1000), (500, 2500), (1000, 1999), (1200, 1300), (5000, 6000)])
+def test_query_intervals(indexed, relation, start, end):
+    _check_index(indexed)
+    assert sdl.query_intervals(indexed, start, end, relation=relation) == _expected(indexed, start, end, relation=relation)
+    video = _video_id(indexed, 1)
+    assert sdl.query_intervals(indexed, start, end, group_id=video, relation=relation) == \
+        _expected(indexed, start, end, group_id=video, relation=relation)
+
+
+def test_invalid_queries(indexed):
+    with pytest.raises(ValueError):
+        sdl.query_intervals(indexed, 0, 10, relation="touches")
+    with pytest.raises(ValueError):
+        sdl.query_intervals(indexed, 10, 0)
+    with pytest.raises(ValueError):
+        sdl.enable_interval_index(indexed, "Objects", "End (ms)")
+
+
+@pytest.mark.parametrize("position", [-500, 0, 1500, 2999, 3000, 10**6])
+@pytest.mark.parametrize("k", [1, 3, 20])
+def test_nearest_intervals(indexed, position, k):
+    video = _video_id(indexed, 2)
+    expected = sorted(
+        (media_id, s, e, max(s - position, position - e, 0))
+        for media_id, (group, s, e) in _intervals(indexed).items() if group == video
+    )
+    expected.sort(key=lambda result: (result[3], result[1], result[0]))
+    assert sdl.nearest_intervals(indexed, position, group_id=video, k=k) == expected[:k]
+    assert len(sdl.nearest_intervals(indexed, position, k=k)) == min(k, len(_intervals(indexed)))
+
+
+def test_triggers_maintain_the_index(indexed):
+    # A media gets its interval once it has both a start and an end
+    sdl.add_medias(indexed, [sdl.MediaObject("segment.txt", sdl.MediaSourceType.IMAGE, group="video_0.mp4")])
+    sdl.add_media_taggings(indexed, [{"media_source": "segment.txt", "tagsets": {"Start (ms)": [60000]}}], register_missing_tags=True)
+    _check_index(indexed)
+    sdl.add_media_taggings(indexed, [{"media_source": "segment.txt", "tagsets": {"End (ms)": [75000]}}], register_missing_tags=True)
+    segment = sdl.get_media_id_map_for_sources(indexed, ["segment.txt"])["segment.txt"]
+    assert sdl.query_intervals(indexed, 61000, 62000) == [(segment, 60000, 75000)]
+
+    # A second start widens the interval, removing it narrows it again
+    sdl.add_media_taggings(indexed, [{"media_source": "segment.txt", "tagsets": {"Start (ms)": [55000]}}], register_missing_tags=True)
+    _check_index(indexed)
+    sdl.sync_media_taggings(indexed, [[{"media_source": "segment.txt", "tagsets": {"Start (ms)": [60000], "End (ms)": [75000]}}]], partial=True)
+    _check_index(indexed)
+    assert sdl.query_intervals(indexed, 61000, 62000) == [(segment, 60000, 75000)]
+
+    # Regrouped medias move with their group, invalid and out of range intervals are not indexed
+    indexed.execute("UPDATE medias SET group_id = ? WHERE id = ?", [_video_id(indexed, 2), segment])
+    sdl.add_medias(indexed, [sdl.MediaObject("reversed.jpg", sdl.MediaSourceType.IMAGE), sdl.MediaObject("long.jpg", sdl.MediaSourceType.IMAGE)])
+    sdl.add_media_taggings(indexed, [
+        {"media_source": "reversed.jpg", "tagsets": {"Start (ms)": [9000], "End (ms)": [8000]}},
+        {"media_source": "long.jpg", "tagsets": {"Start (ms)": [0], "End (ms)": [2**31]}},
+    ], register_missing_tags=True)
+    _check_index(indexed)
+    assert sdl.query_intervals(indexed, 61000, 62000, group_id=_video_id(indexed, 2)) == [(segment, 60000, 75000)]
+
+    indexed.execute("DELETE FROM taggings WHERE media_id = ?", [segment])
+    indexed.commit()
+    _check_index(indexed)
+    assert sdl.query_intervals(indexed, 61000, 62000) == []
+
+
+def test_rebuilt_after_bulk_load(db_file, collection):
+    connection = sqlite3.connect(db_file, autocommit=False, factory=BulkLoadConnection)
+    try:
+        sdl.add_tagsets(connection, collection["tagsets"])
+        sdl.enable_interval_index(connection, "Start (ms)", "End (ms)")
+        with sdl.bulk_load_session(connection):
+            sdl.add_medias(connection, collection["medias"])
+            sdl.add_media_taggings(connection, collection["taggings"], register_missing_tags=True)
+        assert len(_intervals(connection)) == 12
+        _check_index(connection)
+        assert connection.execute("SELECT COUNT(*) FROM sqlite_master WHERE name LIKE 'trg_%media_intervals'").fetchone()[0] == 3
+    finally:
+        connection.close()
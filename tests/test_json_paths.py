@@ -0,0 +1,144 @@
+import operator
+import random
+import sqlite3
+
+import pytest
+
+import SimpleM3DataLoader as sdl
+from SimpleM3DataLoader import BulkLoadConnection
+
+
+_CLASSES = ["car", "dog", "person"]
+_COMPARE = {
+    "=": operator.eq, "!=": operator.ne, "<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge,
+    "in": lambda value, values: value in values,
+    "between": lambda value, bounds: bounds[0] <= value <= bounds[1],
+}
+
+
+def _boxes(count: int = 60):
+    rng = random.Random(22)
+    return {
+        f"image_{i}.jpg": [
+            {"class": rng.choice(_CLASSES), "confidence": round(rng.random(), 2), "box": [rng.randrange(100) for _ in range(4)], "tracked": rng.random() < 0.5}
+            for _ in range(rng.randrange(1, 4))
+        ]
+        for i in range(count)
+    }
+
+
+@pytest.fixture
+def boxes(connection):
+    boxes = _boxes()
+    sdl.add_tagsets(connection, [
+        sdl.Tagset("Boxes", sdl.TagType.JSON, sdl.Tags("Boxes", [])),
+        sdl.Tagset("Objects", sdl.TagType.ALPHANUMERICAL, sdl.Tags("Objects", _CLASSES)),
+    ])
+    sdl.add_medias(connection, [sdl.MediaObject(source, sdl.MediaSourceType.IMAGE) for source in boxes])
+    sdl.add_media_taggings(connection, [
+        {"media_source": source, "tagsets": {"Boxes": media_boxes, "Objects": sorted({box["class"] for box in media_boxes})}}
+        for source, media_boxes in boxes.items()
+    ], register_missing_tags=True)
+    return connection, boxes
+
+
+def _expected(connection, boxes, filters) -> set:
+    def field(box, path):
+        value = box
+        for key in path[2:].replace("[", ".").replace("]", "").split("."):
+            value = value[int(key)] if isinstance(value, list) else value[key]
+        return value
+
+    sources = {
+        source for source, media_boxes in boxes.items()
+        if all(any(_COMPARE[op](field(box, path), target) for box in media_boxes) for _, path, op, target in filters)
+    }
+    return set(sdl.get_media_id_map_for_sources(connection, sources).values())
+
+
+_FILTERS = [
+    [("Boxes", "$.class", "=", "dog")],
+    [("Boxes", "$.confidence", ">=", 0.8)],
+    [("Boxes", "$.confidence", "between", (0.2, 0.4)), ("Boxes", "$.class", "in", ["car", "person"])],
+    [("Boxes", "$.box[2]", "<", 10)],
+    [("Boxes", "$.tracked", "=", True)],
+    [("Boxes", "$.class", "!=", "dog")],
+]
+
+
+@pytest.mark.parametrize("filters", _FILTERS)
+def test_path_filters_with_and_without_index(boxes, filters):
+    connection, data = boxes
+    expected = _expected(connection, data, filters)
+    assert set(sdl.query(connection, filters)) == expected
+    sdl.add_json_path_indexes(connection, "Boxes", ["$.class", "$.confidence", "$.box[2]", "$.tracked"])
+    assert set(sdl.query(connection, filters)) == expected
+    # Mixed with a filter on another tagset
+    objects = set(sdl.query(connection, [("Objects", "=", "car")]))
+    assert set(sdl.query(connection, [*filters, ("Objects", "=", "car")])) == expected & objects
+
+
+def test_indexed_paths_seek_their_index(boxes):
+    connection, _ = boxes
+    sdl.add_json_path_indexes(connection, "Boxes", ["$.confidence"])
+    sql, params = sdl.build_query(connection, [("Boxes", "$.confidence", ">", 0.9)])
+    plan = " ".join(row[-1] for row in connection.execute(f"EXPLAIN QUERY PLAN {sql}", params))
+    assert "idx_json_path_1" in plan
+
+    # Tags added later are indexed as they are inserted
+    sdl.add_medias(connection, [sdl.MediaObject("late.jpg", sdl.MediaSourceType.IMAGE)])
+    sdl.add_media_taggings(connection, [{"media_source": "late.jpg", "tagsets": {"Boxes": [{"class": "cat", "confidence": 0.999}]}}], register_missing_tags=True)
+    late = sdl.get_media_id_map_for_sources(connection, ["late.jpg"])["late.jpg"]
+    assert late in set(sdl.query(connection, [("Boxes", "$.confidence", ">", 0.99)]))
+
+
+def test_declare_and_drop_paths(boxes):
+    connection, _ = boxes
+    assert sdl.get_json_path_indexes(connection) == {}
+    sdl.add_json_path_indexes(connection, "Boxes", ["$.class", "$.confidence"])
+    sdl.add_json_path_indexes(connection, "Boxes", ["$.class"])
+    assert sdl.get_json_path_indexes(connection) == {"Boxes": ["$.class", "$.confidence"]}
+    sdl.drop_json_path_indexes(connection, "Boxes", ["$.class"])
+    assert sdl.get_json_path_indexes(connection) == {"Boxes": ["$.confidence"]}
+    sdl.drop_json_path_indexes(connection, "Boxes")
+    assert sdl.get_json_path_indexes(connection) == {}
+    assert not connection.execute("SELECT name FROM sqlite_master WHERE name LIKE 'idx_json_path_%'").fetchall()
+
+    with pytest.raises(ValueError):
+        sdl.add_json_path_indexes(connection, "Objects", ["$.class"])
+    for path in ("class", "$.box["):
+        with pytest.raises(sqlite3.OperationalError):
+            sdl.add_json_path_indexes(connection, "Boxes", [path])
+    with pytest.raises(ValueError):
+        list(sdl.query(connection, [("Objects", "$.class", "=", "car")]))
+
+
+def test_path_indexes_restored_after_bulk_load(db_file):
+    connection = sqlite3.connect(db_file, autocommit=False, factory=BulkLoadConnection)
+    try:
+        sdl.add_tagsets(connection, [sdl.Tagset("Boxes", sdl.TagType.JSON, sdl.Tags("Boxes", []))])
+        sdl.add_json_path_indexes(connection, "Boxes", ["$.class"])
+        with sdl.bulk_load_session(connection):
+            sdl.add_medias(connection, [sdl.MediaObject("a.jpg", sdl.MediaSourceType.IMAGE)])
+            sdl.add_media_taggings(connection, [{"media_source": "a.jpg", "tagsets": {"Boxes": [{"class": "dog"}]}}], register_missing_tags=True)
+        assert connection.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'idx_json_path_1'").fetchone()[0] == 1
+        assert len(list(sdl.query(connection, [("Boxes", "$.class", "=", "dog")]))) == 1
+    finally:
+        connection.close()
+
+
+def test_json_values_given_as_objects_or_strings(boxes):
+    connection, _ = boxes
+    sdl.add_medias(connection, [sdl.MediaObject("objects.jpg", sdl.MediaSourceType.IMAGE)])
+    tags = connection.execute("SELECT COUNT(*) FROM json_tags").fetchone()[0]
+    # The same value as an object and as a JSON string with other key order and whitespace is one tag
+    sdl.add_media_taggings(connection, [
+        {"media_source": "objects.jpg", "tagsets": {"Boxes": [{"class": "bird", "box": [1, 2]}, '{"box": [1, 2],  "class": "bird"}']}},
+    ], register_missing_tags=True)
+    assert connection.execute("SELECT COUNT(*) FROM json_tags").fetchone()[0] == tags + 1
+    media_id = sdl.get_media_id_map_for_sources(connection, ["objects.jpg"])["objects.jpg"]
+    assert list(sdl.query(connection, [("Boxes", "$.class", "=", "bird")])) == [media_id]
+    assert list(sdl.query(connection, [("Boxes", "=", {"box": [1, 2], "class": "bird"})])) == [media_id]
+
+    added = sdl.add_taggings_from_arrays(connection, [media_id, media_id], [{"class": "bird", "box": [1, 2]}, [1, 2, 3]], tagset="Boxes")
+    assert added == 1
@@ -0,0 +1,229 @@
+import sqlite3
+
+import SimpleM3DataLoader as sdl
+
+
+def _groups(connection: sqlite3.Connection) -> dict:
+    """
+    The group leader source of every media source, None for ungrouped medias.
+    """
+    return dict(connection.execute(
+        "SELECT m.source, leader.source FROM medias m LEFT JOIN medias leader ON leader.id = m.group_id"
+    ))
+
+
+def _taggings(connection: sqlite3.Connection) -> set:
+    """
+    The taggings as (media source, tagset name, tag id).
+    """
+    return set(connection.execute(
+        """
+        SELECT m.source, ts.name, t.id
+        FROM taggings tg
+        JOIN medias m ON m.id = tg.media_id
+        JOIN tags t ON t.id = tg.tag_id
+        JOIN tagsets ts ON ts.id = t.tagset_id
+        """
+    ))
+
+
+def test_media_sources_resolved_in_one_pass(connection):
+    # More sources than the SQLite variable limit, with duplicates and unknown sources
+    sdl.add_medias(connection, [sdl.MediaObject(f"image_{i}.jpg", sdl.MediaSourceType.IMAGE) for i in range(40_000)])
+    sources = [f"image_{i}.jpg" for i in range(0, 80_000, 2)] + ["image_4.jpg"]
+    ids = sdl.get_media_id_map_for_sources(connection, iter(sources))
+    expected = dict(connection.execute("SELECT source, id FROM medias WHERE id % 2 = 1"))
+    assert ids == expected
+    assert sdl.get_media_id_map_for_sources(connection, []) == {}
+
+
+def test_resolve_media_taggings_skips_unknown(loaded):
+    car, dog = (
+        loaded.execute("SELECT id FROM alphanumerical_tags WHERE value = ?", [value]).fetchone()[0] for value in ("car", "dog")
+    )
+    frame = loaded.execute("SELECT id FROM medias WHERE source = 'video_0_frame_1.jpg'").fetchone()[0]
+    taggings = sdl.resolve_media_taggings(loaded, [
+        {"media_source": "video_0_frame_1.jpg", "tagsets": {"Objects": ["car", "dog", "unicorn"], "Unknown": ["x"]}},
+        {"media_source": "missing.jpg", "tagsets": {"Objects": ["car"]}},
+    ])
+    assert sorted(taggings) == sorted([(frame, car), (frame, dog)])
+    # Nothing is registered without register_missing_tags
+    assert loaded.execute("SELECT COUNT(*) FROM alphanumerical_tags WHERE value = 'unicorn'").fetchone()[0] == 0
+
+
+def test_taggings_resolve_typed_values(loaded, collection):
+    # Every tagging of the collection is stored once, numerical and date values resolve to their stored tags
+    expected = {
+        (mapping["media_source"], tagset, value)
+        for mapping in collection["taggings"]
+        for tagset, values in mapping["tagsets"].items()
+        for value in values
+    }
+    stored = set()
+    for source, tagset, tag_id in _taggings(loaded):
+        (tagtype_id,) = loaded.execute("SELECT tagtype_id FROM tags WHERE id = ?", [tag_id]).fetchone()
+        table = f"{sdl.TagType(tagtype_id).name.lower()}_tags"
+        (value,) = loaded.execute(f"SELECT value FROM {table} WHERE id = ?", [tag_id]).fetchone()
+        stored.add((source, tagset, sdl.decode_tag_value(sdl.TagType(tagtype_id), value)))
+    assert {(source, tagset, str(value)) for source, tagset, value in stored} == \
+        {(source, tagset, str(value)) for source, tagset, value in expected}
+
+
+def test_add_medias_resolves_groups(connection):
+    video = sdl.MediaSourceType.VIDEO
+    image = sdl.MediaSourceType.IMAGE
+    # Members before their leader in the batch, and leaders that are already stored
+    sdl.add_medias(connection, [
+        sdl.MediaObject("a_frame.jpg", image, group="a.mp4"),
+        sdl.MediaObject("a.mp4", video),
+        sdl.MediaObject("b.mp4", video),
+    ])
+    sdl.add_medias(connection, [
+        sdl.MediaObject("b_frame_0.jpg", image, group="b.mp4"),
+        sdl.MediaObject("b_frame_1.jpg", image, group="b.mp4"),
+        sdl.MediaObject("c.mp4", video, group="a.mp4"),
+    ])
+    assert _groups(connection) == {
+        "a.mp4": None, "a_frame.jpg": "a.mp4", "b.mp4": None,
+        "b_frame_0.jpg": "b.mp4", "b_frame_1.jpg": "b.mp4", "c.mp4": "a.mp4",
+    }
+
+
+def test_add_medias_after_deletions(connection):
+    # Ids with gaps, including a deleted maximum that SQLite reuses
+    sdl.add_medias(connection, [sdl.MediaObject(f"{i}.mp4", sdl.MediaSourceType.VIDEO) for i in range(10)])
+    connection.execute("DELETE FROM medias WHERE source IN ('2.mp4', '5.mp4', '9.mp4')")
+    connection.commit()
+    sdl.add_medias(connection, [
+        sdl.MediaObject("new_frame.jpg", sdl.MediaSourceType.IMAGE, group="new.mp4"),
+        sdl.MediaObject("new.mp4", sdl.MediaSourceType.VIDEO),
+        sdl.MediaObject("old_frame.jpg", sdl.MediaSourceType.IMAGE, group="8.mp4"),
+    ])
+    groups = _groups(connection)
+    assert groups["new_frame.jpg"] == "new.mp4" and groups["old_frame.jpg"] == "8.mp4"
+    assert sum(1 for leader in groups.values() if leader is not None) == 2
+
+
+def test_add_medias_missing_leader_adds_nothing(connection):
+    sdl.add_medias(connection, [
+        sdl.MediaObject("a.mp4", sdl.MediaSourceType.VIDEO),
+        sdl.MediaObject("orphan.jpg", sdl.MediaSourceType.IMAGE, group="missing.mp4"),
+    ])
+    assert connection.execute("SELECT COUNT(*) FROM medias").fetchone()[0] == 0
+
+
+def test_add_medias_ignore_existing_and_no_groups(connection):
+    image = sdl.MediaSourceType.IMAGE
+    sdl.add_medias(connection, [sdl.MediaObject("a.mp4", sdl.MediaSourceType.VIDEO), sdl.MediaObject("b.mp4", sdl.MediaSourceType.VIDEO)])
+    sdl.add_medias(connection, [sdl.MediaObject("frame_0.jpg", image, group="a.mp4")])
+    # Existing medias keep their group, new members are resolved
+    sdl.add_medias(connection, [
+        sdl.MediaObject("frame_0.jpg", image, group="b.mp4"),
+        sdl.MediaObject("frame_1.jpg", image, group="b.mp4"),
+    ], ignore_existing=True)
+    sdl.add_medias(connection, [sdl.MediaObject("frame_2.jpg", image, group="missing.mp4")], no_groups=True)
+    assert _groups(connection) == {
+        "a.mp4": None, "b.mp4": None, "frame_0.jpg": "a.mp4", "frame_1.jpg": "b.mp4", "frame_2.jpg": None,
+    }
+
+
+def _tag_consistency(connection: sqlite3.Connection):
+    """
+    Every tag has exactly one row in the typed table of its TagType, with the same id and tagset.
+    """
+    tags = set(connection.execute("SELECT id, tagset_id, tagtype_id FROM tags"))
+    typed = set()
+    for tagtype in sdl.TagType:
+        typed.update(
+            (tag_id, tagset_id, tagtype.value)
+            for tag_id, tagset_id in connection.execute(f"SELECT id, tagset_id FROM {tagtype.name.lower()}_tags")
+        )
+    assert tags == typed
+
+
+def _delete_unused_tags(connection: sqlite3.Connection, where: str):
+    # Leaves gaps in the tag ids, including the maximum id
+    tag_ids = [tag_id for (tag_id,) in connection.execute(
+        f"SELECT id FROM tags WHERE {where} AND id NOT IN (SELECT tag_id FROM taggings)"
+    )]
+    for tagtype in sdl.TagType:
+        connection.execute(f"DELETE FROM {tagtype.name.lower()}_tags WHERE id IN (SELECT value FROM json_each(?))", [str(tag_ids)])
+    connection.execute("DELETE FROM tags WHERE id IN (SELECT value FROM json_each(?))", [str(tag_ids)])
+    connection.commit()
+    return tag_ids
+
+
+def test_register_missing_tags_after_deletions(loaded):
+    sdl.add_tags(loaded, sdl.Tags("Objects", ["ant", "bird", "boat", "cat"]))
+    deleted = _delete_unused_tags(loaded, "id IN (SELECT id FROM alphanumerical_tags WHERE value IN ('ant', 'cat'))")
+    assert max(deleted) == loaded.execute("SELECT MAX(id) FROM tags").fetchone()[0] + 1
+
+    mappings = [
+        {"media_source": "video_0_frame_0.jpg", "tagsets": {"Objects": ["cat", "bird"], "Start (ms)": [123456], "Date": ["2030-05-01"]}},
+        {"media_source": "video_1_frame_0.jpg", "tagsets": {"Objects": ["cat", "zebra"], "Caption": ["new caption"]}},
+    ]
+    sdl.add_media_taggings(loaded, mappings, register_missing_tags=True)
+    _tag_consistency(loaded)
+    assert loaded.execute("SELECT COUNT(*) FROM alphanumerical_tags WHERE value = 'cat'").fetchone()[0] == 1
+
+    media_ids = sdl.get_media_id_map_for_sources(loaded, (mapping["media_source"] for mapping in mappings))
+    for mapping in mappings:
+        for tagset, values in mapping["tagsets"].items():
+            for value in values:
+                assert media_ids[mapping["media_source"]] in set(sdl.query(loaded, [(tagset, "=", value)]))
+
+
+def test_missing_tags_skipped_without_register(loaded):
+    counts = "SELECT (SELECT COUNT(*) FROM tags), (SELECT COUNT(*) FROM taggings)"
+    before = loaded.execute(counts).fetchone()
+    # video_0_frame_0.jpg is already tagged with car
+    sdl.add_media_taggings(loaded, [{"media_source": "video_0_frame_0.jpg", "tagsets": {"Objects": ["unicorn", "car"]}}])
+    assert loaded.execute(counts).fetchone() == before
+
+
+def test_add_tags_batch_over_many_tagsets(loaded):
+    sdl.add_tags(loaded, sdl.Tags("Objects", ["ant", "bird"]))
+    _delete_unused_tags(loaded, "id IN (SELECT id FROM alphanumerical_tags WHERE value = 'ant')")
+    sdl.add_tags_batch(loaded, [
+        sdl.Tags("Objects", ["car", "bird", "ant", "ant", "zebra"]),
+        sdl.Tags("Caption", ["first", "second"]),
+        sdl.Tags("Start (ms)", [5, "5", 6, "not a number"]),
+        sdl.Tags("Date", ["2031-02-03", "2031-02-30"]),
+        sdl.Tags("Objects", ["zebra", "yak"]),
+    ])
+    _tag_consistency(loaded)
+
+    def values(tagset: str, table: str) -> list:
+        return sorted(
+            value for (value,) in loaded.execute(
+                f"SELECT t.value FROM {table} t JOIN tagsets ts ON ts.id = t.tagset_id WHERE ts.name = ?", [tagset]
+            )
+        )
+
+    assert values("Objects", "alphanumerical_tags") == ["ant", "bird", "car", "dog", "person", "tree", "yak", "zebra"]
+    assert {"first", "second"} <= set(values("Caption", "alphanumerical_tags"))
+    assert values("Start (ms)", "numerical_int_tags") == [0, 5, 6, 1000, 2000, 3000]
+    assert len(values("Date", "date_tags")) == 4
+
+
+def test_add_tags_batch_unknown_tagset_adds_nothing(loaded):
+    tags = loaded.execute("SELECT COUNT(*) FROM tags").fetchone()[0]
+    sdl.add_tags_batch(loaded, [sdl.Tags("Objects", ["zebra"]), sdl.Tags("Missing", ["x"])])
+    assert loaded.execute("SELECT COUNT(*) FROM tags").fetchone()[0] == tags
+
+
+def test_members_before_their_leader_are_grouped_after_the_last_batch(connection):
+    video = sdl.MediaObject("video.mp4", sdl.MediaSourceType.VIDEO)
+    frames = [sdl.MediaObject(f"frame_{i}.jpg", sdl.MediaSourceType.IMAGE, group="video.mp4") for i in range(3)]
+    orphan = sdl.MediaObject("orphan.jpg", sdl.MediaSourceType.IMAGE, group="missing.mp4")
+    sdl.add_medias(connection, frames[:2] + [orphan], defer_missing_leaders=True)
+    sdl.add_medias(connection, [video, frames[2]], defer_missing_leaders=True)
+    assert sdl.resolve_pending_groups(connection) == ["missing.mp4"]
+    assert _groups(connection) == {
+        "video.mp4": None, "frame_0.jpg": "video.mp4", "frame_1.jpg": "video.mp4", "frame_2.jpg": "video.mp4", "orphan.jpg": None
+    }
+    # The orphan is grouped once its leader is added, e.g. by a later load
+    sdl.add_medias(connection, [sdl.MediaObject("missing.mp4", sdl.MediaSourceType.VIDEO)], defer_missing_leaders=True)
+    assert sdl.resolve_pending_groups(connection) == []
+    assert _groups(connection)["orphan.jpg"] == "missing.mp4"
+    assert connection.execute("SELECT COUNT(*) FROM pending_media_groups").fetchone()[0] == 0
@@ -0,0 +1,124 @@
+import sqlite3
+
+import pytest
+
+import SimpleM3DataLoader as sdl
+from SimpleM3DataLoader import BulkLoadConnection
+
+
+def _naive(connection: sqlite3.Connection, media_id: int) -> dict:
+    """
+    The tags of a media read tagset by tagset from the typed tag tables.
+    """
+    tags = {}
+    for tagset_name, tagtype_id, tag_id in connection.execute(
+        """
+        SELECT ts.name, ts.tagtype_id, t.id
+        FROM taggings tg JOIN tags t ON t.id = tg.tag_id JOIN tagsets ts ON ts.id = t.tagset_id
+        WHERE tg.media_id = ?
+        ORDER BY t.id
+        """,
+        [media_id]
+    ):
+        tagtype = sdl.TagType(tagtype_id)
+        (value,) = connection.execute(f"SELECT value FROM {tagtype.name.lower()}_tags WHERE id = ?", [tag_id]).fetchone()
+        tags.setdefault(tagset_name, []).append(sdl.decode_tag_value(tagtype, value))
+    return tags
+
+
+def _check_records(connection: sqlite3.Connection):
+    media_ids = [media_id for (media_id,) in connection.execute("SELECT id FROM medias ORDER BY id DESC")]
+    records = sdl.get_media_records(connection, [*media_ids, 10**6])
+    assert [record.id for record in records] == media_ids
+    for record in records:
+        assert record.tags == _naive(connection, record.id)
+        assert (record.source, record.source_type.value) == \
+            connection.execute("SELECT source, source_type FROM medias WHERE id = ?", [record.id]).fetchone()
+
+
+def _cached(connection: sqlite3.Connection) -> int:
+    return connection.execute("SELECT COUNT(*) FROM media_tag_cache").fetchone()[0]
+
+
+def _tagged(connection: sqlite3.Connection) -> int:
+    return connection.execute("SELECT COUNT(DISTINCT media_id) FROM taggings").fetchone()[0]
+
+
+@pytest.fixture(autouse=True)
+def detached():
+    yield
+    sdl.detach_media_tag_cache()
+
+
+def test_records_without_and_with_cache(loaded):
+    _check_records(loaded)
+    sdl.enable_media_tag_cache(loaded)
+    assert _cached(loaded) == _tagged(loaded)
+    _check_records(loaded)
+
+
+def test_cache_follows_taggings(loaded):
+    sdl.enable_media_tag_cache(loaded)
+    frame = sdl.get_media_id_map_for_sources(loaded, ["video_2_frame_3.jpg"])["video_2_frame_3.jpg"]
+
+    # Refreshed by the listener after each batch
+    sdl.add_media_taggings(loaded, [{"media_source": "video_2_frame_3.jpg", "tagsets": {"Objects": ["dog", "cat"]}}], register_missing_tags=True)
+    assert _cached(loaded) == _tagged(loaded)
+    _check_records(loaded)
+
+    # Invalidated by the triggers on writes that bypass the loaders
+    loaded.execute("DELETE FROM taggings WHERE media_id = ?", [frame])
+    loaded.commit()
+    assert loaded.execute("SELECT COUNT(*) FROM media_tag_cache WHERE media_id = ?", [frame]).fetchone()[0] == 0
+    _check_records(loaded)
+
+    # Deletions of a sync are refreshed like insertions
+    sdl.sync_media_taggings(loaded, [[{"media_source": "video_0_frame_0.jpg", "tagsets": {"Objects": ["tree"]}}]], partial=True)
+    assert _cached(loaded) == _tagged(loaded)
+    _check_records(loaded)
+
+
+def test_cache_is_refreshed_once_attached(loaded):
+    sdl.enable_media_tag_cache(loaded)
+    sdl.detach_media_tag_cache()
+    tagging = {"media_source": "video_1_frame_0.jpg", "tagsets": {"Objects": ["person"]}}
+
+    # Another process: the changed media is read from the tag tables until the cache is attached
+    sdl.add_media_taggings(loaded, [tagging])
+    assert _cached(loaded) == _tagged(loaded) - 1
+    _check_records(loaded)
+
+    sdl.attach_media_tag_cache()
+    sdl.add_media_taggings(loaded, [tagging])
+    assert _cached(loaded) == _tagged(loaded)
+    _check_records(loaded)
+
+
+def test_cache_rebuilt_after_bulk_load(db_file, collection):
+    connection = sqlite3.connect(db_file, autocommit=False, factory=BulkLoadConnection)
+    try:
+        sdl.enable_media_tag_cache(connection)
+        with sdl.bulk_load_session(connection):
+            sdl.add_tagsets(connection, collection["tagsets"])
+            sdl.add_medias(connection, collection["medias"])
+            sdl.add_media_taggings(connection, collection["taggings"], register_missing_tags=True)
+        assert _cached(connection) == _tagged(connection) > 0
+        _check_records(connection)
+    finally:
+        connection.close()
+
+
+@pytest.mark.parametrize("cache", [False, True])
+def test_listener_does_not_block_other_writers(db_file, loaded, cache):
+    # Attached without a cache, the listener only checks for it
+    if cache:
+        sdl.enable_media_tag_cache(loaded)
+    else:
+        sdl.attach_media_tag_cache()
+    sdl.add_media_taggings(loaded, [{"media_source": "video_0_frame_1.jpg", "tagsets": {"Objects": ["person"]}}])
+    other = sqlite3.connect(db_file, autocommit=True, timeout=0)
+    try:
+        other.execute("BEGIN EXCLUSIVE")
+        other.execute("ROLLBACK")
+    finally:
+        other.close()
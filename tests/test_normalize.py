@@ -0,0 +1,62 @@
+from datetime import date, datetime, time, timezone
+
+import pytest
+
+import SimpleM3DataLoader as sdl
+from SimpleM3DataLoader import TagType
+
+
+def test_timestamp_offsets_are_converted_to_utc():
+    normalized = sdl.normalize_tag_values(TagType.TIMESTAMP, ["2026-01-01T12:00:00Z", "2026-01-01T14:00:00+02:00"])
+    assert normalized.invalid == []
+    expected = sdl.encode_tag_value(TagType.TIMESTAMP, datetime(2026, 1, 1, 12, tzinfo=timezone.utc))
+    assert normalized.values == [expected, expected]
+
+
+def test_time_offsets_are_encoded_per_value():
+    normalized = sdl.normalize_tag_values(TagType.TIME, ["12:00:00+02:00", "08:30:00"])
+    assert normalized.invalid == []
+    assert normalized.values == [sdl.encode_tag_value(TagType.TIME, "12:00:00+02:00"), sdl.encode_tag_value(TagType.TIME, time(8, 30))]
+
+
+@pytest.mark.parametrize("tagtype, values", [
+    (TagType.DATE, ["2026-01-01", "1970-01-01", "1969-12-31"]),
+    (TagType.TIME, ["00:00:00", "23:59:59.999999", "12:30"]),
+    (TagType.TIMESTAMP, ["2026-01-01T12:00:00", "1970-01-01 00:00:00.000001", "1900-06-01T00:00:00"]),
+    (TagType.NUMERICAL_INT, [1, -5, 2**62]),
+    (TagType.ALPHANUMERICAL, ["a", "b"]),
+])
+def test_column_matches_per_value_encoding(tagtype, values):
+    normalized = sdl.normalize_tag_values(tagtype, values)
+    assert normalized.invalid == []
+    assert normalized.values == [sdl.encode_tag_value(tagtype, value) for value in values]
+
+
+def test_invalid_values_are_reported_per_row():
+    normalized = sdl.normalize_tag_values(TagType.DATE, ["2026-01-01", "not a date", None, "2026-02-30"])
+    assert [row for row, _, _ in normalized.invalid] == [1, 2, 3]
+    assert normalized.values[0] == sdl.encode_tag_value(TagType.DATE, date(2026, 1, 1))
+    assert list(normalized.valid()) == [(0, normalized.values[0])]
+
+
+def test_numpy_arrays():
+    numpy = pytest.importorskip("numpy")
+    dates = numpy.array(["2026-01-01", "2026-03-15"], dtype="datetime64[D]")
+    assert sdl.normalize_tag_values(TagType.DATE, dates).values == [
+        sdl.encode_tag_value(TagType.DATE, "2026-01-01"), sdl.encode_tag_value(TagType.DATE, "2026-03-15")
+    ]
+    assert sdl.normalize_tag_values(TagType.NUMERICAL_INT, numpy.arange(3)).values == [0, 1, 2]
+
+
+def test_encode_tag_values_raises_on_invalid_value():
+    with pytest.raises(ValueError, match="row 1"):
+        sdl.encode_tag_values(TagType.NUMERICAL_INT, [1, "x"])
+
+
+def test_add_tags_with_utc_offsets(connection):
+    sdl.add_tagsets(connection, [sdl.Tagset("Captured", TagType.TIMESTAMP, sdl.Tags("Captured", ["2026-01-01T12:00:00Z", "not a timestamp"]))])
+    sdl.add_tags(connection, sdl.Tags("Captured", ["2026-01-01T14:00:00+02:00", "2026-01-02T00:00:00"]))
+    values = [value for (value,) in connection.execute("SELECT value FROM timestamp_tags ORDER BY value")]
+    assert [sdl.decode_tag_value(TagType.TIMESTAMP, value) for value in values] == [
+        datetime(2026, 1, 1, 12), datetime(2026, 1, 2)
+    ]
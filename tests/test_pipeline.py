@@ -0,0 +1,70 @@
+import json
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+import SimpleM3DataLoader as sdl
+from SimpleM3DataLoader import pipeline
+from conftest import init_db
+
+
+def _taggings(connection: sqlite3.Connection) -> list:
+    return connection.execute("SELECT media_id, tag_id FROM taggings ORDER BY media_id, tag_id").fetchall()
+
+
+def _load_tags(connection: sqlite3.Connection, collection):
+    sdl.add_tagsets(connection, collection["tagsets"])
+    sdl.add_medias(connection, collection["medias"])
+    values = {}
+    for mapping in collection["taggings"]:
+        for tagset_name, tagset_values in mapping["tagsets"].items():
+            values.setdefault(tagset_name, {}).update(dict.fromkeys(tagset_values))
+    sdl.add_tags_batch(connection, [sdl.Tags(name, list(tagset_values)) for name, tagset_values in values.items()])
+
+
+def test_parallel_load_equals_serial_load(tmp_path: Path, loaded, collection):
+    parallel_file = init_db(tmp_path / "parallel.db")
+    parallel = sqlite3.connect(parallel_file, autocommit=False)
+    _load_tags(parallel, collection)
+    parallel.close()
+
+    batches = [collection["taggings"][i:i + 3] for i in range(0, len(collection["taggings"]), 3)]
+    written = []
+    rows = sdl.add_media_taggings_parallel(
+        parallel_file, batches, workers=2, commit_rows=5,
+        on_batch_written=lambda _, index: written.append(index)
+    )
+    parallel = sqlite3.connect(parallel_file)
+    try:
+        assert _taggings(parallel) == _taggings(loaded)
+        assert rows == len(_taggings(loaded))
+        assert sorted(written) == list(range(len(batches)))
+    finally:
+        parallel.close()
+
+
+def test_raw_json_lines_batches(db_file: Path, connection, collection):
+    _load_tags(connection, collection)
+    batches = [[json.dumps(mapping) for mapping in collection["taggings"]]]
+    assert sdl.add_media_taggings_parallel(db_file, batches, workers=1) > 0
+
+
+def test_failed_batch_is_raised(db_file: Path, connection, collection):
+    _load_tags(connection, collection)
+    batches = [[json.dumps(mapping) for mapping in collection["taggings"]], ["{not json"]]
+    with pytest.raises(ValueError):
+        sdl.add_media_taggings_parallel(db_file, batches, workers=1, max_pending=1, commit_rows=1)
+    # The batch committed before the failure is kept
+    assert connection.execute("SELECT COUNT(*) FROM taggings").fetchone()[0] > 0
+
+
+def test_worker_connection_holds_no_transaction(db_file: Path, connection, collection):
+    _load_tags(connection, collection)
+    pipeline._init_worker(f"{db_file.resolve().as_uri()}?mode=ro")
+    try:
+        assert pipeline._prepare_taggings_batch(collection["taggings"][:2])
+        assert not pipeline._worker_connection.in_transaction
+    finally:
+        pipeline._worker_connection.close()
+        pipeline._worker_connection = None
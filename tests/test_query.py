@@ -0,0 +1,71 @@
+import operator
+
+import pytest
+
+import SimpleM3DataLoader as sdl
+
+
+_COMPARE = {
+    "=": operator.eq, "!=": operator.ne, "<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge,
+    "in": lambda value, values: value in values,
+    "between": lambda value, bounds: bounds[0] <= value <= bounds[1],
+}
+
+
+def _expected(connection, collection, filters, source_type=None) -> set:
+    """
+    Brute force evaluation of a conjunction of filters over the tagging dictionaries of the collection.
+    A filter matches a media if any of its values in the tagset matches.
+    """
+    sources = {
+        mapping["media_source"] for mapping in collection["taggings"]
+        if all(
+            any(_COMPARE[op](value, target) for value in mapping["tagsets"].get(tagset, []))
+            for tagset, op, target in filters
+        )
+    }
+    if source_type is not None:
+        sources &= {mo.source for mo in collection["medias"] if mo.source_type == source_type}
+    return set(sdl.get_media_id_map_for_sources(connection, sources).values())
+
+
+@pytest.mark.parametrize("filters", [
+    [("Objects", "=", "car")],
+    [("Objects", "!=", "car")],
+    [("Objects", "in", ["dog", "tree"])],
+    [("Start (ms)", "<", 2000)],
+    [("Start (ms)", ">=", 1000), ("End (ms)", "<=", 2999)],
+    [("Start (ms)", "between", (1000, 2000))],
+    [("Date", ">", "2026-01-01")],
+    [("Date", "between", ("2026-01-02", "2026-01-03")), ("Objects", "=", "person")],
+    [("Objects", "=", "car"), ("Objects", "=", "dog")],
+    [("Caption", "=", "A car in video 0"), ("Start (ms)", "=", 0)],
+    [("Objects", "=", "unicorn")],
+])
+def test_query_matches_brute_force(loaded, collection, filters):
+    assert set(sdl.query(loaded, filters)) == _expected(loaded, collection, filters)
+
+
+def test_source_type_and_empty_filters(loaded, collection):
+    all_medias = {media_id for (media_id,) in loaded.execute("SELECT id FROM medias")}
+    videos = {media_id for (media_id,) in loaded.execute("SELECT id FROM medias WHERE source_type = ?", [sdl.MediaSourceType.VIDEO.value])}
+    assert set(sdl.query(loaded, [])) == all_medias
+    assert set(sdl.query(loaded, [], "video")) == videos
+    assert set(sdl.query(loaded, [("Objects", "=", "car")], sdl.MediaSourceType.VIDEO)) == set()
+    assert set(sdl.query(loaded, [("Objects", "=", "car")], "IMAGE")) == \
+        _expected(loaded, collection, [("Objects", "=", "car")], sdl.MediaSourceType.IMAGE)
+
+
+def test_query_batches_lazily(loaded):
+    ids = sdl.query(loaded, [("Start (ms)", ">=", 0)], batch_size=2)
+    first = next(ids)
+    assert [first, *ids] == list(sdl.query(loaded, [("Start (ms)", ">=", 0)]))
+
+
+def test_invalid_filters(loaded):
+    with pytest.raises(ValueError):
+        list(sdl.query(loaded, [("Missing", "=", "x")]))
+    with pytest.raises(ValueError):
+        list(sdl.query(loaded, [("Objects", "~", "car")]))
+    with pytest.raises(ValueError):
+        list(sdl.query(loaded, [("Objects", "in", [])]))
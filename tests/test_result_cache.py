@@ -0,0 +1,109 @@
+import pytest
+
+import SimpleM3DataLoader as sdl
+from SimpleM3DataLoader import ConnectionPool, QueryService, ResultCache
+
+
+@pytest.fixture
+def cache(db_file, loaded):
+    cache = ResultCache(db_file)
+    yield cache
+    cache.close()
+
+
+def test_normalize_query():
+    key = sdl.normalize_query([("Objects", "=", "car"), ("Start (ms)", "IN", [2000, 1000])], "image")
+    assert key == sdl.normalize_query([("Start (ms)", "in", [1000, 2000]), ("Objects", "=", "car")], sdl.MediaSourceType.IMAGE)
+    assert key != sdl.normalize_query([("Objects", "=", "car"), ("Start (ms)", "in", [1000, 2000])])
+    assert key != sdl.normalize_query([("Objects", "=", "Car"), ("Start (ms)", "in", [1000, 2000])], "IMAGE")
+    assert sdl.normalize_query([("Boxes", "$.class", "=", "dog")]) != sdl.normalize_query([("Boxes", "$.label", "=", "dog")])
+
+
+def test_hits_and_misses(cache, loaded):
+    filters = [("Objects", "=", "car")]
+    expected = tuple(sdl.query(loaded, filters))
+    assert cache.query(loaded, filters) == expected
+    assert cache.query(loaded, list(reversed(filters)), limit=None) == expected
+    assert cache.query(loaded, filters, limit=2) == expected[:2]
+    assert cache.facet_counts(loaded, filters, tagsets=["Objects"]) == sdl.facet_counts(loaded, list(expected), ["Objects"])
+    assert cache.facet_counts(loaded, filters, tagsets=["Objects"]) == sdl.facet_counts(loaded, list(expected), ["Objects"])
+
+    stats = cache.stats()
+    # The facet miss looks up the ids of its filters (a hit)
+    assert (stats["hits"], stats["misses"]) == (3, 3)
+    assert stats["hit_rate"] == 0.5 and stats["entries"] == 3 and stats["bytes"] > 0
+
+
+def test_invalidated_by_commits(db_file, cache, loaded):
+    filters = [("Objects", "=", "car")]
+    before = cache.query(loaded, filters)
+    sdl.add_medias(loaded, [sdl.MediaObject("new.jpg", sdl.MediaSourceType.IMAGE)])
+    sdl.add_media_taggings(loaded, [{"media_source": "new.jpg", "tagsets": {"Objects": ["car"]}}])
+    after = cache.query(loaded, filters)
+    assert len(after) == len(before) + 1
+    stats = cache.stats()
+    assert stats["invalidations"] == 1 and stats["hits"] == 0 and stats["entries"] == 1
+
+    # Results are shared by the connections of a pool
+    other = ConnectionPool(db_file, size=1)
+    try:
+        assert cache.query(loaded, filters) == after
+        loaded.execute("DELETE FROM taggings")
+        loaded.commit()
+        with other.connection() as connection:
+            assert cache.query(connection, filters) == ()
+    finally:
+        other.close()
+
+
+def test_result_computed_during_a_commit_is_not_stored(cache, loaded):
+    def compute():
+        sdl.add_medias(loaded, [sdl.MediaObject("new.jpg", sdl.MediaSourceType.IMAGE)])
+        return ("stale",)
+
+    assert cache.get_or_compute(("key",), compute) == ("stale",)
+    assert cache.stats()["entries"] == 0
+    assert cache.get_or_compute(("key",), lambda: ("fresh",)) == ("fresh",)
+    assert cache.get_or_compute(("key",), lambda: ("other",)) == ("fresh",)
+
+
+def test_eviction(db_file, loaded):
+    cache = ResultCache(db_file, max_entries=2)
+    try:
+        for key in ("a", "b", "a", "c"):
+            cache.get_or_compute((key,), lambda: [1, 2, 3])
+        # b was the least recently used
+        assert cache.stats()["evictions"] == 1
+        cache.get_or_compute(("a",), lambda: None)
+        assert cache.stats()["hits"] == 2
+    finally:
+        cache.close()
+
+    cache = ResultCache(db_file, max_bytes=2000)
+    try:
+        cache.get_or_compute(("large",), lambda: list(range(1000)))
+        assert cache.stats()["entries"] == 0
+        for key in range(10):
+            cache.get_or_compute((str(key),), lambda: list(range(10)))
+        stats = cache.stats()
+        assert 0 < stats["entries"] < 10 and stats["bytes"] <= 2000 and stats["evictions"] == 10 - stats["entries"]
+        cache.clear()
+        assert cache.stats()["entries"] == cache.stats()["bytes"] == 0
+    finally:
+        cache.close()
+
+
+def test_service_stats(db_file, loaded):
+    sdl.enable_wal(db_file)
+    pool = ConnectionPool(db_file, size=1)
+    cache = ResultCache(db_file)
+    try:
+        service = QueryService(pool, cache=cache)
+        body = {"filters": [["Objects", "=", "dog"]]}
+        assert service.handle("POST", "/query", body) == service.handle("POST", "/query", body)
+        _, stats = service.handle("GET", "/stats", {})
+        assert stats["cache"]["hits"] == 1 and stats["cache"]["misses"] == 1
+        assert "cache" not in QueryService(pool).handle("GET", "/stats", {})[1]
+    finally:
+        cache.close()
+        pool.close()
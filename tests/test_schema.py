@@ -0,0 +1,95 @@
+import sqlite3
+
+import pytest
+
+import SimpleM3DataLoader as sdl
+from SimpleM3DataLoader.schema import _schema_objects
+
+from conftest import DDL_FILE
+
+
+def _schema(connection: sqlite3.Connection) -> dict:
+    return {name: " ".join(sql.split()) for name, (_, sql) in _schema_objects(connection).items()}
+
+
+def _tag_counts(connection: sqlite3.Connection) -> set:
+    return set(connection.execute("SELECT tag_id, tagset_id, count FROM tag_counts"))
+
+
+def test_upgrade_from_before_tag_counts(tmp_path, loaded, collection):
+    expected = _tag_counts(loaded)
+    fresh = _schema(loaded)
+    # The schema before tag_counts, with the previous idx_taggings_tag_id
+    loaded.executescript(
+        """
+        DROP TRIGGER trg_taggings_insert_tag_counts;
+        DROP TRIGGER trg_taggings_delete_tag_counts;
+        DROP TABLE tag_counts;
+        DROP INDEX idx_taggings_tag_id;
+        CREATE INDEX idx_taggings_tag_id ON taggings(tag_id);
+        """
+    )
+
+    upgraded = sdl.upgrade_schema(loaded, DDL_FILE.read_text())
+    assert sorted(upgraded) == sorted([
+        "idx_taggings_tag_id", "tag_counts", "trg_taggings_insert_tag_counts", "trg_taggings_delete_tag_counts",
+        "idx_tag_counts_tagset_id_count",
+    ])
+    assert _schema(loaded) == fresh
+    assert _tag_counts(loaded) == expected
+
+    # Maintained from now on, and a second upgrade does nothing
+    sdl.add_media_taggings(loaded, [{"media_source": "video_0_frame_0.jpg", "tagsets": {"Objects": ["person", "dog", "car"]}}])
+    counts = _tag_counts(loaded)
+    sdl.rebuild_tag_counts(loaded)
+    assert _tag_counts(loaded) == counts
+    assert sdl.upgrade_schema(loaded, DDL_FILE.read_text()) == []
+
+
+def test_upgrade_keeps_other_objects(loaded):
+    sdl.enable_interval_index(loaded, "Start (ms)", "End (ms)")
+    loaded.execute("ALTER TABLE medias ADD COLUMN note TEXT")
+    loaded.commit()
+    before = _schema(loaded)
+    assert sdl.upgrade_schema(loaded, DDL_FILE.read_text()) == []
+    assert _schema(loaded) == before
+
+
+def test_upgrade_from_before_the_ingest_manifest(tmp_path, db_file):
+    medias_file = tmp_path / "medias.jsonl"
+    medias_file.write_text('{"source": "a.jpg", "source_type": "image"}\n')
+    connection = sqlite3.connect(db_file, autocommit=False, factory=sdl.BulkLoadConnection)
+    try:
+        connection.executescript("DROP TABLE ingest_failures; DROP TABLE ingest_chunks;")
+
+        def load():
+            with open(medias_file) as f:
+                return sdl.load_checkpointed(
+                    connection, "medias", medias_file, sdl.iter_raw_json_batches(f, 10),
+                    lambda batch: sdl.add_medias(connection, [sdl.MediaObject(mo["source"], sdl.MediaSourceType.IMAGE) for mo in batch])
+                )
+
+        with pytest.raises(RuntimeError, match="upgradedb"):
+            load()
+        assert sorted(sdl.upgrade_schema(connection, DDL_FILE.read_text())) == ["ingest_chunks", "ingest_failures"]
+        assert load() == (1, 0)
+        assert load() == (0, 0)
+    finally:
+        connection.close()
+
+
+def test_temporal_values_stored_as_text_are_encoded(loaded):
+    # As stored before temporal values were encoded as integers
+    loaded.executescript(
+        """
+        UPDATE date_tags SET value = date(value * 86400, 'unixepoch');
+        INSERT INTO tags (id, tagset_id, tagtype_id) SELECT 1000, tagset_id, tagtype_id FROM tags WHERE id = (SELECT MIN(id) FROM date_tags);
+        INSERT INTO date_tags (id, value, tagset_id) SELECT 1000, 'not a date', tagset_id FROM date_tags WHERE id = (SELECT MIN(id) FROM date_tags);
+        """
+    )
+    assert list(sdl.query(loaded, [("Date", "=", "2026-01-02")])) == []
+
+    assert sdl.upgrade_schema(loaded, DDL_FILE.read_text()) == ["date_tags"]
+    assert len(list(sdl.query(loaded, [("Date", "=", "2026-01-02")]))) == 4
+    assert loaded.execute("SELECT value FROM date_tags WHERE typeof(value) = 'text'").fetchall() == [("not a date",)]
+    assert sdl.upgrade_schema(loaded, DDL_FILE.read_text()) == []
@@ -0,0 +1,115 @@
+import re
+import sqlite3
+
+import pytest
+
+import SimpleM3DataLoader as sdl
+from SimpleM3DataLoader import BulkLoadConnection
+
+
+def _integrity_check(connection: sqlite3.Connection):
+    """
+    The values of the indexed tagsets, and only those, are found in both indexes.
+    """
+    indexed = {tagset_id for (tagset_id,) in connection.execute("SELECT tagset_id FROM text_search_tagsets")}
+    for table in ("alphanumerical_tags_fts", "alphanumerical_tags_trigram"):
+        connection.execute(f"INSERT INTO {table} ({table}) VALUES ('integrity-check')")
+        for tag_id, tagset_id, value in connection.execute("SELECT id, tagset_id, value FROM alphanumerical_tags").fetchall():
+            if table.endswith("trigram") and len(value) < 3:
+                continue
+            found = connection.execute(
+                f"SELECT 1 FROM {table} WHERE {table} MATCH ? AND rowid = ?", ['"' + value.replace('"', '""') + '"', tag_id]
+            ).fetchone() is not None
+            assert found == (tagset_id in indexed), (table, value)
+
+
+def _expected(connection: sqlite3.Connection, matches) -> set:
+    """
+    Medias tagged with a Caption value for which matches(value) is true.
+    """
+    return {
+        media_id for media_id, value in connection.execute(
+            """
+            SELECT tg.media_id, t.value
+            FROM taggings tg JOIN alphanumerical_tags t ON t.id = tg.tag_id JOIN tagsets ts ON ts.id = t.tagset_id
+            WHERE ts.name = 'Caption'
+            """
+        )
+        if matches(value)
+    }
+
+
+def _words(value: str) -> set:
+    return set(re.findall(r"\w+", value.lower()))
+
+
+@pytest.fixture
+def indexed(loaded):
+    sdl.add_media_taggings(loaded, [
+        {"media_source": "video_0_frame_0.jpg", "tagsets": {"Caption": ["Café au lait, BMXing"]}},
+        {"media_source": "video_1_frame_1.jpg", "tagsets": {"Caption": ["A BMX race"]}},
+    ], register_missing_tags=True)
+    sdl.enable_text_search(loaded, ["Caption"])
+    return loaded
+
+
+@pytest.mark.parametrize("text", ["car", "A car", "video 2", "bmx", "BMX race", "cafe", "dog tree", "zebra"])
+def test_word_search(indexed, text):
+    ids = {media_id for media_id, _ in sdl.search_text(indexed, text, limit=None)}
+    assert ids == _expected(indexed, lambda value: set(text.lower().split()) <= _words(value.replace("é", "e")))
+
+
+@pytest.mark.parametrize("text", ["bmx", "in video 1", "ar", "é", "%"])
+def test_substring_search(indexed, text):
+    ids = {media_id for media_id, _ in sdl.search_text(indexed, text, substring=True, limit=None)}
+    assert ids == _expected(indexed, lambda value: text.lower() in value.lower())
+
+
+def test_ranking_and_filters(indexed):
+    results = sdl.search_text(indexed, "bmx", limit=None)
+    assert [score for _, score in results] == sorted(score for _, score in results)
+    assert len(sdl.search_text(indexed, "video", limit=3)) == 3
+    assert sdl.search_text(indexed, "video", source_type="VIDEO") == []
+    assert sdl.search_text(indexed, "   ") == []
+    with pytest.raises(ValueError):
+        sdl.search_text(indexed, "car", tagsets=["Objects"])
+    with pytest.raises(ValueError):
+        sdl.enable_text_search(indexed, ["Date"])
+
+
+def test_triggers_maintain_the_index(indexed):
+    # Values added later are indexed, values of other tagsets are not
+    sdl.add_media_taggings(indexed, [
+        {"media_source": "video_2_frame_2.jpg", "tagsets": {"Caption": ["Penguins on ice"], "Objects": ["penguin"]}},
+    ], register_missing_tags=True)
+    assert len(sdl.search_text(indexed, "penguins")) == 1
+    assert sdl.search_text(indexed, "penguin") == []
+    _integrity_check(indexed)
+
+    # Deleted tags are removed
+    tag_id = indexed.execute("SELECT id FROM alphanumerical_tags WHERE value = 'Penguins on ice'").fetchone()[0]
+    indexed.execute("DELETE FROM taggings WHERE tag_id = ?", [tag_id])
+    indexed.execute("DELETE FROM alphanumerical_tags WHERE id = ?", [tag_id])
+    indexed.execute("DELETE FROM tags WHERE id = ?", [tag_id])
+    indexed.commit()
+    assert indexed.execute("SELECT COUNT(*) FROM alphanumerical_tags_fts WHERE alphanumerical_tags_fts MATCH 'penguins'").fetchone()[0] == 0
+    _integrity_check(indexed)
+
+    sdl.disable_text_search(indexed, ["Caption"])
+    assert sdl.search_text(indexed, "car") == []
+    _integrity_check(indexed)
+
+
+def test_rebuilt_after_bulk_load(db_file, collection):
+    connection = sqlite3.connect(db_file, autocommit=False, factory=BulkLoadConnection)
+    try:
+        sdl.add_tagsets(connection, collection["tagsets"])
+        sdl.enable_text_search(connection, ["Caption"])
+        with sdl.bulk_load_session(connection):
+            sdl.add_medias(connection, collection["medias"])
+            sdl.add_media_taggings(connection, collection["taggings"], register_missing_tags=True)
+        ids = {media_id for media_id, _ in sdl.search_text(connection, "video 1", limit=None)}
+        assert ids == _expected(connection, lambda value: value.endswith("video 1"))
+        _integrity_check(connection)
+    finally:
+        connection.close()
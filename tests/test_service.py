@@ -0,0 +1,69 @@
+import json
+import sqlite3
+import threading
+
+import pytest
+
+import SimpleM3DataLoader as sdl
+from SimpleM3DataLoader import ConnectionPool, QueryService
+
+
+@pytest.fixture
+def pool(db_file, loaded):
+    sdl.enable_wal(db_file)
+    pool = ConnectionPool(db_file, size=2)
+    yield pool
+    pool.close()
+
+
+def test_handle_requests(pool, loaded):
+    service = QueryService(pool, max_limit=5)
+    status, response = service.handle("POST", "/query", {"filters": [["Objects", "=", "car"]]})
+    expected = list(sdl.query(loaded, [("Objects", "=", "car")]))
+    assert status == 200 and response == {"media_ids": expected[:5], "count": min(5, len(expected))}
+
+    status, response = service.handle("POST", "/query", {"filters": [["Start (ms)", "between", [1000, 2000]]], "source_type": "IMAGE", "limit": 2})
+    assert status == 200 and response["count"] == 2
+
+    status, response = service.handle("POST", "/facets", {"filters": [["Objects", "=", "car"]], "tagsets": ["Objects"], "top_n": 2})
+    assert status == 200 and response == {"facets": sdl.facet_counts(loaded, expected, ["Objects"], 2)}
+
+    assert service.handle("POST", "/query", {"filters": [["Missing", "=", "x"]]})[0] == 400
+    assert service.handle("GET", "/missing", {})[0] == 404
+    status, stats = service.handle("GET", "/stats", {})
+    assert stats["requests"] == {"/query": 3, "/facets": 1, "/stats": 1}
+    assert stats["errors"] == 1 and stats["pool_size"] == 2 and stats["idle_connections"] == 2
+
+
+def test_pool_is_read_only_and_sees_commits(pool, loaded):
+    with pool.connection() as connection:
+        with pytest.raises(sqlite3.OperationalError):
+            connection.execute("DELETE FROM taggings")
+        before = connection.execute("SELECT COUNT(*) FROM medias").fetchone()[0]
+        sdl.add_medias(loaded, [sdl.MediaObject("new.jpg", sdl.MediaSourceType.IMAGE)])
+        # No read transaction is held between statements
+        assert connection.execute("SELECT COUNT(*) FROM medias").fetchone()[0] == before + 1
+        assert pool.idle == 1
+
+
+def test_server_and_load_test(tmp_path, pool, loaded):
+    server = sdl.make_server(QueryService(pool), unix_socket=tmp_path / "service.sock")
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        requests = sdl.sample_requests(loaded, count=20)
+        assert {path for path, _ in requests} == {"/query", "/facets"}
+        results = sdl.load_test(requests, unix_socket=tmp_path / "service.sock", clients=3, total_requests=30)
+        assert results["requests"] == 30 and results["errors"] == 0
+        assert results["p50_ms"] <= results["p90_ms"] <= results["p99_ms"]
+
+        # Temporal values are returned as ISO 8601 strings
+        connection = sdl.service._client(None, tmp_path / "service.sock")
+        connection.request("POST", "/facets", json.dumps({"tagsets": ["Date"]}))
+        response = connection.getresponse()
+        assert response.status == 200
+        assert {value for value, _ in json.loads(response.read())["facets"]["Date"]} == {"2026-01-01", "2026-01-02", "2026-01-03"}
+        connection.close()
+    finally:
+        server.shutdown()
+        server.server_close()
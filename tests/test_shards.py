@@ -0,0 +1,124 @@
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+import SimpleM3DataLoader as sdl
+from conftest import DDL_FILE, init_db, small_collection
+
+
+@pytest.fixture
+def collection():
+    return small_collection(videos=6, keyframes=3)
+
+
+@pytest.fixture
+def sharded(tmp_path: Path, collection) -> Path:
+    directory = tmp_path / "shards"
+    sdl.init_shards(directory, DDL_FILE, 3)
+    catalog = sqlite3.connect(directory / sdl.shards.CATALOG_FILE, autocommit=False)
+    sdl.add_tagsets(catalog, collection["tagsets"])
+    tags = {}
+    for mapping in collection["taggings"]:
+        for tagset_name, values in mapping["tagsets"].items():
+            tags.setdefault(tagset_name, {}).update(dict.fromkeys(values))
+    sdl.add_tags_batch(catalog, [sdl.Tags(name, list(values)) for name, values in tags.items()])
+    catalog.close()
+    sdl.replicate_tags(directory)
+    sdl.add_medias_sharded(directory, [collection["medias"]], workers=2, batch_size=5)
+    sdl.add_media_taggings_sharded(directory, [collection["taggings"]], workers=2, batch_size=5)
+    return directory
+
+
+@pytest.fixture
+def single(tmp_path: Path, collection) -> sqlite3.Connection:
+    connection = sqlite3.connect(init_db(tmp_path / "single.db"), autocommit=False)
+    sdl.add_tagsets(connection, collection["tagsets"])
+    sdl.add_medias(connection, collection["medias"])
+    sdl.add_media_taggings(connection, collection["taggings"], register_missing_tags=True)
+    yield connection
+    connection.close()
+
+
+def _sources(connection: sqlite3.Connection, media_ids) -> set:
+    rows = connection.execute(
+        "SELECT source FROM medias WHERE id IN (SELECT value FROM json_each(?))", [str(list(media_ids))]
+    ).fetchall()
+    return {source for (source,) in rows}
+
+
+def test_groups_stay_on_one_shard(sharded: Path):
+    for shard in range(3):
+        with sqlite3.connect(sdl.shards.shard_file(sharded, shard)) as connection:
+            orphans = connection.execute(
+                "SELECT COUNT(*) FROM medias m WHERE m.source LIKE '%frame%' AND m.group_id IS NULL"
+            ).fetchone()[0]
+        connection.close()
+        assert orphans == 0
+
+
+@pytest.mark.parametrize("filters", [
+    [("Objects", "=", "car")],
+    [("Objects", "in", ["dog", "tree"]), ("Start (ms)", ">=", 1000)],
+    [("Date", "between", ("2026-01-02", "2026-01-04"))],
+])
+def test_sharded_query_equals_single_database(sharded: Path, single: sqlite3.Connection, filters):
+    expected = _sources(single, sdl.query(single, filters))
+    with sdl.ShardedDatabase(sharded) as sdb:
+        media_ids = sdb.query(filters)
+    federated = sdl.connect_federated(sharded)
+    try:
+        assert _sources(federated, media_ids) == expected
+        assert _sources(federated, sdl.query(federated, filters)) == expected
+    finally:
+        federated.close()
+
+
+def test_sharded_facet_counts_equal_single_database(sharded: Path, single: sqlite3.Connection):
+    expected = sdl.facet_counts(single, None, ["Objects", "Date"], 10)
+    with sdl.ShardedDatabase(sharded) as sdb:
+        counts = sdb.facet_counts(None, ["Objects", "Date"], 10)
+    assert {name: sorted(values) for name, values in counts.items()} == {
+        name: sorted(values) for name, values in expected.items()
+    }
+
+
+def test_sharded_reads_see_later_commits(sharded: Path):
+    with sdl.ShardedDatabase(sharded) as sdb:
+        media_ids = sdb.query([("Objects", "=", "car")])
+        sdb.facet_counts(media_ids, ["Objects"])
+        assert not any(connection.in_transaction for connection in sdb.connections)
+
+        shard, local_id = sdl.split_media_id(media_ids[0], sdb.shards)
+        with sqlite3.connect(sdl.shards.shard_file(sharded, shard)) as writer:
+            writer.execute("DELETE FROM taggings WHERE media_id = ?", [local_id])
+        writer.close()
+        assert media_ids[0] not in sdb.query([("Objects", "=", "car")])
+
+
+def test_failed_shard_batch_is_not_routed(sharded: Path):
+    # The existing video fails the batch, the new keyframe of its group is rolled back with it
+    frame = sdl.MediaObject("video_0_frame_9.jpg", sdl.MediaSourceType.IMAGE, group="video_0.mp4")
+    video = sdl.MediaObject("video_0.mp4", sdl.MediaSourceType.VIDEO)
+    sdl.add_medias_sharded(sharded, [[frame, video]], workers=1)
+    with sqlite3.connect(sharded / sdl.shards.CATALOG_FILE) as catalog:
+        routed = catalog.execute("SELECT COUNT(*) FROM media_routes WHERE source = ?", [frame.source]).fetchone()[0]
+        total = catalog.execute("SELECT COUNT(*) FROM media_routes").fetchone()[0]
+    catalog.close()
+    assert routed == 0
+    assert total == 6 * 4
+
+
+def test_members_before_their_leader_are_grouped(sharded: Path):
+    video = sdl.MediaObject("late_video.mp4", sdl.MediaSourceType.VIDEO)
+    frames = [sdl.MediaObject(f"late_frame_{i}.jpg", sdl.MediaSourceType.IMAGE, group=video.source) for i in range(3)]
+    sdl.add_medias_sharded(sharded, [frames, [video]], workers=1, batch_size=2)
+    shard = sdl.shards.shard_of(video.source, 3)
+    with sqlite3.connect(sdl.shards.shard_file(sharded, shard)) as connection:
+        groups = connection.execute(
+            "SELECT m.source, leader.source FROM medias m JOIN medias leader ON leader.id = m.group_id WHERE m.source LIKE 'late_frame_%'"
+        ).fetchall()
+        pending = connection.execute("SELECT COUNT(*) FROM pending_media_groups").fetchone()[0]
+    connection.close()
+    assert sorted(groups) == [(frame.source, video.source) for frame in frames]
+    assert pending == 0
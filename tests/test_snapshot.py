@@ -0,0 +1,68 @@
+import sqlite3
+
+import pytest
+
+import SimpleM3DataLoader as sdl
+from SimpleM3DataLoader import Snapshot
+from SimpleM3DataLoader.snapshot import MANIFEST_FILE
+
+
+@pytest.fixture
+def snapshot_dir(tmp_path, loaded):
+    # A NULL thumbnail next to non-ASCII strings, and a decimal tagset
+    sdl.add_medias(loaded, [sdl.MediaObject("vidéo_ü.mp4", sdl.MediaSourceType.VIDEO, thumbnail="vidéo_ü.jpg")])
+    sdl.add_tagsets(loaded, [sdl.Tagset("Score", sdl.TagType.NUMERICAL_DEC, sdl.Tags("Score", [0.5, 1.25]))])
+    manifest = sdl.export_snapshot(loaded, tmp_path / "snapshot")
+    assert manifest["tables"]["medias"]["rows"] == loaded.execute("SELECT COUNT(*) FROM medias").fetchone()[0]
+    return tmp_path / "snapshot"
+
+
+def test_tables_match_database(snapshot_dir, loaded):
+    with Snapshot(snapshot_dir) as snapshot:
+        medias = loaded.execute("SELECT id, source, source_type, thumbnail_uri, group_id FROM medias ORDER BY id").fetchall()
+        assert list(zip(
+            snapshot.column("medias", "id"),
+            snapshot.strings("medias", "source"),
+            snapshot.column("medias", "source_type"),
+            snapshot.strings("medias", "thumbnail_uri"),
+            snapshot.column("medias", "group_id"),
+        )) == [(i, s, t, th, -1 if g is None else g) for i, s, t, th, g in medias]
+        assert snapshot.strings("medias", "thumbnail_uri")[-1] == "vidéo_ü.jpg"
+
+        assert list(zip(snapshot.column("date_tags", "id"), snapshot.column("date_tags", "value"))) == \
+            loaded.execute("SELECT id, value FROM date_tags ORDER BY id").fetchall()
+        assert list(snapshot.column("numerical_dec_tags", "value")) == [0.5, 1.25]
+        assert list(snapshot.strings("tagsets", "name")) == [name for (name,) in loaded.execute("SELECT name FROM tagsets ORDER BY id")]
+
+
+def test_taggings_in_csr_layout(snapshot_dir, loaded):
+    with Snapshot(snapshot_dir) as snapshot:
+        indptr, indices = snapshot.taggings()
+        assert len(indices) == loaded.execute("SELECT COUNT(*) FROM taggings").fetchone()[0]
+        for (media_id,) in loaded.execute("SELECT id FROM medias"):
+            expected = [tag_id for (tag_id,) in loaded.execute("SELECT tag_id FROM taggings WHERE media_id = ? ORDER BY tag_id", [media_id])]
+            assert list(snapshot.media_tags(media_id)) == expected
+        assert list(snapshot.media_tags(10**6)) == [] and list(snapshot.media_tags(-1)) == []
+        assert list(snapshot.numpy("taggings", "indptr")) == list(indptr)
+
+
+def test_column_type_errors_and_incomplete_snapshots(snapshot_dir):
+    with Snapshot(snapshot_dir) as snapshot:
+        with pytest.raises(TypeError):
+            snapshot.column("medias", "source")
+        with pytest.raises(TypeError):
+            snapshot.strings("medias", "id")
+        with pytest.raises(KeyError):
+            snapshot.column("medias", "missing")
+    (snapshot_dir / MANIFEST_FILE).unlink()
+    with pytest.raises(FileNotFoundError):
+        Snapshot(snapshot_dir)
+
+
+def test_export_ends_its_read_transaction(tmp_path, db_file, loaded):
+    connection = sqlite3.connect(db_file)
+    try:
+        sdl.export_snapshot(connection, tmp_path / "legacy")
+        assert not connection.in_transaction
+    finally:
+        connection.close()
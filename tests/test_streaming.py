@@ -0,0 +1,116 @@
+import io
+import json
+
+import pytest
+
+import SimpleM3DataLoader as sdl
+
+
+RECORDS = [
+    {"source": "a.jpg", "tags": [1, 2.5, -3e-2, True, False, None]},
+    {"source": "bé \"quoted\" \\\\ 😀", "nested": {"x": [{"y": "z"}]}},
+    [],
+    {},
+    "string record",
+    12345678901234567890,
+]
+
+
+class CountingReader(io.StringIO):
+    """
+    A text file that records how many characters were read, and in how many reads.
+    """
+    def __init__(self, text: str):
+        super().__init__(text)
+        self.characters_read = 0
+        self.reads = 0
+
+    def read(self, size: int = -1) -> str:
+        chunk = super().read(size)
+        self.characters_read += len(chunk)
+        self.reads += 1
+        return chunk
+
+    def readline(self, size: int = -1) -> str:
+        line = super().readline(size)
+        self.characters_read += len(line)
+        self.reads += 1
+        return line
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 1 << 20])
+@pytest.mark.parametrize("text", [
+    json.dumps(RECORDS),
+    json.dumps(RECORDS, indent=4),
+    json.dumps(RECORDS, ensure_ascii=False),
+    "\n".join(json.dumps(record) for record in RECORDS) + "\n",
+    "\n\n" + "\n\n".join(json.dumps(record, ensure_ascii=False) for record in RECORDS),
+])
+def test_records_across_chunk_boundaries(text, chunk_size):
+    assert list(sdl.iter_json_records(io.StringIO(text), chunk_size)) == RECORDS
+
+
+@pytest.mark.parametrize("text, expected", [("", []), ("  \n", []), ("[]", []), (" [ ] \n", []), ("[1]", [1]), ("1\n2", [1, 2]), ("1\r\n\r\n2\r\n", [1, 2])])
+def test_empty_and_small_inputs(text, expected):
+    assert list(sdl.iter_json_records(io.StringIO(text), 1)) == expected
+
+
+# JSON Lines hold exactly one value per line
+@pytest.mark.parametrize("text", ["[1, 2", "[1 2]", "[1,]", "[1] x", "[1]\n[2]", "{\"a\": 1} {", "[tru]", "1 2", "{\"a\":\n1}"])
+def test_invalid_inputs(text):
+    with pytest.raises(ValueError):
+        list(sdl.iter_json_records(io.StringIO(text), 2))
+
+
+def test_syntax_error_fails_without_reading_the_rest_of_the_file():
+    records = [json.dumps({"source": f"{i}.jpg", "tags": {"Objects": ["car"]}}) for i in range(20_000)]
+    records[10] = '{"source": "10.jpg", "tags": {"Objects": ["car"}}'
+    for text in ["\n".join(records), "[" + ",\n".join(records) + "]"]:
+        f = CountingReader(text)
+        with pytest.raises(ValueError):
+            list(sdl.iter_json_records(f, 1024))
+        assert f.characters_read < 4096 < len(text)
+
+
+def test_unterminated_record_is_bounded_by_max_record_size():
+    f = CountingReader('["' + "x" * 100_000)
+    with pytest.raises(ValueError, match="larger than"):
+        list(sdl.iter_json_records(f, 1024, max_record_size=10_000))
+    assert f.characters_read < 20_000
+
+
+def test_batches():
+    text = "\n".join(json.dumps({"i": i}) for i in range(10))
+    assert [len(batch) for batch in sdl.iter_json_batches(io.StringIO(text), 4)] == [4, 4, 2]
+
+
+def test_large_record_is_read_in_growing_chunks():
+    record = {"caption": "x" * 1_000_000}
+    for text in [json.dumps([record]), json.dumps(record)]:
+        f = CountingReader(text)
+        assert list(sdl.iter_json_records(f, 1024)) == [record]
+        assert f.reads < 30
+
+
+def test_json_lines_record_is_bounded_by_max_record_size():
+    f = CountingReader("1\n" + "2" * 100_000 + "\n3\n")
+    with pytest.raises(ValueError, match="larger than"):
+        list(sdl.iter_json_records(f, 4, max_record_size=10_000))
+    assert f.characters_read < 20_000
+
+
+def test_raw_batches_keep_json_lines_undecoded():
+    lines = [json.dumps({"i": i}) for i in range(5)]
+    batches = list(sdl.iter_raw_json_batches(io.StringIO("\n".join(lines) + "\n\n"), 2))
+    assert [[line.strip() for line in batch] for batch in batches] == [lines[0:2], lines[2:4], lines[4:5]]
+
+    array = list(sdl.iter_raw_json_batches(io.StringIO("  [" + ",".join(lines) + "]"), 2))
+    assert array == [[{"i": 0}, {"i": 1}], [{"i": 2}, {"i": 3}], [{"i": 4}]]
+
+
+def test_raw_batches_split_json_lines_as_records():
+    text = '{"a": 1}\r\n\n  \n[2, 3]\n"x"'
+    raw = [json.loads(line) for batch in sdl.iter_raw_json_batches(io.StringIO(text), 10) for line in batch]
+    assert raw == list(sdl.iter_json_records(io.StringIO(text)))
+    with pytest.raises(ValueError, match="larger than"):
+        list(sdl.iter_raw_json_batches(io.StringIO("1\n" + "2" * 100 + "\n"), 10, max_record_size=10))
@@ -0,0 +1,115 @@
+import sqlite3
+from pathlib import Path
+
+import SimpleM3DataLoader as sdl
+from SimpleM3DataLoader import BitmapIndex
+
+from conftest import init_db, small_collection
+
+
+def _snapshot(connection: sqlite3.Connection) -> dict:
+    """
+    The medias (by source, with their group leader's source) and their tags, independent of the ids.
+    """
+    sources = dict(connection.execute("SELECT id, source FROM medias"))
+    records = sdl.get_media_records(connection, sorted(sources))
+    return {
+        r.source: (
+            r.source_type,
+            r.thumbnail,
+            sources.get(r.group_id),
+            {tagset: sorted(map(str, values)) for tagset, values in r.tags.items() if values},
+        )
+        for r in records
+    }
+
+
+def _load(connection: sqlite3.Connection, collection: dict) -> sqlite3.Connection:
+    sdl.add_tagsets(connection, collection["tagsets"])
+    sdl.add_medias(connection, collection["medias"])
+    sdl.add_media_taggings(connection, collection["taggings"], register_missing_tags=True)
+    return connection
+
+
+def _v2() -> dict:
+    # One video less, one keyframe more per video, and other objects for the remaining frames
+    v2 = small_collection(videos=2, keyframes=5)
+    for mapping in v2["taggings"]:
+        mapping["tagsets"]["Objects"] = sorted({"tree", *mapping["tagsets"]["Objects"][:1]})
+    v2["medias"][0].thumbnail = "video_0.jpg"
+    return v2
+
+
+def test_sync_equals_fresh_load(tmp_path: Path, loaded):
+    v2 = _v2()
+    medias = sdl.sync_medias(loaded, [v2["medias"]], batch_size=4)
+    taggings = sdl.sync_media_taggings(loaded, [v2["taggings"]], batch_size=4)
+    assert medias["inserted"] == 2 and medias["updated"] == 1 and medias["deleted"] == 5
+    assert taggings["inserted"] > 0 and taggings["deleted"] > 0
+
+    fresh = sqlite3.connect(init_db(tmp_path / "fresh.db"), autocommit=False)
+    try:
+        assert _snapshot(loaded) == _snapshot(_load(fresh, v2))
+    finally:
+        fresh.close()
+
+    # A second sync has nothing left to do
+    assert sdl.sync_medias(loaded, [v2["medias"]]) == {"inserted": 0, "updated": 0, "deleted": 0, "regrouped": 0}
+    assert sdl.sync_media_taggings(loaded, [v2["taggings"]]) == {"inserted": 0, "deleted": 0}
+
+
+def test_dry_run_counts_without_writing(loaded):
+    before = _snapshot(loaded)
+    v2 = _v2()
+    medias = sdl.sync_medias(loaded, [v2["medias"]], dry_run=True)
+    taggings = sdl.sync_media_taggings(loaded, [v2["taggings"]], dry_run=True)
+    assert medias["inserted"] == 2 and medias["deleted"] == 5
+    assert taggings["deleted"] > 0
+    assert _snapshot(loaded) == before
+
+
+def test_partial_sync_keeps_other_medias(loaded):
+    before = _snapshot(loaded)
+    changed = {
+        "media_source": "video_1_frame_2.jpg",
+        "tagsets": {"Objects": ["dog"], "Caption": ["A dog"]},
+    }
+    assert sdl.sync_medias(loaded, [[sdl.MediaObject("video_9.mp4", sdl.MediaSourceType.VIDEO)]], partial=True)["deleted"] == 0
+    sdl.sync_media_taggings(loaded, [[changed]], partial=True)
+
+    after = _snapshot(loaded)
+    assert after["video_1_frame_2.jpg"][3] == {"Objects": ["dog"], "Caption": ["A dog"]}
+    assert "video_9.mp4" in after
+    assert {source: v for source, v in after.items() if source not in ("video_1_frame_2.jpg", "video_9.mp4")} == \
+        {source: v for source, v in before.items() if source != "video_1_frame_2.jpg"}
+
+
+def test_attached_bitmap_index_follows_deletions(loaded):
+    index = BitmapIndex.build(loaded)
+    index.attach()
+    try:
+        v2 = _v2()
+        sdl.sync_medias(loaded, [v2["medias"]], batch_size=4)
+        sdl.sync_media_taggings(loaded, [v2["taggings"]], batch_size=4)
+        for value in ("car", "dog", "tree", "person"):
+            expected = set(sdl.query(loaded, [("Objects", "=", value)]))
+            assert set(index.evaluate(loaded, ("Objects", "=", value))) == expected
+    finally:
+        index.detach()
+
+
+def test_sync_replaces_pending_groups(loaded):
+    pending = [
+        sdl.MediaObject("late_frame.jpg", sdl.MediaSourceType.IMAGE, group="late_video.mp4"),
+        sdl.MediaObject("gone_frame.jpg", sdl.MediaSourceType.IMAGE, group="gone_video.mp4"),
+    ]
+    sdl.add_medias(loaded, pending, defer_missing_leaders=True)
+    v2 = _v2()
+    v2["medias"].append(sdl.MediaObject("late_frame.jpg", sdl.MediaSourceType.IMAGE, group="video_0.mp4"))
+    sdl.sync_medias(loaded, [v2["medias"]])
+
+    # The synced frame keeps its new group, the deleted frame takes its pending group along
+    assert loaded.execute("SELECT COUNT(*) FROM pending_media_groups").fetchone()[0] == 0
+    sdl.add_medias(loaded, [sdl.MediaObject("late_video.mp4", sdl.MediaSourceType.VIDEO)])
+    assert sdl.resolve_pending_groups(loaded) == []
+    assert _snapshot(loaded)["late_frame.jpg"][2] == "video_0.mp4"
@@ -0,0 +1,61 @@
+import random
+from datetime import date, datetime, time, timedelta
+
+import pytest
+
+import SimpleM3DataLoader as sdl
+from SimpleM3DataLoader import TagType
+
+
+_rng = random.Random(8)
+_DATES = sorted({date(1900, 1, 1) + timedelta(days=_rng.randrange(200 * 365)) for _ in range(50)} | {date.min, date.max})
+_TIMES = sorted({time(_rng.randrange(24), _rng.randrange(60), _rng.randrange(60), _rng.randrange(1_000_000)) for _ in range(50)})
+_TIMESTAMPS = sorted({datetime(1969, 12, 31, 23, 59, 59) + timedelta(microseconds=_rng.randrange(10**15)) for _ in range(50)})
+
+
+@pytest.mark.parametrize("tagtype, values", [
+    (TagType.DATE, _DATES), (TagType.TIME, _TIMES), (TagType.TIMESTAMP, _TIMESTAMPS),
+])
+def test_encoding_is_sortable_and_reversible(tagtype, values):
+    encoded = [sdl.encode_tag_value(tagtype, value) for value in values]
+    assert all(isinstance(value, int) for value in encoded)
+    assert encoded == sorted(encoded) and len(set(encoded)) == len(values)
+    assert [sdl.decode_tag_value(tagtype, value) for value in encoded] == values
+    # ISO 8601 strings encode like the objects
+    assert [sdl.encode_tag_value(tagtype, value.isoformat()) for value in values] == encoded
+
+
+def test_legacy_text_values_decode_unchanged():
+    assert sdl.decode_tag_value(TagType.DATE, "2026-01-01") == "2026-01-01"
+
+
+@pytest.fixture
+def temporal(connection):
+    sdl.add_tagsets(connection, [
+        sdl.Tagset("Taken", TagType.TIMESTAMP, sdl.Tags("Taken", [])),
+        sdl.Tagset("Time of day", TagType.TIME, sdl.Tags("Time of day", [])),
+    ])
+    sdl.add_medias(connection, [sdl.MediaObject(f"{i}.jpg", sdl.MediaSourceType.IMAGE) for i in range(len(_TIMESTAMPS))])
+    sdl.add_media_taggings(connection, [
+        {"media_source": f"{i}.jpg", "tagsets": {"Taken": [taken.isoformat()], "Time of day": [taken.time().isoformat()]}}
+        for i, taken in enumerate(_TIMESTAMPS)
+    ], register_missing_tags=True)
+    return connection
+
+
+def test_range_queries(temporal):
+    ids = sdl.get_media_id_map_for_sources(temporal, (f"{i}.jpg" for i in range(len(_TIMESTAMPS))))
+    low, high = _TIMESTAMPS[10], _TIMESTAMPS[30]
+    expected = {ids[f"{i}.jpg"] for i, taken in enumerate(_TIMESTAMPS) if low <= taken <= high}
+    assert set(sdl.query(temporal, [("Taken", "between", (low.isoformat(), high))])) == expected
+    assert set(sdl.query(temporal, [("Taken", ">=", low), ("Taken", "<=", high.isoformat())])) == expected
+
+    noon = time(12)
+    expected = {ids[f"{i}.jpg"] for i, taken in enumerate(_TIMESTAMPS) if taken.time() < noon}
+    assert set(sdl.query(temporal, [("Time of day", "<", "12:00:00")])) == expected
+
+
+def test_range_queries_use_the_value_index(temporal):
+    sql, params = sdl.build_query(temporal, [("Taken", "between", ("2000-01-01", "2001-01-01"))])
+    plan = " ".join(row[-1] for row in temporal.execute(f"EXPLAIN QUERY PLAN {sql}", params))
+    assert "idx_timestamp_tagset_id_value (tagset_id=? AND value>? AND value<?)" in plan